@@ -0,0 +1,268 @@
+#!/usr/bin/env python
+# Copyright 2013 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Autoscaler of workers of Hadoop cluster driven by JobTracker load.
+
+Load of the cluster is read from JMX metrics of JobTracker, which its Web
+console (port 50030) serves in JSON.  Workers are added while tasks are
+waiting for busy slots, and are removed while most slots are idle, within
+the minimum and the maximum number of workers.  A resize is made only after
+the load stays beyond the threshold for consecutive samples, and not within
+the cooldown period after the last resize, so that short spikes and the
+load change by the resize itself don't make the cluster flap.
+"""
+
+
+
+import collections
+import json
+import logging
+import math
+import time
+import urllib2
+
+
+# Metrics of JobTracker that matter to scaling.
+Load = collections.namedtuple(
+    'Load', ['trackers', 'map_slots', 'occupied_map_slots', 'waiting_maps',
+             'reduce_slots', 'occupied_reduce_slots', 'waiting_reduces'])
+
+
+class MetricsError(Exception):
+  """Failure to read metrics of JobTracker."""
+
+
+class JobTrackerClient(object):
+  """Reads metrics from JMX servlet of JobTracker Web console."""
+
+  JMX_QUERY = 'Hadoop:service=JobTracker,name=JobTrackerMetrics'
+  DEFAULT_PORT = 50030
+  DEFAULT_TIMEOUT = 10
+
+  def __init__(self, host, port=DEFAULT_PORT, timeout=DEFAULT_TIMEOUT):
+    """Constructor.
+
+    Args:
+      host: Host name or IP address of JobTracker.
+      port: Port of Web console of JobTracker.
+      timeout: Timeout of HTTP request in seconds.
+    """
+    self.url = 'http://%s:%d/jmx?qry=%s' % (host, port, self.JMX_QUERY)
+    self.timeout = timeout
+
+  def GetLoad(self):
+    """Returns current load of the cluster.
+
+    Returns:
+      Load object.
+    Raises:
+      MetricsError: JobTracker didn't respond, or the response is broken.
+    """
+    try:
+      response = urllib2.urlopen(self.url, timeout=self.timeout)
+      beans = json.loads(response.read()).get('beans', [])
+    except (IOError, ValueError) as e:
+      raise MetricsError('Failed to read %s: %s' % (self.url, e))
+    if not beans:
+      raise MetricsError('No JobTracker metrics in %s' % self.url)
+    try:
+      return Load(*[int(beans[0][name]) for name in Load._fields])
+    except (KeyError, TypeError, ValueError) as e:
+      raise MetricsError('Invalid JobTracker metrics: %s' % e)
+
+
+class ScalingPolicy(object):
+  """Thresholds and limits of autoscaling."""
+
+  def __init__(self, min_workers, max_workers, scale_up_occupancy=0.9,
+               scale_down_occupancy=0.3, target_occupancy=0.7,
+               scale_up_samples=2, scale_down_samples=5,
+               scale_up_cooldown=300, scale_down_cooldown=600, max_step=10):
+    """Constructor.
+
+    Args:
+      min_workers: Minimum number of workers.
+      max_workers: Maximum number of workers.
+      scale_up_occupancy: Workers are added when occupancy of slots is at
+          least this ratio and tasks are waiting.
+      scale_down_occupancy: Workers are removed when occupancy of slots is
+          at most this ratio and no task is waiting.
+      target_occupancy: Occupancy of slots to aim at when removing workers.
+      scale_up_samples: Number of consecutive samples over the threshold to
+          add workers.
+      scale_down_samples: Number of consecutive samples under the threshold
+          to remove workers.
+      scale_up_cooldown: Seconds after the last resize before adding workers.
+      scale_down_cooldown: Seconds after the last resize before removing
+          workers.
+      max_step: Maximum number of workers to add or remove at once.
+    Raises:
+      ValueError: The parameters are inconsistent.
+    """
+    if not 0 < min_workers <= max_workers:
+      raise ValueError('Invalid number of workers: min %d, max %d' % (
+          min_workers, max_workers))
+    if not (0 <= scale_down_occupancy < target_occupancy <=
+            scale_up_occupancy <= 1):
+      raise ValueError('Occupancy thresholds must be in the order of '
+                       'scale down, target and scale up')
+    self.min_workers = min_workers
+    self.max_workers = max_workers
+    self.scale_up_occupancy = scale_up_occupancy
+    self.scale_down_occupancy = scale_down_occupancy
+    self.target_occupancy = target_occupancy
+    self.scale_up_samples = scale_up_samples
+    self.scale_down_samples = scale_down_samples
+    self.scale_up_cooldown = scale_up_cooldown
+    self.scale_down_cooldown = scale_down_cooldown
+    self.max_step = max_step
+
+
+def _Occupancy(occupied, slots):
+  return float(occupied) / slots if slots else 0.0
+
+
+class Autoscaler(object):
+  """Resizes the worker pool following the load of the cluster."""
+
+  def __init__(self, policy, get_load, count_workers, resize,
+               clock=time.time):
+    """Constructor.
+
+    Args:
+      policy: ScalingPolicy object.
+      get_load: Function that returns current Load object.
+      count_workers: Function that returns the current number of workers.
+      resize: Function that takes number of workers to add, or negative
+          number of workers to remove.
+      clock: Function that returns current time in seconds.
+    """
+    self.policy = policy
+    self._get_load = get_load
+    self._count_workers = count_workers
+    self._resize = resize
+    self._clock = clock
+    self.high_samples = 0
+    self.low_samples = 0
+    self.last_resize_time = None
+
+  def _InCooldown(self, cooldown):
+    return (self.last_resize_time is not None and
+            self._clock() < self.last_resize_time + cooldown)
+
+  def Decide(self, load, workers):
+    """Returns number of workers to add or remove for the load.
+
+    Updates the counts of consecutive samples over and under the
+    thresholds.
+
+    Args:
+      load: Load object.
+      workers: Current number of workers.
+    Returns:
+      Positive number of workers to add, negative number of workers to
+      remove, or 0.
+    """
+    policy = self.policy
+    if workers < policy.min_workers:
+      return min(policy.min_workers - workers, policy.max_step)
+    if workers > policy.max_workers:
+      return -min(workers - policy.max_workers, policy.max_step)
+
+    occupancy = max(
+        _Occupancy(load.occupied_map_slots, load.map_slots),
+        _Occupancy(load.occupied_reduce_slots, load.reduce_slots))
+    waiting = load.waiting_maps + load.waiting_reduces
+    if waiting and (occupancy >= policy.scale_up_occupancy or
+                    not load.trackers):
+      self.high_samples += 1
+      self.low_samples = 0
+    elif not waiting and occupancy <= policy.scale_down_occupancy:
+      self.low_samples += 1
+      self.high_samples = 0
+    else:
+      self.high_samples = self.low_samples = 0
+
+    # Slots per worker are estimated from the TaskTrackers in service.
+    trackers = max(load.trackers, 1)
+    map_slots_per_worker = max(load.map_slots // trackers, 1)
+    reduce_slots_per_worker = max(load.reduce_slots // trackers, 1)
+
+    if (self.high_samples >= policy.scale_up_samples and
+        not self._InCooldown(policy.scale_up_cooldown)):
+      wanted = max(
+          int(math.ceil(float(load.waiting_maps) / map_slots_per_worker)),
+          int(math.ceil(float(load.waiting_reduces) /
+                        reduce_slots_per_worker)),
+          1)
+      return min(wanted, policy.max_step, policy.max_workers - workers)
+
+    if (self.low_samples >= policy.scale_down_samples and
+        not self._InCooldown(policy.scale_down_cooldown)):
+      needed = max(
+          int(math.ceil(load.occupied_map_slots / (
+              map_slots_per_worker * policy.target_occupancy))),
+          int(math.ceil(load.occupied_reduce_slots / (
+              reduce_slots_per_worker * policy.target_occupancy))),
+          policy.min_workers)
+      return -min(max(workers - needed, 0), policy.max_step)
+    return 0
+
+  def Step(self):
+    """Samples the load once, and resizes the cluster if necessary.
+
+    Returns:
+      Number of workers added, negative number of workers removed, or 0.
+    """
+    try:
+      load = self._get_load()
+    except MetricsError as e:
+      logging.warning('Skipping sample: %s', e)
+      self.high_samples = self.low_samples = 0
+      return 0
+    workers = self._count_workers()
+    change = self.Decide(load, workers)
+    logging.info('Workers %d, trackers %d, map slots %d/%d (waiting %d), '
+                 'reduce slots %d/%d (waiting %d)', workers, load.trackers,
+                 load.occupied_map_slots, load.map_slots, load.waiting_maps,
+                 load.occupied_reduce_slots, load.reduce_slots,
+                 load.waiting_reduces)
+    if not change:
+      return 0
+
+    logging.info('%s %d workers', 'Adding' if change > 0 else 'Removing',
+                 abs(change))
+    try:
+      self._resize(change)
+    except Exception as e:  # pylint: disable=broad-except
+      # Keep running, and retry after the cooldown.
+      logging.error('Resize failed: %s', e)
+    self.last_resize_time = self._clock()
+    self.high_samples = self.low_samples = 0
+    return change
+
+  def Run(self, interval, iterations=None):
+    """Samples the load periodically, and resizes the cluster.
+
+    Args:
+      interval: Seconds between samples.
+      iterations: Number of samples to take.  Runs forever if None.
+    """
+    count = 0
+    while iterations is None or count < iterations:
+      self.Step()
+      count += 1
+      if iterations is None or count < iterations:
+        time.sleep(interval)
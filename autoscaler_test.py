@@ -0,0 +1,218 @@
+#!/usr/bin/env python
+# Copyright 2013 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Unit tests of autoscaler.py."""
+
+
+
+import BaseHTTPServer
+import json
+import threading
+import unittest
+
+import mock
+
+import autoscaler
+
+
+class FakeJobTrackerHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+  """Serves JMX servlet of JobTracker with metrics set to the server."""
+
+  def do_GET(self):  # pylint: disable=invalid-name
+    self.server.paths.append(self.path)
+    self.send_response(self.server.status)
+    self.send_header('Content-Type', 'application/json')
+    self.end_headers()
+    self.wfile.write(self.server.body)
+
+  def log_message(self, *unused_args):
+    pass
+
+
+class AutoscalerTest(unittest.TestCase):
+  """Unit test class of autoscaler."""
+
+  METRICS = {
+      'name': 'Hadoop:service=JobTracker,name=JobTrackerMetrics',
+      'trackers': 4,
+      'map_slots': 16,
+      'occupied_map_slots': 12,
+      'waiting_maps': 7,
+      'reduce_slots': 8,
+      'occupied_reduce_slots': 2,
+      'waiting_reduces': 0,
+      'jobs_running': 1,
+  }
+
+  def _FakeJobTracker(self, body, status=200):
+    """Starts fake JobTracker on local host and returns its client."""
+    server = BaseHTTPServer.HTTPServer(('127.0.0.1', 0),
+                                       FakeJobTrackerHandler)
+    server.body = body
+    server.status = status
+    server.paths = []
+    thread = threading.Thread(target=server.serve_forever, args=(0.05,))
+    thread.daemon = True
+    thread.start()
+    self.addCleanup(server.server_close)
+    self.addCleanup(server.shutdown)
+    self.server = server
+    return autoscaler.JobTrackerClient('127.0.0.1', server.server_port,
+                                       timeout=5)
+
+  def _Load(self, trackers=4, occupied_map_slots=0, waiting_maps=0,
+            occupied_reduce_slots=0, waiting_reduces=0):
+    """Returns Load of the workers with 4 map and 2 reduce slots each."""
+    return autoscaler.Load(trackers, trackers * 4, occupied_map_slots,
+                           waiting_maps, trackers * 2, occupied_reduce_slots,
+                           waiting_reduces)
+
+  def _Autoscaler(self, **kwargs):
+    """Returns Autoscaler with mock functions and fake clock."""
+    self.now = 1000.0
+    self.get_load = mock.MagicMock()
+    self.count_workers = mock.MagicMock(return_value=4)
+    self.resize = mock.MagicMock()
+    policy = autoscaler.ScalingPolicy(2, 10, **kwargs)
+    return autoscaler.Autoscaler(policy, self.get_load, self.count_workers,
+                                 self.resize, clock=lambda: self.now)
+
+  def testGetLoad(self):
+    """Unit test of GetLoad() from fake JobTracker."""
+    client = self._FakeJobTracker(json.dumps({'beans': [self.METRICS]}))
+
+    load = client.GetLoad()
+
+    self.assertEqual(autoscaler.Load(4, 16, 12, 7, 8, 2, 0), load)
+    self.assertEqual(
+        ['/jmx?qry=Hadoop:service=JobTracker,name=JobTrackerMetrics'],
+        self.server.paths)
+
+  def testGetLoad_Error(self):
+    """Unit test of GetLoad() with broken responses."""
+    for body, status in [
+        (json.dumps({'beans': [self.METRICS]}), 500),
+        ('{"beans": [', 200),
+        (json.dumps({'beans': []}), 200),
+        (json.dumps({'beans': [{'trackers': 4}]}), 200),
+    ]:
+      client = self._FakeJobTracker(body, status)
+      self.assertRaises(autoscaler.MetricsError, client.GetLoad)
+
+  def testScalingPolicy_Invalid(self):
+    """Unit test of ScalingPolicy with inconsistent parameters."""
+    self.assertRaises(ValueError, autoscaler.ScalingPolicy, 0, 5)
+    self.assertRaises(ValueError, autoscaler.ScalingPolicy, 6, 5)
+    self.assertRaises(ValueError, autoscaler.ScalingPolicy, 2, 5,
+                      scale_down_occupancy=0.8)
+    self.assertRaises(ValueError, autoscaler.ScalingPolicy, 2, 5,
+                      scale_up_occupancy=1.5)
+
+  def testDecide_ScaleUp(self):
+    """Unit test of Decide() adding workers after consecutive samples."""
+    scaler = self._Autoscaler()
+    busy = self._Load(occupied_map_slots=16, waiting_maps=10)
+
+    self.assertEqual(0, scaler.Decide(busy, 4))
+    # 10 waiting maps need 3 more workers with 4 map slots each.
+    self.assertEqual(3, scaler.Decide(busy, 4))
+
+  def testDecide_ScaleUpLimits(self):
+    """Unit test of Decide() adding workers up to the step and the maximum."""
+    scaler = self._Autoscaler(max_step=5, scale_up_samples=1)
+
+    self.assertEqual(5, scaler.Decide(
+        self._Load(occupied_map_slots=16, waiting_maps=100), 4))
+    self.assertEqual(2, scaler.Decide(
+        self._Load(trackers=8, occupied_map_slots=32, waiting_maps=100), 8))
+
+  def testDecide_Hysteresis(self):
+    """Unit test of Decide() resetting samples when the load changes."""
+    scaler = self._Autoscaler()
+    busy = self._Load(occupied_map_slots=16, waiting_maps=10)
+    moderate = self._Load(occupied_map_slots=10)
+
+    self.assertEqual(0, scaler.Decide(busy, 4))
+    self.assertEqual(0, scaler.Decide(moderate, 4))
+    self.assertEqual(0, scaler.Decide(busy, 4))
+    self.assertEqual(3, scaler.Decide(busy, 4))
+
+  def testDecide_ScaleDown(self):
+    """Unit test of Decide() removing idle workers down to the minimum."""
+    scaler = self._Autoscaler()
+    idle = self._Load(trackers=8, occupied_map_slots=4)
+
+    for _ in xrange(4):
+      self.assertEqual(0, scaler.Decide(idle, 8))
+    # 4 occupied map slots fit in 2 workers at the target occupancy.
+    self.assertEqual(-6, scaler.Decide(idle, 8))
+
+  def testDecide_OutOfBounds(self):
+    """Unit test of Decide() with workers out of the minimum and maximum."""
+    scaler = self._Autoscaler()
+
+    self.assertEqual(1, scaler.Decide(self._Load(trackers=1), 1))
+    self.assertEqual(-2, scaler.Decide(self._Load(trackers=12), 12))
+
+  def testStep_Cooldown(self):
+    """Unit test of Step() not resizing within the cooldown."""
+    scaler = self._Autoscaler(scale_up_samples=1, scale_up_cooldown=300)
+    self.get_load.return_value = self._Load(occupied_map_slots=16,
+                                            waiting_maps=4)
+
+    self.assertEqual(1, scaler.Step())
+    self.now += 299
+    self.assertEqual(0, scaler.Step())
+    self.now += 1
+    self.assertEqual(1, scaler.Step())
+
+    self.assertEqual([mock.call(1), mock.call(1)],
+                     self.resize.call_args_list)
+
+  def testStep_MetricsError(self):
+    """Unit test of Step() skipping the sample JobTracker didn't return."""
+    scaler = self._Autoscaler()
+    busy = self._Load(occupied_map_slots=16, waiting_maps=4)
+    self.get_load.side_effect = [
+        busy, autoscaler.MetricsError('timeout'), busy, busy]
+
+    self.assertEqual([0, 0, 0, 1], [scaler.Step() for _ in xrange(4)])
+    self.resize.assert_called_once_with(1)
+
+  def testStep_ResizeError(self):
+    """Unit test of Step() continuing after resize fails."""
+    scaler = self._Autoscaler(scale_up_samples=1)
+    self.get_load.return_value = self._Load(occupied_map_slots=16,
+                                            waiting_maps=4)
+    self.resize.side_effect = RuntimeError('quota exceeded')
+
+    self.assertEqual(1, scaler.Step())
+    self.assertEqual(self.now, scaler.last_resize_time)
+
+  def testRun(self):
+    """Unit test of Run() with number of iterations."""
+    scaler = self._Autoscaler()
+    self.get_load.return_value = self._Load(occupied_map_slots=8)
+
+    with mock.patch('time.sleep') as mock_sleep:
+      scaler.Run(60, 3)
+
+    self.assertEqual(3, self.get_load.call_count)
+    self.assertEqual([mock.call(60)] * 2, mock_sleep.call_args_list)
+    self.assertFalse(self.resize.called)
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,215 @@
+#!/usr/bin/env python
+# Copyright 2013 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Local record of Compute Engine resources of Hadoop cluster.
+
+Subcommands record the instances and the disks that they create, find and
+delete, so that the later subcommands find them without list requests.  The
+record is kept in JSON file per cluster.  Resources may be changed by other
+means than the subcommands, so that the record is a hint.  It is checked
+against the API when it turns out wrong, e.g. when the recorded resource is
+not found.
+"""
+
+
+
+import json
+import logging
+import os
+import re
+import threading
+
+
+class ClusterState(object):
+  """Instances and disks of a cluster recorded in local file.
+
+  The file is read when the record is used for the first time, and written
+  by Save() only if the record has changed.  All methods are thread-safe.
+  """
+
+  # Version of the file format.  File of other versions is ignored.
+  VERSION = 1
+
+  def __init__(self, path=None):
+    """Constructor.
+
+    Args:
+      path: JSON file to keep the record in.  The record is kept only in
+          memory if not specified.
+    """
+    self.path = path
+    self._lock = threading.Lock()
+    self._loaded = False
+    self._dirty = False
+    # Dictionary of instance name to the instance resource trimmed to the
+    # name, zone name, status and IP addresses.
+    self._instances = {}
+    # Dictionary of disk name to dictionary of zone name and status.
+    self._disks = {}
+
+  def _Load(self):
+    """Reads the file if not yet read.  Must be called with the lock."""
+    if self._loaded:
+      return
+    self._loaded = True
+    if not self.path or not os.path.exists(self.path):
+      return
+    try:
+      with open(self.path) as f:
+        data = json.load(f)
+    except (IOError, OSError, ValueError) as e:
+      logging.warning('Ignoring broken cluster state %s: %s', self.path, e)
+      return
+    if data.get('version') != self.VERSION:
+      logging.warning('Ignoring cluster state %s of version %s',
+                      self.path, data.get('version'))
+      return
+    self._instances = data.get('instances', {})
+    self._disks = data.get('disks', {})
+    logging.debug('Loaded cluster state %s: %d instances, %d disks',
+                  self.path, len(self._instances), len(self._disks))
+
+  def Clear(self):
+    """Forgets all resources, so that they are found by the API again."""
+    with self._lock:
+      self._loaded = True
+      self._instances = {}
+      self._disks = {}
+      self._dirty = True
+
+  def Save(self):
+    """Writes the record to the file if it has changed.
+
+    The file is written to temporary file and renamed, so that interrupted
+    write never breaks the file.
+    """
+    with self._lock:
+      if not self._dirty or not self.path:
+        return
+      data = {
+          'version': self.VERSION,
+          'instances': self._instances,
+          'disks': self._disks,
+      }
+      temp_file = '%s.%d' % (self.path, os.getpid())
+      try:
+        with open(temp_file, 'w') as f:
+          json.dump(data, f, indent=1, sort_keys=True)
+        os.rename(temp_file, self.path)
+        self._dirty = False
+      except (IOError, OSError) as e:
+        logging.warning('Failed to save cluster state %s: %s', self.path, e)
+
+  @staticmethod
+  def _Names(records, name_pattern, zone):
+    """Returns sorted names of the records that match the conditions."""
+    return sorted(
+        name for name, record in records.iteritems()
+        if (not name_pattern or re.match('^(%s)$' % name_pattern, name)) and
+        (not zone or record['zone'] == zone))
+
+  def Instance(self, instance_name):
+    """Returns recorded instance.
+
+    Args:
+      instance_name: Name of the instance.
+    Returns:
+      Dictionary of name, zone name, status and networkInterfaces in the
+      same format as instance resource.  None if not recorded.
+    """
+    with self._lock:
+      self._Load()
+      instance = self._instances.get(instance_name)
+      return json.loads(json.dumps(instance)) if instance else None
+
+  def InstanceNames(self, name_pattern=None, zone=None):
+    """Returns names of recorded instances.
+
+    Args:
+      name_pattern: Regular expression that matches the whole names.  All
+          instances if not specified.
+      zone: Zone name of the instances.  All zones if not specified.
+    Returns:
+      Sorted list of the instance names.
+    """
+    with self._lock:
+      self._Load()
+      return self._Names(self._instances, name_pattern, zone)
+
+  def RecordInstance(self, instance_name, zone, instance):
+    """Records the instance.
+
+    Args:
+      instance_name: Name of the instance.
+      zone: Zone name of the instance.
+      instance: Instance resource.  Status and IP addresses are recorded
+          if the resource has them.
+    """
+    network_interfaces = []
+    for network_interface in instance.get('networkInterfaces', []):
+      network_interfaces.append({
+          'networkIP': network_interface.get('networkIP'),
+          'accessConfigs': [
+              {'natIP': access_config['natIP']} for access_config in
+              network_interface.get('accessConfigs', [])
+              if access_config.get('natIP')],
+      })
+    record = {
+        'name': instance_name,
+        'zone': zone,
+        'status': instance.get('status'),
+        'networkInterfaces': network_interfaces,
+    }
+    with self._lock:
+      self._Load()
+      if self._instances.get(instance_name) != record:
+        self._instances[instance_name] = record
+        self._dirty = True
+
+  def RemoveInstance(self, instance_name):
+    """Forgets the instance if recorded."""
+    with self._lock:
+      self._Load()
+      if self._instances.pop(instance_name, None):
+        self._dirty = True
+
+  def Disk(self, disk_name):
+    """Returns recorded disk as dictionary of zone name and status, or None."""
+    with self._lock:
+      self._Load()
+      disk = self._disks.get(disk_name)
+      return dict(disk) if disk else None
+
+  def DiskNames(self, name_pattern=None, zone=None):
+    """Returns sorted names of recorded disks.  See InstanceNames()."""
+    with self._lock:
+      self._Load()
+      return self._Names(self._disks, name_pattern, zone)
+
+  def RecordDisk(self, disk_name, zone, status):
+    """Records the disk with the zone name and the status."""
+    record = {'zone': zone, 'status': status}
+    with self._lock:
+      self._Load()
+      if self._disks.get(disk_name) != record:
+        self._disks[disk_name] = record
+        self._dirty = True
+
+  def RemoveDisk(self, disk_name):
+    """Forgets the disk if recorded."""
+    with self._lock:
+      self._Load()
+      if self._disks.pop(disk_name, None):
+        self._dirty = True
@@ -0,0 +1,152 @@
+#!/usr/bin/env python
+# Copyright 2013 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Unit tests of cluster_state.py."""
+
+
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+import cluster_state
+
+
+class ClusterStateTest(unittest.TestCase):
+  """Unit test class of cluster_state."""
+
+  INSTANCE = {
+      'name': 'hm',
+      'status': 'RUNNING',
+      'machineType': 'n1-standard-1',
+      'networkInterfaces': [{
+          'networkIP': '10.0.0.1',
+          'accessConfigs': [{'type': 'ONE_TO_ONE_NAT', 'natIP': '1.2.3.4'}],
+      }],
+  }
+
+  def setUp(self):
+    self.temp_dir = tempfile.mkdtemp()
+    self.addCleanup(shutil.rmtree, self.temp_dir)
+    self.path = os.path.join(self.temp_dir, 'cluster.json')
+
+  def testRecordInstance(self):
+    """Unit test of RecordInstance() and Instance()."""
+    state = cluster_state.ClusterState()
+    state.RecordInstance('hm', 'zone-a', self.INSTANCE)
+
+    self.assertEqual(
+        {'name': 'hm', 'zone': 'zone-a', 'status': 'RUNNING',
+         'networkInterfaces': [{
+             'networkIP': '10.0.0.1',
+             'accessConfigs': [{'natIP': '1.2.3.4'}],
+         }]},
+        state.Instance('hm'))
+    self.assertIsNone(state.Instance('hw-000'))
+
+    # Returned instance is a copy.
+    state.Instance('hm')['status'] = 'TERMINATED'
+    self.assertEqual('RUNNING', state.Instance('hm')['status'])
+
+    state.RemoveInstance('hm')
+    self.assertIsNone(state.Instance('hm'))
+
+  def testInstanceNames(self):
+    """Unit test of InstanceNames() with name pattern and zone."""
+    state = cluster_state.ClusterState()
+    for name, zone in [('hm', 'zone-a'), ('hw-001', 'zone-b'),
+                       ('hw-000', 'zone-a'), ('hc-000', 'zone-b')]:
+      state.RecordInstance(name, zone, {'status': 'RUNNING'})
+
+    self.assertEqual(['hc-000', 'hm', 'hw-000', 'hw-001'],
+                     state.InstanceNames())
+    self.assertEqual(['hw-000', 'hw-001'], state.InstanceNames('hw-\\d+'))
+    self.assertEqual(['hc-000', 'hw-001'],
+                     state.InstanceNames('hw-\\d+|hc-\\d+', zone='zone-b'))
+    # Pattern matches the whole names.
+    self.assertEqual([], state.InstanceNames('hw'))
+
+  def testRecordDisk(self):
+    """Unit test of RecordDisk(), Disk() and DiskNames()."""
+    state = cluster_state.ClusterState()
+    state.RecordDisk('hw-000', 'zone-a', 'CREATING')
+    state.RecordDisk('hw-000-data', 'zone-a', 'READY')
+    state.RecordDisk('hw-000', 'zone-a', 'READY')
+
+    self.assertEqual({'zone': 'zone-a', 'status': 'READY'},
+                     state.Disk('hw-000'))
+    self.assertEqual(['hw-000', 'hw-000-data'],
+                     state.DiskNames('hw-000(-data)?', zone='zone-a'))
+    self.assertEqual([], state.DiskNames(zone='zone-b'))
+
+    state.RemoveDisk('hw-000')
+    self.assertIsNone(state.Disk('hw-000'))
+
+  def testSaveAndLoad(self):
+    """Unit test of Save() and loading the record from the file."""
+    state = cluster_state.ClusterState(self.path)
+    state.RecordInstance('hm', 'zone-a', self.INSTANCE)
+    state.RecordDisk('hm', 'zone-a', 'READY')
+    state.Save()
+
+    loaded = cluster_state.ClusterState(self.path)
+    self.assertEqual(state.Instance('hm'), loaded.Instance('hm'))
+    self.assertEqual({'zone': 'zone-a', 'status': 'READY'},
+                     loaded.Disk('hm'))
+    # No temporary file is left.
+    self.assertEqual(['cluster.json'], os.listdir(self.temp_dir))
+
+  def testSave_Unchanged(self):
+    """Unit test of Save() that doesn't write unchanged record."""
+    state = cluster_state.ClusterState(self.path)
+    state.Save()
+    self.assertFalse(os.path.exists(self.path))
+
+    state.RecordDisk('hm', 'zone-a', 'READY')
+    state.Save()
+    os.remove(self.path)
+    # Recording the same resource again doesn't change the record.
+    state.RecordDisk('hm', 'zone-a', 'READY')
+    state.Save()
+    self.assertFalse(os.path.exists(self.path))
+
+  def testLoad_BrokenFile(self):
+    """Unit test of loading broken file or file of other version."""
+    with open(self.path, 'w') as f:
+      f.write('{broken')
+    self.assertEqual([], cluster_state.ClusterState(self.path).DiskNames())
+
+    with open(self.path, 'w') as f:
+      json.dump({'version': cluster_state.ClusterState.VERSION + 1,
+                 'disks': {'hm': {'zone': 'zone-a', 'status': 'READY'}}}, f)
+    self.assertEqual([], cluster_state.ClusterState(self.path).DiskNames())
+
+  def testClear(self):
+    """Unit test of Clear() that discards the record in the file."""
+    state = cluster_state.ClusterState(self.path)
+    state.RecordInstance('hm', 'zone-a', self.INSTANCE)
+    state.Save()
+
+    state = cluster_state.ClusterState(self.path)
+    state.Clear()
+    self.assertIsNone(state.Instance('hm'))
+    state.Save()
+    self.assertEqual([], cluster_state.ClusterState(self.path).InstanceNames())
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,177 @@
+#!/usr/bin/env python
+# Copyright 2013 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Benchmark of compression codecs on sample data of MapReduce.
+
+Compresses and decompresses sample data with each codec, and shows bytes
+moved and wall time of compression, transfer over the network and
+decompression.  With --mapper, the data is output of the mapper run on the
+sample input, which is what --map-output-codec compresses for shuffle.
+
+"default" and "gzip" codecs of Hadoop are zlib and gzip at the default
+level.  "snappy" and "lzo" are measured only if python-snappy or python-lzo
+module is installed.
+"""
+
+
+
+import argparse
+import collections
+import gzip
+import logging
+import StringIO
+import subprocess
+import sys
+import time
+import zlib
+
+try:
+  import snappy
+except ImportError:
+  snappy = None
+try:
+  import lzo
+except ImportError:
+  lzo = None
+
+
+DEFAULT_NETWORK_MBPS = 1000
+
+Result = collections.namedtuple(
+    'Result', ['codec', 'original_bytes', 'compressed_bytes',
+               'compress_seconds', 'decompress_seconds'])
+
+
+def _GzipCompress(data):
+  output = StringIO.StringIO()
+  with gzip.GzipFile(fileobj=output, mode='wb') as f:
+    f.write(data)
+  return output.getvalue()
+
+
+def _GzipDecompress(data):
+  return gzip.GzipFile(fileobj=StringIO.StringIO(data)).read()
+
+
+def AvailableCodecs():
+  """Returns ordered dictionary of codec name to compress and decompress."""
+  codecs = collections.OrderedDict()
+  codecs['none'] = (lambda data: data, lambda data: data)
+  codecs['default'] = (zlib.compress, zlib.decompress)
+  codecs['gzip'] = (_GzipCompress, _GzipDecompress)
+  if snappy:
+    codecs['snappy'] = (snappy.compress, snappy.decompress)
+  if lzo:
+    codecs['lzo'] = (lzo.compress, lzo.decompress)
+  return codecs
+
+
+def Benchmark(data, codecs, repeat=3):
+  """Measures compression of the data by each codec.
+
+  Args:
+    data: Sample data as string.
+    codecs: Dictionary of codec name to compress and decompress functions.
+    repeat: Number of times to repeat, to take the fastest time.
+  Returns:
+    List of Result objects in the order of the codecs.
+  Raises:
+    ValueError: Decompressed data doesn't match the original.
+  """
+  results = []
+  for name, (compress, decompress) in codecs.iteritems():
+    compress_seconds = decompress_seconds = float('inf')
+    for _ in xrange(repeat):
+      start = time.time()
+      compressed = compress(data)
+      middle = time.time()
+      decompressed = decompress(compressed)
+      end = time.time()
+      if decompressed != data:
+        raise ValueError('Codec %s broke the data' % name)
+      compress_seconds = min(compress_seconds, middle - start)
+      decompress_seconds = min(decompress_seconds, end - middle)
+    results.append(Result(name, len(data), len(compressed),
+                          compress_seconds, decompress_seconds))
+  return results
+
+
+def FormatResults(results, network_mbps):
+  """Returns lines of table of the results.
+
+  Args:
+    results: List of Result objects.
+    network_mbps: Network bandwidth in megabits per second to estimate
+        transfer time of the compressed data.
+  Returns:
+    List of lines of the table.
+  """
+  lines = ['%-8s %12s %7s %10s %10s %10s %10s' % (
+      'codec', 'bytes', 'ratio', 'compress', 'transfer', 'decompress',
+      'total')]
+  for result in results:
+    transfer_seconds = result.compressed_bytes * 8.0 / network_mbps / 1e6
+    lines.append('%-8s %12d %6.1f%% %9.3fs %9.3fs %9.3fs %9.3fs' % (
+        result.codec, result.compressed_bytes,
+        100.0 * result.compressed_bytes / max(result.original_bytes, 1),
+        result.compress_seconds, transfer_seconds, result.decompress_seconds,
+        result.compress_seconds + transfer_seconds +
+        result.decompress_seconds))
+  return lines
+
+
+def _ReadSample(paths, mapper):
+  """Reads sample files, and runs the mapper on them if specified."""
+  data = ''.join(open(path, 'rb').read() for path in paths)
+  if not mapper:
+    return data
+  process = subprocess.Popen(mapper, shell=True, stdin=subprocess.PIPE,
+                             stdout=subprocess.PIPE)
+  output = process.communicate(data)[0]
+  if process.returncode:
+    raise subprocess.CalledProcessError(process.returncode, mapper)
+  return output
+
+
+def main(argv, stdout=sys.stdout):
+  parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+  parser.add_argument(
+      'input', nargs='+',
+      help='Local files of sample input.')
+  parser.add_argument(
+      '--mapper',
+      help='Command to run on the sample input to produce the data to '
+      'compress, such as mapper of the job.')
+  parser.add_argument(
+      '--repeat', type=int, default=3,
+      help='Number of times to repeat each measurement.')
+  parser.add_argument(
+      '--network-mbps', type=float, dest='network_mbps',
+      default=DEFAULT_NETWORK_MBPS,
+      help='Network bandwidth in megabits per second to estimate transfer '
+      'time with.')
+  flags = parser.parse_args(argv)
+
+  data = _ReadSample(flags.input, flags.mapper)
+  logging.info('Benchmarking %d bytes of data', len(data))
+  results = Benchmark(data, AvailableCodecs(), flags.repeat)
+  for line in FormatResults(results, flags.network_mbps):
+    stdout.write(line + '\n')
+  return 0
+
+
+if __name__ == '__main__':
+  logging.basicConfig(level=logging.INFO)
+  sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+# Copyright 2013 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Unit tests of compression_benchmark.py."""
+
+
+
+import StringIO
+import tempfile
+import unittest
+
+import compression_benchmark
+
+
+class CompressionBenchmarkTest(unittest.TestCase):
+  """Unit test class of compression_benchmark."""
+
+  def testBenchmark(self):
+    """Unit test of Benchmark() with codecs always available."""
+    data = 'word\t1\n' * 10000
+
+    results = compression_benchmark.Benchmark(
+        data, compression_benchmark.AvailableCodecs(), repeat=1)
+
+    self.assertEqual(['none', 'default', 'gzip'],
+                     [result.codec for result in results][:3])
+    self.assertEqual(len(data), results[0].compressed_bytes)
+    for result in results[1:]:
+      self.assertEqual(len(data), result.original_bytes)
+      self.assertLess(result.compressed_bytes, len(data) / 10)
+
+  def testBenchmark_BrokenCodec(self):
+    """Unit test of Benchmark() with codec not restoring the data."""
+    self.assertRaises(
+        ValueError, compression_benchmark.Benchmark, 'data',
+        {'broken': (lambda data: data, lambda data: data[1:])})
+
+  def testFormatResults(self):
+    """Unit test of FormatResults()."""
+    lines = compression_benchmark.FormatResults(
+        [compression_benchmark.Result('gzip', 2000000, 500000, 0.5, 0.25)],
+        network_mbps=8)
+
+    self.assertEqual(2, len(lines))
+    # Transfer of 500000 bytes at 8 Mbps takes 0.5 seconds.
+    self.assertEqual(
+        ['gzip', '500000', '25.0%', '0.500s', '0.500s', '0.250s', '1.250s'],
+        lines[1].split())
+
+  def testMain(self):
+    """Unit test of main() with mapper."""
+    with tempfile.NamedTemporaryFile() as f:
+      f.write('this is a test\n' * 100)
+      f.flush()
+      stdout = StringIO.StringIO()
+
+      self.assertEqual(0, compression_benchmark.main(
+          [f.name, '--mapper', 'tr a-z A-Z', '--repeat', '1'], stdout))
+
+    lines = stdout.getvalue().splitlines()
+    self.assertEqual('codec', lines[0].split()[0])
+    self.assertEqual(['none', '1500'], lines[1].split()[:2])
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -40,6 +40,31 @@ class ComputeClusterForHadoop(object):
     """Starts Google Compute Engine cluster with Hadoop set up."""
     gce_cluster.GceCluster(flags).StartCluster()
 
+  @staticmethod
+  def Grow(flags):
+    """Adds workers to running Hadoop cluster."""
+    gce_cluster.GceCluster(flags).GrowCluster()
+
+  @staticmethod
+  def Shrink(flags):
+    """Removes workers from running Hadoop cluster."""
+    gce_cluster.GceCluster(flags).ShrinkCluster()
+
+  @staticmethod
+  def Autoscale(flags):
+    """Resizes running Hadoop cluster following its load."""
+    gce_cluster.GceCluster(flags).Autoscale()
+
+  @staticmethod
+  def ReplacePreempted(flags):
+    """Replaces preempted compute-only workers of Hadoop cluster."""
+    gce_cluster.GceCluster(flags).ReplacePreemptedWorkers()
+
+  @staticmethod
+  def Timeline(flags):
+    """Shows timeline of the start-up of Hadoop cluster."""
+    gce_cluster.GceCluster(flags).ShowTimeline()
+
   @staticmethod
   def ShutDown(flags):
     """Deletes all instances included in the Hadoop cluster."""
@@ -50,6 +75,16 @@ class ComputeClusterForHadoop(object):
     """Starts MapReduce job."""
     gce_cluster.GceCluster(flags).StartMapReduce()
 
+  @staticmethod
+  def Pipeline(flags):
+    """Runs pipeline of MapReduce stages."""
+    gce_cluster.GceCluster(flags).StartPipeline()
+
+  @staticmethod
+  def BakeImage(flags):
+    """Builds boot image with Hadoop preinstalled."""
+    gce_cluster.GceCluster(flags).BakeImage()
+
   def __init__(self):
     self._parser = argparse.ArgumentParser()
 
@@ -68,6 +103,17 @@ class ComputeClusterForHadoop(object):
         '--debug', action='store_true',
         help='Debug mode.  Shows verbose log.')
 
+    self._parser.add_argument(
+        '--state-dir', dest='state_dir', default='.',
+        help='Directory to keep local record of instances and disks of the '
+        'cluster in, so that subcommands skip looking them up.  Empty '
+        'string not to keep the record.')
+
+    self._parser.add_argument(
+        '--refresh-state', dest='refresh_state', action='store_true',
+        help='Discards local record of the cluster and looks up instances '
+        'and disks again.')
+
     self._subparsers = self._parser.add_subparsers(
         title='Sub-commands', dest='subcommand')
 
@@ -100,28 +146,183 @@ class ComputeClusterForHadoop(object):
     parser_start.add_argument(
         'num_workers', default=5, type=int, nargs='?',
         help='Number of worker instances in Hadoop cluster. (default 5)')
+    self._AddInstanceArguments(parser_start)
+    parser_start.add_argument(
+        '--wait-for-hadoop', action='store_true',
+        help='Wait until Web consoles of NameNode and JobTracker on the '
+        'master accept connections.')
     parser_start.add_argument(
+        '--boot-snapshot', dest='boot_snapshot', default='',
+        help='Snapshot to create boot disks of workers from.  If it does '
+        'not exist, it is taken from boot disk of the master after Hadoop '
+        'is set up on it.')
+    parser_start.add_argument(
+        '--preemptible-workers', dest='preemptible_workers', type=int,
+        default=0,
+        help='Number of compute-only workers on preemptible instances in '
+        'addition to the workers.  They run TaskTracker without DataNode. '
+        '(default 0)')
+
+  @staticmethod
+  def _AddInstanceArguments(parser):
+    """Sets up parameters of instances to start."""
+    parser.add_argument(
         '--prefix', default='',
         help='Name prefix of Google Compute Engine instances. (default "")')
-    parser_start.add_argument(
+    parser.add_argument(
         '--zone', default='',
         help='Zone name where to add Hadoop cluster.')
-    parser_start.add_argument(
+    parser.add_argument(
+        '--worker-zones', dest='worker_zones', default='',
+        help='Comma-separated zone names to spread workers over in turn.  '
+        'Hadoop regards each zone as a rack.  Workers are in the zone of '
+        'the master if not specified.')
+    parser.add_argument(
         '--image', default='',
         help='Machine image of Google Compute Engine instance.')
-    parser_start.add_argument(
+    parser.add_argument(
         '--machinetype', default='',
         help='Machine type of Google Compute Engine instance.')
-    parser_start.add_argument(
+    parser.add_argument(
         '--data-disk-gb', default=0, type=int,
         help='Size of persistent disk for data per instance in GB.')
-    parser_start.add_argument(
+    parser.add_argument(
         '--command', default='',
         help='Additional command to run on each instance.')
-    parser_start.add_argument(
+    parser.add_argument(
         '--external-ip', choices=['all', 'master'], default='all',
         help=('Indicates which instance has external IP addresses. '
               '["all" or "master"] (default "all")'))
+    parser.add_argument(
+        '--concurrency', default=10, type=int,
+        help='Maximum number of workers to provision in parallel. '
+        '(default 10)')
+
+  def _AddGrowSubcommand(self):
+    """Sets up parameters for 'grow' subcommand."""
+    parser_grow = self._subparsers.add_parser(
+        'grow',
+        help='Add workers to running Hadoop cluster.  Options must be the '
+        'same as those the cluster was started with.')
+    parser_grow.set_defaults(handler=self.Grow)
+    parser_grow.add_argument(
+        'project',
+        help='Project ID where Hadoop cluster lives.')
+    parser_grow.add_argument(
+        'bucket',
+        help='Google Cloud Storage bucket name for temporary use.')
+    parser_grow.add_argument(
+        'count', type=int,
+        help='Number of workers to add.')
+    self._AddInstanceArguments(parser_grow)
+
+  def _AddShrinkSubcommand(self):
+    """Sets up parameters for 'shrink' subcommand."""
+    parser_shrink = self._subparsers.add_parser(
+        'shrink',
+        help='Remove workers from running Hadoop cluster after '
+        'decommissioning them.')
+    parser_shrink.set_defaults(handler=self.Shrink,
+                               image='', machinetype='')
+    parser_shrink.add_argument(
+        'project',
+        help='Project ID where Hadoop cluster lives.')
+    parser_shrink.add_argument(
+        'count', type=int,
+        help='Number of workers to remove.  At least 3 workers, or all '
+        'the workers if fewer, must remain.  Nothing is removed if more are '
+        'requested, and the error tells how many can be removed.')
+    parser_shrink.add_argument(
+        '--prefix', default='',
+        help='Name prefix of Google Compute Engine instances. (default "")')
+    parser_shrink.add_argument(
+        '--zone', default='',
+        help='Zone name where Hadoop cluster lives.')
+    parser_shrink.add_argument(
+        '--worker-zones', dest='worker_zones', default='',
+        help='Comma-separated zone names where workers live.')
+
+  def _AddAutoscaleSubcommand(self):
+    """Sets up parameters for 'autoscale' subcommand."""
+    parser_autoscale = self._subparsers.add_parser(
+        'autoscale',
+        help='Add and remove workers of running Hadoop cluster following '
+        'the load of JobTracker, until interrupted.  Options of instances '
+        'must be the same as those the cluster was started with.')
+    parser_autoscale.set_defaults(handler=self.Autoscale)
+    parser_autoscale.add_argument(
+        'project',
+        help='Project ID where Hadoop cluster lives.')
+    parser_autoscale.add_argument(
+        'bucket',
+        help='Google Cloud Storage bucket name for temporary use.')
+    parser_autoscale.add_argument(
+        '--min-workers', dest='min_workers', type=int, required=True,
+        help='Minimum number of workers.  At least 3 workers, or '
+        '--max-workers if fewer, are kept for HDFS replication.')
+    parser_autoscale.add_argument(
+        '--max-workers', dest='max_workers', type=int, required=True,
+        help='Maximum number of workers.')
+    parser_autoscale.add_argument(
+        '--interval', type=int, default=60,
+        help='Seconds between samples of the load. (default 60)')
+    parser_autoscale.add_argument(
+        '--max-step', dest='max_step', type=int, default=10,
+        help='Maximum number of workers to add or remove at once. '
+        '(default 10)')
+    parser_autoscale.add_argument(
+        '--scale-up-cooldown', dest='scale_up_cooldown', type=int,
+        default=300,
+        help='Seconds after the last resize before adding workers. '
+        '(default 300)')
+    parser_autoscale.add_argument(
+        '--scale-down-cooldown', dest='scale_down_cooldown', type=int,
+        default=600,
+        help='Seconds after the last resize before removing workers. '
+        '(default 600)')
+    self._AddInstanceArguments(parser_autoscale)
+
+  def _AddReplacePreemptedSubcommand(self):
+    """Sets up parameters for 'replace-preempted' subcommand."""
+    parser_replace = self._subparsers.add_parser(
+        'replace-preempted',
+        help='Replace compute-only workers preempted by Compute Engine.  '
+        'Options of instances must be the same as those the cluster was '
+        'started with.')
+    parser_replace.set_defaults(handler=self.ReplacePreempted)
+    parser_replace.add_argument(
+        'project',
+        help='Project ID where Hadoop cluster lives.')
+    parser_replace.add_argument(
+        'bucket',
+        help='Google Cloud Storage bucket name for temporary use.')
+    parser_replace.add_argument(
+        '--interval', type=int, default=0,
+        help='Keep checking at the interval in seconds until interrupted.  '
+        'Checks once if 0. (default 0)')
+    self._AddInstanceArguments(parser_replace)
+
+  def _AddTimelineSubcommand(self):
+    """Sets up parameters for 'timeline' subcommand."""
+    parser_timeline = self._subparsers.add_parser(
+        'timeline',
+        help='Show timeline of the last start-up of Hadoop cluster, merging '
+        'the steps run here and the phases of start-up script on the '
+        'instances, with its critical path.  Must be run in the directory '
+        'where "start" ran.')
+    parser_timeline.set_defaults(handler=self.Timeline)
+    parser_timeline.add_argument(
+        'project',
+        help='Project ID where the cluster is running.')
+    parser_timeline.add_argument(
+        'bucket',
+        help='Google Cloud Storage bucket name for temporary use.')
+    parser_timeline.add_argument(
+        '--prefix', default='',
+        help='Name prefix of Compute Engine instances. (default "")')
+    parser_timeline.add_argument(
+        '--csv', default='',
+        help='Local file to write the timeline to in CSV.')
 
   def _AddShutdownSubcommand(self):
     """Sets up parameters for 'shutdown' subcommand."""
@@ -139,6 +340,13 @@ class ComputeClusterForHadoop(object):
     parser_shutdown.add_argument(
         '--zone', default='',
         help='Zone name where Hadoop cluster lives.')
+    parser_shutdown.add_argument(
+        '--worker-zones', dest='worker_zones', default='',
+        help='Comma-separated zone names where workers live.')
+    parser_shutdown.add_argument(
+        '--keep-disks', dest='keep_disks', action='store_true',
+        help='Delete instances only, and keep their persistent disks, so '
+        'that the cluster started again with the same prefix reuses them.')
 
   def _AddMapReduceSubcommand(self):
     """Sets up parameters for 'mapreduce' subcommand."""
@@ -165,6 +373,16 @@ class ComputeClusterForHadoop(object):
     parser_mapreduce.add_argument(
         '--reducer',
         help='Reducer program file either on local or on Cloud Storage.')
+    parser_mapreduce.add_argument(
+        '--combiner',
+        help='Combiner program file either on local or on Cloud Storage.  '
+        'Combiner aggregates output of each mapper before shuffle, and '
+        'its output must be in the same format as mapper output.')
+    parser_mapreduce.add_argument(
+        '--file', action='append', default=[],
+        help='Additional file, such as library of mapper, either on local or '
+        'on Cloud Storage, to ship into the working directory of tasks.  '
+        'Can be specified multiple times.')
     parser_mapreduce.add_argument(
         '--input', required=True,
         help='Input data directory on Cloud Storage.')
@@ -177,13 +395,125 @@ class ComputeClusterForHadoop(object):
     parser_mapreduce.add_argument(
         '--reducer-count', type=int, dest='reducer_count', default=1,
         help='Number of reducer tasks.  Make this 0 to skip reducer.')
+    parser_mapreduce.add_argument(
+        '--output-mode', dest='output_mode',
+        choices=['files', 'compose', 'concat'], default='files',
+        help=('How to copy output part files to Cloud Storage.  "files" '
+              'uploads them in parallel from workers.  "compose" also '
+              'combines them into results.txt on Cloud Storage.  "concat" '
+              'concatenates them into results.txt through the master. '
+              '(default "files")'))
+    parser_mapreduce.add_argument(
+        '--incremental-input', dest='incremental_input', action='store_true',
+        help='Copy only input files that are new or changed since the last '
+        'MapReduce on the cluster, and delete removed ones from HDFS.')
+    parser_mapreduce.add_argument(
+        '--direct-io', dest='direct_io',
+        choices=['none', 'input', 'output', 'both'], default='none',
+        help=('Which of input and output MapReduce reads from and writes to '
+              'Cloud Storage directly, without copying through HDFS. '
+              '(default "none")'))
+    self._AddCompressionArguments(parser_mapreduce)
+
+  @staticmethod
+  def _AddCompressionArguments(parser):
+    """Sets up parameters for compression of data of MapReduce."""
+    parser.add_argument(
+        '--map-output-codec', dest='map_output_codec',
+        choices=['none', 'default', 'gzip', 'snappy'], default='none',
+        help='Codec to compress map output shuffled to reducers.  "snappy" '
+        'requires native Snappy library on the instances. (default "none")')
+    parser.add_argument(
+        '--output-codec', dest='output_codec',
+        choices=['none', 'gzip'], default='none',
+        help='Codec to compress output with.  Output files and combined '
+        'results get ".gz" suffix. (default "none")')
+    parser.add_argument(
+        '--decompress-input', dest='decompress_input', action='store_true',
+        help='Decompress gzip (.gz) input files when they are copied to '
+        'HDFS, so that they can be split among mappers.')
+
+  def _AddPipelineSubcommand(self):
+    """Sets up parameters for 'pipeline' subcommand."""
+    parser_pipeline = self._subparsers.add_parser(
+        'pipeline',
+        help='Run pipeline of MapReduce stages.')
+    parser_pipeline.set_defaults(handler=self.Pipeline,
+                                 image='', machinetype='')
+    parser_pipeline.add_argument(
+        'project',
+        help='Project ID where Hadoop cluster lives.')
+    parser_pipeline.add_argument(
+        'bucket',
+        help='Google Cloud Storage bucket name for temporary use.')
+    parser_pipeline.add_argument(
+        'pipeline',
+        help='JSON file of pipeline specification.')
+    parser_pipeline.add_argument(
+        '--zone', default='',
+        help='Zone name where Hadoop cluster lives.')
+    parser_pipeline.add_argument(
+        '--prefix', default='',
+        help='Name prefix of Google Compute Engine instances. (default "")')
+    parser_pipeline.add_argument(
+        '--concurrency', default=3, type=int,
+        help='Maximum number of stages to run at the same time. (default 3)')
+    parser_pipeline.add_argument(
+        '--output-mode', dest='output_mode',
+        choices=['files', 'compose', 'concat'], default='files',
+        help='How to copy output part files of stages to Cloud Storage.  '
+        'See "mapreduce" subcommand. (default "files")')
+    parser_pipeline.add_argument(
+        '--incremental-input', dest='incremental_input', action='store_true',
+        help='Copy only input files that are new or changed since the last '
+        'run of the pipeline on the cluster.')
+    self._AddCompressionArguments(parser_pipeline)
+
+  def _AddBakeImageSubcommand(self):
+    """Sets up parameters for 'bake-image' subcommand."""
+    parser_bake_image = self._subparsers.add_parser(
+        'bake-image',
+        help='Build boot image with Hadoop and Java preinstalled.  Instances '
+        'started with the image by --image option of "start" skip download '
+        'and installation of the packages.')
+    parser_bake_image.set_defaults(handler=self.BakeImage)
+    parser_bake_image.add_argument(
+        'project',
+        help='Project ID to create the image in.')
+    parser_bake_image.add_argument(
+        'bucket',
+        help='Google Cloud Storage bucket name for temporary use.  Must be '
+        'set up by "setup" subcommand.')
+    parser_bake_image.add_argument(
+        'image_name',
+        help='Name of the new image.')
+    parser_bake_image.add_argument(
+        '--prefix', default='',
+        help='Name prefix of the temporary instance to build the image. '
+        '(default "")')
+    parser_bake_image.add_argument(
+        '--zone', default='',
+        help='Zone name where to run the temporary instance.')
+    parser_bake_image.add_argument(
+        '--image', default='',
+        help='Base machine image to install the packages on.')
+    parser_bake_image.add_argument(
+        '--machinetype', default='',
+        help='Machine type of the temporary instance.')
 
   def ParseArgumentsAndExecute(self, argv):
     """Parses command-line arguments and executes sub-command handler."""
     self._AddSetUpSubcommand()
     self._AddStartSubcommand()
+    self._AddGrowSubcommand()
+    self._AddShrinkSubcommand()
+    self._AddAutoscaleSubcommand()
+    self._AddReplacePreemptedSubcommand()
+    self._AddTimelineSubcommand()
     self._AddShutdownSubcommand()
     self._AddMapReduceSubcommand()
+    self._AddPipelineSubcommand()
+    self._AddBakeImageSubcommand()
 
     # Parse command-line arguments and execute corresponding handler function.
     params = self._parser.parse_args(argv)
@@ -68,6 +68,8 @@ class ComputeClusterForHadoopTest(unittest.TestCase):
       self.assertEqual('bucket-name', flags.bucket)
       self.assertEqual(10, flags.num_workers)
       self.assertEqual('all', flags.external_ip)
+      self.assertFalse(flags.wait_for_hadoop)
+      self.assertEqual(0, flags.preemptible_workers)
       mock_cluster.return_value.StartCluster.assert_called_once_with()
 
   def testStart_DefaultClusterSize(self):
@@ -92,7 +94,9 @@ class ComputeClusterForHadoopTest(unittest.TestCase):
       hadoop_cluster.ParseArgumentsAndExecute([
           'start', 'project-name', 'bucket-name', '--prefix', 'fuga',
           '--zone', 'piyo', '--command', '"additional command"',
-          '--external-ip=master'])
+          '--external-ip=master', '--concurrency', '20',
+          '--wait-for-hadoop', '--boot-snapshot', 'snap',
+          '--preemptible-workers', '30', '--worker-zones', 'piyo,hoge'])
 
       self.assertEqual(1, mock_cluster.call_count)
       flags = self._GetFlags(mock_cluster)
@@ -103,6 +107,11 @@ class ComputeClusterForHadoopTest(unittest.TestCase):
       self.assertEqual('piyo', flags.zone)
       self.assertEqual('"additional command"', flags.command)
       self.assertEqual('master', flags.external_ip)
+      self.assertEqual(20, flags.concurrency)
+      self.assertTrue(flags.wait_for_hadoop)
+      self.assertEqual('snap', flags.boot_snapshot)
+      self.assertEqual(30, flags.preemptible_workers)
+      self.assertEqual('piyo,hoge', flags.worker_zones)
       mock_cluster.return_value.StartCluster.assert_called_once_with()
 
   def testStart_Prefix(self):
@@ -153,6 +162,90 @@ class ComputeClusterForHadoopTest(unittest.TestCase):
                         ['start', 'project-piyo', 'bucket-bar',
                          '--external-ip', 'foo'])
 
+  def testGrow(self):
+    """Grow sub-command unit test."""
+    with mock.patch('gce_cluster.GceCluster') as mock_cluster:
+      hadoop_cluster = compute_cluster_for_hadoop.ComputeClusterForHadoop()
+      hadoop_cluster.ParseArgumentsAndExecute([
+          'grow', 'project-name', 'bucket-name', '3', '--prefix', 'fuga',
+          '--external-ip=master'])
+
+      mock_cluster.return_value.GrowCluster.assert_called_once_with()
+      flags = self._GetFlags(mock_cluster)
+      self.assertEqual('bucket-name', flags.bucket)
+      self.assertEqual(3, flags.count)
+      self.assertEqual('fuga', flags.prefix)
+      self.assertEqual('master', flags.external_ip)
+      self.assertEqual(10, flags.concurrency)
+
+  def testShrink(self):
+    """Shrink sub-command unit test."""
+    with mock.patch('gce_cluster.GceCluster') as mock_cluster:
+      hadoop_cluster = compute_cluster_for_hadoop.ComputeClusterForHadoop()
+      hadoop_cluster.ParseArgumentsAndExecute([
+          'shrink', 'project-name', '2', '--zone', 'piyo',
+          '--worker-zones', 'piyo,hoge'])
+
+      mock_cluster.return_value.ShrinkCluster.assert_called_once_with()
+      flags = self._GetFlags(mock_cluster)
+      self.assertEqual('project-name', flags.project)
+      self.assertEqual(2, flags.count)
+      self.assertEqual('piyo', flags.zone)
+      self.assertEqual('piyo,hoge', flags.worker_zones)
+
+  def testAutoscale(self):
+    """Autoscale sub-command unit test."""
+    with mock.patch('gce_cluster.GceCluster') as mock_cluster:
+      hadoop_cluster = compute_cluster_for_hadoop.ComputeClusterForHadoop()
+      hadoop_cluster.ParseArgumentsAndExecute([
+          'autoscale', 'project-name', 'bucket-name', '--min-workers', '2',
+          '--max-workers', '20', '--scale-up-cooldown', '120'])
+
+      mock_cluster.return_value.Autoscale.assert_called_once_with()
+      flags = self._GetFlags(mock_cluster)
+      self.assertEqual('bucket-name', flags.bucket)
+      self.assertEqual(2, flags.min_workers)
+      self.assertEqual(20, flags.max_workers)
+      self.assertEqual(60, flags.interval)
+      self.assertEqual(10, flags.max_step)
+      self.assertEqual(120, flags.scale_up_cooldown)
+      self.assertEqual(600, flags.scale_down_cooldown)
+
+  def testAutoscale_NoBounds(self):
+    """Autoscale sub-command unit test without minimum and maximum."""
+    with mock.patch('gce_cluster.GceCluster'):
+      hadoop_cluster = compute_cluster_for_hadoop.ComputeClusterForHadoop()
+      self.assertRaises(SystemExit, hadoop_cluster.ParseArgumentsAndExecute,
+                        ['autoscale', 'project-name', 'bucket-name'])
+
+  def testReplacePreempted(self):
+    """Replace-preempted sub-command unit test."""
+    with mock.patch('gce_cluster.GceCluster') as mock_cluster:
+      hadoop_cluster = compute_cluster_for_hadoop.ComputeClusterForHadoop()
+      hadoop_cluster.ParseArgumentsAndExecute([
+          'replace-preempted', 'project-name', 'bucket-name',
+          '--interval', '120', '--prefix', 'fuga'])
+
+      (mock_cluster.return_value.ReplacePreemptedWorkers.
+       assert_called_once_with())
+      flags = self._GetFlags(mock_cluster)
+      self.assertEqual('bucket-name', flags.bucket)
+      self.assertEqual(120, flags.interval)
+      self.assertEqual('fuga', flags.prefix)
+
+  def testTimeline(self):
+    """Timeline sub-command unit test."""
+    with mock.patch('gce_cluster.GceCluster') as mock_cluster:
+      hadoop_cluster = compute_cluster_for_hadoop.ComputeClusterForHadoop()
+      hadoop_cluster.ParseArgumentsAndExecute([
+          'timeline', 'project-name', 'bucket-name', '--csv', 'out.csv'])
+
+      mock_cluster.return_value.ShowTimeline.assert_called_once_with()
+      flags = self._GetFlags(mock_cluster)
+      self.assertEqual('bucket-name', flags.bucket)
+      self.assertEqual('', flags.prefix)
+      self.assertEqual('out.csv', flags.csv)
+
   def testShutdown(self):
     """Shutdown sub-command unit test."""
     with mock.patch('gce_cluster.GceCluster') as mock_cluster:
@@ -163,6 +256,7 @@ class ComputeClusterForHadoopTest(unittest.TestCase):
       self.assertEqual(1, mock_cluster.call_count)
       flags = self._GetFlags(mock_cluster)
       self.assertEqual('project-name', flags.project)
+      self.assertFalse(flags.keep_disks)
       mock_cluster.return_value.TeardownCluster.assert_called_once_with()
 
   def testShutdown_OptionalParams(self):
@@ -171,15 +265,35 @@ class ComputeClusterForHadoopTest(unittest.TestCase):
       hadoop_cluster = compute_cluster_for_hadoop.ComputeClusterForHadoop()
       hadoop_cluster.ParseArgumentsAndExecute([
           'shutdown', 'project-name', '--prefix', 'foo',
-          '--zone', 'abc'])
+          '--zone', 'abc', '--keep-disks', '--worker-zones', 'abc,def'])
 
       self.assertEqual(1, mock_cluster.call_count)
       flags = self._GetFlags(mock_cluster)
       self.assertEqual('project-name', flags.project)
       self.assertEqual('foo', flags.prefix)
       self.assertEqual('abc', flags.zone)
+      self.assertEqual('abc,def', flags.worker_zones)
+      self.assertTrue(flags.keep_disks)
       mock_cluster.return_value.TeardownCluster.assert_called_once_with()
 
+  def testShutdown_StateDir(self):
+    """Shutdown sub-command unit test with local record of the cluster."""
+    with mock.patch('gce_cluster.GceCluster') as mock_cluster:
+      hadoop_cluster = compute_cluster_for_hadoop.ComputeClusterForHadoop()
+      hadoop_cluster.ParseArgumentsAndExecute([
+          'shutdown', 'project-name'])
+      flags = self._GetFlags(mock_cluster)
+      self.assertEqual('.', flags.state_dir)
+      self.assertFalse(flags.refresh_state)
+
+      hadoop_cluster = compute_cluster_for_hadoop.ComputeClusterForHadoop()
+      hadoop_cluster.ParseArgumentsAndExecute([
+          '--state-dir', '/tmp/state', '--refresh-state',
+          'shutdown', 'project-name'])
+      flags = self._GetFlags(mock_cluster)
+      self.assertEqual('/tmp/state', flags.state_dir)
+      self.assertTrue(flags.refresh_state)
+
   def testShutdown_MissingParamValue(self):
     """Shutdown sub-command unit test with missing param value."""
     with mock.patch('gce_cluster.GceCluster'):
@@ -213,8 +327,97 @@ class ComputeClusterForHadoopTest(unittest.TestCase):
       self.assertEqual('bucket-name', flags.bucket)
       self.assertEqual('gs://some-bucket/inputs', flags.input)
       self.assertEqual('gs://some-bucket/outputs', flags.output)
+      self.assertEqual('files', flags.output_mode)
+      self.assertFalse(flags.incremental_input)
+      self.assertEqual('none', flags.direct_io)
       mock_cluster.return_value.StartMapReduce.assert_called_once_with()
 
+  def testMapReduce_OutputMode(self):
+    """MapReduce sub-command unit test with output mode."""
+    with mock.patch('gce_cluster.GceCluster') as mock_cluster:
+      hadoop_cluster = compute_cluster_for_hadoop.ComputeClusterForHadoop()
+      hadoop_cluster.ParseArgumentsAndExecute([
+          'mapreduce', 'project-name', 'bucket-name',
+          '--input', 'gs://some-bucket/inputs',
+          '--output', 'gs://some-bucket/outputs',
+          '--output-mode', 'compose'])
+
+      self.assertEqual('compose', self._GetFlags(mock_cluster).output_mode)
+
+      hadoop_cluster = compute_cluster_for_hadoop.ComputeClusterForHadoop()
+      self.assertRaises(SystemExit,
+                        hadoop_cluster.ParseArgumentsAndExecute,
+                        ['mapreduce', 'project-name', 'bucket-name',
+                         '--input', 'gs://some-bucket/inputs',
+                         '--output', 'gs://some-bucket/outputs',
+                         '--output-mode', 'zip'])
+
+  def testMapReduce_IncrementalInput(self):
+    """MapReduce sub-command unit test with incremental input."""
+    with mock.patch('gce_cluster.GceCluster') as mock_cluster:
+      hadoop_cluster = compute_cluster_for_hadoop.ComputeClusterForHadoop()
+      hadoop_cluster.ParseArgumentsAndExecute([
+          'mapreduce', 'project-name', 'bucket-name',
+          '--input', 'gs://some-bucket/inputs',
+          '--output', 'gs://some-bucket/outputs',
+          '--incremental-input'])
+
+      self.assertTrue(self._GetFlags(mock_cluster).incremental_input)
+
+  def testMapReduce_DirectIo(self):
+    """MapReduce sub-command unit test with direct input and output."""
+    with mock.patch('gce_cluster.GceCluster') as mock_cluster:
+      hadoop_cluster = compute_cluster_for_hadoop.ComputeClusterForHadoop()
+      hadoop_cluster.ParseArgumentsAndExecute([
+          'mapreduce', 'project-name', 'bucket-name',
+          '--input', 'gs://some-bucket/inputs',
+          '--output', 'gs://some-bucket/outputs',
+          '--direct-io', 'both'])
+
+      self.assertEqual('both', self._GetFlags(mock_cluster).direct_io)
+
+  def testMapReduce_CombinerAndFiles(self):
+    """MapReduce sub-command unit test with combiner and files."""
+    with mock.patch('gce_cluster.GceCluster') as mock_cluster:
+      hadoop_cluster = compute_cluster_for_hadoop.ComputeClusterForHadoop()
+      hadoop_cluster.ParseArgumentsAndExecute([
+          'mapreduce', 'project-name', 'bucket-name',
+          '--input', 'gs://some-bucket/inputs',
+          '--output', 'gs://some-bucket/outputs',
+          '--combiner', 'combiner.py',
+          '--file', 'lib1.py', '--file', 'gs://some-bucket/lib2.py'])
+
+      flags = self._GetFlags(mock_cluster)
+      self.assertEqual('combiner.py', flags.combiner)
+      self.assertEqual(['lib1.py', 'gs://some-bucket/lib2.py'], flags.file)
+
+  def testMapReduce_Compression(self):
+    """MapReduce sub-command unit test with compression options."""
+    with mock.patch('gce_cluster.GceCluster') as mock_cluster:
+      hadoop_cluster = compute_cluster_for_hadoop.ComputeClusterForHadoop()
+      hadoop_cluster.ParseArgumentsAndExecute([
+          'mapreduce', 'project-name', 'bucket-name',
+          '--input', 'gs://some-bucket/inputs',
+          '--output', 'gs://some-bucket/outputs',
+          '--map-output-codec', 'snappy', '--output-codec', 'gzip',
+          '--decompress-input'])
+
+      flags = self._GetFlags(mock_cluster)
+      self.assertEqual('snappy', flags.map_output_codec)
+      self.assertEqual('gzip', flags.output_codec)
+      self.assertTrue(flags.decompress_input)
+
+  def testMapReduce_InvalidCodec(self):
+    """MapReduce sub-command unit test with unsupported codec."""
+    with mock.patch('gce_cluster.GceCluster'):
+      hadoop_cluster = compute_cluster_for_hadoop.ComputeClusterForHadoop()
+      self.assertRaises(SystemExit,
+                        hadoop_cluster.ParseArgumentsAndExecute,
+                        ['mapreduce', 'project-name', 'bucket-name',
+                         '--input', 'gs://some-bucket/inputs',
+                         '--output', 'gs://some-bucket/outputs',
+                         '--output-codec', 'lzo'])
+
   def testMapReduce_NoInputOutput(self):
     """MapReduce sub-command unit test."""
     with mock.patch('gce_cluster.GceCluster'):
@@ -223,6 +426,37 @@ class ComputeClusterForHadoopTest(unittest.TestCase):
                         hadoop_cluster.ParseArgumentsAndExecute,
                         ['mapreduce', 'project-name', 'bucket-name'])
 
+  def testPipeline(self):
+    """Pipeline sub-command unit test."""
+    with mock.patch('gce_cluster.GceCluster') as mock_cluster:
+      hadoop_cluster = compute_cluster_for_hadoop.ComputeClusterForHadoop()
+      hadoop_cluster.ParseArgumentsAndExecute([
+          'pipeline', 'project-name', 'bucket-name', 'pipeline.json',
+          '--concurrency', '2', '--output-mode', 'concat'])
+
+      mock_cluster.return_value.StartPipeline.assert_called_once_with()
+      flags = self._GetFlags(mock_cluster)
+      self.assertEqual('pipeline.json', flags.pipeline)
+      self.assertEqual(2, flags.concurrency)
+      self.assertEqual('concat', flags.output_mode)
+      self.assertFalse(flags.incremental_input)
+
+  def testBakeImage(self):
+    """Bake-image sub-command unit test."""
+    with mock.patch('gce_cluster.GceCluster') as mock_cluster:
+      hadoop_cluster = compute_cluster_for_hadoop.ComputeClusterForHadoop()
+      hadoop_cluster.ParseArgumentsAndExecute([
+          'bake-image', 'project-name', 'bucket-name', 'hadoop-image',
+          '--zone', 'zone-name'])
+
+      mock_cluster.return_value.BakeImage.assert_called_once_with()
+      flags = self._GetFlags(mock_cluster)
+      self.assertEqual('project-name', flags.project)
+      self.assertEqual('bucket-name', flags.bucket)
+      self.assertEqual('hadoop-image', flags.image_name)
+      self.assertEqual('zone-name', flags.zone)
+      self.assertEqual('', flags.image)
+
 
 if __name__ == '__main__':
   unittest.main()
@@ -0,0 +1,303 @@
+#!/usr/bin/env python
+# Copyright 2013 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Benchmark of cluster start and teardown against fake Compute Engine API.
+
+Starts and tears down clusters of each number of workers against
+fake_compute_server.py running in this process, which simulates
+provisioning time of disks and instances, latency of requests, quota
+errors and rate limit errors.  Shows API calls, HTTP requests, API calls
+throttled by the rate limiter and retried, wall time and peak memory of each
+run, to check how the control plane scales with the number of workers.
+
+Each run is made in a child process, so that its peak memory is measured
+apart from the others.  The instances aren't reachable, so that SSH to them
+is regarded as ready once they are RUNNING.  Intervals of status checks
+are multiplied by --time-scale, which should be the ratio of the simulated
+provisioning time to the real one, and the rate limit of API calls is
+divided by it.  Retries aren't scaled, as the rate limit of the server is
+in real time.
+"""
+
+
+
+import argparse
+import collections
+import logging
+import multiprocessing
+import resource
+import shutil
+import sys
+import tempfile
+import time
+
+import fake_compute_server
+import gce_api
+import gce_cluster
+
+
+DEFAULT_WORKERS = [10, 100, 1000]
+# Time for disks and instances to get ready on the fake server.
+DEFAULT_PROVISIONING_SECONDS = 2.0
+# Status checks are made 10 times as often as the real ones by default, as
+# provisioning on the fake server is about 10 times faster.
+DEFAULT_TIME_SCALE = 0.1
+
+Result = collections.namedtuple(
+    'Result', ['action', 'workers', 'api_calls', 'http_requests', 'throttled',
+               'retried', 'seconds', 'peak_memory_mb', 'method_counts',
+               'error'])
+
+
+class _NoCredentials(object):
+  """Credentials that leave HTTP requests to the fake server as they are."""
+
+  invalid = False
+
+  @staticmethod
+  def authorize(http):
+    return http
+
+
+_NO_CREDENTIALS = _NoCredentials()
+
+
+class _FakeServerApi(gce_api.GceApi):
+  """GceApi that sends requests to the fake server without authorization."""
+
+  def __init__(self, server, project, zone, time_scale, rate_limiter):
+    gce_api.GceApi.__init__(self, 'control_plane_benchmark', '', '',
+                            project, zone, rate_limiter=rate_limiter)
+    self._server = server
+    self.OPERATION_WAIT_INITIAL_INTERVAL *= time_scale
+    self.OPERATION_WAIT_MAX_INTERVAL *= time_scale
+
+  def _GetCredentials(self):
+    return _NO_CREDENTIALS
+
+  def _GetDiscoveryDocument(self, unused_http):
+    with self._lock:
+      if not self._discovery_document:
+        self._discovery_document = self._server.DiscoveryDocument()
+      return self._discovery_document
+
+
+class _BenchmarkCluster(gce_cluster.GceCluster):
+  """GceCluster on the fake server, with the instances regarded as ready."""
+
+  def __init__(self, flags, server, time_scale, local_dir):
+    gce_cluster.GceCluster.__init__(self, flags)
+    self._server = server
+    self._time_scale = time_scale
+    self.STATUS_CHECK_INITIAL_INTERVAL *= time_scale
+    self.STATUS_CHECK_MAX_INTERVAL *= time_scale
+    self.rate_limiter = gce_api.RateLimiter(
+        gce_api.RateLimiter.DEFAULT_CALLS_PER_SECOND / time_scale)
+    self.LOCAL_TMP_DIR = local_dir
+    self.private_key = 'private key'
+    self.public_key = 'public key'
+
+  def _GetApi(self, zone=None):
+    zone = zone or self.zone
+    if zone not in self.apis:
+      self.apis[zone] = _FakeServerApi(self._server, self.flags.project, zone,
+                                       self._time_scale, self.rate_limiter)
+    return self.apis[zone]
+
+  def _CheckPortsOpen(self, unused_instance_name, unused_ip_address,
+                      unused_ports):
+    return True
+
+  def _CheckSshReady(self, unused_instance_name):
+    return True
+
+
+def _PeakMemoryMb():
+  """Returns peak resident memory of this process in MB."""
+  return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+def _Run(action, cluster, queue):
+  """Runs the action on the cluster, and puts the measurements to queue.
+
+  Args:
+    action: 'start' or 'teardown'.
+    cluster: _BenchmarkCluster object.
+    queue: multiprocessing.Queue object to put tuple of wall time, increase
+        of peak memory in MB, error message or None, and dictionary of
+        request counts of GceApi.
+  """
+  memory_before = _PeakMemoryMb()
+  start = time.time()
+  error = None
+  try:
+    if action == 'start':
+      cluster.StartCluster()
+    else:
+      cluster.TeardownCluster()
+  except (gce_cluster.ClusterSetUpError,
+          gce_cluster.ClusterDeletionTimeout) as e:
+    error = str(e)
+  except Exception as e:  # pylint: disable=broad-except
+    # Report unexpected error as the result instead of leaving the parent
+    # waiting.
+    logging.exception('%s failed', action)
+    error = '%s: %s' % (type(e).__name__, e)
+  request_counts = collections.Counter()
+  for api in cluster.apis.values():
+    request_counts.update(api.request_counts)
+  queue.put((time.time() - start, _PeakMemoryMb() - memory_before, error,
+             dict(request_counts)))
+
+
+def Benchmark(server, action, workers, time_scale=DEFAULT_TIME_SCALE,
+              concurrency=0):
+  """Starts or tears down cluster on the fake server in child process.
+
+  Args:
+    server: FakeComputeServer object that is running.
+    action: 'start' or 'teardown'.
+    workers: Number of workers.
+    time_scale: Ratio to multiply the intervals of status checks by.
+    concurrency: Number of workers provisioned in parallel.  The default of
+        GceCluster if 0.
+  Returns:
+    Result object.
+  """
+  flags = argparse.Namespace(
+      project='benchmark', bucket='benchmark', prefix='', zone='',
+      num_workers=workers, machinetype='', image='', command='',
+      external_ip='all', concurrency=concurrency, keep_disks=False)
+  local_dir = tempfile.mkdtemp()
+  try:
+    cluster = _BenchmarkCluster(flags, server, time_scale, local_dir)
+    api_calls = server.api_call_count
+    http_requests = server.http_request_count
+    method_counts = collections.Counter(server.method_counts)
+
+    queue = multiprocessing.Queue()
+    process = multiprocessing.Process(target=_Run,
+                                      args=(action, cluster, queue))
+    process.start()
+    seconds, peak_memory_mb, error, request_counts = queue.get()
+    process.join()
+  finally:
+    shutil.rmtree(local_dir, ignore_errors=True)
+
+  method_counts = collections.Counter(server.method_counts) - method_counts
+  return Result(action, workers, server.api_call_count - api_calls,
+                server.http_request_count - http_requests,
+                request_counts.get('throttled', 0),
+                request_counts.get('retried', 0), seconds, peak_memory_mb,
+                dict(method_counts), error)
+
+
+def FormatResults(results):
+  """Returns lines of table of the results.
+
+  Each result is followed by a line of API calls by method.
+
+  Args:
+    results: List of Result objects.
+  Returns:
+    List of lines of the table.
+  """
+  lines = ['%-8s %7s %9s %8s %9s %7s %9s %8s  %s' % (
+      'action', 'workers', 'api-calls', 'requests', 'throttled', 'retried',
+      'seconds', 'memory', 'status')]
+  for result in results:
+    lines.append('%-8s %7d %9d %8d %9d %7d %8.1fs %6.1fMB  %s' % (
+        result.action, result.workers, result.api_calls,
+        result.http_requests, result.throttled, result.retried,
+        result.seconds, result.peak_memory_mb, result.error or 'ok'))
+    lines.append('    ' + ' '.join(
+        '%s=%d' % item for item in sorted(result.method_counts.iteritems())))
+  return lines
+
+
+def main(argv, stdout=sys.stdout):
+  parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+  parser.add_argument(
+      '--workers', type=int, nargs='+', default=DEFAULT_WORKERS,
+      help='Numbers of workers of the clusters.')
+  parser.add_argument(
+      '--provisioning-seconds', type=float, dest='provisioning_seconds',
+      default=DEFAULT_PROVISIONING_SECONDS,
+      help='Time for operations on disks and instances to finish.')
+  parser.add_argument(
+      '--request-latency', type=float, dest='request_latency', default=0.0,
+      help='Time in seconds for the server to respond to each HTTP request.')
+  parser.add_argument(
+      '--time-scale', type=float, dest='time_scale',
+      default=DEFAULT_TIME_SCALE,
+      help='Ratio to multiply the intervals of status checks by.')
+  parser.add_argument(
+      '--concurrency', type=int, default=0,
+      help='Number of workers provisioned in parallel.')
+  parser.add_argument(
+      '--instance-quota', type=int, dest='instance_quota',
+      help='Maximum number of instances, beyond which creation fails.')
+  parser.add_argument(
+      '--disk-quota', type=int, dest='disk_quota',
+      help='Maximum number of disks, beyond which creation fails.')
+  parser.add_argument(
+      '--server-rate-limit', type=int, dest='server_rate_limit',
+      help='Maximum number of API calls per second, beyond which calls '
+      'fail with rate limit error.')
+  parser.add_argument(
+      '--max-calls-per-worker', type=float, dest='max_calls_per_worker',
+      help='Fails if any run makes more API calls per worker than this.')
+  flags = parser.parse_args(argv)
+
+  quotas = {}
+  if flags.instance_quota is not None:
+    quotas['instances'] = flags.instance_quota
+  if flags.disk_quota is not None:
+    quotas['disks'] = flags.disk_quota
+
+  results = []
+  for workers in flags.workers:
+    server = fake_compute_server.FakeComputeServer(
+        provisioning_seconds=flags.provisioning_seconds,
+        request_latency=flags.request_latency, quotas=quotas,
+        rate_limit=flags.server_rate_limit)
+    server.Start()
+    try:
+      for action in ['start', 'teardown']:
+        logging.info('Benchmarking %s of %d workers', action, workers)
+        results.append(Benchmark(server, action, workers, flags.time_scale,
+                                 flags.concurrency))
+    finally:
+      server.Stop()
+
+  for line in FormatResults(results):
+    stdout.write(line + '\n')
+
+  if flags.max_calls_per_worker is not None:
+    exceeded = [result for result in results
+                if result.api_calls > flags.max_calls_per_worker *
+                result.workers]
+    for result in exceeded:
+      logging.error('%s of %d workers made %d API calls, more than %g per '
+                    'worker', result.action, result.workers,
+                    result.api_calls, flags.max_calls_per_worker)
+    if exceeded:
+      return 1
+  return 0
+
+
+if __name__ == '__main__':
+  logging.basicConfig(level=logging.WARNING)
+  sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,153 @@
+#!/usr/bin/env python
+# Copyright 2013 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Unit tests of control_plane_benchmark.py."""
+
+
+
+import StringIO
+import unittest
+
+import control_plane_benchmark
+import fake_compute_server
+
+
+# Provisioning on the fake server and status checks run 400 times as fast
+# as the real ones.
+PROVISIONING_SECONDS = 0.05
+TIME_SCALE = 0.0025
+
+
+class ControlPlaneBenchmarkTest(unittest.TestCase):
+  """Unit test class of control_plane_benchmark."""
+
+  def _StartServer(self, quotas=None, rate_limit=None):
+    server = fake_compute_server.FakeComputeServer(
+        provisioning_seconds=PROVISIONING_SECONDS, quotas=quotas,
+        rate_limit=rate_limit)
+    server.Start()
+    self.addCleanup(server.Stop)
+    return server
+
+  def testBenchmark(self):
+    """Unit test of Benchmark() starting and tearing down cluster."""
+    server = self._StartServer()
+
+    start = control_plane_benchmark.Benchmark(
+        server, 'start', 5, time_scale=TIME_SCALE)
+
+    self.assertIsNone(start.error)
+    self.assertEqual(6, len(server.resources['instances']))
+    self.assertEqual(12, len(server.resources['disks']))
+    self.assertEqual(6, start.method_counts['instances.insert'])
+    self.assertEqual(12, start.method_counts['disks.insert'])
+    self.assertEqual(sum(start.method_counts.values()), start.api_calls)
+    # Disks are created by batch requests.
+    self.assertLess(start.http_requests, start.api_calls)
+    self.assertLess(PROVISIONING_SECONDS, start.seconds)
+
+    teardown = control_plane_benchmark.Benchmark(
+        server, 'teardown', 5, time_scale=TIME_SCALE)
+
+    self.assertIsNone(teardown.error)
+    self.assertFalse(server.resources['instances'])
+    self.assertFalse(server.resources['disks'])
+    self.assertEqual(6, teardown.method_counts['instances.delete'])
+    self.assertEqual(12, teardown.method_counts['disks.delete'])
+
+  def testBenchmark_Scaling(self):
+    """Unit test of Benchmark() for API calls growing with workers."""
+    results = {}
+    for workers in [4, 40]:
+      server = self._StartServer()
+      results[workers] = control_plane_benchmark.Benchmark(
+          server, 'start', workers, time_scale=TIME_SCALE)
+
+    # Calls that create disks and instances grow with the workers, while
+    # status checks don't, as they are made for all workers together.
+    for workers, result in results.iteritems():
+      self.assertIsNone(result.error)
+      self.assertLess(result.api_calls, 5 * workers + 50)
+    self.assertEqual(
+        results[4].method_counts['instances.list'],
+        results[40].method_counts['instances.list'])
+
+  def testBenchmark_Quota(self):
+    """Unit test of Benchmark() with instances beyond the quota."""
+    server = self._StartServer(quotas={'instances': 3})
+
+    start = control_plane_benchmark.Benchmark(
+        server, 'start', 4, time_scale=TIME_SCALE)
+
+    self.assertRegexpMatches(start.error, 'hw-00\\d')
+    self.assertEqual(3, len(server.resources['instances']))
+
+    # Teardown deletes the instances and the disks that were created.
+    teardown = control_plane_benchmark.Benchmark(
+        server, 'teardown', 4, time_scale=TIME_SCALE)
+
+    self.assertIsNone(teardown.error)
+    self.assertFalse(server.resources['instances'])
+    self.assertFalse(server.resources['disks'])
+
+  def testBenchmark_RateLimit(self):
+    """Unit test of Benchmark() retrying API calls beyond the rate limit."""
+    server = self._StartServer(rate_limit=10)
+
+    start = control_plane_benchmark.Benchmark(
+        server, 'start', 2, time_scale=TIME_SCALE)
+
+    self.assertIsNone(start.error)
+    self.assertEqual(3, len(server.resources['instances']))
+    self.assertLess(0, start.retried)
+
+  def testFormatResults(self):
+    """Unit test of FormatResults()."""
+    lines = control_plane_benchmark.FormatResults([
+        control_plane_benchmark.Result(
+            'start', 100, 560, 160, 300, 12, 9.75, 19.4,
+            {'instances.insert': 101, 'disks.insert': 202}, None),
+        control_plane_benchmark.Result(
+            'teardown', 100, 50, 20, 0, 0, 1.0, 3.0, {}, 'Deletion failed'),
+    ])
+
+    self.assertEqual(5, len(lines))
+    self.assertEqual(
+        ['start', '100', '560', '160', '300', '12', '9.8s', '19.4MB', 'ok'],
+        lines[1].split())
+    self.assertEqual(['disks.insert=202', 'instances.insert=101'],
+                     lines[2].split())
+    self.assertTrue(lines[3].endswith('Deletion failed'))
+
+  def testMain(self):
+    """Unit test of main() with the limit of API calls per worker."""
+    args = ['--workers', '2', '--provisioning-seconds',
+            str(PROVISIONING_SECONDS), '--time-scale', str(TIME_SCALE)]
+    stdout = StringIO.StringIO()
+
+    self.assertEqual(0, control_plane_benchmark.main(
+        args + ['--max-calls-per-worker', '100'], stdout))
+
+    lines = stdout.getvalue().splitlines()
+    self.assertEqual('action', lines[0].split()[0])
+    self.assertEqual(['start', '2'], lines[1].split()[:2])
+    self.assertEqual(['teardown', '2'], lines[3].split()[:2])
+
+    self.assertEqual(1, control_plane_benchmark.main(
+        args + ['--max-calls-per-worker', '1'], StringIO.StringIO()))
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,553 @@
+#!/usr/bin/env python
+# Copyright 2013 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Local fake server of Google Compute Engine API for testing."""
+
+
+
+import BaseHTTPServer
+import collections
+import email.parser
+import heapq
+import json
+import re
+import socket
+import SocketServer
+import threading
+import time
+import urlparse
+
+
+class FakeComputeServer(object):
+  """In-process HTTP server that emulates subset of Compute Engine API.
+
+  The server serves its own discovery document, so that Google Client API
+  library can be used against it without modification.  Instances, disks
+  and zone operations can be got, listed, inserted and deleted, either by
+  individual requests or by batch requests.  Routes and machine types are
+  served as well.
+
+  All operations finish immediately by default.  With provisioning_seconds,
+  operations go through PENDING and RUNNING, and the resources through the
+  intermediate statuses, such as PROVISIONING and STAGING of instances,
+  before the operations get DONE.  Resources being deleted are listed until
+  their deletion finishes.  Creation beyond the quota of the collection
+  results in operation with QUOTA_EXCEEDED error, as the real API does.
+  API calls beyond rate_limit per second fail with 403 rateLimitExceeded
+  error, and InjectErrors() makes the next API calls fail with the status.
+
+  Usage:
+    server = FakeComputeServer(provisioning_seconds=5, quotas={'disks': 100})
+    server.Start()
+    gce_api.GceApi.DISCOVERY_URI = server.discovery_uri
+    ...
+    server.Stop()
+  """
+
+  API_VERSION = 'v1'
+  # Maximum number of resources in single page of list response.
+  PAGE_SIZE = 500
+  # Statuses of the resources while created, and after created.
+  CREATION_STATUS = {
+      'instances': ['PROVISIONING', 'STAGING', 'RUNNING'],
+      'disks': ['CREATING', 'READY'],
+      'routes': ['READY'],
+  }
+  # Status of the resources while deleted.
+  DELETION_STATUS = {
+      'instances': 'STOPPING',
+      'disks': 'DELETING',
+      'routes': 'DELETING',
+  }
+  MACHINE_TYPES = {
+      'n1-standard-1': (1, 3840),
+      'n1-standard-4': (4, 15360),
+      'n1-highcpu-4': (4, 3686),
+      'n1-highmem-4': (4, 26624),
+  }
+
+  def __init__(self, provisioning_seconds=0, request_latency=0,
+               quotas=None, rate_limit=None, clock=time.time):
+    """Constructor.
+
+    Args:
+      provisioning_seconds: Time for operations to finish.
+      request_latency: Time in seconds that the server takes to respond to
+          each HTTP request.
+      quotas: Dictionary of collection name, 'instances' or 'disks', to the
+          maximum number of the resources.
+      rate_limit: Maximum number of API calls in each second.  Unlimited if
+          not specified.
+      clock: Function that returns current time in seconds.
+    """
+    self.provisioning_seconds = provisioning_seconds
+    self.request_latency = request_latency
+    self.quotas = quotas or {}
+    self.rate_limit = rate_limit
+    self._clock = clock
+    self._lock = threading.Lock()
+    self._server = None
+    self._thread = None
+    self._operation_count = 0
+    # Heap of the time, sequence number and function of status changes
+    # scheduled by the operations.
+    self._events = []
+    self._event_count = 0
+    # Start time of the current second of the rate limit, and the number of
+    # API calls in it.
+    self._rate_window = None
+    self._rate_window_calls = 0
+    self._injected_errors = collections.deque()
+    # Dictionary of collection name to dictionary of name to resource.
+    self.resources = {
+        'instances': {},
+        'disks': {},
+        'operations': {},
+        'routes': {},
+        'machineTypes': dict(
+            (name, {'name': name, 'guestCpus': cpus, 'memoryMb': memory_mb})
+            for name, (cpus, memory_mb) in self.MACHINE_TYPES.iteritems()),
+    }
+    # Number of HTTP requests received, counting batch request as one.
+    self.http_request_count = 0
+    # Number of API calls received, counting each call in batch request.
+    self.api_call_count = 0
+    # Number of API calls by method, such as 'instances.insert'.
+    self.method_counts = collections.Counter()
+
+  def Start(self):
+    """Starts the server in background thread."""
+    fake = self
+
+    class Handler(_FakeComputeRequestHandler):
+      server_fake = fake
+
+    self._server = _ThreadingHTTPServer(('localhost', 0), Handler)
+    self._thread = threading.Thread(target=self._server.serve_forever,
+                                    kwargs={'poll_interval': 0.05})
+    self._thread.daemon = True
+    self._thread.start()
+
+  def Stop(self):
+    """Stops the server."""
+    self._server.shutdown()
+    self._server.server_close()
+    self._thread.join()
+
+  @property
+  def url(self):
+    return 'http://localhost:%d/' % self._server.server_address[1]
+
+  @property
+  def discovery_uri(self):
+    return self.url + 'discovery/v1/apis/{api}/{apiVersion}/rest'
+
+  def DiscoveryDocument(self):
+    """Returns discovery document of the fake API as JSON string."""
+    list_parameters = {
+        'filter': {'type': 'string', 'location': 'query'},
+        'maxResults': {'type': 'integer', 'location': 'query'},
+        'pageToken': {'type': 'string', 'location': 'query'},
+    }
+
+    def Methods(collection, id_parameter, resource_schema, zonal=True,
+                method_names=('get', 'list', 'insert', 'delete')):
+      scope_parameters = {
+          'project': {'type': 'string', 'required': True,
+                      'location': 'path'},
+      }
+      if zonal:
+        scope_parameters['zone'] = {
+            'type': 'string', 'required': True, 'location': 'path'}
+        path = '{project}/zones/{zone}/%s' % collection
+      else:
+        path = '{project}/global/%s' % collection
+      scope_order = sorted(scope_parameters)
+      item_path = '%s/{%s}' % (path, id_parameter)
+      item_parameters = dict(scope_parameters)
+      item_parameters[id_parameter] = {
+          'type': 'string', 'required': True, 'location': 'path'}
+      list_method_parameters = dict(scope_parameters)
+      list_method_parameters.update(list_parameters)
+      insert_parameters = dict(scope_parameters)
+      insert_parameters['sourceImage'] = {
+          'type': 'string', 'location': 'query'}
+      methods = {
+          'get': {'path': item_path, 'httpMethod': 'GET',
+                  'parameters': item_parameters,
+                  'parameterOrder': scope_order + [id_parameter],
+                  'response': {'$ref': resource_schema}},
+          'list': {'path': path, 'httpMethod': 'GET',
+                   'parameters': list_method_parameters,
+                   'parameterOrder': scope_order,
+                   'response': {'$ref': 'List'}},
+          'insert': {'path': path, 'httpMethod': 'POST',
+                     'parameters': insert_parameters,
+                     'parameterOrder': scope_order,
+                     'request': {'$ref': resource_schema},
+                     'response': {'$ref': 'Operation'}},
+          'delete': {'path': item_path, 'httpMethod': 'DELETE',
+                     'parameters': item_parameters,
+                     'parameterOrder': scope_order + [id_parameter],
+                     'response': {'$ref': 'Operation'}},
+      }
+      for name in methods.keys():
+        if name in method_names:
+          methods[name]['id'] = 'compute.%s.%s' % (collection, name)
+        else:
+          del methods[name]
+      return {'methods': methods}
+
+    document = {
+        'kind': 'discovery#restDescription',
+        'name': 'compute',
+        'version': self.API_VERSION,
+        'rootUrl': self.url,
+        'servicePath': 'compute/%s/projects/' % self.API_VERSION,
+        'schemas': {
+            'Instance': {'id': 'Instance', 'type': 'object'},
+            'Disk': {'id': 'Disk', 'type': 'object'},
+            'Operation': {'id': 'Operation', 'type': 'object'},
+            'Route': {'id': 'Route', 'type': 'object'},
+            'MachineType': {'id': 'MachineType', 'type': 'object'},
+            'List': {'id': 'List', 'type': 'object', 'properties': {
+                'items': {'type': 'array', 'items': {'type': 'object'}},
+                'nextPageToken': {'type': 'string'},
+            }},
+        },
+        'resources': {
+            'instances': Methods('instances', 'instance', 'Instance'),
+            'disks': Methods('disks', 'disk', 'Disk'),
+            'zoneOperations': Methods(
+                'operations', 'operation', 'Operation',
+                method_names=('get', 'list', 'delete')),
+            'routes': Methods('routes', 'route', 'Route', zonal=False),
+            'machineTypes': Methods(
+                'machineTypes', 'machineType', 'MachineType',
+                method_names=('get', 'list')),
+        },
+    }
+    return json.dumps(document)
+
+  def InjectErrors(self, status, count=1):
+    """Makes the next API calls fail with the HTTP status.
+
+    Args:
+      status: HTTP status code of the error, e.g. 503.
+      count: Number of the API calls to fail.
+    """
+    with self._lock:
+      self._injected_errors.extend([status] * count)
+
+  def _IsRateLimited(self):
+    """Counts API call and checks if it exceeds the rate limit."""
+    if self.rate_limit is None:
+      return False
+    window = int(self._clock())
+    if window != self._rate_window:
+      self._rate_window = window
+      self._rate_window_calls = 0
+    self._rate_window_calls += 1
+    return self._rate_window_calls > self.rate_limit
+
+  def CountHttpRequest(self):
+    with self._lock:
+      self.http_request_count += 1
+
+  def HandleRequest(self, method, path, body):
+    """Handles single API call.
+
+    Args:
+      method: HTTP method.
+      path: Request path including query string.
+      body: Request body.
+    Returns:
+      Tuple of HTTP status code and response body in dictionary.
+    """
+    with self._lock:
+      self.api_call_count += 1
+      self._ProcessEvents()
+      parsed = urlparse.urlparse(path)
+      match = re.match(
+          '^/compute/%s/projects/([^/]+)/(?:zones/([^/]+)|global)/'
+          '(instances|disks|operations|routes|machineTypes)(?:/([^/]+))?$' %
+          self.API_VERSION, parsed.path)
+      if not match:
+        return _Error(404, 'Unknown path: %s' % parsed.path)
+      project, zone, collection, name = match.groups()
+      query = dict(urlparse.parse_qsl(parsed.query))
+      self.method_counts['%s.%s' % (collection, _MethodName(method, name))] += 1
+      if self._injected_errors:
+        status = self._injected_errors.popleft()
+        return _Error(status, 'Injected error %d' % status)
+      if self._IsRateLimited():
+        return _Error(403, 'Rate limit exceeded', reason='rateLimitExceeded')
+
+      if method == 'GET' and name:
+        if name not in self.resources[collection]:
+          return _Error(404, 'Not found: %s' % name)
+        return 200, self.resources[collection][name]
+      elif method == 'GET':
+        return 200, self._List(collection, query)
+      elif (method == 'POST' and not name and
+            collection in self.CREATION_STATUS):
+        resource = json.loads(body)
+        name = resource['name']
+        if name in self.resources[collection]:
+          return _Error(409, 'Already exists: %s' % name)
+        self_link = self._SelfLink(project, zone, collection, name)
+        if len(self.resources[collection]) >= self.quotas.get(
+            collection, float('inf')):
+          return 200, self._Operation(
+              'insert', self_link, zone,
+              error=('QUOTA_EXCEEDED', 'Quota of %s exceeded: limit %d' % (
+                  collection, self.quotas[collection])))
+        statuses = self.CREATION_STATUS[collection]
+        resource['status'] = statuses[0]
+        resource['selfLink'] = self_link
+        self.resources[collection][name] = resource
+
+        def SetStatus(status):
+          return lambda: resource.update(status=status)
+        return 200, self._Operation(
+            'insert', self_link, zone,
+            [SetStatus(status) for status in statuses[1:]])
+      elif (method == 'DELETE' and name and
+            collection in self.CREATION_STATUS):
+        if name not in self.resources[collection]:
+          return _Error(404, 'Not found: %s' % name)
+        resource = self.resources[collection][name]
+        resource['status'] = self.DELETION_STATUS[collection]
+
+        def Delete():
+          if self.resources[collection].get(name) is resource:
+            del self.resources[collection][name]
+        return 200, self._Operation('delete', resource['selfLink'], zone,
+                                    [Delete])
+      elif method == 'DELETE' and name and collection == 'operations':
+        if name not in self.resources[collection]:
+          return _Error(404, 'Not found: %s' % name)
+        del self.resources[collection][name]
+        return 204, {}
+      return _Error(400, 'Unsupported request: %s %s' % (method, path))
+
+  def HandleBatchRequest(self, content_type, body):
+    """Handles batch request.
+
+    Args:
+      content_type: Content-Type header of the request.
+      body: Request body in multipart/mixed format.
+    Returns:
+      Tuple of Content-Type header and body of the response.
+    """
+    message = email.parser.Parser().parsestr(
+        'Content-Type: %s\r\n\r\n%s' % (content_type, body))
+    boundary = 'batch_boundary'
+    parts = []
+    for part in message.get_payload():
+      request_line, request = part.get_payload().split('\n', 1)
+      method, path, _ = request_line.split(' ', 2)
+      headers_and_body = re.split('\r?\n\r?\n', request, 1)
+      request_body = headers_and_body[1] if len(headers_and_body) > 1 else ''
+      status, response = self.HandleRequest(method, path, request_body)
+      content_id = part['Content-ID'].replace('<', '<response-', 1)
+      parts.append(
+          '--%s\r\nContent-Type: application/http\r\nContent-ID: %s\r\n\r\n'
+          'HTTP/1.1 %d %s\r\nContent-Type: application/json\r\n\r\n%s\r\n' % (
+              boundary, content_id, status,
+              BaseHTTPServer.BaseHTTPRequestHandler.responses.get(
+                  status, ('Error',))[0],
+              json.dumps(response)))
+    parts.append('--%s--\r\n' % boundary)
+    return 'multipart/mixed; boundary=%s' % boundary, ''.join(parts)
+
+  def _List(self, collection, query):
+    """Returns a page of list response of the collection."""
+    items = sorted(self.resources[collection].values(),
+                   key=lambda r: r['name'])
+    if 'filter' in query:
+      field, pattern = re.match(
+          r'^(\w+) eq "?(.*?)"?$', query['filter']).groups()
+      items = [r for r in items if re.match(pattern, str(r.get(field)))]
+    start = int(query.get('pageToken', 0))
+    end = start + int(query.get('maxResults', self.PAGE_SIZE))
+    response = {'items': items[start:end]}
+    if end < len(items):
+      response['nextPageToken'] = str(end)
+    return response
+
+  def _ScopeUrl(self, project, zone):
+    scope = 'zones/%s' % zone if zone else 'global'
+    return '%scompute/%s/projects/%s/%s' % (
+        self.url, self.API_VERSION, project, scope)
+
+  def _SelfLink(self, project, zone, collection, name):
+    return '%s/%s/%s' % (self._ScopeUrl(project, zone), collection, name)
+
+  def _Operation(self, operation_type, target_link, zone=None, steps=(),
+                 error=None):
+    """Creates operation resource working on the target.
+
+    The operation is DONE immediately without provisioning_seconds.
+    Otherwise it is PENDING and RUNNING for the first and the second half
+    of the time.
+
+    Args:
+      operation_type: Type of the operation, such as 'insert'.
+      target_link: URL of the target resource.
+      zone: Zone name of zone operation.
+      steps: Functions that change the target, called at even intervals
+          while the operation runs.  The last one is called when the
+          operation finishes.
+      error: Tuple of error code and message if the operation fails.
+    Returns:
+      Operation resource.
+    """
+    self._operation_count += 1
+    name = 'operation-%d' % self._operation_count
+    operation = {
+        'kind': 'compute#operation',
+        'name': name,
+        'operationType': operation_type,
+        'targetLink': target_link,
+        'status': 'PENDING',
+    }
+    if zone:
+      operation['zone'] = '%s/%s' % (self.url.rstrip('/'), zone)
+    if error:
+      operation['error'] = {'errors': [{'code': error[0],
+                                        'message': error[1]}]}
+      operation['status'] = 'DONE'
+    self.resources['operations'][name] = operation
+    if error:
+      return dict(operation)
+
+    def SetStatus(status):
+      return lambda: operation.update(status=status)
+    steps = list(steps) or [lambda: None]
+    # Operation is RUNNING from the half of the time until the last step.
+    now = self._clock()
+    duration = self.provisioning_seconds
+    self._Schedule(now + duration / 2.0, SetStatus('RUNNING'))
+    for i, step in enumerate(steps[:-1]):
+      self._Schedule(now + duration * (i + 1) / len(steps), step)
+    self._Schedule(now + duration, steps[-1])
+    self._Schedule(now + duration, SetStatus('DONE'))
+    self._ProcessEvents()
+    return dict(operation)
+
+  def _Schedule(self, event_time, function):
+    self._event_count += 1
+    heapq.heappush(self._events, (event_time, self._event_count, function))
+
+  def _ProcessEvents(self):
+    """Applies the status changes that are due."""
+    now = self._clock()
+    while self._events and self._events[0][0] <= now:
+      heapq.heappop(self._events)[2]()
+
+
+class _ThreadingHTTPServer(SocketServer.ThreadingMixIn,
+                           BaseHTTPServer.HTTPServer):
+  """HTTP server that handles each keep-alive connection in its own thread."""
+  daemon_threads = True
+
+  def __init__(self, *args):
+    BaseHTTPServer.HTTPServer.__init__(self, *args)
+    self._connections = set()
+    self._connections_lock = threading.Lock()
+
+  def process_request(self, request, client_address):
+    with self._connections_lock:
+      self._connections.add(request)
+    SocketServer.ThreadingMixIn.process_request(self, request, client_address)
+
+  def shutdown_request(self, request):
+    with self._connections_lock:
+      self._connections.discard(request)
+    BaseHTTPServer.HTTPServer.shutdown_request(self, request)
+
+  def server_close(self):
+    """Closes the server and the connections kept alive by the clients."""
+    BaseHTTPServer.HTTPServer.server_close(self)
+    with self._connections_lock:
+      for request in self._connections:
+        try:
+          request.shutdown(socket.SHUT_RDWR)
+        except socket.error:
+          pass
+
+
+def _MethodName(http_method, name):
+  """Returns API method name of the request."""
+  if http_method == 'GET':
+    return 'get' if name else 'list'
+  return {'POST': 'insert', 'DELETE': 'delete'}.get(http_method, http_method)
+
+
+def _Error(code, message, reason=None):
+  """Returns error response of the API."""
+  error = {'message': message}
+  if reason:
+    error['reason'] = reason
+  return code, {'error': {
+      'code': code,
+      'message': message,
+      'errors': [error],
+  }}
+
+
+class _FakeComputeRequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+  """HTTP request handler of FakeComputeServer."""
+
+  # Keep connections alive as the real API does.
+  protocol_version = 'HTTP/1.1'
+  server_fake = None
+
+  def do_GET(self):  # pylint: disable=g-bad-name
+    self._Handle('GET')
+
+  def do_POST(self):  # pylint: disable=g-bad-name
+    self._Handle('POST')
+
+  def do_DELETE(self):  # pylint: disable=g-bad-name
+    self._Handle('DELETE')
+
+  def _Handle(self, method):
+    """Dispatches request to FakeComputeServer."""
+    fake = self.server_fake
+    body = self.rfile.read(int(self.headers.getheader('content-length', 0)))
+    fake.CountHttpRequest()
+    if fake.request_latency:
+      time.sleep(fake.request_latency)
+    content_type = 'application/json'
+    if self.path.startswith('/discovery/'):
+      status, content = 200, fake.DiscoveryDocument()
+    elif self.path == '/batch':
+      status = 200
+      content_type, content = fake.HandleBatchRequest(
+          self.headers.getheader('content-type'), body)
+    else:
+      status, response = fake.HandleRequest(method, self.path, body)
+      content = json.dumps(response)
+
+    self.send_response(status)
+    self.send_header('Content-Type', content_type)
+    self.send_header('Content-Length', str(len(content)))
+    self.end_headers()
+    self.wfile.write(content)
+
+  def log_message(self, *unused_args):
+    pass
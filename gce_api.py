@@ -17,12 +17,18 @@
 
 
 
+import collections
+import json
 import logging
 import os
 import os.path
+import random
+import threading
+import time
 
 import apiclient.discovery
 import apiclient.errors
+import apiclient.http
 import httplib2
 
 import oauth2client.client
@@ -37,13 +43,144 @@ class ResourceZoning(object):
   ZONE = 2
 
 
+def OperationTargetName(operation):
+  """Returns the name of the resource the operation works on."""
+  return operation.get('targetLink', '').split('/')[-1]
+
+
+class Backoff(object):
+  """Generates wait intervals that grow exponentially with random jitter.
+
+  The interval starts with the initial interval, and is multiplied every time
+  up to the maximum interval.  Each interval is randomized by the jitter ratio
+  so that concurrent pollers don't send requests at the same moment.
+  """
+
+  def __init__(self, initial_interval, max_interval,
+               multiplier=1.5, jitter=0.2):
+    """Constructor.
+
+    Args:
+      initial_interval: The first interval in seconds.
+      max_interval: Maximum interval in seconds.
+      multiplier: Ratio to grow the interval each time.
+      jitter: Maximum ratio of the random change of the interval.
+    """
+    self._initial_interval = initial_interval
+    self._max_interval = max_interval
+    self._multiplier = multiplier
+    self._jitter = jitter
+    self._interval = initial_interval
+
+  def Reset(self):
+    """Makes the next interval the initial interval."""
+    self._interval = self._initial_interval
+
+  def NextInterval(self):
+    """Returns the next wait interval in seconds."""
+    interval = self._interval * (
+        1 + random.uniform(-self._jitter, self._jitter))
+    self._interval = min(self._interval * self._multiplier,
+                         self._max_interval)
+    return interval
+
+  def Sleep(self, deadline=None):
+    """Sleeps for the next interval, but not beyond the deadline.
+
+    Args:
+      deadline: Time in seconds since the epoch not to sleep beyond.
+    """
+    interval = self.NextInterval()
+    if deadline is not None:
+      interval = max(0, min(interval, deadline - time.time()))
+    time.sleep(interval)
+
+
+class RateLimiter(object):
+  """Token bucket that limits the rate of API calls across threads.
+
+  Tokens are added at the rate up to the burst size, and each API call
+  takes one token.  Callers that find no token reserve the next one and
+  sleep until it is added, so that waiting callers proceed in turn.
+  """
+
+  # Default rate limit of Compute Engine API per project.
+  DEFAULT_CALLS_PER_SECOND = 20
+  DEFAULT_BURST = 100
+
+  def __init__(self, calls_per_second=DEFAULT_CALLS_PER_SECOND,
+               burst=DEFAULT_BURST):
+    """Constructor.
+
+    Args:
+      calls_per_second: Rate at which tokens are added.
+      burst: Maximum number of tokens, which is the number of API calls
+          that can be made at once.
+    """
+    self._calls_per_second = float(calls_per_second)
+    self._burst = burst
+    self._tokens = float(burst)
+    self._last_time = time.time()
+    self._lock = threading.Lock()
+
+  def Acquire(self, count=1):
+    """Takes tokens for API calls, waiting until they are available.
+
+    Args:
+      count: Number of API calls.  Calls beyond the burst size are counted
+          as the burst size, so that large batch never waits forever.
+    Returns:
+      Time waited in seconds.
+    """
+    count = min(count, self._burst)
+    with self._lock:
+      now = time.time()
+      # Clock may go backward, e.g. when it is adjusted.
+      elapsed = max(0, now - self._last_time)
+      self._tokens = min(self._tokens + elapsed * self._calls_per_second,
+                         self._burst)
+      self._last_time = now
+      self._tokens -= count
+      wait = max(0, -self._tokens / self._calls_per_second)
+    if wait:
+      time.sleep(wait)
+    return wait
+
+
 class GceApi(object):
   """Google Client API wrapper for Google Compute Engine."""
 
   COMPUTE_ENGINE_SCOPE = 'https://www.googleapis.com/auth/compute'
   COMPUTE_ENGINE_API_VERSION = 'v1'
+  DISCOVERY_URI = apiclient.discovery.DISCOVERY_URI
 
-  def __init__(self, name, client_id, client_secret, project, zone):
+  OPERATION_WAIT_INITIAL_INTERVAL = 1
+  OPERATION_WAIT_MAX_INTERVAL = 10
+  # Maximum number of operation names in the filter of single list request.
+  MAX_OPERATIONS_PER_LIST = 50
+  # Maximum number of API calls in single batch request.
+  MAX_REQUESTS_PER_BATCH = 100
+  # Name of the path parameter to identify the resource for each type.
+  RESOURCE_ID_PARAMETERS = {
+      'instances': 'instance',
+      'disks': 'disk',
+  }
+  # Discovery document cached on local disk is refreshed after this period.
+  DISCOVERY_CACHE_MAX_AGE = 24 * 60 * 60
+  # API calls failed with rate limit errors or server errors are retried
+  # up to MAX_RETRIES times with exponential backoff.
+  MAX_RETRIES = 5
+  RETRY_INITIAL_INTERVAL = 1
+  RETRY_MAX_INTERVAL = 30
+  # Reasons of 403 errors that mean the rate limit, rather than permission.
+  RATE_LIMIT_REASONS = ('rateLimitExceeded', 'userRateLimitExceeded')
+  # HTTP methods of the API calls that can be sent again after server
+  # errors.  Insertion may have been done in spite of the error, so that
+  # it's retried only when the server rejected it by the rate limit.
+  IDEMPOTENT_METHODS = ('GET', 'DELETE')
+
+  def __init__(self, name, client_id, client_secret, project, zone,
+               rate_limiter=None):
     """Constructor.
 
     Args:
@@ -52,38 +189,122 @@ class GceApi(object):
       client_secret: Client secret of the user of the class.
       project: Project ID.
       zone: Zone name, e.g. 'us-east-a'
+      rate_limiter: RateLimiter object shared with the other GceApi objects
+          of the project.  New RateLimiter with the default rate if not
+          specified.
     """
     self._name = name
     self._client_id = client_id
     self._client_secret = client_secret
     self._project = project
     self._zone = zone
+    self._lock = threading.Lock()
+    self._credentials = None
+    self._discovery_document = None
+    # API object and its HTTP connection are kept per thread, since
+    # httplib2.Http is not thread-safe.
+    self._thread_local = threading.local()
+    self.rate_limiter = rate_limiter or RateLimiter()
+    self._counts_lock = threading.Lock()
+    # Number of API calls by what happened to them.  'throttled' calls
+    # waited for the rate limiter, 'rate_limited' calls were rejected by the
+    # rate limit of the server, and 'retried' calls were sent again.
+    self.request_counts = collections.Counter()
 
   def GetApi(self):
     """Does OAuth2 authorization and prepares Google Compute Engine API.
 
-    Since access keys may expire at any moment, call the function every time
-    making API call.
+    API object is created once per thread and reused by the subsequent calls,
+    so that the HTTP connection is kept alive between API calls.  Access token
+    is refreshed by the credentials object when it expires, and new API object
+    is created only when credentials themselves are replaced.
 
     Returns:
       Google Client API object for Google Compute Engine.
     """
-    # First, check local file for credentials.
-    homedir = os.environ['HOME']
-    storage = oauth2client.file.Storage(
-        os.path.join(homedir, '.%s.credentials' % self._name))
-    credentials = storage.get()
+    credentials = self._GetCredentials()
+    local = self._thread_local
+    if getattr(local, 'credentials', None) is not credentials:
+      # Set up http with the credentials.
+      authorized_http = credentials.authorize(httplib2.Http())
+      local.api = apiclient.discovery.build_from_document(
+          self._GetDiscoveryDocument(authorized_http), http=authorized_http)
+      local.credentials = credentials
+    return local.api
 
-    if not credentials or credentials.invalid:
-      # If local credentials are not valid, do OAuth2 dance.
-      flow = oauth2client.client.OAuth2WebServerFlow(
-          self._client_id, self._client_secret, self.COMPUTE_ENGINE_SCOPE)
-      credentials = oauth2client.tools.run(flow, storage)
+  def _GetCredentials(self):
+    """Returns OAuth2 credentials, doing OAuth2 dance only if necessary.
 
-    # Set up http with the credentials.
-    authorized_http = credentials.authorize(httplib2.Http())
-    return apiclient.discovery.build(
-        'compute', self.COMPUTE_ENGINE_API_VERSION, http=authorized_http)
+    Returns:
+      OAuth2 credentials shared by all threads.
+    """
+    with self._lock:
+      if self._credentials and not self._credentials.invalid:
+        return self._credentials
+
+      # First, check local file for credentials.
+      homedir = os.environ['HOME']
+      storage = oauth2client.file.Storage(
+          os.path.join(homedir, '.%s.credentials' % self._name))
+      credentials = storage.get()
+
+      if not credentials or credentials.invalid:
+        # If local credentials are not valid, do OAuth2 dance.
+        flow = oauth2client.client.OAuth2WebServerFlow(
+            self._client_id, self._client_secret, self.COMPUTE_ENGINE_SCOPE)
+        credentials = oauth2client.tools.run(flow, storage)
+
+      self._credentials = credentials
+      return credentials
+
+  def _GetDiscoveryDocument(self, http):
+    """Returns discovery document of Compute Engine API.
+
+    Discovery document is cached on local disk, and is downloaded only when
+    the cache doesn't exist or is older than DISCOVERY_CACHE_MAX_AGE.
+
+    Args:
+      http: httplib2.Http object to download discovery document with.
+    Returns:
+      Discovery document as JSON string.
+    Raises:
+      apiclient.errors.HttpError: Failed to download discovery document.
+    """
+    with self._lock:
+      if self._discovery_document:
+        return self._discovery_document
+
+      cache_file = os.path.join(
+          os.environ['HOME'], '.%s.compute-%s.discovery' % (
+              self._name, self.COMPUTE_ENGINE_API_VERSION))
+      try:
+        if (time.time() - os.path.getmtime(cache_file) <
+            self.DISCOVERY_CACHE_MAX_AGE):
+          with open(cache_file) as f:
+            self._discovery_document = f.read()
+      except (IOError, OSError):
+        pass
+
+      if not self._discovery_document:
+        url = self.DISCOVERY_URI.replace(
+            '{api}', 'compute').replace(
+                '{apiVersion}', self.COMPUTE_ENGINE_API_VERSION)
+        logging.debug('Downloading discovery document: %s', url)
+        response, content = http.request(url)
+        if response.status >= 400:
+          raise apiclient.errors.HttpError(response, content, uri=url)
+        try:
+          # Write to temporary file and rename, so that concurrent processes
+          # never read partially written cache.
+          temp_file = '%s.%d' % (cache_file, os.getpid())
+          with open(temp_file, 'w') as f:
+            f.write(content)
+          os.rename(temp_file, cache_file)
+        except (IOError, OSError) as e:
+          logging.warning('Failed to cache discovery document: %s', e)
+        self._discovery_document = content
+
+      return self._discovery_document
 
   @staticmethod
   def IsNotFoundError(http_error):
@@ -96,6 +317,81 @@ class GceApi(object):
     """
     return http_error.resp['status'] == '404'
 
+  @classmethod
+  def IsRateLimitError(cls, http_error):
+    """Checks if HttpError means the rate limit of the API was exceeded.
+
+    Args:
+      http_error: HttpError
+    Returns:
+      True if the status was 429, or 403 with rate limit reason.
+    """
+    status = http_error.resp['status']
+    if status == '429':
+      return True
+    if status != '403':
+      return False
+    try:
+      errors = json.loads(http_error.content)['error']['errors']
+    except (ValueError, KeyError, TypeError):
+      return False
+    return any(e.get('reason') in cls.RATE_LIMIT_REASONS for e in errors)
+
+  def _IsRetriable(self, http_error, method):
+    """Checks if API call that failed with the error can be sent again.
+
+    Args:
+      http_error: HttpError
+      method: HTTP method of the API call.
+    Returns:
+      True if the call was rejected by the rate limit, or if the call is
+      idempotent and failed with server error.
+    """
+    if self.IsRateLimitError(http_error):
+      return True
+    return (int(http_error.resp['status']) >= 500 and
+            method in self.IDEMPOTENT_METHODS)
+
+  def _CountRequests(self, key, count=1):
+    with self._counts_lock:
+      self.request_counts[key] += count
+
+  def _Throttle(self, count=1):
+    """Waits for the rate limiter before making API calls."""
+    if self.rate_limiter.Acquire(count):
+      self._CountRequests('throttled', count)
+
+  def _RetryBackoff(self):
+    return Backoff(self.RETRY_INITIAL_INTERVAL, self.RETRY_MAX_INTERVAL,
+                   multiplier=2, jitter=0.5)
+
+  def _Execute(self, request):
+    """Executes API request within the rate limit, retrying it on errors.
+
+    Args:
+      request: apiclient.http.HttpRequest object.
+    Returns:
+      Response of the API call.
+    Raises:
+      HttpError if the call failed with error that isn't retried, or failed
+      MAX_RETRIES + 1 times.
+    """
+    backoff = self._RetryBackoff()
+    for attempt in xrange(self.MAX_RETRIES + 1):
+      self._Throttle()
+      try:
+        return request.execute()
+      except apiclient.errors.HttpError as e:
+        if self.IsRateLimitError(e):
+          self._CountRequests('rate_limited')
+        if (attempt == self.MAX_RETRIES or
+            not self._IsRetriable(e, request.method)):
+          raise
+        logging.warning('%s %s failed with status %s, retrying',
+                        request.method, request.uri, e.resp['status'])
+        self._CountRequests('retried')
+        backoff.Sleep()
+
   @classmethod
   def _ResourceUrlFromPath(cls, path):
     """Creates full resource URL from path."""
@@ -152,6 +448,209 @@ class GceApi(object):
                         w.get('message', 'NO WARNING MESSAGE'))
     return True
 
+  def ListZoneOperations(self, filter_string=None):
+    """Lists zone operations that match filter condition.
+
+    Args:
+      filter_string: Filtering condition.
+    Returns:
+      List of compute#operation.
+    """
+    return self._ListAllPages(self.GetApi().zoneOperations().list,
+                              filter_string)
+
+  def WaitForOperations(self, operations, timeout):
+    """Waits for zone operations to finish.
+
+    Status of all operations is checked in bulk by list requests filtered
+    by the operation names.  The check interval starts short and grows
+    while no operation finishes, so that completion is detected soon
+    without sending many requests for long operations.
+
+    Args:
+      operations: List of zone operation resources returned by the methods
+          of the class.
+      timeout: Maximum time to wait in seconds.
+    Returns:
+      List of the operations that finished with errors or didn't finish
+      within the timeout.  Empty list if all operations succeeded.
+    """
+    deadline = time.time() + timeout
+    backoff = Backoff(self.OPERATION_WAIT_INITIAL_INTERVAL,
+                      self.OPERATION_WAIT_MAX_INTERVAL)
+    failed = []
+    pending = {}
+    for operation in operations:
+      pending[operation['name']] = operation
+
+    while True:
+      finished = [o for o in pending.values() if o.get('status') == 'DONE']
+      for operation in finished:
+        del pending[operation['name']]
+        if not self._ParseOperation(
+            operation, '%s %s' % (operation.get('operationType', 'Operation'),
+                                  OperationTargetName(operation))):
+          failed.append(operation)
+
+      if not pending or time.time() >= deadline:
+        break
+      if finished:
+        backoff.Reset()
+      backoff.Sleep(deadline)
+
+      names = sorted(pending)
+      for i in xrange(0, len(names), self.MAX_OPERATIONS_PER_LIST):
+        name_filter = 'name eq "^(%s)$"' % '|'.join(
+            names[i:i + self.MAX_OPERATIONS_PER_LIST])
+        for operation in self.ListZoneOperations(name_filter):
+          if operation['name'] in pending:
+            pending[operation['name']] = operation
+
+    for operation in pending.values():
+      logging.error('%s %s: timed out', operation.get('operationType'),
+                    OperationTargetName(operation))
+    return failed + pending.values()
+
+  def _ListAllPages(self, list_method, filter_string):
+    """Calls list method of zonal resources until all pages are read.
+
+    Args:
+      list_method: Method of Google Client API to list the resources.
+      filter_string: Filtering condition.
+    Returns:
+      List of the resources in all pages.
+    """
+    items = []
+    params = {
+        'project': self._project,
+        'zone': self._zone,
+        'filter': filter_string,
+    }
+    while True:
+      result = self._Execute(list_method(**params))
+      items.extend(result.get('items', []))
+      if not result.get('nextPageToken'):
+        return items
+      params['pageToken'] = result['nextPageToken']
+
+  def _BatchUri(self):
+    """Returns URL of batch request endpoint of the API."""
+    root_url = 'https://www.googleapis.com/'
+    if self._discovery_document:
+      root_url = json.loads(self._discovery_document).get('rootUrl', root_url)
+    return root_url + 'batch'
+
+  def _ExecuteBatch(self, requests):
+    """Executes API requests with as few HTTP round trips as possible.
+
+    Requests are sent in batch requests of up to MAX_REQUESTS_PER_BATCH
+    API calls each.  API calls that failed with retriable errors are
+    requeued and sent together in the next batch requests after backoff.
+
+    Args:
+      requests: Dictionary of request ID to apiclient.http.HttpRequest object.
+    Returns:
+      Dictionary of request ID to (response, exception) tuple.  Exception is
+      apiclient.errors.HttpError if the API call failed, otherwise None.
+    Raises:
+      HttpError if batch request itself failed with error that isn't
+      retried.
+    """
+    results = {}
+    pending = requests
+    backoff = self._RetryBackoff()
+    for attempt in xrange(self.MAX_RETRIES + 1):
+      requeued = {}
+      last_attempt = attempt == self.MAX_RETRIES
+
+      def Callback(request_id, response, exception):
+        if exception and self.IsRateLimitError(exception):
+          self._CountRequests('rate_limited')
+        if (exception and not last_attempt and
+            self._IsRetriable(exception, pending[request_id].method)):
+          requeued[request_id] = pending[request_id]
+        else:
+          results[request_id] = (response, exception)
+
+      request_ids = sorted(pending)
+      for i in xrange(0, len(request_ids), self.MAX_REQUESTS_PER_BATCH):
+        chunk = request_ids[i:i + self.MAX_REQUESTS_PER_BATCH]
+        batch = apiclient.http.BatchHttpRequest(batch_uri=self._BatchUri())
+        for request_id in chunk:
+          batch.add(pending[request_id], callback=Callback,
+                    request_id=request_id)
+        self._Throttle(len(chunk))
+        try:
+          batch.execute()
+        except apiclient.errors.HttpError as e:
+          if self.IsRateLimitError(e):
+            self._CountRequests('rate_limited', len(chunk))
+          # Server error of the batch request is retried only if all the
+          # API calls in it are idempotent.
+          if last_attempt or not all(
+              self._IsRetriable(e, pending[request_id].method)
+              for request_id in chunk):
+            raise
+          for request_id in chunk:
+            requeued[request_id] = pending[request_id]
+
+      if not requeued:
+        break
+      logging.warning('Retrying %d API calls in batch', len(requeued))
+      self._CountRequests('retried', len(requeued))
+      backoff.Sleep()
+      pending = requeued
+    return results
+
+  def _ExecuteBatchOperations(self, requests, title):
+    """Executes API requests that return operations in batch.
+
+    Args:
+      requests: Dictionary of resource name to apiclient.http.HttpRequest
+          object.
+      title: Title used for log.
+    Returns:
+      Dictionary of resource name to operation resource.  Operation is None
+      if the resource was not found or the request had errors.
+    """
+    operations = {}
+    for name, (operation, error) in self._ExecuteBatch(requests).iteritems():
+      operations[name] = None
+      if error:
+        if self.IsNotFoundError(error):
+          logging.warning('%s: %s not found', title, name)
+        else:
+          logging.error('%s: %s: %s', title, name, error)
+      elif self._ParseOperation(operation, '%s: %s' % (title, name)):
+        operations[name] = operation
+    return operations
+
+  def BatchGet(self, resource_type, resource_names):
+    """Gets information of multiple resources with batch requests.
+
+    Args:
+      resource_type: Type of the resources.  'instances' or 'disks'.
+      resource_names: List of the resource names.
+    Returns:
+      Dictionary of resource name to the resource.  None for the resource
+      that was not found.
+    Raises:
+      HttpError on API error, except for 'resource not found' error.
+    """
+    collection = getattr(self.GetApi(), resource_type)()
+    id_parameter = self.RESOURCE_ID_PARAMETERS[resource_type]
+    requests = {}
+    for name in resource_names:
+      requests[name] = collection.get(
+          project=self._project, zone=self._zone, **{id_parameter: name})
+
+    resources = {}
+    for name, (resource, error) in self._ExecuteBatch(requests).iteritems():
+      if error and not self.IsNotFoundError(error):
+        raise error
+      resources[name] = resource
+    return resources
+
   def GetInstance(self, instance_name):
     """Gets instance information.
 
@@ -162,18 +661,39 @@ class GceApi(object):
       https://developers.google.com/compute/docs/reference/latest/instances
     """
     try:
-      return self.GetApi().instances().get(
+      return self._Execute(self.GetApi().instances().get(
           project=self._project, zone=self._zone,
-          instance=instance_name).execute()
+          instance=instance_name))
     except apiclient.errors.HttpError as e:
       if self.IsNotFoundError(e):
         logging.warning('Get instance: %s not found', instance_name)
         return None
       raise
 
+  def GetMachineType(self, machine_type_name):
+    """Gets machine type information.
+
+    Args:
+      machine_type_name: Name of the machine type.
+    Returns:
+      Google Compute Engine machine type resource.  None if not found.
+      https://developers.google.com/compute/docs/reference/latest/machineTypes
+    Raises:
+      HttpError on API error, except for 'resource not found' error.
+    """
+    try:
+      return self._Execute(self.GetApi().machineTypes().get(
+          project=self._project, zone=self._zone,
+          machineType=machine_type_name))
+    except apiclient.errors.HttpError as e:
+      if self.IsNotFoundError(e):
+        return None
+      raise
+
   def ListInstances(self, filter_string=None):
     """Lists instances that matches filter condition.
 
+    All pages of the result are read if the result has multiple pages.
     Format of filter string can be found in the following URL.
     http://developers.google.com/compute/docs/reference/latest/instances/list
 
@@ -182,14 +702,12 @@ class GceApi(object):
     Returns:
       List of compute#instance.
     """
-    result = self.GetApi().instances().list(
-        project=self._project, zone=self._zone, filter=filter_string).execute()
-    return result.get('items', [])
+    return self._ListAllPages(self.GetApi().instances().list, filter_string)
 
   def CreateInstance(self, instance_name, machine_type, boot_disk, disks=None,
                      startup_script='', service_accounts=None,
                      external_ip=True, metadata=None, tags=None,
-                     can_ip_forward=False):
+                     can_ip_forward=False, preemptible=False):
     """Creates Google Compute Engine instance.
 
     Args:
@@ -209,8 +727,12 @@ class GceApi(object):
       tags: String list of tags to attach to the new instance.
       can_ip_forward: Boolean to indicate if the new instance can forward IP
           packets.
+      preemptible: Boolean to indicate if the new instance is preemptible.
+          Compute Engine may stop preemptible instances at any time, and
+          they are neither restarted nor migrated.
     Returns:
-      Boolean to indicate whether the instance creation was successful.
+      Operation resource of the instance creation.  None if the request had
+      errors.
     """
     params = {
         'kind': 'compute#instance',
@@ -283,11 +805,20 @@ class GceApi(object):
     if tags:
       params['tags'] = {'items': tags}
 
-    operation = self.GetApi().instances().insert(
-        project=self._project, zone=self._zone, body=params).execute()
+    if preemptible:
+      params['scheduling'] = {
+          'preemptible': True,
+          'automaticRestart': False,
+          'onHostMaintenance': 'TERMINATE',
+      }
+
+    operation = self._Execute(self.GetApi().instances().insert(
+        project=self._project, zone=self._zone, body=params))
 
-    return self._ParseOperation(
-        operation, 'Instance creation: %s' % instance_name)
+    if self._ParseOperation(
+        operation, 'Instance creation: %s' % instance_name):
+      return operation
+    return None
 
   def DeleteInstance(self, instance_name):
     """Deletes Google Compute Engine instance.
@@ -295,20 +826,40 @@ class GceApi(object):
     Args:
       instance_name: Name of the instance to delete.
     Returns:
-      Boolean to indicate whether the instance deletion was successful.
+      Operation resource of the instance deletion.  None if the instance
+      was not found or the request had errors.
     """
     try:
-      operation = self.GetApi().instances().delete(
+      operation = self._Execute(self.GetApi().instances().delete(
           project=self._project, zone=self._zone,
-          instance=instance_name).execute()
-      return self._ParseOperation(
-          operation, 'Instance deletion: %s' % instance_name)
+          instance=instance_name))
+      if self._ParseOperation(
+          operation, 'Instance deletion: %s' % instance_name):
+        return operation
+      return None
     except apiclient.errors.HttpError as e:
       if self.IsNotFoundError(e):
         logging.warning('Delete instance: %s not found', instance_name)
-        return False
+        return None
       raise
 
+  def BatchDeleteInstances(self, instance_names):
+    """Deletes multiple instances with batch requests.
+
+    Args:
+      instance_names: List of the names of the instances to delete.
+    Returns:
+      Dictionary of instance name to operation resource of the deletion.
+      Operation is None if the instance was not found or the request had
+      errors.
+    """
+    instances = self.GetApi().instances()
+    requests = {}
+    for name in instance_names:
+      requests[name] = instances.delete(
+          project=self._project, zone=self._zone, instance=name)
+    return self._ExecuteBatchOperations(requests, 'Instance deletion')
+
   def GetDisk(self, disk_name):
     """Gets persistent disk information.
 
@@ -321,8 +872,8 @@ class GceApi(object):
       HttpError on API error, except for 'resource not found' error.
     """
     try:
-      return self.GetApi().disks().get(
-          project=self._project, zone=self._zone, disk=disk_name).execute()
+      return self._Execute(self.GetApi().disks().get(
+          project=self._project, zone=self._zone, disk=disk_name))
     except apiclient.errors.HttpError as e:
       if self.IsNotFoundError(e):
         return None
@@ -331,6 +882,7 @@ class GceApi(object):
   def ListDisks(self, filter_string=None):
     """Lists disks that match filter condition.
 
+    All pages of the result are read if the result has multiple pages.
     Format of filter string can be found in the following URL.
     https://developers.google.com/compute/docs/reference/latest/disks/list
 
@@ -339,11 +891,25 @@ class GceApi(object):
     Returns:
       List of compute#disk.
     """
-    result = self.GetApi().disks().list(
-        project=self._project, zone=self._zone, filter=filter_string).execute()
-    return result.get('items', [])
+    return self._ListAllPages(self.GetApi().disks().list, filter_string)
 
-  def CreateDisk(self, disk_name, size_gb=10, image=None):
+  def _CreateDiskRequest(self, disk_name, size_gb=10, image=None,
+                         snapshot=None):
+    """Returns API request to create persistent disk."""
+    params = {
+        'kind': 'compute#disk',
+        'sizeGb': '%d' % size_gb,
+        'name': disk_name,
+    }
+    if snapshot:
+      params['sourceSnapshot'] = self._ResourceUrl(
+          'snapshots', snapshot, zoning=ResourceZoning.GLOBAL)
+    source_image = self._ResourceUrlFromPath(image) if image else None
+    return self.GetApi().disks().insert(
+        project=self._project, zone=self._zone, body=params,
+        sourceImage=source_image)
+
+  def CreateDisk(self, disk_name, size_gb=10, image=None, snapshot=None):
     """Creates persistent disk in the zone of this API.
 
     Args:
@@ -351,20 +917,33 @@ class GceApi(object):
       size_gb: Size of the new persistent disk in GB.
       image: Machine image name for the new disk to base upon.
           e.g. 'projects/debian-cloud/global/images/debian-7-wheezy-v20131014'
+      snapshot: Name of the snapshot in the project for the new disk to
+          restore.  Used instead of the image.
     Returns:
-      Boolean to indicate whether the disk creation was successful.
+      Operation resource of the disk creation.  None if the request had
+      errors.
     """
-    params = {
-        'kind': 'compute#disk',
-        'sizeGb': '%d' % size_gb,
-        'name': disk_name,
-    }
-    source_image = self._ResourceUrlFromPath(image) if image else None
-    operation = self.GetApi().disks().insert(
-        project=self._project, zone=self._zone, body=params,
-        sourceImage=source_image).execute()
-    return self._ParseOperation(
-        operation, 'Disk creation %s' % disk_name)
+    operation = self._Execute(self._CreateDiskRequest(
+        disk_name, size_gb=size_gb, image=image, snapshot=snapshot))
+    if self._ParseOperation(operation, 'Disk creation %s' % disk_name):
+      return operation
+    return None
+
+  def BatchCreateDisks(self, disks):
+    """Creates multiple persistent disks with batch requests.
+
+    Args:
+      disks: Dictionary of the name of the new persistent disk to the
+          dictionary of other parameters of CreateDisk().
+          e.g. {'foo-data': {'size_gb': 500}}
+    Returns:
+      Dictionary of disk name to operation resource of the disk creation.
+      Operation is None if the request had errors.
+    """
+    requests = {}
+    for name, params in disks.iteritems():
+      requests[name] = self._CreateDiskRequest(name, **params)
+    return self._ExecuteBatchOperations(requests, 'Disk creation')
 
   def DeleteDisk(self, disk_name):
     """Deletes persistent disk.
@@ -372,13 +951,115 @@ class GceApi(object):
     Args:
       disk_name: Name of the persistent disk to delete.
     Returns:
-      Boolean to indicate whether the disk deletion was successful.
+      Operation resource of the disk deletion.  None if the request had
+      errors.
+    """
+    operation = self._Execute(self.GetApi().disks().delete(
+        project=self._project, zone=self._zone, disk=disk_name))
+
+    if self._ParseOperation(operation, 'Disk deletion: %s' % disk_name):
+      return operation
+    return None
+
+  def BatchDeleteDisks(self, disk_names):
+    """Deletes multiple persistent disks with batch requests.
+
+    Args:
+      disk_names: List of the names of the persistent disks to delete.
+    Returns:
+      Dictionary of disk name to operation resource of the disk deletion.
+      Operation is None if the disk was not found or the request had errors.
+    """
+    disks = self.GetApi().disks()
+    requests = {}
+    for name in disk_names:
+      requests[name] = disks.delete(
+          project=self._project, zone=self._zone, disk=name)
+    return self._ExecuteBatchOperations(requests, 'Disk deletion')
+
+  def CreateSnapshot(self, disk_name, snapshot_name):
+    """Takes snapshot of persistent disk.
+
+    Args:
+      disk_name: Name of the persistent disk.
+      snapshot_name: Name of the new snapshot.
+    Returns:
+      Operation resource of the snapshot creation.  None if the request had
+      errors.
+    """
+    operation = self._Execute(self.GetApi().disks().createSnapshot(
+        project=self._project, zone=self._zone, disk=disk_name,
+        body={'name': snapshot_name}))
+    if self._ParseOperation(
+        operation, 'Snapshot creation: %s' % snapshot_name):
+      return operation
+    return None
+
+  def GetSnapshot(self, snapshot_name):
+    """Gets snapshot information of the project.
+
+    Args:
+      snapshot_name: Name of the snapshot.
+    Returns:
+      Google Compute Engine snapshot resource.  None if not found.
+      https://developers.google.com/compute/docs/reference/latest/snapshots
+    Raises:
+      HttpError on API error, except for 'resource not found' error.
+    """
+    try:
+      return self._Execute(self.GetApi().snapshots().get(
+          project=self._project, snapshot=snapshot_name))
+    except apiclient.errors.HttpError as e:
+      if self.IsNotFoundError(e):
+        return None
+      raise
+
+  def GetImage(self, image_name):
+    """Gets image information of the project.
+
+    Args:
+      image_name: Name of the image.
+    Returns:
+      Google Compute Engine image resource.  None if not found.
+      https://developers.google.com/compute/docs/reference/latest/images
+    Raises:
+      HttpError on API error, except for 'resource not found' error.
     """
-    operation = self.GetApi().disks().delete(
-        project=self._project, zone=self._zone, disk=disk_name).execute()
+    try:
+      return self._Execute(self.GetApi().images().get(
+          project=self._project, image=image_name))
+    except apiclient.errors.HttpError as e:
+      if self.IsNotFoundError(e):
+        return None
+      raise
+
+  def CreateImage(self, image_name, source_url, description=''):
+    """Creates image of the project from image bundle on Cloud Storage.
 
-    return self._ParseOperation(
-        operation, 'Disk deletion: %s' % disk_name)
+    Args:
+      image_name: Name of the new image.
+      source_url: URL of the image bundle (.image.tar.gz) on Cloud Storage.
+          e.g. 'https://storage.googleapis.com/bucket/foo.image.tar.gz'
+      description: Description of the new image.
+    Returns:
+      Operation resource of the image creation.  None if the request had
+      errors.
+    """
+    params = {
+        'kind': 'compute#image',
+        'name': image_name,
+        'description': description,
+        'sourceType': 'RAW',
+        'rawDisk': {
+            'containerType': 'TAR',
+            'source': source_url,
+        },
+    }
+    operation = self._Execute(self.GetApi().images().insert(
+        project=self._project, body=params))
+    if self._ParseOperation(operation, 'Image creation: %s' % image_name):
+      return operation
+    return None
 
   def AddRoute(self, route_name, next_hop_instance,
                network='default', dest_range='0.0.0.0/0',
@@ -408,8 +1089,8 @@ class GceApi(object):
     if tags:
       params['tags'] = tags
 
-    operation = self.GetApi().routes().insert(
-        project=self._project, body=params).execute()
+    operation = self._Execute(self.GetApi().routes().insert(
+        project=self._project, body=params))
     return self._ParseOperation(operation, 'Route creation: %s' % route_name)
 
   def DeleteRoute(self, route_name):
@@ -421,8 +1102,8 @@ class GceApi(object):
       Boolean to indicate whether the route deletion was successful.
     """
     try:
-      operation = self.GetApi().routes().delete(
-          project=self._project, route=route_name).execute()
+      operation = self._Execute(self.GetApi().routes().delete(
+          project=self._project, route=route_name))
       return self._ParseOperation(operation, 'Route deletion: %s' % route_name)
     except apiclient.errors.HttpError as e:
       if self.IsNotFoundError(e):
@@ -17,19 +17,84 @@
 
 
 
+import json
+import os
+import os.path
+import shutil
+import tempfile
+import threading
 import unittest
 
 import apiclient
+import apiclient.errors
+import httplib2
 import mock
 import oauth2client
 import oauth2client.client
 
+import fake_compute_server
 import gce_api
 
 
+class BackoffTest(unittest.TestCase):
+  """Unit test class of Backoff."""
+
+  def testNextInterval(self):
+    """Unit test of NextInterval() without jitter."""
+    backoff = gce_api.Backoff(1, 5, multiplier=2, jitter=0)
+
+    self.assertEqual([1, 2, 4, 5, 5],
+                     [backoff.NextInterval() for _ in xrange(5)])
+    backoff.Reset()
+    self.assertEqual(1, backoff.NextInterval())
+
+  def testNextInterval_Jitter(self):
+    """Unit test of NextInterval() with jitter."""
+    backoff = gce_api.Backoff(10, 10, jitter=0.2)
+
+    for _ in xrange(100):
+      self.assertTrue(8 <= backoff.NextInterval() <= 12)
+
+  def testSleep_Deadline(self):
+    """Unit test of Sleep() not to sleep beyond the deadline."""
+    backoff = gce_api.Backoff(10, 10, jitter=0)
+    with mock.patch('time.sleep') as mock_sleep:
+      with mock.patch('time.time', return_value=1000):
+        backoff.Sleep(1003)
+        backoff.Sleep(999)
+    self.assertEqual([mock.call(3), mock.call(0)],
+                     mock_sleep.call_args_list)
+
+
+class RateLimiterTest(unittest.TestCase):
+  """Unit test class of RateLimiter."""
+
+  def testAcquire(self):
+    """Unit test of Acquire() waiting beyond the burst."""
+    clock = [1000.0]
+    with mock.patch('time.time', side_effect=lambda: clock[0]):
+      with mock.patch('time.sleep') as mock_sleep:
+        rate_limiter = gce_api.RateLimiter(calls_per_second=10, burst=5)
+
+        self.assertEqual(0, rate_limiter.Acquire(5))
+        # Each caller waits for its token in turn.
+        self.assertAlmostEqual(0.1, rate_limiter.Acquire())
+        self.assertAlmostEqual(0.3, rate_limiter.Acquire(2))
+        # Tokens are added while no API call is made, up to the burst.
+        clock[0] += 10
+        self.assertEqual(0, rate_limiter.Acquire(3))
+        self.assertEqual(0, rate_limiter.Acquire(2))
+        # Batch beyond the burst waits for the burst.
+        self.assertAlmostEqual(0.5, rate_limiter.Acquire(100))
+
+    self.assertEqual(3, mock_sleep.call_count)
+
+
 class GceApiTest(unittest.TestCase):
   """Unit test class of GceApi."""
 
+  DISCOVERY_DOCUMENT = '{"name": "compute"}'
+
   def setUp(self):
     self.gce_api = gce_api.GceApi('gce_api_test', 'CLIENT_ID', 'CLIENT_SECRET',
                                   'project-name', 'zone-name')
@@ -47,6 +112,11 @@ class GceApiTest(unittest.TestCase):
     Returns:
       Dictionary that holds mocks created.
     """
+    # Discovery document is cached under temporary home directory.
+    self.home_dir = tempfile.mkdtemp()
+    self.addCleanup(shutil.rmtree, self.home_dir)
+    mock.patch.dict(os.environ, {'HOME': self.home_dir}).start()
+
     mock_local_credentials = mock.MagicMock(
         spec=oauth2client.client.Credentials, name='Mock Credentials')
     mock_http_local = mock.MagicMock(
@@ -57,6 +127,10 @@ class GceApiTest(unittest.TestCase):
         spec=oauth2client.client.Credentials, name='Mock New Credentials')
     mock_http_new = mock.MagicMock(name='HTTP authorized by new credentials')
     mock_new_credentials.authorize.return_value = mock_http_new
+    mock_new_credentials.invalid = False
+    for mock_http in (mock_http_local, mock_http_new):
+      mock_http.request.return_value = (
+          httplib2.Response({'status': '200'}), self.DISCOVERY_DOCUMENT)
     mock_api = mock.MagicMock(name='Google Client API')
 
     mock_storage_class = mock.patch('oauth2client.file.Storage').start()
@@ -64,7 +138,8 @@ class GceApiTest(unittest.TestCase):
         'oauth2client.client.OAuth2WebServerFlow').start()
     mock.patch('oauth2client.tools.run',
                return_value=mock_new_credentials).start()
-    mock.patch('apiclient.discovery.build', return_value=mock_api).start()
+    mock.patch('apiclient.discovery.build_from_document',
+               return_value=mock_api).start()
     mock.patch('httplib2.Http').start()
 
     mock_storage = mock_storage_class.return_value
@@ -74,7 +149,6 @@ class GceApiTest(unittest.TestCase):
       mock_storage.get.return_value = mock_local_credentials
       mock_local_credentials.invalid = not credentials_validity
     mock_flow = mock_flow_class.return_value
-    apiclient.discovery.build = mock.MagicMock(return_value=mock_api)
 
     return {'api': mock_api,
             'storage_class': mock_storage_class,
@@ -86,6 +160,11 @@ class GceApiTest(unittest.TestCase):
             'new_credentials': mock_new_credentials,
             'http_authorized_by_new_credentials': mock_http_new}
 
+  def _AssertDiscoveryDocumentDownloaded(self, mock_http):
+    mock_http.request.assert_called_once_with(mock.ANY)
+    self.assertRegexpMatches(mock_http.request.call_args[0][0],
+                             '/apis/compute/v\\d[^/]*/rest$')
+
   def testGetApi_CachedCredentials(self):
     """Unit test of GetApi().  Local credentials are valid."""
     my_mocks = self._MockGoogleClientApi()
@@ -98,11 +177,11 @@ class GceApiTest(unittest.TestCase):
     self.assertFalse(my_mocks['flow_class'].called)
     self.assertFalse(oauth2client.tools.run.called)
     self.assertEqual(1, my_mocks['local_credentials'].authorize.call_count)
-    apiclient.discovery.build.assert_called_once_with(
-        'compute', mock.ANY,
+    self._AssertDiscoveryDocumentDownloaded(
+        my_mocks['http_authorized_by_local_credentials'])
+    apiclient.discovery.build_from_document.assert_called_once_with(
+        self.DISCOVERY_DOCUMENT,
         http=my_mocks['http_authorized_by_local_credentials'])
-    self.assertRegexpMatches(
-        apiclient.discovery.build.call_args[0][1], '^v\\d')
 
   def testGetApi_InvalidCachedCredentials(self):
     """Unit test of GetApi().  Local credentials are invalid."""
@@ -117,11 +196,9 @@ class GceApiTest(unittest.TestCase):
         my_mocks['flow'], my_mocks['storage'])
     # New credentials are used.
     self.assertEqual(1, my_mocks['new_credentials'].authorize.call_count)
-    apiclient.discovery.build.assert_called_once_with(
-        'compute', mock.ANY,
+    apiclient.discovery.build_from_document.assert_called_once_with(
+        self.DISCOVERY_DOCUMENT,
         http=my_mocks['http_authorized_by_new_credentials'])
-    self.assertRegexpMatches(
-        apiclient.discovery.build.call_args[0][1], '^v\\d')
 
   def testGetApi_NoCachedCredentials(self):
     """Unit test of GetApi().  Local credentials are invalid."""
@@ -136,11 +213,95 @@ class GceApiTest(unittest.TestCase):
         my_mocks['flow'], my_mocks['storage'])
     # New credentials are used.
     self.assertEqual(1, my_mocks['new_credentials'].authorize.call_count)
-    apiclient.discovery.build.assert_called_once_with(
-        'compute', mock.ANY,
+    apiclient.discovery.build_from_document.assert_called_once_with(
+        self.DISCOVERY_DOCUMENT,
+        http=my_mocks['http_authorized_by_new_credentials'])
+
+  def testGetApi_Reuse(self):
+    """Unit test of GetApi() called repeatedly in the same thread."""
+    my_mocks = self._MockGoogleClientApi()
+
+    self.assertEqual(my_mocks['api'], self.gce_api.GetApi())
+    self.assertEqual(my_mocks['api'], self.gce_api.GetApi())
+    self.assertEqual(my_mocks['api'], self.gce_api.GetApi())
+
+    # Credentials, HTTP and API object are created only once.
+    self.assertEqual(1, my_mocks['storage_class'].call_count)
+    self.assertEqual(1, my_mocks['local_credentials'].authorize.call_count)
+    self.assertEqual(1, apiclient.discovery.build_from_document.call_count)
+
+  def testGetApi_PerThread(self):
+    """Unit test of GetApi() called from multiple threads."""
+    my_mocks = self._MockGoogleClientApi()
+
+    self.gce_api.GetApi()
+    thread = threading.Thread(target=self.gce_api.GetApi)
+    thread.start()
+    thread.join()
+    self.gce_api.GetApi()
+
+    # Credentials and discovery document are shared, but each thread has
+    # its own HTTP connection and API object.
+    self.assertEqual(1, my_mocks['storage_class'].call_count)
+    self._AssertDiscoveryDocumentDownloaded(
+        my_mocks['http_authorized_by_local_credentials'])
+    self.assertEqual(2, my_mocks['local_credentials'].authorize.call_count)
+    self.assertEqual(2, apiclient.discovery.build_from_document.call_count)
+
+  def testGetApi_CredentialsExpired(self):
+    """Unit test of GetApi() after credentials become invalid."""
+    my_mocks = self._MockGoogleClientApi()
+
+    self.gce_api.GetApi()
+    my_mocks['local_credentials'].invalid = True
+    self.gce_api.GetApi()
+
+    # Credentials are reloaded and new API object is created.
+    self.assertEqual(2, my_mocks['storage_class'].call_count)
+    oauth2client.tools.run.assert_called_once_with(
+        my_mocks['flow'], my_mocks['storage'])
+    self.assertEqual(2, apiclient.discovery.build_from_document.call_count)
+    apiclient.discovery.build_from_document.assert_called_with(
+        self.DISCOVERY_DOCUMENT,
         http=my_mocks['http_authorized_by_new_credentials'])
-    self.assertRegexpMatches(
-        apiclient.discovery.build.call_args[0][1], '^v\\d')
+
+  def testGetApi_DiscoveryDocumentCache(self):
+    """Unit test of GetApi() with discovery document cached on disk."""
+    my_mocks = self._MockGoogleClientApi()
+
+    self.gce_api.GetApi()
+    # Another GceApi object reads discovery document from the disk cache.
+    another_gce_api = gce_api.GceApi(
+        'gce_api_test', 'CLIENT_ID', 'CLIENT_SECRET',
+        'project-name', 'zone-name')
+    another_gce_api.GetApi()
+
+    self._AssertDiscoveryDocumentDownloaded(
+        my_mocks['http_authorized_by_local_credentials'])
+    apiclient.discovery.build_from_document.assert_called_with(
+        self.DISCOVERY_DOCUMENT,
+        http=my_mocks['http_authorized_by_local_credentials'])
+
+  def testGetApi_StaleDiscoveryDocumentCache(self):
+    """Unit test of GetApi() with expired discovery document cache."""
+    my_mocks = self._MockGoogleClientApi()
+    cache_file = os.path.join(self.home_dir,
+                              '.gce_api_test.compute-v1.discovery')
+    with open(cache_file, 'w') as f:
+      f.write('{"name": "stale"}')
+    stale_time = os.path.getmtime(cache_file) - (
+        gce_api.GceApi.DISCOVERY_CACHE_MAX_AGE + 1)
+    os.utime(cache_file, (stale_time, stale_time))
+
+    self.gce_api.GetApi()
+
+    self._AssertDiscoveryDocumentDownloaded(
+        my_mocks['http_authorized_by_local_credentials'])
+    apiclient.discovery.build_from_document.assert_called_once_with(
+        self.DISCOVERY_DOCUMENT,
+        http=my_mocks['http_authorized_by_local_credentials'])
+    with open(cache_file) as f:
+      self.assertEqual(self.DISCOVERY_DOCUMENT, f.read())
 
   def testGetInstance(self):
     """Unit test of GetInstance()."""
@@ -192,6 +353,112 @@ class GceApiTest(unittest.TestCase):
      assert_called_once_with())
     self.assertEqual(['dummy', 'list'], instance_list)
 
+  def testListInstances_MultiplePages(self):
+    """Unit test of ListInstances() with result in multiple pages."""
+    mock_api = mock.MagicMock(name='Mock Google Client API')
+    self.gce_api.GetApi = mock.MagicMock(return_value=mock_api)
+    mock_api.instances.return_value.list.return_value.execute.side_effect = [
+        {'items': ['page1-1', 'page1-2'], 'nextPageToken': 'token-1'},
+        {'items': ['page2-1'], 'nextPageToken': 'token-2'},
+        {'items': ['page3-1']},
+    ]
+
+    instance_list = self.gce_api.ListInstances('filter condition')
+
+    self.assertEqual(
+        [mock.call(project='project-name', zone='zone-name',
+                   filter='filter condition'),
+         mock.call(project='project-name', zone='zone-name',
+                   filter='filter condition', pageToken='token-1'),
+         mock.call(project='project-name', zone='zone-name',
+                   filter='filter condition', pageToken='token-2')],
+        mock_api.instances.return_value.list.call_args_list)
+    self.assertEqual(['page1-1', 'page1-2', 'page2-1', 'page3-1'],
+                     instance_list)
+
+  def _SetUpFakeClock(self):
+    """Patches time.time() and time.sleep() with a fake clock.
+
+    Returns:
+      Mock of time.sleep().
+    """
+    clock = [1000.0]
+
+    def Sleep(seconds):
+      clock[0] += seconds
+
+    mock.patch('time.time', side_effect=lambda: clock[0]).start()
+    return mock.patch('time.sleep', side_effect=Sleep).start()
+
+  def testWaitForOperations(self):
+    """Unit test of WaitForOperations()."""
+    mock_sleep = self._SetUpFakeClock()
+    mock_api = mock.MagicMock(name='Mock Google Client API')
+    self.gce_api.GetApi = mock.MagicMock(return_value=mock_api)
+    mock_list = mock_api.zoneOperations.return_value.list
+    mock_list.return_value.execute.side_effect = [
+        {'items': [
+            {'name': 'op-1', 'status': 'RUNNING'},
+            {'name': 'op-2', 'status': 'DONE'},
+        ]},
+        {'items': [
+            {'name': 'op-1', 'status': 'DONE',
+             'error': {'errors': [{'code': 'SOME_ERROR'}]}},
+        ]},
+    ]
+
+    failed = self.gce_api.WaitForOperations([
+        {'name': 'op-1', 'status': 'PENDING'},
+        {'name': 'op-2', 'status': 'PENDING'},
+        {'name': 'op-3', 'status': 'DONE'},
+    ], 100)
+
+    # Only pending operations are checked by single list request.
+    self.assertEqual(
+        [mock.call(project='project-name', zone='zone-name',
+                   filter='name eq "^(op-1|op-2)$"'),
+         mock.call(project='project-name', zone='zone-name',
+                   filter='name eq "^(op-1)$"')],
+        mock_list.call_args_list)
+    self.assertEqual(['op-1'], [o['name'] for o in failed])
+    self.assertEqual(2, mock_sleep.call_count)
+
+  def testWaitForOperations_ManyOperations(self):
+    """Unit test of WaitForOperations() with many operations."""
+    self._SetUpFakeClock()
+    mock_api = mock.MagicMock(name='Mock Google Client API')
+    self.gce_api.GetApi = mock.MagicMock(return_value=mock_api)
+    operations = [{'name': 'op-%03d' % i, 'status': 'PENDING'}
+                  for i in xrange(120)]
+    mock_list = mock_api.zoneOperations.return_value.list
+    mock_list.return_value.execute.side_effect = [
+        {'items': [dict(o, status='DONE') for o in operations[:50]]},
+        {'items': [dict(o, status='DONE') for o in operations[50:100]]},
+        {'items': [dict(o, status='DONE') for o in operations[100:]]},
+    ]
+
+    self.assertEqual([], self.gce_api.WaitForOperations(operations, 100))
+    self.assertEqual(3, mock_list.call_count)
+
+  def testWaitForOperations_Timeout(self):
+    """Unit test of WaitForOperations() with timeout."""
+    mock_sleep = self._SetUpFakeClock()
+    mock_api = mock.MagicMock(name='Mock Google Client API')
+    self.gce_api.GetApi = mock.MagicMock(return_value=mock_api)
+    mock_list = mock_api.zoneOperations.return_value.list
+    mock_list.return_value.execute.return_value = {
+        'items': [{'name': 'op-1', 'status': 'RUNNING'}]
+    }
+
+    failed = self.gce_api.WaitForOperations(
+        [{'name': 'op-1', 'status': 'PENDING'}], 60)
+
+    self.assertEqual([{'name': 'op-1', 'status': 'RUNNING'}], failed)
+    # Interval grows up to the maximum, and total sleep equals the timeout.
+    intervals = [c[0][0] for c in mock_sleep.call_args_list]
+    self.assertLess(intervals[0], intervals[3])
+    self.assertAlmostEqual(60, sum(intervals))
+
   def testCreateInstance_Success(self):
     """Unit test of CreateInstance() with success result."""
     mock_api = mock.MagicMock(name='Mock Google Client API')
@@ -259,6 +526,24 @@ class GceApiTest(unittest.TestCase):
     (mock_api.instances.return_value.insert.return_value.execute.
      assert_called_once_with())
 
+  def testCreateInstance_Preemptible(self):
+    """Unit test of CreateInstance() with preemptible instance."""
+    mock_api = mock.MagicMock(name='Mock Google Client API')
+    self.gce_api.GetApi = mock.MagicMock(return_value=mock_api)
+    mock_insert = mock_api.instances.return_value.insert
+    mock_insert.return_value.execute.return_value = {'name': 'instance-name'}
+
+    self.assertTrue(self.gce_api.CreateInstance(
+        'instance-name', 'machine-type', 'image-name', preemptible=True))
+    self.assertTrue(self.gce_api.CreateInstance(
+        'instance-name', 'machine-type', 'image-name'))
+
+    self.assertEqual(
+        {'preemptible': True, 'automaticRestart': False,
+         'onHostMaintenance': 'TERMINATE'},
+        mock_insert.call_args_list[0][1]['body']['scheduling'])
+    self.assertNotIn('scheduling', mock_insert.call_args_list[1][1]['body'])
+
   def testDeleteInstance(self):
     """Unit test of DeleteInstance()."""
     mock_api = mock.MagicMock(name='Mock Google Client API')
@@ -275,6 +560,19 @@ class GceApiTest(unittest.TestCase):
     (mock_api.instances.return_value.delete.return_value.execute.
      assert_called_once_with())
 
+  def testGetMachineType(self):
+    """Unit test of GetMachineType()."""
+    mock_api = mock.MagicMock(name='Mock Google Client API')
+    self.gce_api.GetApi = mock.MagicMock(return_value=mock_api)
+
+    machine_type = self.gce_api.GetMachineType('n1-standard-4')
+
+    mock_api.machineTypes.return_value.get.assert_called_once_with(
+        project='project-name', zone='zone-name', machineType='n1-standard-4')
+    self.assertEqual(mock_api.machineTypes.return_value.get.return_value.
+                     execute.return_value,
+                     machine_type)
+
   def testGetDisk(self):
     """Unit test of GetDisk()."""
     mock_api = mock.MagicMock(name='Mock Google Client API')
@@ -367,6 +665,26 @@ class GceApiTest(unittest.TestCase):
     (mock_api.disks.return_value.insert.return_value.execute.
      assert_called_once_with())
 
+  def testCreateDisk_WithSnapshot(self):
+    """Unit test of CreateDisk() with snapshot."""
+    mock_api = mock.MagicMock(name='Mock Google Client API')
+    self.gce_api.GetApi = mock.MagicMock(return_value=mock_api)
+    mock_api.disks.return_value.insert.return_value.execute.return_value = {
+        'name': 'disk-name'
+    }
+
+    self.assertTrue(self.gce_api.CreateDisk(
+        'disk-name', snapshot='snapshot-name'))
+
+    mock_api.disks.return_value.insert.assert_called_once_with(
+        project='project-name', zone='zone-name', body=mock.ANY,
+        sourceImage=None)
+    params = mock_api.disks.return_value.insert.call_args[1]['body']
+    self.assertEqual(
+        'https://www.googleapis.com/compute/v1/projects/project-name/'
+        'global/snapshots/snapshot-name',
+        params['sourceSnapshot'])
+
   def testDeleteDisk(self):
     """Unit test of DeleteDisk()."""
     mock_api = mock.MagicMock(name='Mock Google Client API')
@@ -383,6 +701,350 @@ class GceApiTest(unittest.TestCase):
     (mock_api.disks.return_value.delete.return_value.execute.
      assert_called_once_with())
 
+  def testCreateSnapshot(self):
+    """Unit test of CreateSnapshot()."""
+    mock_api = mock.MagicMock(name='Mock Google Client API')
+    self.gce_api.GetApi = mock.MagicMock(return_value=mock_api)
+    (mock_api.disks.return_value.createSnapshot.return_value.execute.
+     return_value) = {'name': 'operation-name'}
+
+    self.assertTrue(self.gce_api.CreateSnapshot('disk-name', 'snapshot-name'))
+
+    mock_api.disks.return_value.createSnapshot.assert_called_once_with(
+        project='project-name', zone='zone-name', disk='disk-name',
+        body={'name': 'snapshot-name'})
+
+  def testGetSnapshot(self):
+    """Unit test of GetSnapshot()."""
+    mock_api = mock.MagicMock(name='Mock Google Client API')
+    self.gce_api.GetApi = mock.MagicMock(return_value=mock_api)
+
+    snapshot = self.gce_api.GetSnapshot('snapshot-name')
+
+    mock_api.snapshots.return_value.get.assert_called_once_with(
+        project='project-name', snapshot='snapshot-name')
+    self.assertEqual(mock_api.snapshots.return_value.get.return_value.
+                     execute.return_value,
+                     snapshot)
+
+  def testGetImage(self):
+    """Unit test of GetImage()."""
+    mock_api = mock.MagicMock(name='Mock Google Client API')
+    self.gce_api.GetApi = mock.MagicMock(return_value=mock_api)
+
+    image = self.gce_api.GetImage('image-name')
+
+    mock_api.images.return_value.get.assert_called_once_with(
+        project='project-name', image='image-name')
+    self.assertEqual(mock_api.images.return_value.get.return_value.
+                     execute.return_value,
+                     image)
+
+  def testCreateImage(self):
+    """Unit test of CreateImage()."""
+    mock_api = mock.MagicMock(name='Mock Google Client API')
+    self.gce_api.GetApi = mock.MagicMock(return_value=mock_api)
+    mock_api.images.return_value.insert.return_value.execute.return_value = {
+        'name': 'operation-name'
+    }
+
+    self.assertTrue(self.gce_api.CreateImage(
+        'image-name', 'https://storage.googleapis.com/b/x.image.tar.gz'))
+
+    mock_api.images.return_value.insert.assert_called_once_with(
+        project='project-name', body=mock.ANY)
+    params = mock_api.images.return_value.insert.call_args[1]['body']
+    self.assertEqual('image-name', params['name'])
+    self.assertEqual('RAW', params['sourceType'])
+    self.assertEqual('https://storage.googleapis.com/b/x.image.tar.gz',
+                     params['rawDisk']['source'])
+
+  @staticmethod
+  def _HttpError(status, reason=None):
+    errors = [{'reason': reason}] if reason else []
+    return apiclient.errors.HttpError(
+        httplib2.Response({'status': str(status)}),
+        json.dumps({'error': {'code': status, 'errors': errors}}))
+
+  def testIsRateLimitError(self):
+    """Unit test of IsRateLimitError()."""
+    self.assertTrue(self.gce_api.IsRateLimitError(self._HttpError(429)))
+    self.assertTrue(self.gce_api.IsRateLimitError(
+        self._HttpError(403, 'rateLimitExceeded')))
+    self.assertTrue(self.gce_api.IsRateLimitError(
+        self._HttpError(403, 'userRateLimitExceeded')))
+    self.assertFalse(self.gce_api.IsRateLimitError(
+        self._HttpError(403, 'forbidden')))
+    self.assertFalse(self.gce_api.IsRateLimitError(self._HttpError(503)))
+
+  def testGetInstance_Retry(self):
+    """Unit test of GetInstance() retried on server errors."""
+    mock_sleep = self._SetUpFakeClock()
+    mock_api = mock.MagicMock(name='Mock Google Client API')
+    self.gce_api.GetApi = mock.MagicMock(return_value=mock_api)
+    mock_request = mock_api.instances.return_value.get.return_value
+    mock_request.method = 'GET'
+    mock_request.execute.side_effect = [
+        self._HttpError(503), self._HttpError(429), {'name': 'instance-name'}]
+
+    self.assertEqual({'name': 'instance-name'},
+                     self.gce_api.GetInstance('instance-name'))
+    self.assertEqual(3, mock_request.execute.call_count)
+    self.assertEqual(2, mock_sleep.call_count)
+    self.assertEqual({'rate_limited': 1, 'retried': 2},
+                     self.gce_api.request_counts)
+
+  def testGetInstance_RetryGivesUp(self):
+    """Unit test of GetInstance() failing after MAX_RETRIES retries."""
+    self._SetUpFakeClock()
+    mock_api = mock.MagicMock(name='Mock Google Client API')
+    self.gce_api.GetApi = mock.MagicMock(return_value=mock_api)
+    mock_request = mock_api.instances.return_value.get.return_value
+    mock_request.method = 'GET'
+    mock_request.execute.side_effect = self._HttpError(500)
+
+    self.assertRaises(apiclient.errors.HttpError,
+                      self.gce_api.GetInstance, 'instance-name')
+    self.assertEqual(self.gce_api.MAX_RETRIES + 1,
+                     mock_request.execute.call_count)
+
+  def testCreateInstance_Retry(self):
+    """Unit test of CreateInstance() retried only on rate limit errors."""
+    self._SetUpFakeClock()
+    mock_api = mock.MagicMock(name='Mock Google Client API')
+    self.gce_api.GetApi = mock.MagicMock(return_value=mock_api)
+    mock_request = mock_api.instances.return_value.insert.return_value
+    mock_request.method = 'POST'
+    mock_request.execute.side_effect = [
+        self._HttpError(403, 'rateLimitExceeded'), {'name': 'operation-name'},
+        self._HttpError(503)]
+
+    self.assertEqual(
+        {'name': 'operation-name'},
+        self.gce_api.CreateInstance('instance-name', 'machine-type', 'disk'))
+    # Insertion is not sent again after server error, as the instance may
+    # have been created.
+    self.assertRaises(apiclient.errors.HttpError, self.gce_api.CreateInstance,
+                      'instance-name', 'machine-type', 'disk')
+    self.assertEqual(3, mock_request.execute.call_count)
+
+
+class GceApiBatchTest(unittest.TestCase):
+  """Unit test class of batch requests of GceApi with fake API server."""
+
+  def setUp(self):
+    # Clock of the fake server, which doesn't advance by itself.
+    self.now = [1000.0]
+    self.server = fake_compute_server.FakeComputeServer(
+        clock=lambda: self.now[0])
+    self.server.Start()
+    self.addCleanup(self.server.Stop)
+
+    home_dir = tempfile.mkdtemp()
+    self.addCleanup(shutil.rmtree, home_dir)
+    mock.patch.dict(os.environ, {'HOME': home_dir}).start()
+    mock_credentials = mock.MagicMock(
+        spec=oauth2client.client.Credentials, name='Mock Credentials')
+    mock_credentials.invalid = False
+    mock_credentials.authorize.side_effect = lambda http: http
+    mock_storage_class = mock.patch('oauth2client.file.Storage').start()
+    mock_storage_class.return_value.get.return_value = mock_credentials
+
+    self.gce_api = gce_api.GceApi('gce_api_test', 'CLIENT_ID', 'CLIENT_SECRET',
+                                  'project-name', 'zone-name')
+    self.gce_api.DISCOVERY_URI = self.server.discovery_uri
+    # Download discovery document before counting requests.
+    self.gce_api.GetApi()
+    self.server.http_request_count = 0
+
+  def tearDown(self):
+    mock.patch.stopall()
+
+  def _AddResources(self, collection, names):
+    for name in names:
+      self.server.resources[collection][name] = {
+          'name': name, 'selfLink': 'http://fake/%s/%s' % (collection, name)}
+
+  def testBatchCreateDisks(self):
+    """Unit test of BatchCreateDisks()."""
+    self._AddResources('disks', ['disk-exists'])
+
+    operations = self.gce_api.BatchCreateDisks({
+        'disk-boot': {'image': 'projects/foo/global/images/bar'},
+        'disk-data': {'size_gb': 500},
+        'disk-exists': {},
+    })
+
+    self.assertEqual(1, self.server.http_request_count)
+    self.assertEqual('DONE', operations['disk-boot']['status'])
+    self.assertEqual('DONE', operations['disk-data']['status'])
+    self.assertIsNone(operations['disk-exists'])
+    disks = self.server.resources['disks']
+    self.assertEqual('500', disks['disk-data']['sizeGb'])
+    self.assertEqual('READY', disks['disk-boot']['status'])
+
+  def testBatchGet(self):
+    """Unit test of BatchGet()."""
+    self._AddResources('instances', ['instance-1', 'instance-2'])
+
+    instances = self.gce_api.BatchGet(
+        'instances', ['instance-1', 'instance-2', 'no-instance'])
+
+    self.assertEqual(1, self.server.http_request_count)
+    self.assertEqual('instance-1', instances['instance-1']['name'])
+    self.assertEqual('instance-2', instances['instance-2']['name'])
+    self.assertIsNone(instances['no-instance'])
+
+  def testBatchDeleteInstances(self):
+    """Unit test of BatchDeleteInstances() with many instances."""
+    names = ['instance-%03d' % i for i in xrange(250)]
+    self._AddResources('instances', names)
+
+    with mock.patch('time.sleep') as mock_sleep:
+      operations = self.gce_api.BatchDeleteInstances(names + ['no-instance'])
+
+    # 251 API calls are sent in 3 HTTP requests.
+    self.assertEqual(3, self.server.http_request_count)
+    self.assertEqual(251, self.server.api_call_count)
+    # Batch requests beyond the burst of the rate limiter wait.
+    self.assertEqual(2, mock_sleep.call_count)
+    self.assertEqual(151, self.gce_api.request_counts['throttled'])
+    self.assertFalse(self.server.resources['instances'])
+    self.assertEqual(
+        'http://fake/instances/instance-123',
+        operations['instance-123']['targetLink'])
+    self.assertIsNone(operations['no-instance'])
+
+    # Operations can be waited for.
+    with mock.patch('time.sleep'):
+      self.assertEqual([], self.gce_api.WaitForOperations(
+          [o for o in operations.values() if o], 10))
+
+  def testBatchDeleteDisks(self):
+    """Unit test of BatchDeleteDisks()."""
+    self._AddResources('disks', ['disk-1', 'disk-1-data'])
+
+    operations = self.gce_api.BatchDeleteDisks(['disk-1', 'disk-1-data'])
+
+    self.assertEqual(1, self.server.http_request_count)
+    self.assertEqual(['disk-1', 'disk-1-data'], sorted(operations))
+    self.assertFalse(self.server.resources['disks'])
+
+  def testCreateInstance_Provisioning(self):
+    """Unit test of instance creation taking time on the server."""
+    self.server.provisioning_seconds = 30
+
+    operation = self.gce_api.CreateInstance('instance-1', 'n1-standard-1',
+                                            'instance-1')
+
+    self.assertEqual('PENDING', operation['status'])
+    self.assertEqual('PROVISIONING',
+                     self.gce_api.GetInstance('instance-1')['status'])
+    self.now[0] += 15
+    self.assertEqual('STAGING',
+                     self.gce_api.GetInstance('instance-1')['status'])
+    self.assertEqual('RUNNING', self.gce_api.ListZoneOperations()[0]['status'])
+    self.now[0] += 15
+    self.assertEqual('RUNNING',
+                     self.gce_api.GetInstance('instance-1')['status'])
+    with mock.patch('time.sleep'):
+      self.assertEqual([], self.gce_api.WaitForOperations([operation], 10))
+
+    # Instance being deleted is listed until the deletion finishes.
+    self.gce_api.DeleteInstance('instance-1')
+    self.assertEqual(['STOPPING'],
+                     [i['status'] for i in self.gce_api.ListInstances()])
+    self.now[0] += 30
+    self.assertEqual([], self.gce_api.ListInstances())
+    self.assertEqual({'instances.insert': 1, 'instances.get': 3,
+                      'instances.list': 2, 'instances.delete': 1,
+                      'operations.list': 2},
+                     self.server.method_counts)
+
+  def testBatchCreateDisks_Quota(self):
+    """Unit test of BatchCreateDisks() beyond the quota."""
+    self.server.quotas = {'disks': 2}
+    self._AddResources('disks', ['disk-exists'])
+
+    operations = self.gce_api.BatchCreateDisks({
+        'disk-boot': {'image': 'projects/foo/global/images/bar'},
+        'disk-data': {'size_gb': 500},
+    })
+
+    # One of the disks is created, and the other fails.
+    self.assertEqual(1, len([o for o in operations.values() if o]))
+    self.assertEqual(2, len(self.server.resources['disks']))
+
+  def testGetMachineType(self):
+    """Unit test of GetMachineType() and routes on the fake server."""
+    self.assertEqual(
+        4, self.gce_api.GetMachineType('n1-highcpu-4')['guestCpus'])
+    self.assertIsNone(self.gce_api.GetMachineType('no-such-type'))
+    self.assertTrue(self.gce_api.AddRoute('route-1', 'instance-1'))
+    self.assertTrue(self.gce_api.DeleteRoute('route-1'))
+    self.assertFalse(self.gce_api.DeleteRoute('route-1'))
+
+  def testBatchGet_Retry(self):
+    """Unit test of BatchGet() requeueing API calls failed by server errors."""
+    self._AddResources('instances', ['instance-1', 'instance-2'])
+    self.server.InjectErrors(503)
+    self.server.InjectErrors(429)
+
+    with mock.patch('time.sleep') as mock_sleep:
+      instances = self.gce_api.BatchGet(
+          'instances', ['instance-1', 'instance-2', 'no-instance'])
+
+    self.assertEqual(2, self.server.http_request_count)
+    self.assertEqual(5, self.server.api_call_count)
+    self.assertEqual(1, mock_sleep.call_count)
+    self.assertEqual(['instance-1', 'instance-2', None],
+                     [instances[name] and instances[name]['name'] for name in
+                      ['instance-1', 'instance-2', 'no-instance']])
+    self.assertEqual({'rate_limited': 1, 'retried': 2},
+                     self.gce_api.request_counts)
+
+  def testBatchCreateDisks_RateLimit(self):
+    """Unit test of BatchCreateDisks() beyond the rate limit of the server."""
+    self.server.rate_limit = 2
+
+    def Sleep(seconds):
+      self.now[0] += seconds
+
+    with mock.patch('time.sleep', side_effect=Sleep):
+      operations = self.gce_api.BatchCreateDisks(
+          dict(('disk-%d' % i, {}) for i in xrange(5)))
+
+    # Disks are created 2 per second.
+    self.assertTrue(all(operations.values()))
+    self.assertEqual(5, len(self.server.resources['disks']))
+    self.assertLessEqual(1002, self.now[0])
+    self.assertEqual(self.gce_api.request_counts['rate_limited'],
+                     self.gce_api.request_counts['retried'])
+    self.assertEqual(5, self.server.api_call_count -
+                     self.gce_api.request_counts['retried'])
+
+  def testDeleteDisk_ServerError(self):
+    """Unit test of DeleteDisk() retried on server error."""
+    self._AddResources('disks', ['disk-1'])
+    self.server.InjectErrors(503, count=2)
+
+    with mock.patch('time.sleep'):
+      self.assertTrue(self.gce_api.DeleteDisk('disk-1'))
+
+    self.assertFalse(self.server.resources['disks'])
+    self.assertEqual(2, self.gce_api.request_counts['retried'])
+
+  def testListInstances_MultiplePages(self):
+    """Unit test of ListInstances() reading multiple pages."""
+    self.server.PAGE_SIZE = 2
+    self._AddResources('instances', ['hw-000', 'hw-001', 'hw-002', 'hm'])
+
+    instances = self.gce_api.ListInstances('name eq "^hw-\\d+$"')
+
+    self.assertEqual(['hw-000', 'hw-001', 'hw-002'],
+                     [i['name'] for i in instances])
+    self.assertEqual(2, self.server.http_request_count)
+
 
 if __name__ == '__main__':
   unittest.main()
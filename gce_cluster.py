@@ -17,13 +17,25 @@
 
 
 
+import collections
 import logging
+import math
 import os
 import os.path
+import Queue
+import re
+import shutil
 import subprocess
+import tempfile
+import threading
 import time
 
+import autoscaler
+import cluster_state
 import gce_api
+import pipeline
+import port_prober
+import timeline
 
 
 def MakeScriptRelativePath(relative_path):
@@ -51,6 +63,73 @@ class MapReduceError(Exception):
   """MapReduce job start failure."""
 
 
+class ImageBakeError(Exception):
+  """Failure to build boot image with Hadoop preinstalled."""
+
+
+class ClusterResizeError(Exception):
+  """Failure to add workers to or remove workers from running cluster."""
+
+
+# Memory reserved for OS and Hadoop daemons on each instance.
+MIN_RESERVED_MEMORY_MB = 768
+MAX_RESERVED_MEMORY_MB = 4096
+# Heap size of JVM of single map or reduce task.
+MIN_CHILD_HEAP_MB = 256
+MAX_CHILD_HEAP_MB = 4096
+# io.sort.mb must be smaller than 2GB.
+MAX_SORT_BUFFER_MB = 1024
+
+
+def HadoopProperties(cpus, memory_mb, data_disk_gb, num_workers):
+  """Computes Hadoop configuration for the shape of the instances.
+
+  Each instance gets a map slot per vCPU and a reduce slot per 2 vCPUs.
+  Memory except for the part reserved for OS and daemons is divided into
+  child JVM heaps of the slots, with fewer slots if the heap would be
+  smaller than MIN_CHILD_HEAP_MB.  Sort buffer takes 40% of the heap.
+
+  Args:
+    cpus: Number of vCPUs of the instance.
+    memory_mb: Memory size of the instance in MB.
+    data_disk_gb: Size of data disk of the instance in GB.
+    num_workers: Number of workers in the cluster.
+  Returns:
+    List of (site file name, property name, value) tuples.
+  """
+  reserved_mb = min(max(memory_mb // 4, MIN_RESERVED_MEMORY_MB),
+                    MAX_RESERVED_MEMORY_MB)
+  available_mb = max(memory_mb - reserved_mb, MIN_CHILD_HEAP_MB * 2)
+  map_slots = max(cpus, 1)
+  reduce_slots = max(cpus // 2, 1)
+  if available_mb // (map_slots + reduce_slots) < MIN_CHILD_HEAP_MB:
+    slots = max(available_mb // MIN_CHILD_HEAP_MB, 2)
+    map_slots = max(slots * 2 // 3, 1)
+    reduce_slots = max(slots - map_slots, 1)
+  # Round the heap down to multiple of 64MB.
+  heap_mb = min(available_mb // (map_slots + reduce_slots) // 64 * 64,
+                MAX_CHILD_HEAP_MB)
+  heap_mb = max(heap_mb, MIN_CHILD_HEAP_MB)
+  sort_mb = min(heap_mb * 2 // 5, MAX_SORT_BUFFER_MB)
+
+  return [
+      ('mapred-site.xml', 'mapred.tasktracker.map.tasks.maximum', map_slots),
+      ('mapred-site.xml', 'mapred.tasktracker.reduce.tasks.maximum',
+       reduce_slots),
+      ('mapred-site.xml', 'mapred.child.java.opts', '-Xmx%dm' % heap_mb),
+      ('mapred-site.xml', 'io.sort.mb', sort_mb),
+      ('hdfs-site.xml', 'dfs.replication', min(max(num_workers, 1), 3)),
+      ('hdfs-site.xml', 'dfs.datanode.handler.count',
+       min(max(cpus * 2, 3), 32)),
+      # NameNode handles requests of all DataNodes.
+      ('hdfs-site.xml', 'dfs.namenode.handler.count',
+       min(max(int(20 * math.log(max(num_workers, 1))), 10), 200)),
+      # Keep 10% of data disk, up to 50GB, out of HDFS for map output.
+      ('hdfs-site.xml', 'dfs.datanode.du.reserved',
+       min(max(data_disk_gb // 10, 1), 50) * 1024 ** 3),
+  ]
+
+
 class GceCluster(object):
   """Class to start Compute Engine server farm for Hadoop cluster.
 
@@ -83,27 +162,68 @@ class GceCluster(object):
 
   MASTER_NAME = 'hm'
   WORKER_NAME_CORE = 'hw'
+  # Compute-only workers run on preemptible instances.  They have no
+  # DataNode, so that preemption never loses HDFS blocks.
+  WORKER_NAME_COMPUTE = 'hc'
   WORKER_TAG_CORE = 'hadoop-workers'
   ROUTE_NAME_CORE = 'hadoop-worker-route'
 
   INSTANCE_ROLES = {
       'master': ['NameNode', 'JobTracker'],
       'worker': ['DataNode', 'TaskTracker'],
+      'compute-worker': ['TaskTracker'],
   }
+  # Status of preemptible instance stopped by Compute Engine.
+  PREEMPTED_STATUS = 'TERMINATED'
 
   # Appendix of the name of the data disk.
   DATA_DISK_APPENDIX = '-data'
 
-  DISK_CREATION_WAIT_INTERVAL = 3
-  DISK_CREATION_MAX_WAIT_TIMES = 100
-  INSTANCE_STATUS_CHECK_INTERVAL = 15
-  MAX_MASTER_STATUS_CHECK_TIMES = 40  # Waits up to 10min (15s x 40)
-  MAX_WORKERS_CHECK_TIMES = 120  # Waits up to 30min (15s x 120)
-  DELETION_CHECK_INTERVAL = 5
-  DELETION_MAX_CHECK_TIMES = 24
+  # Maximum number of workers provisioned in parallel.
+  DEFAULT_CONCURRENCY = 10
+
+  # Timeouts in seconds.
+  DISK_CREATION_TIMEOUT = 300
+  INSTANCE_CREATION_TIMEOUT = 300
+  MASTER_SET_UP_TIMEOUT = 600
+  WORKERS_SET_UP_TIMEOUT = 1800
+  DELETION_TIMEOUT = 120
+  SNAPSHOT_CREATION_TIMEOUT = 600
+  DECOMMISSION_TIMEOUT = 3600
+  # Decommission never finishes if the remaining DataNodes are fewer than
+  # the replication factor, which is up to this number.
+  MAX_REPLICATION = 3
+  # Status check interval starts with the initial interval, and grows up to
+  # the maximum interval while the status doesn't change.
+  STATUS_CHECK_INITIAL_INTERVAL = 2
+  STATUS_CHECK_MAX_INTERVAL = 15
+  # Maximum time in seconds to wait for TCP connection of single port probe.
+  PORT_PROBE_TIMEOUT = 5
+  HADOOP_SET_UP_TIMEOUT = 600
+
+  SSH_PORT = 22
+  # Ports of Web consoles of NameNode and JobTracker on the master.  The ports
+  # are open to outside by the firewall rules set up by preprocess.sh, while
+  # the ports of the daemons (9000 and 9001) are not.
+  HADOOP_MASTER_PORTS = (50070, 50030)
+
+  # Directory in HDFS to keep input and output of stages of pipeline.
+  PIPELINE_HDFS_DIR = 'pipeline'
+
+  # Script on the instances that tells Hadoop the rack of hosts, which is
+  # the zone of the instance, on cluster that spans zones.
+  TOPOLOGY_SCRIPT = '/home/hadoop/hadoop/conf/topology.sh'
+
+  # Temporary instance that installs packages to bake boot image.
+  IMAGE_BUILDER_NAME = 'hadoop-image-builder'
+  IMAGE_BAKE_TIMEOUT = 1800
+  IMAGE_CREATION_TIMEOUT = 600
 
   def __init__(self, flags):
-    self.api = None
+    # GceApi objects keyed by zone.
+    self.apis = {}
+    # API calls in all zones count against the rate limit of the project.
+    self.rate_limiter = gce_api.RateLimiter()
     self.flags = flags
     if getattr(flags, 'bucket', ''):
       self.tmp_storage = 'gs://%s/mapreduce/tmp' % flags.bucket
@@ -114,22 +234,60 @@ class GceCluster(object):
           flags.prefix, self.WORKER_NAME_CORE)
       self.worker_name_pattern = '%s-%s-\\d+' % (
           flags.prefix, self.WORKER_NAME_CORE)
+      self.compute_worker_name_template = '%s-%s-%%03d' % (
+          flags.prefix, self.WORKER_NAME_COMPUTE)
+      self.compute_worker_name_pattern = '%s-%s-\\d+' % (
+          flags.prefix, self.WORKER_NAME_COMPUTE)
       self.worker_tag = '%s-%s' % (flags.prefix, self.WORKER_TAG_CORE)
       self.route_name = '%s-%s' % (flags.prefix, self.ROUTE_NAME_CORE)
     else:
       self.master_name = self.MASTER_NAME
       self.worker_name_template = self.WORKER_NAME_CORE + '-%03d'
       self.worker_name_pattern = '%s-\\d+' % self.WORKER_NAME_CORE
+      self.compute_worker_name_template = self.WORKER_NAME_COMPUTE + '-%03d'
+      self.compute_worker_name_pattern = '%s-\\d+' % self.WORKER_NAME_COMPUTE
       self.worker_tag = self.WORKER_TAG_CORE
       self.route_name = self.ROUTE_NAME_CORE
 
     self.zone = getattr(self.flags, 'zone', None) or self.DEFAULT_ZONE
+    # Workers are spread over the zones in turn by their indices.  They are
+    # in the zone of the master if no zone is specified for workers.
+    self.worker_zones = [
+        zone for zone in (getattr(self.flags, 'worker_zones', None) or
+                          '').split(',') if zone] or [self.zone]
+    # Zones of existing instances found by list requests.  Key is instance
+    # name and value is zone name.
+    self.instance_zones = {}
     self.data_disk_size_gb = getattr(self.flags, 'data_disk_gb', 0)
     if self.data_disk_size_gb <= 0:
       self.data_disk_size_gb = self.DEFAULT_DATA_DISK_SIZE_GB
+    self.concurrency = getattr(self.flags, 'concurrency', 0)
+    if self.concurrency <= 0:
+      self.concurrency = self.DEFAULT_CONCURRENCY
+    # Last known status of the workers.  Key is worker name and value is
+    # instance status, or None if the instance is not found.
+    self.worker_status = {}
+    # Workers that are RUNNING and whose SSH port is open, if the worker has
+    # external IP address.
+    self.ready_workers = set()
+    # Index of the disks of the cluster.  Key is disk name and value is disk
+    # status, or None if the disk doesn't exist.  Disks are looked up only
+    # when they are not in the index yet.
+    self.disk_index = {}
     self.startup_script = None
     self.private_key = None
     self.public_key = None
+    self.hadoop_properties = None
+    # Spans of the steps of cluster start-up.
+    self.timeline = timeline.Recorder()
+    # Instances and disks of the cluster recorded by the previous
+    # subcommands, which are used instead of looking them up by the API.
+    state_dir = getattr(self.flags, 'state_dir', '')
+    self.state = cluster_state.ClusterState(state_dir and os.path.join(
+        state_dir, 'cluster-%s-%s.json' % (self.flags.project,
+                                           self.master_name)))
+    if getattr(self.flags, 'refresh_state', False):
+      self.state.Clear()
     logging.debug('Current directory: %s', os.getcwd())
 
   def EnvironmentSetUp(self):
@@ -152,31 +310,312 @@ class GceCluster(object):
     """Returns Hadoop worker name with specified worker index."""
     return self.worker_name_template % index
 
-  def _GetApi(self):
-    if not self.api:
-      self.api = gce_api.GceApi('hadoop_on_compute',
-                                self.CLIENT_ID, self.CLIENT_SECRET,
-                                self.flags.project, self.zone)
-    return self.api
+  def _ComputeWorkerName(self, index):
+    """Returns name of compute-only worker with specified worker index."""
+    return self.compute_worker_name_template % index
+
+  def _StartUpWorkerNames(self):
+    """Returns names of core and compute-only workers to start cluster with."""
+    return ([self._WorkerName(i) for i in xrange(self.flags.num_workers)] +
+            [self._ComputeWorkerName(i) for i in
+             xrange(getattr(self.flags, 'preemptible_workers', 0))])
+
+  def _WorkerRole(self, worker_name):
+    """Returns instance role of the worker judging from its name."""
+    if re.match('^%s$' % self.compute_worker_name_pattern, worker_name):
+      return 'compute-worker'
+    return 'worker'
+
+  def _GetApi(self, zone=None):
+    """Returns GceApi object for the zone, the zone of the master by default."""
+    zone = zone or self.zone
+    if zone not in self.apis:
+      self.apis[zone] = gce_api.GceApi('hadoop_on_compute',
+                                       self.CLIENT_ID, self.CLIENT_SECRET,
+                                       self.flags.project, zone,
+                                       rate_limiter=self.rate_limiter)
+    return self.apis[zone]
+
+  def _IsMultiZone(self):
+    """Returns True if the instances of the cluster are in multiple zones."""
+    return len(set(self.worker_zones + [self.zone])) > 1
+
+  def _InstanceZone(self, instance_name):
+    """Returns zone of the instance.
+
+    Zone of an existing instance is the one it was found in or recorded
+    in.  Otherwise, workers are in the worker zones chosen by their indices,
+    and the other instances are in the zone of the master.
+    """
+    if instance_name in self.instance_zones:
+      return self.instance_zones[instance_name]
+    recorded = self.state.Instance(instance_name)
+    if recorded:
+      return recorded['zone']
+    if instance_name == self.master_name:
+      return self.zone
+    match = re.match('^(%s|%s)$' % (self.worker_name_pattern,
+                                    self.compute_worker_name_pattern),
+                     instance_name)
+    if not match:
+      return self.zone
+    index = int(instance_name.split('-')[-1])
+    return self.worker_zones[index % len(self.worker_zones)]
+
+  def _GroupByZone(self, instance_names):
+    """Returns dictionary of zone to the names of instances in the zone."""
+    groups = {}
+    for instance_name in instance_names:
+      groups.setdefault(self._InstanceZone(instance_name), []).append(
+          instance_name)
+    return groups
+
+  def _ListInstancesInZones(self, filter_string, zones):
+    """Lists instances in the zones, and records the zones of them.
+
+    Args:
+      filter_string: Filter string of the instances.
+      zones: List of zone names.
+    Returns:
+      List of instance resources.
+    """
+    instances = []
+    for zone in zones:
+      for instance in self._GetApi(zone).ListInstances(filter_string):
+        self.instance_zones[instance['name']] = zone
+        self.state.RecordInstance(instance['name'], zone, instance)
+        instances.append(instance)
+    self.state.Save()
+    return instances
+
+  def _ForgetResources(self, names):
+    """Forgets the instances and their disks that turned out wrong.
+
+    The resources are looked up by the API next time.
 
-  def _WaitForDiskReady(self, disk_name):
-    """Waits for the persistent disk get ready.
+    Args:
+      names: List of the names of the instances or the disks.
+    """
+    for name in names:
+      self.state.RemoveInstance(name)
+      for disk_name in [name, name + self.DATA_DISK_APPENDIX]:
+        self.state.RemoveDisk(disk_name)
+        self.disk_index.pop(disk_name, None)
+    self.state.Save()
+
+  def _StatusCheckBackoff(self):
+    """Returns Backoff object for the status check intervals."""
+    return gce_api.Backoff(self.STATUS_CHECK_INITIAL_INTERVAL,
+                           self.STATUS_CHECK_MAX_INTERVAL)
+
+  def _OperationZone(self, operation):
+    """Returns zone name of the operation, the zone of the master if none."""
+    return operation.get('zone', '').split('/')[-1] or self.zone
+
+  def _WaitForOperations(self, operations, timeout, title,
+                         error_class=ClusterSetUpError):
+    """Waits for the operations to finish.
 
     Args:
-      disk_name: Name of the persistent disk.
+      operations: List of operation resources.
+      timeout: Maximum time to wait in seconds.
+      title: Description of the operations used in the error message.
+      error_class: Exception class to raise on failure.
     Raises:
-      ClusterSetUpError: persistent disk didn't get ready until timeout.
+      error_class: Some of the operations failed or timed out.
     """
-    for _ in xrange(self.DISK_CREATION_MAX_WAIT_TIMES):
-      logging.info('Waiting for boot disk %s getting ready...', disk_name)
-      disk_status = self._GetApi().GetDisk(disk_name)
-      if disk_status and disk_status.get('status', None) == 'READY':
-        logging.info('Disk %s created successfully.', disk_name)
-        break
-      time.sleep(self.DISK_CREATION_WAIT_INTERVAL)
-    else:
-      raise ClusterSetUpError(
-          'Persistent disk %s creation timed out.' % disk_name)
+    # Operations are waited for by the GceApi object of their zones.
+    operations_by_zone = {}
+    for operation in operations:
+      operations_by_zone.setdefault(self._OperationZone(operation),
+                                    []).append(operation)
+    deadline = time.time() + timeout
+    failed = []
+    for zone in sorted(operations_by_zone):
+      failed.extend(self._GetApi(zone).WaitForOperations(
+          operations_by_zone[zone], max(deadline - time.time(), 0)))
+    if failed:
+      failed_names = sorted(gce_api.OperationTargetName(o) for o in failed)
+      self._ForgetResources(failed_names)
+      raise error_class('%s failed: %s' % (title, ', '.join(failed_names)))
+    self.state.Save()
+
+  def _WaitForDisksReady(self, disk_names, zone=None):
+    """Waits for the persistent disks to get ready.
+
+    Status of all the disks is checked by single batch request per check.
+
+    Args:
+      disk_names: List of names of the persistent disks.
+      zone: Zone of the disks.  The zone of the master if not specified.
+    Raises:
+      ClusterSetUpError: persistent disks didn't get ready until timeout.
+    """
+    deadline = time.time() + self.DISK_CREATION_TIMEOUT
+    backoff = self._StatusCheckBackoff()
+    pending = sorted(disk_names)
+    while True:
+      logging.info('Waiting for %d disks getting ready...', len(pending))
+      disks = self._GetApi(zone).BatchGet('disks', pending)
+      pending = [name for name in pending
+                 if (disks.get(name) or {}).get('status') != 'READY']
+      if not pending:
+        logging.info('Disks are ready.')
+        return
+      if time.time() >= deadline:
+        raise ClusterSetUpError(
+            'Persistent disk creation timed out: %s' % ', '.join(pending))
+      backoff.Sleep(deadline)
+
+  def _RunInParallel(self, function, names):
+    """Calls the function for each resource name with bounded concurrency.
+
+    Up to self.concurrency threads process the resources at the same time.
+    An exception raised for one resource doesn't stop the others.
+
+    Args:
+      function: Function that takes a resource name as the only argument.
+      names: List of resource names.
+    Returns:
+      Tuple of 2 dictionaries.  The first one maps the resource name to the
+      return value of the function, and the second one maps the resource
+      name to the exception raised while processing the resource.  The
+      second one is empty if all resources are processed successfully.
+    """
+    results = {}
+    errors = {}
+    name_queue = Queue.Queue()
+    for name in names:
+      name_queue.put(name)
+
+    def Run():
+      while True:
+        try:
+          name = name_queue.get_nowait()
+        except Queue.Empty:
+          return
+        try:
+          results[name] = function(name)
+        except Exception as e:  # pylint: disable=broad-except
+          logging.error('%s: %s', name, e)
+          errors[name] = e
+
+    threads = [threading.Thread(target=Run)
+               for _ in xrange(min(self.concurrency, len(names)))]
+    for thread in threads:
+      thread.start()
+    for thread in threads:
+      thread.join()
+    return results, errors
+
+  def _RunInParallelOrRaise(self, title, function, names):
+    """Calls _RunInParallel() and raises if any of the resources failed.
+
+    Args:
+      title: Description of the step used in the error message.
+      function: Function that takes a resource name as the only argument.
+      names: List of resource names.
+    Returns:
+      Dictionary of the resource name to the return value of the function.
+    Raises:
+      ClusterSetUpError: Processing of at least one resource failed.
+    """
+    results, errors = self._RunInParallel(function, names)
+    if errors:
+      raise ClusterSetUpError('Failed to %s: %s' % (
+          title, ', '.join(
+              '%s (%s)' % (name, errors[name]) for name in sorted(errors))))
+    return results
+
+  def _CreateDisks(self, instance_names, boot_snapshot=None):
+    """Creates boot disks and data disks of the instances if they don't exist.
+
+    Existence of the disks not in the disk index is checked, and missing
+    disks are created, by batch requests per zone of the instances.  Disks
+    in the local record are checked as well, since the record may be left
+    by interrupted start whose disk creation never happened.
+    Existing disks are reused as they are, so that instances restarted on
+    them skip installation of packages and formatting of the data disks.
+    Existing disks that are not ready yet are waited for together.
+
+    Args:
+      instance_names: List of the instance names.
+      boot_snapshot: Name of the snapshot to create boot disks from.  Boot
+          disks are created from the image if not specified.
+    Returns:
+      List of operation resources of the disk creation.
+    Raises:
+      ClusterSetUpError: Disk creation failed.
+    """
+    operations = {}
+    # Dictionary of zone name to list of existing disks that are not ready.
+    disks_to_wait = {}
+    for zone, names in sorted(self._GroupByZone(instance_names).iteritems()):
+      disks = {}
+      for instance_name in names:
+        # Use the same disk name as instance name.
+        if boot_snapshot:
+          disks[instance_name] = {'snapshot': boot_snapshot}
+        else:
+          disks[instance_name] = {
+              'image': self.flags.image or self.DEFAULT_IMAGE}
+        disks[instance_name + self.DATA_DISK_APPENDIX] = {
+            'size_gb': self.data_disk_size_gb}
+
+      unknown_disks = sorted(name for name in disks
+                             if name not in self.disk_index)
+      if unknown_disks:
+        for disk_name, disk in self._GetApi(zone).BatchGet(
+            'disks', unknown_disks).iteritems():
+          self.disk_index[disk_name] = disk.get('status') if disk else None
+          if disk:
+            self.state.RecordDisk(disk_name, zone, disk.get('status'))
+          else:
+            self.state.RemoveDisk(disk_name)
+      for disk_name in sorted(disks):
+        status = self.disk_index[disk_name]
+        if status:
+          logging.info('Reusing existing disk %s', disk_name)
+          del disks[disk_name]
+          if status != 'READY':
+            disks_to_wait.setdefault(zone, []).append(disk_name)
+      if disks:
+        zone_operations = self._GetApi(zone).BatchCreateDisks(disks)
+        for disk_name, operation in zone_operations.iteritems():
+          if operation:
+            self.state.RecordDisk(disk_name, zone, 'CREATING')
+        operations.update(zone_operations)
+
+    failed = sorted(name for name, operation in operations.iteritems()
+                    if not operation)
+    if failed:
+      raise ClusterSetUpError('Failed to create disks: %s' % ', '.join(failed))
+
+    for zone, disk_names in sorted(disks_to_wait.iteritems()):
+      self._WaitForDisksReady(disk_names, zone)
+      for disk_name in disk_names:
+        self.disk_index[disk_name] = 'READY'
+        self.state.RecordDisk(disk_name, zone, 'READY')
+    return operations.values()
+
+  def _PrepareDisks(self, instance_names, boot_snapshot=None):
+    """Creates disks of the instances, and waits for them to get ready.
+
+    Args:
+      instance_names: List of the instance names.
+      boot_snapshot: Name of the snapshot to create boot disks from.
+    Raises:
+      ClusterSetUpError: Disk creation failed or timed out.
+    """
+    operations = self._CreateDisks(instance_names, boot_snapshot)
+    self._WaitForOperations(operations, self.DISK_CREATION_TIMEOUT,
+                            'Disk creation')
+    for operation in operations:
+      disk_name = gce_api.OperationTargetName(operation)
+      self.disk_index[disk_name] = 'READY'
+      self.state.RecordDisk(disk_name, self._OperationZone(operation),
+                            'READY')
+    self.state.Save()
 
   def _StartInstance(self, instance_name, role):
     """Starts single Compute Engine instance.
@@ -185,34 +624,76 @@ class GceCluster(object):
       instance_name: Name of the instance.
       role: Instance role name.  Must be one of the keys of INSTANCE_ROLES.
     Raises:
-      ClusterSetUpError: Role name was invalid.
+      ClusterSetUpError: Role name was invalid, or instance creation failed.
     """
+    if self.state.Instance(instance_name):
+      # Check the record with single request, instead of creating the
+      # instance again, so that interrupted start resumes.
+      instance = self._GetApi(self._InstanceZone(instance_name)).GetInstance(
+          instance_name)
+      if instance:
+        logging.info('Instance %s already exists', instance_name)
+        self.state.RecordInstance(instance_name,
+                                  self._InstanceZone(instance_name), instance)
+        self.state.Save()
+        return
+      self._ForgetResources([instance_name])
     logging.info('Starting instance: %s', instance_name)
+    self._PrepareDisks([instance_name])
+    self._WaitForOperations([self._CreateInstance(instance_name, role)],
+                            self.INSTANCE_CREATION_TIMEOUT,
+                            'Instance creation')
 
-    # Use the same disk name as instance name.
-    boot_disk_name = instance_name
-    data_disk_name = instance_name + self.DATA_DISK_APPENDIX
-
-    # If the boot disk doesn't already exist, create.
-    if not self._GetApi().GetDisk(boot_disk_name):
-      image = self.flags.image or self.DEFAULT_IMAGE
-      if not self._GetApi().CreateDisk(boot_disk_name, image=image):
-        raise ClusterSetUpError(
-            'Failed to create boot disk: %s' % boot_disk_name)
-      self._WaitForDiskReady(boot_disk_name)
+  def _HadoopProperties(self):
+    """Returns Hadoop configuration for the machine type as metadata value.
 
-    # If the data disk doesn't already exist, create.
-    if not self._GetApi().GetDisk(data_disk_name):
-      if not self._GetApi().CreateDisk(data_disk_name,
-                                       size_gb=self.data_disk_size_gb):
-        raise ClusterSetUpError(
-            'Failed to create data disk: %s' % data_disk_name)
-      self._WaitForDiskReady(data_disk_name)
+    Topology script is configured as well if the cluster spans zones.
 
-    # Load start-up script.
+    Returns:
+      Lines of site file name, property name and value separated by tab.
+    Raises:
+      ClusterSetUpError: The machine type is not found.
+    """
+    if self.hadoop_properties is None:
+      machine_type_name = self.flags.machinetype or self.DEFAULT_MACHINE_TYPE
+      machine_type = self._GetApi().GetMachineType(machine_type_name)
+      if not machine_type:
+        raise ClusterSetUpError('Machine type not found: %s' %
+                                machine_type_name)
+      properties = HadoopProperties(
+          machine_type['guestCpus'], machine_type['memoryMb'],
+          self.data_disk_size_gb, self.flags.num_workers)
+      if self._IsMultiZone():
+        properties.append(('core-site.xml', 'topology.script.file.name',
+                           self.TOPOLOGY_SCRIPT))
+      logging.info('Hadoop configuration for %s: %s', machine_type_name,
+                   ', '.join('%s=%s' % (name, value)
+                             for _, name, value in properties))
+      self.hadoop_properties = ''.join(
+          '%s\t%s\t%s\n' % property_tuple for property_tuple in properties)
+    return self.hadoop_properties
+
+  def _StartupScript(self):
+    """Returns content of the start-up script of the instances."""
     if not self.startup_script:
       self.startup_script = open(
           MakeScriptRelativePath(self.COMPUTE_STARTUP_SCRIPT)).read()
+    return self.startup_script
+
+  def _CreateInstance(self, instance_name, role):
+    """Creates Compute Engine instance on the disks that are ready.
+
+    Args:
+      instance_name: Name of the instance.
+      role: Instance role name.  Must be one of the keys of INSTANCE_ROLES.
+    Returns:
+      Operation resource of the instance creation.
+    Raises:
+      ClusterSetUpError: Role name was invalid, or instance creation failed.
+    """
+    boot_disk_name = instance_name
+    data_disk_name = instance_name + self.DATA_DISK_APPENDIX
+    startup_script = self._StartupScript()
 
     # Load SSH keys.
     if not self.private_key:
@@ -230,6 +711,8 @@ class GceCluster(object):
         'hadoop-public-key': self.public_key,
         'worker-external-ip': int(self.flags.external_ip == 'all'),
         'data-disk-id': data_disk_name,
+        'hadoop-properties': self._HadoopProperties(),
+        'rack-aware': int(self._IsMultiZone()),
     }
 
     if role not in self.INSTANCE_ROLES:
@@ -251,30 +734,82 @@ class GceCluster(object):
 
     # Assign a tag to workers for routing.
     tags = None
-    if role == 'worker':
+    if role in ('worker', 'compute-worker'):
       tags = [self.worker_tag]
 
-    self._GetApi().CreateInstance(
+    operation = self._GetApi(self._InstanceZone(instance_name)).CreateInstance(
         instance_name,
         self.flags.machinetype or self.DEFAULT_MACHINE_TYPE,
         boot_disk=boot_disk_name,
         disks=[data_disk_name],
-        startup_script=self.startup_script,
+        startup_script=startup_script,
         service_accounts=[
             'https://www.googleapis.com/auth/devstorage.full_control'],
         external_ip=external_ip,
         metadata=metadata, tags=tags,
-        can_ip_forward=can_ip_forward)
-
-  def _CheckInstanceRunning(self, instance_name):
-    """Checks if instance status is 'RUNNING'."""
-    instance_info = self._GetApi().GetInstance(instance_name)
+        can_ip_forward=can_ip_forward,
+        preemptible=(role == 'compute-worker'))
+    if not operation:
+      self._ForgetResources([instance_name])
+      raise ClusterSetUpError('Failed to create instance: %s' % instance_name)
+    self.state.RecordInstance(instance_name, self._InstanceZone(instance_name),
+                              {'status': 'PROVISIONING'})
+    return operation
+
+  @staticmethod
+  def _ExternalIp(instance):
+    """Returns external IP address of the instance, or None if it has none."""
+    for network_interface in instance.get('networkInterfaces', []):
+      for access_config in network_interface.get('accessConfigs', []):
+        if access_config.get('natIP'):
+          return access_config['natIP']
+    return None
+
+  def _GetRunningInstance(self, instance_name):
+    """Returns instance resource if instance status is 'RUNNING'."""
+    zone = self._InstanceZone(instance_name)
+    instance_info = self._GetApi(zone).GetInstance(instance_name)
     if not instance_info:
       logging.info('Instance %s has not yet started', instance_name)
-      return False
+      self.state.RemoveInstance(instance_name)
+      return None
+    self.state.RecordInstance(instance_name, zone, instance_info)
     instance_status = instance_info.get('status', None)
     logging.info('Instance %s status: %s', instance_name, instance_status)
-    return True if instance_status == 'RUNNING' else False
+    return instance_info if instance_status == 'RUNNING' else None
+
+  def _GetMasterInstance(self):
+    """Returns instance resource of the master.
+
+    The master in the local record is returned without API call if its
+    external IP address is recorded.
+
+    Returns:
+      Instance resource, or None if the master is not found.
+    """
+    master = self.state.Instance(self.master_name)
+    if master and self._ExternalIp(master):
+      return master
+    master = self._GetApi(self._InstanceZone(self.master_name)).GetInstance(
+        self.master_name)
+    if master:
+      self.state.RecordInstance(self.master_name,
+                                self._InstanceZone(self.master_name), master)
+      self.state.Save()
+    return master
+
+  def _CheckPortsOpen(self, instance_name, ip_address, ports):
+    """Checks if the ports of the instance accept TCP connections."""
+    endpoints = [(ip_address, port) for port in ports]
+    open_endpoints = port_prober.ProbePorts(endpoints, self.PORT_PROBE_TIMEOUT)
+    closed_ports = [port for port in ports
+                    if (ip_address, port) not in open_endpoints]
+    if closed_ports:
+      logging.info('Port %s not yet open on %s',
+                   ', '.join(str(port) for port in closed_ports),
+                   instance_name)
+      return False
+    return True
 
   def _CheckSshReady(self, instance_name):
     """Checks if the instance is ready to connect via SSH.
@@ -302,10 +837,19 @@ class GceCluster(object):
   def _MasterSshChecker(self):
     """Returns generator that indicates whether master is ready to SSH.
 
+    SSH port is probed by TCP connection first, and actual SSH connection
+    is tried only after the port accepts connections.
+
     Yields:
       False until master is ready to SSH.
     """
-    while not self._CheckInstanceRunning(self.master_name):
+    master = self._GetRunningInstance(self.master_name)
+    while not master:
+      yield False
+      master = self._GetRunningInstance(self.master_name)
+    master_ip = self._ExternalIp(master)
+    while not self._CheckPortsOpen(self.master_name, master_ip,
+                                   [self.SSH_PORT]):
       yield False
     while not self._CheckSshReady(self.master_name):
       yield False
@@ -316,84 +860,509 @@ class GceCluster(object):
     Raises:
       ClusterSetUpError: Master set-up timed out.
     """
-    wait_counter = 0
+    deadline = time.time() + self.MASTER_SET_UP_TIMEOUT
+    backoff = self._StatusCheckBackoff()
     for _ in self._MasterSshChecker():
-      if wait_counter >= self.MAX_MASTER_STATUS_CHECK_TIMES:
+      if time.time() >= deadline:
         logging.critical('Hadoop master set up time out')
         raise ClusterSetUpError('Hadoop master set up time out')
       logging.info('Waiting for the master instance to get ready...')
-      time.sleep(self.INSTANCE_STATUS_CHECK_INTERVAL)
-      wait_counter += 1
+      backoff.Sleep(deadline)
+
+  def _UpdateWorkerStatus(self, worker_names):
+    """Updates status of the workers with single list request per zone.
 
-  def _WorkerStatusChecker(self):
-    """Returns generator that indicates how many workers are RUNNING.
+    Only the workers whose status changed since the last update are logged.
+    SSH ports of RUNNING workers with external IP addresses are probed
+    together, and the workers are regarded as ready once the port accepts
+    connections.  Workers without external IP addresses are ready when they
+    are RUNNING, since they are not reachable from here.
 
-    The returned generator finishes iteration when all workers are in
-    RUNNING status.
+    Args:
+      worker_names: List of worker names to check.
+    Returns:
+      Number of ready workers.
+    """
+    instances = self._ListInstancesInZones(
+        'name eq "^(%s|%s)$"' % (self.worker_name_pattern,
+                                 self.compute_worker_name_pattern),
+        sorted(self._GroupByZone(worker_names)))
+    status = dict.fromkeys(worker_names)
+    ssh_endpoints = {}
+    for instance in instances:
+      name = instance['name']
+      if name not in status:
+        continue
+      status[name] = instance.get('status', None)
+      if status[name] == 'RUNNING' and name not in self.ready_workers:
+        external_ip = self._ExternalIp(instance)
+        if external_ip:
+          ssh_endpoints[(external_ip, self.SSH_PORT)] = name
+        else:
+          self.ready_workers.add(name)
+
+    for worker_name in sorted(status):
+      if status[worker_name] != self.worker_status.get(worker_name):
+        logging.info('Instance %s status: %s', worker_name,
+                     status[worker_name] or 'NOT FOUND')
+      if not status[worker_name]:
+        self.state.RemoveInstance(worker_name)
+    self.worker_status = status
+
+    if ssh_endpoints:
+      for endpoint in port_prober.ProbePorts(ssh_endpoints,
+                                             self.PORT_PROBE_TIMEOUT):
+        logging.info('SSH port open on %s', ssh_endpoints[endpoint])
+        self.ready_workers.add(ssh_endpoints[endpoint])
+    # Workers that have stopped are no longer ready.
+    self.ready_workers.intersection_update(
+        name for name in status if status[name] == 'RUNNING')
+    return len(self.ready_workers)
+
+  def _WorkerStatusChecker(self, worker_names):
+    """Returns generator that indicates how many workers are ready.
+
+    The returned generator finishes iteration when all workers are ready.
+    Status of all workers is checked by one list request per zone per
+    iteration regardless of the number of workers.
 
+    Args:
+      worker_names: List of worker names to check.
     Yields:
-      Number of RUNNING workers.
+      Number of ready workers.
     """
-    workers = [self._WorkerName(i) for i in xrange(self.flags.num_workers)]
     while True:
-      running_workers = 0
-      for worker_name in workers:
-        if self._CheckInstanceRunning(worker_name):
-          running_workers += 1
-      if running_workers == self.flags.num_workers:
+      ready_workers = self._UpdateWorkerStatus(worker_names)
+      if ready_workers == len(worker_names):
         return
-      yield running_workers
+      yield ready_workers
 
-  def _WaitForWorkersReady(self):
-    """Waits until all workers are in RUNNING status.
+  def _WaitForWorkersReady(self, worker_names=None):
+    """Waits until all workers are RUNNING and their SSH ports are open.
 
+    Args:
+      worker_names: List of worker names to wait for.  All workers of the
+          cluster if not specified.
     Raises:
       ClusterSetUpError: Workers set-up timed out.
     """
-    wait_counter = 0
-    for running_workers in self._WorkerStatusChecker():
-      logging.info('%d out of %d workers RUNNING',
-                   running_workers, self.flags.num_workers)
-      if wait_counter >= self.MAX_WORKERS_CHECK_TIMES:
+    if worker_names is None:
+      worker_names = self._StartUpWorkerNames()
+    deadline = time.time() + self.WORKERS_SET_UP_TIMEOUT
+    backoff = self._StatusCheckBackoff()
+    last_ready_workers = 0
+    for ready_workers in self._WorkerStatusChecker(worker_names):
+      logging.info('%d out of %d workers ready',
+                   ready_workers, len(worker_names))
+      if time.time() >= deadline:
         logging.critical('Hadoop worker set up time out')
         raise ClusterSetUpError('Hadoop worker set up time out')
+      # Check soon again while workers are changing status.
+      if ready_workers != last_ready_workers:
+        backoff.Reset()
+        last_ready_workers = ready_workers
       logging.info('Waiting for the worker instances to start...')
-      time.sleep(self.INSTANCE_STATUS_CHECK_INTERVAL)
-      wait_counter += 1
-    logging.info('All workers are RUNNING now.')
+      backoff.Sleep(deadline)
+    logging.info('All workers are ready now.')
+
+  def _WaitForHadoopMaster(self):
+    """Waits until Web consoles of Hadoop daemons on master are open.
+
+    Raises:
+      ClusterSetUpError: Hadoop daemons didn't start within the timeout.
+    """
+    deadline = time.time() + self.HADOOP_SET_UP_TIMEOUT
+    backoff = self._StatusCheckBackoff()
+    master_ip = self._ExternalIp(self._GetMasterInstance())
+    while not self._CheckPortsOpen(self.master_name, master_ip,
+                                   self.HADOOP_MASTER_PORTS):
+      if time.time() >= deadline:
+        logging.critical('Hadoop daemons set up time out')
+        raise ClusterSetUpError('Hadoop daemons set up time out')
+      logging.info('Waiting for Hadoop daemons on master to start...')
+      backoff.Sleep(deadline)
+
+  def _StartWorkers(self, worker_names, boot_snapshot=None):
+    """Starts worker instances in parallel.
+
+    All disks are created first by batch requests, and then waited for
+    together.  Instances are created in parallel after all disks get ready.
+    Creation of the disks and the instances is waited for by bulk status
+    check of the operations.
+
+    Workers in the local record are checked by single list request per
+    zone, and the existing ones are skipped, so that interrupted start
+    resumes.
+
+    Args:
+      worker_names: List of worker instance names.  Compute-only workers
+          are told by their names.
+      boot_snapshot: Name of the snapshot to create boot disks from.
+    Raises:
+      ClusterSetUpError: Set-up of at least one worker failed.
+    """
+    recorded = [name for name in worker_names if self.state.Instance(name)]
+    if recorded:
+      existing = set(instance['name'] for instance in
+                     self._ListInstancesInZones(
+                         'name eq "^(%s)$"' % '|'.join(recorded),
+                         sorted(self._GroupByZone(recorded))))
+      self._ForgetResources(
+          [name for name in recorded if name not in existing])
+      if existing:
+        logging.info('%d workers already exist', len(existing))
+      worker_names = [name for name in worker_names if name not in existing]
+      if not worker_names:
+        return
+    logging.info('Starting %d workers with concurrency %d',
+                 len(worker_names), self.concurrency)
+    for zone, names in sorted(self._GroupByZone(worker_names).iteritems()):
+      logging.info('%d workers in zone %s', len(names), zone)
+    with self.timeline.Span('create-worker-disks'):
+      self._PrepareDisks(worker_names, boot_snapshot)
+    with self.timeline.Span('create-worker-instances'):
+      instance_operations = self._RunInParallelOrRaise(
+          'create instances',
+          lambda name: self._CreateInstance(name,
+                                            role=self._WorkerRole(name)),
+          worker_names)
+      self.state.Save()
+      self._WaitForOperations(instance_operations.values(),
+                              self.INSTANCE_CREATION_TIMEOUT,
+                              'Instance creation')
+
+  def _PrepareBootSnapshot(self, snapshot_name):
+    """Takes snapshot of boot disk of the master if it doesn't exist.
+
+    The snapshot is taken after Hadoop is set up on the master, so that
+    the boot disks of the workers restored from it have the packages
+    installed already.
+
+    Args:
+      snapshot_name: Name of the snapshot.
+    Raises:
+      ClusterSetUpError: Snapshot creation failed or timed out.
+    """
+    if self._GetApi().GetSnapshot(snapshot_name):
+      logging.info('Creating worker boot disks from snapshot %s',
+                   snapshot_name)
+      return
+    self._WaitForHadoopMaster()
+    logging.info('Taking snapshot %s of boot disk of master', snapshot_name)
+    operation = self._GetApi().CreateSnapshot(self.master_name, snapshot_name)
+    if not operation:
+      raise ClusterSetUpError('Failed to create snapshot: %s' % snapshot_name)
+    self._WaitForOperations([operation], self.SNAPSHOT_CREATION_TIMEOUT,
+                            'Snapshot creation')
+
+  def _TimelineFile(self):
+    """Returns local file to keep spans of the steps of cluster start-up."""
+    return os.path.join(self.LOCAL_TMP_DIR,
+                        'timeline-%s.csv' % self.master_name)
 
   def StartCluster(self):
-    """Starts Hadoop cluster on Compute Engine."""
+    """Starts Hadoop cluster on Compute Engine.
+
+    Spans of the steps are saved to local file even if the start-up fails,
+    so that the timeline subcommand shows where the time went.
+    """
+    try:
+      self._StartCluster()
+    finally:
+      self.timeline.Save(self._TimelineFile())
+      self._LogRequestCounts()
+
+  def _LogRequestCounts(self):
+    """Logs number of API calls throttled and retried in all zones."""
+    counts = collections.Counter()
+    for api in self.apis.values():
+      counts.update(api.request_counts)
+    if counts:
+      logging.info('API calls throttled: %d, rate limited: %d, retried: %d',
+                   counts['throttled'], counts['rate_limited'],
+                   counts['retried'])
+
+  def _StartCluster(self):
+    """Runs the steps of StartCluster()."""
+    start_time = time.time()
     # Create a route if no external IP addresses are assigned to the workers.
-    if self.flags.external_ip == 'all':
-      self._GetApi().DeleteRoute(self.route_name)
-    else:
-      self._GetApi().AddRoute(self.route_name, self.master_name,
-                              tags=[self.worker_tag])
+    with self.timeline.Span('create-route'):
+      if self.flags.external_ip == 'all':
+        self._GetApi().DeleteRoute(self.route_name)
+      else:
+        self._GetApi().AddRoute(self.route_name, self.master_name,
+                                tags=[self.worker_tag])
 
     # Start master instance.
-    self._StartInstance(self.master_name, role='master')
-    self._WaitForMasterSsh()
+    with self.timeline.Span('start-master'):
+      self._StartInstance(self.master_name, role='master')
+    with self.timeline.Span('wait-master-ssh'):
+      self._WaitForMasterSsh()
 
     # Start worker instances.
-    for i in xrange(self.flags.num_workers):
-      self._StartInstance(self._WorkerName(i), role='worker')
-
-    self._WaitForWorkersReady()
+    boot_snapshot = getattr(self.flags, 'boot_snapshot', '')
+    if boot_snapshot:
+      with self.timeline.Span('prepare-boot-snapshot'):
+        self._PrepareBootSnapshot(boot_snapshot)
+    self._StartWorkers(self._StartUpWorkerNames(), boot_snapshot)
+
+    with self.timeline.Span('wait-workers-ready'):
+      self._WaitForWorkersReady()
+    if getattr(self.flags, 'wait_for_hadoop', False):
+      with self.timeline.Span('wait-hadoop-master'):
+        self._WaitForHadoopMaster()
+    logging.info('Cluster started in %d seconds', time.time() - start_time)
     self._ShowHadoopInformation()
 
-  @classmethod
-  def _DeleteResource(cls, filter_string, list_method,
-                      delete_method, get_method):
+  def _ListWorkers(self, name_pattern=None, use_state=True):
+    """Returns instance resources of existing workers in index order.
+
+    Workers in the local record are returned without API call if all of
+    them have been seen RUNNING.
+
+    Args:
+      name_pattern: Regular expression of the worker names.  Core workers
+          are listed if not specified.
+      use_state: Boolean to indicate whether to use the local record.
+          Workers are listed by the API if False, e.g. to see their latest
+          status.
+    Returns:
+      List of instance resources.
+    """
+    name_pattern = name_pattern or self.worker_name_pattern
+    instances = [self.state.Instance(name) for name in
+                 self.state.InstanceNames(name_pattern)]
+    if not (use_state and instances and
+            all(instance['status'] == 'RUNNING' for instance in instances)):
+      instances = self._ListInstancesInZones('name eq "^%s$"' % name_pattern,
+                                             self.worker_zones)
+      # Workers not listed have been deleted.
+      listed = set(instance['name'] for instance in instances)
+      for name in self.state.InstanceNames(name_pattern):
+        if name not in listed:
+          self.state.RemoveInstance(name)
+      self.state.Save()
+    return sorted(instances,
+                  key=lambda instance: int(instance['name'].split('-')[-1]))
+
+  @staticmethod
+  def _InstanceHosts(instance):
+    """Returns instance name and IP addresses to identify Hadoop daemons."""
+    hosts = [instance['name']]
+    for network_interface in instance.get('networkInterfaces', []):
+      if network_interface.get('networkIP'):
+        hosts.append(network_interface['networkIP'])
+      for access_config in network_interface.get('accessConfigs', []):
+        if access_config.get('natIP'):
+          hosts.append(access_config['natIP'])
+    return hosts
+
+  def GrowCluster(self):
+    """Adds workers to running Hadoop cluster.
+
+    New workers are numbered after the existing ones, and started in the
+    same way as 'start'.  They are added to slaves file on the master once
+    they are ready.  DataNodes and TaskTrackers on them join the cluster
+    when they start.
+
+    Raises:
+      ClusterSetUpError: Set-up of new workers failed.
+      RemoteExecutionError: Update of the master failed.
+    """
+    workers = self._ListWorkers()
+    if workers:
+      first_index = int(workers[-1]['name'].split('-')[-1]) + 1
+    else:
+      first_index = 0
+    new_workers = [self._WorkerName(i) for i in
+                   xrange(first_index, first_index + self.flags.count)]
+    # Configuration of the new workers is generated for the cluster size
+    # after the resize.
+    self.flags.num_workers = len(workers) + self.flags.count
+    logging.info('Adding workers: %s', ', '.join(new_workers))
+
+    self._StartWorkers(new_workers)
+    self._WaitForWorkersReady(new_workers)
+    self._StartScriptAtMaster('resize__at__master.sh', 'add', '0', *new_workers)
+    logging.info('Cluster has %d workers now.', self.flags.num_workers)
+
+  def ShrinkCluster(self):
+    """Removes workers from running Hadoop cluster.
+
+    Workers with the largest numbers are removed.  Their DataNodes are
+    decommissioned first, so that HDFS blocks on them are replicated to the
+    remaining DataNodes before the instances and the disks are deleted.
+
+    Raises:
+      ClusterResizeError: Too many workers to remove.  No worker is removed
+          in this case, and the message tells how many can be removed.
+      RemoteExecutionError: Decommission failed or timed out.  No worker is
+          deleted in this case.
+    """
+    workers = self._ListWorkers()
+    min_workers = min(len(workers), self.MAX_REPLICATION)
+    if len(workers) - self.flags.count < min_workers:
+      raise ClusterResizeError(
+          'Cannot remove %d out of %d workers.  At least %d must remain, '
+          'so at most %d can be removed.' % (
+              self.flags.count, len(workers), min_workers,
+              len(workers) - min_workers))
+    removed_workers = workers[len(workers) - self.flags.count:]
+    names = [instance['name'] for instance in removed_workers]
+    hosts = sum((self._InstanceHosts(instance)
+                 for instance in removed_workers), [])
+    logging.info('Decommissioning workers: %s', ', '.join(names))
+    self._StartScriptAtMaster('resize__at__master.sh', 'decommission',
+                              str(self.DECOMMISSION_TIMEOUT), *hosts)
+
+    logging.info('Deleting workers: %s', ', '.join(names))
+    self._DeleteWorkers(names)
+    self._StartScriptAtMaster('resize__at__master.sh', 'remove', '0', *hosts)
+    logging.info('Cluster has %d workers now.',
+                 len(workers) - self.flags.count)
+
+  def _DeleteWorkers(self, worker_names, delete_disks=True):
+    """Deletes the worker instances zone by zone.
+
+    Args:
+      worker_names: List of worker names.
+      delete_disks: Boolean to indicate whether to delete the boot disks and
+          the data disks of the workers as well.
+    Raises:
+      ClusterDeletionTimeout: Deletion failed or timed out.
+    """
+    for zone, names in sorted(self._GroupByZone(worker_names).iteritems()):
+      self._DeleteResourcesInZone(
+          zone, 'instances', 'name eq "^(%s)$"' % '|'.join(names), names)
+      if delete_disks:
+        self._DeleteResourcesInZone(
+            zone, 'disks',
+            'name eq "^(%s)(%s)?$"' % ('|'.join(names),
+                                       self.DATA_DISK_APPENDIX),
+            sum(([name, name + self.DATA_DISK_APPENDIX] for name in names),
+                []))
+
+  def _Resize(self, change):
+    """Adds workers if the change is positive, or removes them if negative.
+
+    Removes no more workers than ShrinkCluster() allows to remove.
+    """
+    if change < 0:
+      workers = len(self._ListWorkers())
+      removable = max(workers - self.MAX_REPLICATION, 0)
+      if -change > removable:
+        logging.info('Removing %d workers instead of %d to keep %d workers',
+                     removable, -change, workers - removable)
+        change = -removable
+    self.flags.count = abs(change)
+    if change > 0:
+      self.GrowCluster()
+    elif change < 0:
+      self.ShrinkCluster()
+
+  def Autoscale(self, iterations=None):
+    """Resizes running cluster following the load of JobTracker.
+
+    Args:
+      iterations: Number of samples of the load to take.  Runs until
+          interrupted if None.
+    Raises:
+      ClusterResizeError: The master is not running, or the scaling
+          parameters are invalid.
+    """
+    master = self._GetMasterInstance()
+    master_ip = master and self._ExternalIp(master)
+    if not master_ip:
+      raise ClusterResizeError('Master %s is not running' % self.master_name)
+    # Shrink never leaves fewer workers than the replication of HDFS.
+    min_workers = min(max(self.flags.min_workers, self.MAX_REPLICATION),
+                      self.flags.max_workers)
+    if min_workers != self.flags.min_workers:
+      logging.warning('Keeping at least %d workers for HDFS replication',
+                      min_workers)
+    try:
+      policy = autoscaler.ScalingPolicy(
+          min_workers, self.flags.max_workers,
+          scale_up_cooldown=self.flags.scale_up_cooldown,
+          scale_down_cooldown=self.flags.scale_down_cooldown,
+          max_step=self.flags.max_step)
+    except ValueError as e:
+      raise ClusterResizeError(str(e))
+    logging.info('Autoscaling between %d and %d workers',
+                 policy.min_workers, policy.max_workers)
+    autoscaler.Autoscaler(
+        policy, autoscaler.JobTrackerClient(master_ip).GetLoad,
+        lambda: len(self._ListWorkers()), self._Resize).Run(
+            self.flags.interval, iterations)
+
+  def _ReplacePreemptedWorkersOnce(self):
+    """Recreates compute-only workers that have been preempted.
+
+    Preempted instances are TERMINATED with their disks kept.  They are
+    deleted, and created again with the same names on the same disks, so
+    that their TaskTrackers rejoin JobTracker as the same hosts.
+
+    Raises:
+      ClusterSetUpError: Set-up of the new instances failed.
+    """
+    preempted_workers = [
+        instance['name'] for instance in
+        self._ListWorkers(self.compute_worker_name_pattern, use_state=False)
+        if instance.get('status') == self.PREEMPTED_STATUS]
+    if not preempted_workers:
+      logging.info('No compute-only worker has been preempted.')
+      return
+    logging.info('Replacing preempted workers: %s',
+                 ', '.join(preempted_workers))
+    self._DeleteWorkers(preempted_workers, delete_disks=False)
+    # Configuration of the new instances depends on the number of core
+    # workers.
+    self.flags.num_workers = len(self._ListWorkers())
+    self._StartWorkers(preempted_workers)
+    self._WaitForWorkersReady(preempted_workers)
+    logging.info('Replaced %d preempted workers.', len(preempted_workers))
+
+  def ReplacePreemptedWorkers(self, iterations=None):
+    """Replaces compute-only workers preempted by Compute Engine.
+
+    Checks once, or periodically until interrupted if --interval is
+    specified.  While checking periodically, failure of the replacement is
+    logged and retried at the next check.
+
+    Args:
+      iterations: Number of checks when checking periodically.  Runs until
+          interrupted if None.
+    Raises:
+      ClusterSetUpError: Replacement failed when checking once.
+    """
+    interval = getattr(self.flags, 'interval', 0)
+    count = 0
+    while True:
+      try:
+        self._ReplacePreemptedWorkersOnce()
+      except ClusterSetUpError as e:
+        if not interval:
+          raise
+        logging.error('Failed to replace preempted workers: %s', e)
+      count += 1
+      if not interval or count == iterations:
+        return
+      time.sleep(interval)
+
+  def _DeleteResource(self, filter_string, list_method, batch_delete_method,
+                      remove_record=None):
     """Deletes Compute Engine resources that match the filter.
 
     Args:
       filter_string: Filter string of the resource.
       list_method: Method to list the resources.
-      delete_method: Method to delete the single resource.
-      get_method: Method to get the status of the single resource.
+      batch_delete_method: Method to delete multiple resources by batch
+          requests.  Must return dictionary of resource name to operation
+          resource of the deletion.
+      remove_record: Function to remove the deleted resource from the local
+          record, which takes the resource name.
     Raises:
-      ClusterDeletionTimeout: the resource deletion times out.
+      ClusterDeletionTimeout: the resource deletion fails or times out.
     """
     while True:
       list_of_resources = list_method(filter_string)
@@ -402,42 +1371,289 @@ class GceCluster(object):
         break
       for name in resource_names:
         logging.info('  %s', name)
-        delete_method(name)
-
-      for _ in xrange(cls.DELETION_MAX_CHECK_TIMES):
-        still_alive = []
-        for name in resource_names:
-          if get_method(name):
-            still_alive.append(name)
-          else:
-            logging.info('Deletion complete: %s', name)
-        if not still_alive:
-          break
-        resource_names = still_alive
-        time.sleep(cls.DELETION_CHECK_INTERVAL)
+      operations = [o for o in batch_delete_method(resource_names).values()
+                    if o]
+      if operations:
+        self._WaitForOperations(operations, self.DELETION_TIMEOUT,
+                                'Resource deletion', ClusterDeletionTimeout)
       else:
-        raise ClusterDeletionTimeout('Resource deletion time out')
+        # No deletion is accepted if the resources have been deleted by
+        # others, which looks the same as errors.  Give up only if they
+        # still exist.
+        remaining = [i['name'] for i in list_method(filter_string)
+                     if i['name'] in resource_names]
+        if remaining:
+          raise ClusterDeletionTimeout(
+              'Failed to delete resources: %s' % ', '.join(remaining))
+      if remove_record:
+        for name in resource_names:
+          remove_record(name)
+        self.state.Save()
+      logging.info('Deletion complete: %s', ', '.join(resource_names))
+
+  def _DeleteRecordedResources(self, names, batch_delete_method,
+                               remove_record):
+    """Deletes resources in the local record without listing them.
+
+    Args:
+      names: List of the resource names.
+      batch_delete_method: Method to delete multiple resources by batch
+          requests.
+      remove_record: Function to remove the resource from the local record.
+    Returns:
+      True if deletion of all the resources was accepted.  False if some of
+      them were not found or failed, in which case the record was wrong.
+    Raises:
+      ClusterDeletionTimeout: the resource deletion fails or times out.
+    """
+    for name in names:
+      logging.info('  %s', name)
+    operations = batch_delete_method(names)
+    # The resources are forgotten even if the deletion fails, so that they
+    # are looked up by the API next time.
+    for name in names:
+      remove_record(name)
+    self._WaitForOperations([o for o in operations.values() if o],
+                            self.DELETION_TIMEOUT, 'Resource deletion',
+                            ClusterDeletionTimeout)
+    logging.info('Deletion complete: %s', ', '.join(names))
+    return all(operations.get(name) for name in names)
+
+  def _DeleteResourcesInZone(self, zone, resource_type, filter_string,
+                             names=None):
+    """Deletes instances or disks of the cluster in the zone.
+
+    Resources in the local record are deleted without list requests.  The
+    resources are listed by the filter instead if the record doesn't have
+    them, or if the record turns out wrong.
+
+    Args:
+      zone: Zone name.
+      resource_type: 'instances' or 'disks'.
+      filter_string: Filter string to list the resources.
+      names: List of the resource names.  All resources of the type in the
+          zone are deleted if not specified.
+    Raises:
+      ClusterDeletionTimeout: the resource deletion fails or times out.
+    """
+    api = self._GetApi(zone)
+    if resource_type == 'instances':
+      recorded_names = self.state.InstanceNames(zone=zone)
+      list_method = api.ListInstances
+      batch_delete_method = api.BatchDeleteInstances
+      remove_record = self.state.RemoveInstance
+    else:
+      recorded_names = self.state.DiskNames(zone=zone)
+      list_method = api.ListDisks
+      batch_delete_method = api.BatchDeleteDisks
+      remove_record = self.state.RemoveDisk
+    if names is not None:
+      recorded_names = [name for name in names if name in recorded_names]
+    if (recorded_names and
+        (names is None or len(recorded_names) == len(names)) and
+        self._DeleteRecordedResources(recorded_names, batch_delete_method,
+                                      remove_record)):
+      return
+    self._DeleteResource(filter_string, list_method, batch_delete_method,
+                         remove_record)
 
   def TeardownCluster(self):
-    """Deletes Compute Engine instances with likely names."""
+    """Deletes Compute Engine instances with likely names.
+
+    Instances and disks in the local record are deleted without list
+    requests.  Otherwise, they are looked for in the zone of the master and
+    the zones of the workers.  Persistent disks are kept if --keep-disks is
+    specified, so that the cluster restarted with the same name reuses them.
+    """
     # Delete route that might have been created at start up time.
     self._GetApi().DeleteRoute(self.route_name)
+    zones = sorted(set([self.zone] + self.worker_zones))
 
     # Delete instances and boot disk.
-    instance_name_filter = 'name eq "^(%s|%s)$"' % (
-        self.master_name, self.worker_name_pattern)
+    instance_name_filter = 'name eq "^(%s|%s|%s)$"' % (
+        self.master_name, self.worker_name_pattern,
+        self.compute_worker_name_pattern)
     logging.info('Delete instances:')
-    self._DeleteResource(
-        instance_name_filter, self._GetApi().ListInstances,
-        self._GetApi().DeleteInstance, self._GetApi().GetInstance)
+    for zone in zones:
+      self._DeleteResourcesInZone(zone, 'instances', instance_name_filter)
+
+    if getattr(self.flags, 'keep_disks', False):
+      logging.info('Keeping persistent disks.')
+      return
 
     # Delete persistent disks (boot disks and data disks).
-    disk_name_filter = 'name eq "^(%s|%s)(%s)?$"' % (
-        self.master_name, self.worker_name_pattern, self.DATA_DISK_APPENDIX)
+    disk_name_filter = 'name eq "^(%s|%s|%s)(%s)?$"' % (
+        self.master_name, self.worker_name_pattern,
+        self.compute_worker_name_pattern, self.DATA_DISK_APPENDIX)
     logging.info('Delete persistent disks:')
-    self._DeleteResource(
-        disk_name_filter, self._GetApi().ListDisks,
-        self._GetApi().DeleteDisk, self._GetApi().GetDisk)
+    for zone in zones:
+      self._DeleteResourcesInZone(zone, 'disks', disk_name_filter)
+
+  def _WaitForImageBundle(self, bundle):
+    """Waits for the image builder to upload the image bundle.
+
+    Args:
+      bundle: Path of the image bundle on Cloud Storage.
+    Raises:
+      ImageBakeError: The builder reported an error, or timed out.
+    """
+    deadline = time.time() + self.IMAGE_BAKE_TIMEOUT
+    backoff = self._StatusCheckBackoff()
+    while True:
+      logging.info('Waiting for image bundle %s...', bundle)
+      if not subprocess.call('gsutil -q ls %s' % bundle, shell=True):
+        return
+      if not subprocess.call('gsutil -q ls %s.error' % bundle, shell=True):
+        raise ImageBakeError(
+            'Image builder failed.  See its serial console output.')
+      if time.time() >= deadline:
+        raise ImageBakeError('Image builder timed out.')
+      backoff.Sleep(deadline)
+
+  def _WaitForImageReady(self, image_name):
+    """Waits for the image created from the bundle to get ready.
+
+    Args:
+      image_name: Name of the image.
+    Raises:
+      ImageBakeError: The image creation failed or timed out.
+    """
+    deadline = time.time() + self.IMAGE_CREATION_TIMEOUT
+    backoff = self._StatusCheckBackoff()
+    while True:
+      image = self._GetApi().GetImage(image_name)
+      status = image.get('status') if image else None
+      if status == 'READY':
+        return
+      if status == 'FAILED':
+        raise ImageBakeError('Image creation failed: %s' % image_name)
+      if time.time() >= deadline:
+        raise ImageBakeError('Image creation timed out: %s' % image_name)
+      backoff.Sleep(deadline)
+
+  def BakeImage(self):
+    """Builds boot image with Hadoop and its packages preinstalled.
+
+    A temporary instance booted from the base image installs the packages,
+    and uploads its boot disk as an image bundle to Cloud Storage, from which
+    the image is created.  Instances started with the image skip download
+    and installation of the packages in the start-up script.  The temporary
+    instance and its disk are deleted even if the image creation fails.
+
+    Raises:
+      ImageBakeError: Building the image failed.
+    """
+    if self._GetApi().GetImage(self.flags.image_name):
+      raise ImageBakeError('Image already exists: %s' % self.flags.image_name)
+
+    if getattr(self.flags, 'prefix', ''):
+      builder_name = '%s-%s' % (self.flags.prefix, self.IMAGE_BUILDER_NAME)
+    else:
+      builder_name = self.IMAGE_BUILDER_NAME
+    bundle = 'gs://%s/mapreduce/image/%s.image.tar.gz' % (
+        self.flags.bucket, self.flags.image_name)
+
+    logging.info('Starting image builder %s', builder_name)
+    self._WaitForOperations(
+        [self._GetApi().CreateDisk(
+            builder_name, image=self.flags.image or self.DEFAULT_IMAGE)],
+        self.DISK_CREATION_TIMEOUT, 'Disk creation', ImageBakeError)
+    try:
+      self._WaitForOperations(
+          [self._GetApi().CreateInstance(
+              builder_name,
+              self.flags.machinetype or self.DEFAULT_MACHINE_TYPE,
+              boot_disk=builder_name,
+              startup_script=self._StartupScript(),
+              service_accounts=[
+                  'https://www.googleapis.com/auth/devstorage.full_control'],
+              metadata={
+                  'tmp-cloud-storage': self.tmp_storage,
+                  'image-bundle': bundle,
+              })],
+          self.INSTANCE_CREATION_TIMEOUT, 'Instance creation', ImageBakeError)
+      self._WaitForImageBundle(bundle)
+
+      logging.info('Creating image %s', self.flags.image_name)
+      if not self._GetApi().CreateImage(
+          self.flags.image_name,
+          bundle.replace('gs://', 'https://storage.googleapis.com/', 1),
+          description='Hadoop on Google Compute Engine'):
+        raise ImageBakeError('Failed to create image: %s' %
+                             self.flags.image_name)
+      self._WaitForImageReady(self.flags.image_name)
+    finally:
+      logging.info('Deleting image builder %s', builder_name)
+      self._DeleteResource('name eq "^%s$"' % builder_name,
+                           self._GetApi().ListInstances,
+                           self._GetApi().BatchDeleteInstances)
+      self._DeleteResource('name eq "^%s$"' % builder_name,
+                           self._GetApi().ListDisks,
+                           self._GetApi().BatchDeleteDisks)
+      # Image bundle is no longer needed once the image is created.
+      for path in [bundle, bundle + '.error']:
+        subprocess.call('gsutil -q rm %s' % path, shell=True)
+
+    logging.info('Image %s is ready.  Start cluster with --image '
+                 'projects/%s/global/images/%s', self.flags.image_name,
+                 self.flags.project, self.flags.image_name)
+
+  def _LoadNodeTimelines(self):
+    """Downloads phase markers of the instances from Cloud Storage.
+
+    Returns:
+      List of spans of the instances of this cluster.
+    """
+    node_pattern = re.compile('^(%s|%s|%s)$' % (
+        re.escape(self.master_name), self.worker_name_pattern,
+        self.compute_worker_name_pattern))
+    local_dir = tempfile.mkdtemp()
+    try:
+      command = 'gsutil -q -m cp %s/timeline/*.txt %s' % (
+          self.tmp_storage, local_dir)
+      logging.debug('Timeline download command: %s', command)
+      if subprocess.call(command, shell=True):
+        logging.warning('No timeline of instances found in %s/timeline/',
+                        self.tmp_storage)
+      spans = []
+      for file_name in sorted(os.listdir(local_dir)):
+        node = os.path.splitext(file_name)[0]
+        if node_pattern.match(node):
+          with open(os.path.join(local_dir, file_name)) as f:
+            spans.extend(timeline.ParseMarkers(node, f.read()))
+      return spans
+    finally:
+      shutil.rmtree(local_dir, ignore_errors=True)
+
+  def ShowTimeline(self):
+    """Shows timeline of the last cluster start-up and its critical path.
+
+    Spans of the steps of the controller are read from the local file saved
+    by StartCluster(), and phases of the instances from the markers that
+    start-up script uploaded to Cloud Storage.
+
+    Raises:
+      ClusterSetUpError: No timeline is found.
+    """
+    spans = []
+    if os.path.exists(self._TimelineFile()):
+      spans.extend(timeline.LoadSpans(self._TimelineFile()))
+    else:
+      logging.warning('No timeline of cluster start-up in %s',
+                      self._TimelineFile())
+    spans.extend(self._LoadNodeTimelines())
+    if not spans:
+      raise ClusterSetUpError('No timeline found')
+
+    critical_path = timeline.CriticalPath(spans)
+    for line in (timeline.FormatGantt(spans, critical_path) + [''] +
+                 timeline.FormatCriticalPath(critical_path)):
+      logging.info('%s', line)
+    csv_file = getattr(self.flags, 'csv', None)
+    if csv_file:
+      with open(csv_file, 'w') as f:
+        timeline.WriteCsv(spans, critical_path, f)
+      logging.info('Timeline written to %s', csv_file)
 
   def _StartScriptAtMaster(self, script, *params):
     """Injects script to master instance and runs it as hadoop user.
@@ -463,8 +1679,7 @@ class GceCluster(object):
 
   def _ShowHadoopInformation(self):
     """Shows Hadoop master information."""
-    instance = self._GetApi().GetInstance(self.master_name)
-    external_ip = instance['networkInterfaces'][0]['accessConfigs'][0]['natIP']
+    external_ip = self._ExternalIp(self._GetMasterInstance())
     logging.info('')
     logging.info('Hadoop cluster is set up, and workers will be eventually '
                  'recognized by the master.')
@@ -527,19 +1742,117 @@ class GceCluster(object):
 
     mapper = self._SetUpMapperReducer(self.flags.mapper, mapreduce_dir)
     reducer = self._SetUpMapperReducer(self.flags.reducer, mapreduce_dir)
-
-    # Upload mappers to copy files between Google Cloud Storage and HDFS.
-    command = 'gsutil cp %s %s %s' % (
-        MakeScriptRelativePath('gcs_to_hdfs_mapper.sh'),
-        MakeScriptRelativePath('hdfs_to_gcs_mapper.sh'),
+    combiner = getattr(self.flags, 'combiner', None)
+    if combiner:
+      combiner = self._SetUpMapperReducer(combiner, mapreduce_dir)
+    files = [self._SetUpMapperReducer(f, mapreduce_dir)
+             for f in getattr(self.flags, 'file', None) or []]
+    self._UploadCopyMapper(mapreduce_dir)
+
+    self._StartMapReduceAtMaster(
+        mapper, self.flags.mapper_count, reducer, self.flags.reducer_count,
+        input_dir, output_dir, combiner, files)
+
+  def _UploadCopyMapper(self, mapreduce_dir):
+    """Uploads mapper to copy files between Google Cloud Storage and HDFS."""
+    command = 'gsutil cp %s %s' % (
+        MakeScriptRelativePath('gcs_hdfs_copy_mapper.py'),
         mapreduce_dir + '/mapper-reducer/')
-    logging.debug('GCS-HDFS mappers upload command: %s', command)
+    logging.debug('GCS-HDFS mapper upload command: %s', command)
     if subprocess.call(command, shell=True):
       # Non-zero return code indicates an error.
       raise MapReduceError('GCS/HDFS copy mapper upload error')
 
+  def _StartMapReduceAtMaster(self, mapper, mapper_count,
+                              reducer, reducer_count, input_dir, output_dir,
+                              combiner=None, files=None):
+    """Runs mapreduce__at__master.sh with options of copy from flags.
+
+    Args:
+      mapper: Mapper on Cloud Storage or on the cluster, or '-' to only copy
+          input to output.
+      mapper_count: Number of mapper tasks.
+      reducer: Reducer on Cloud Storage or on the cluster.
+      reducer_count: Number of reducer tasks.
+      input_dir: Input directory on Cloud Storage, or comma-separated list
+          of directories in HDFS.
+      output_dir: Output directory on Cloud Storage or in HDFS.
+      combiner: Combiner on Cloud Storage or on the cluster, if any.
+      files: List of additional files on Cloud Storage or on the cluster to
+          ship with the job.
+    """
     self._StartScriptAtMaster(
         'mapreduce__at__master.sh', self.flags.bucket,
-        mapper, str(self.flags.mapper_count),
-        reducer, str(self.flags.reducer_count),
-        input_dir, output_dir)
+        mapper, str(mapper_count), reducer, str(reducer_count),
+        input_dir, output_dir,
+        getattr(self.flags, 'output_mode', 'files'),
+        'incremental' if getattr(self.flags, 'incremental_input', False)
+        else 'full',
+        getattr(self.flags, 'direct_io', 'none'),
+        combiner or '-', ','.join(files or []) or '-',
+        getattr(self.flags, 'map_output_codec', 'none'),
+        getattr(self.flags, 'output_codec', 'none'),
+        'decompress' if getattr(self.flags, 'decompress_input', False)
+        else 'keep')
+
+  def StartPipeline(self):
+    """Runs MapReduce stages of the pipeline keeping data in HDFS.
+
+    Each input on Cloud Storage is copied to HDFS once, and output of each
+    stage is kept in HDFS for the stages reading it.  Stages run as soon as
+    the stages they read finish, up to self.concurrency at the same time.
+    Only output of stages with "output" is copied to Cloud Storage at the
+    end.
+
+    Raises:
+      MapReduceError: Pipeline is invalid, or a stage failed.
+    """
+    try:
+      spec = pipeline.Pipeline.Load(self.flags.pipeline)
+    except pipeline.PipelineError as e:
+      raise MapReduceError(str(e))
+    mapreduce_dir = 'gs://%s/mapreduce' % self.flags.bucket
+    self._UploadCopyMapper(mapreduce_dir)
+
+    # Upload programs and files once, even if used by multiple stages.
+    programs = {}
+    for stage in spec.stages:
+      for program in ([stage.mapper, stage.reducer, stage.combiner] +
+                      stage.files):
+        if program not in programs:
+          programs[program] = self._SetUpMapperReducer(program, mapreduce_dir)
+
+    hdfs_dirs = {}
+    for index, input_dir in enumerate(spec.CloudStorageInputs()):
+      hdfs_dirs[input_dir] = '%s/inputs/%d' % (self.PIPELINE_HDFS_DIR, index)
+      logging.info('Copying %s to HDFS', input_dir)
+      # Copy job runs as many mappers as the stages reading the input.
+      copy_count = max(stage.mapper_count for stage in spec.stages
+                       if input_dir in stage.CloudStorageInputs())
+      self._StartMapReduceAtMaster('-', copy_count, '-', 0,
+                                   input_dir.rstrip('/'), hdfs_dirs[input_dir])
+    for stage in spec.stages:
+      hdfs_dirs[stage.name] = '%s/stages/%s' % (self.PIPELINE_HDFS_DIR,
+                                                stage.name)
+
+    def RunStage(stage):
+      self._StartMapReduceAtMaster(
+          programs[stage.mapper], stage.mapper_count,
+          programs[stage.reducer], stage.reducer_count,
+          ','.join(hdfs_dirs[name] for name in stage.inputs),
+          hdfs_dirs[stage.name],
+          programs[stage.combiner] if stage.combiner else None,
+          [programs[f] for f in stage.files])
+
+    try:
+      spec.Run(RunStage, self.concurrency)
+    except pipeline.PipelineError as e:
+      raise MapReduceError(str(e))
+
+    for stage in spec.stages:
+      if stage.output:
+        logging.info('Copying output of stage %s to %s', stage.name,
+                     stage.output)
+        self._StartMapReduceAtMaster(
+            '-', max(stage.mapper_count, stage.reducer_count), '-', 0,
+            hdfs_dirs[stage.name], stage.output.rstrip('/'))
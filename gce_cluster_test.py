@@ -18,10 +18,15 @@
 
 
 import argparse
+import json
+import os
+import shutil
+import tempfile
 import unittest
 
 import mock
 
+import cluster_state
 import gce_cluster
 from gce_cluster import GceCluster
 
@@ -32,6 +37,34 @@ class GceClusterTest(unittest.TestCase):
   def tearDown(self):
     mock.patch.stopall()
 
+  def _SetUpFakeClock(self):
+    """Patches time.time() and time.sleep() with a fake clock.
+
+    Returns:
+      Mock of time.sleep().
+    """
+    clock = [1000.0]
+
+    def Sleep(seconds):
+      clock[0] += seconds
+
+    mock.patch('time.time', side_effect=lambda: clock[0]).start()
+    return mock.patch('time.sleep', side_effect=Sleep).start()
+
+  @staticmethod
+  def _FakeOperation(resource_name, *unused_args, **unused_kwargs):
+    """Returns fake operation resource working on the resource."""
+    return {
+        'name': 'operation-' + resource_name,
+        'targetLink': 'https://www.googleapis.com/compute/v1/' + resource_name,
+        'status': 'PENDING',
+    }
+
+  @classmethod
+  def _FakeBatchOperations(cls, resource_names):
+    """Returns dictionary of fake operations working on the resources."""
+    return dict((name, cls._FakeOperation(name)) for name in resource_names)
+
   def _SetUpMocksForClusterStart(self):
     """Sets up mocks for cluster start tests.
 
@@ -45,7 +78,11 @@ class GceClusterTest(unittest.TestCase):
     mock_popen.return_value.returncode = None
     mock_popen.return_value.poll.return_value = 0
     mock_builtin_open = mock.patch('__builtin__.open').start()
-    mock_sleep = mock.patch('time.sleep').start()
+    mock_sleep = self._SetUpFakeClock()
+    # All ports are open.
+    mock_probe_ports = mock.patch(
+        'port_prober.ProbePorts',
+        side_effect=lambda endpoints, unused_timeout: set(endpoints)).start()
 
     # Create parent mock and attach other mocks to it, so that we can
     # track call order of all mocks.
@@ -58,11 +95,18 @@ class GceClusterTest(unittest.TestCase):
         mock_gce_api_class.return_value.GetInstance,
         'GetInstance')
     parent_mock.attach_mock(
-        mock_gce_api_class.return_value.CreateDisk,
-        'CreateDisk')
+        mock_gce_api_class.return_value.ListInstances,
+        'ListInstances')
     parent_mock.attach_mock(
-        mock_gce_api_class.return_value.GetDisk,
-        'GetDisk')
+        mock_gce_api_class.return_value.BatchCreateDisks,
+        'BatchCreateDisks')
+    parent_mock.attach_mock(
+        mock_gce_api_class.return_value.BatchGet,
+        'BatchGet')
+    parent_mock.attach_mock(
+        mock_gce_api_class.return_value.WaitForOperations,
+        'WaitForOperations')
+    parent_mock.attach_mock(mock_probe_ports, 'ProbePorts')
     parent_mock.attach_mock(mock_subprocess_call, 'subprocess_call')
     parent_mock.attach_mock(mock_popen, 'Popen')
     parent_mock.attach_mock(mock_popen.return_value.poll, 'poll')
@@ -77,23 +121,33 @@ class GceClusterTest(unittest.TestCase):
             }],
         }],
     }
-
-    # Total 6 disks (2 per instance x 3 instances).
-    mock_gce_api_class.return_value.GetDisk.side_effect = [
-        None,
-        {'status': 'READY'},
-        None,
-        {'status': 'READY'},
-        None,
-        {'status': 'READY'},
-        None,
-        {'status': 'READY'},
-        None,
-        {'status': 'READY'},
-        None,
-        {'status': 'READY'},
+    mock_gce_api_class.return_value.ListInstances.return_value = [
+        {'name': 'hw-000', 'status': 'RUNNING'},
+        {'name': 'hw-001', 'status': 'RUNNING'},
     ]
 
+    mock_gce_api_class.return_value.GetMachineType.return_value = {
+        'name': 'n1-highcpu-4', 'guestCpus': 4, 'memoryMb': 3686,
+    }
+    mock_gce_api_class.return_value.CreateInstance.side_effect = (
+        self._FakeOperation)
+    mock_gce_api_class.return_value.WaitForOperations.return_value = []
+
+    # Disks exist once they are created, and are READY immediately.
+    created_disks = set()
+
+    def BatchCreateDisks(disks):
+      created_disks.update(disks)
+      return dict((name, self._FakeOperation(name)) for name in disks)
+
+    def BatchGet(unused_resource_type, names):
+      return dict((name, {'status': 'READY'} if name in created_disks else None)
+                  for name in names)
+
+    mock_gce_api_class.return_value.BatchCreateDisks.side_effect = (
+        BatchCreateDisks)
+    mock_gce_api_class.return_value.BatchGet.side_effect = BatchGet
+
     return parent_mock
 
   def testEnvironmentSetUp_Success(self):
@@ -122,6 +176,35 @@ class GceClusterTest(unittest.TestCase):
           mock_subprocess_call.call_args[0][0],
           '/preprocess.sh \\S+ project-foo gs://bucket-bar/mapreduce/tmp$')
 
+  def _AssertNextCall(self, method_calls, method_name, *args):
+    """Asserts the next call is to the method with the arguments.
+
+    Args:
+      method_calls: Iterator of method calls.
+      method_name: Expected method name.
+      *args: Expected leading positional arguments of the call.
+    Returns:
+      The call object.
+    """
+    call = method_calls.next()
+    self.assertEqual(method_name, call[0])
+    self.assertEqual(args, call[1][:len(args)])
+    return call
+
+  def _AssertNextCallsInAnyOrder(self, method_calls, expected_calls):
+    """Asserts the next calls are the expected calls in arbitrary order.
+
+    Args:
+      method_calls: Iterator of method calls.
+      expected_calls: List of (method name, first positional argument).
+    Returns:
+      List of call objects.
+    """
+    calls = [method_calls.next() for _ in expected_calls]
+    self.assertItemsEqual(expected_calls,
+                          [(call[0], call[1][0]) for call in calls])
+    return calls
+
   def testStartCluster(self):
     """Unit test of StartCluster()."""
     parent_mock = self._SetUpMocksForClusterStart()
@@ -137,30 +220,14 @@ class GceClusterTest(unittest.TestCase):
     # Create GceApi.
     call = method_calls.next()
     self.assertEqual('GceApi', call[0])
-    # See if boot disk exists.
-    call = method_calls.next()
-    self.assertEqual('GetDisk', call[0])
-    self.assertEqual('hm', call[1][0])
-    # Create boot disk.
-    call = method_calls.next()
-    self.assertEqual('CreateDisk', call[0])
-    self.assertEqual('hm', call[1][0])
-    # See if boot disk is ready.
-    call = method_calls.next()
-    self.assertEqual('GetDisk', call[0])
-    self.assertEqual('hm', call[1][0])
-    # See if data disk exists.
-    call = method_calls.next()
-    self.assertEqual('GetDisk', call[0])
-    self.assertEqual('hm-data', call[1][0])
-    # Create data disk.
-    call = method_calls.next()
-    self.assertEqual('CreateDisk', call[0])
-    self.assertEqual('hm-data', call[1][0])
-    # See if data disk is ready.
-    call = method_calls.next()
-    self.assertEqual('GetDisk', call[0])
-    self.assertEqual('hm-data', call[1][0])
+    # Create boot disk and data disk of master if they don't exist.
+    self._AssertNextCall(method_calls, 'BatchGet', 'disks', ['hm', 'hm-data'])
+    call = self._AssertNextCall(method_calls, 'BatchCreateDisks')
+    self.assertEqual(['hm', 'hm-data'], sorted(call[1][0]))
+    # Wait for the disks to get ready.
+    call = self._AssertNextCall(method_calls, 'WaitForOperations')
+    self.assertItemsEqual(['operation-hm', 'operation-hm-data'],
+                          [o['name'] for o in call[1][0]])
     # Open start up script for Compute Engine instance.
     call = method_calls.next()
     self.assertEqual('open', call[0])
@@ -174,94 +241,141 @@ class GceClusterTest(unittest.TestCase):
     self.assertEqual('open', call[0])
     self.assertRegexpMatches(call[1][0], 'id_rsa\\.pub$')
     # Create master instance.
-    call = method_calls.next()
-    self.assertEqual('CreateInstance', call[0])
-    self.assertEqual('hm', call[1][0])
+    call = self._AssertNextCall(method_calls, 'CreateInstance', 'hm')
     self.assertTrue(call[2]['external_ip'])
     self.assertFalse(call[2]['can_ip_forward'])
+    # Wait for the instance creation.
+    call = self._AssertNextCall(method_calls, 'WaitForOperations')
+    self.assertEqual(['operation-hm'], [o['name'] for o in call[1][0]])
     # Check master status.
-    call = method_calls.next()
-    self.assertEqual('GetInstance', call[0])
-    self.assertEqual('hm', call[1][0])
+    self._AssertNextCall(method_calls, 'GetInstance', 'hm')
+    # Check if SSH port of master is open.
+    self._AssertNextCall(method_calls, 'ProbePorts', [('1.2.3.4', 22)])
     # Check if master is ready to SSH.
     call = method_calls.next()
     self.assertEqual('subprocess_call', call[0])
     self.assertRegexpMatches(call[1][0], '^gcutil ssh')
-    # See if boot disk for worker instance #000 exists.
-    call = method_calls.next()
-    self.assertEqual('GetDisk', call[0])
-    self.assertEqual('hw-000', call[1][0])
-    # Create boot disk.
-    call = method_calls.next()
-    self.assertEqual('CreateDisk', call[0])
-    self.assertEqual('hw-000', call[1][0])
-    # See if boot disk is ready.
-    call = method_calls.next()
-    self.assertEqual('GetDisk', call[0])
-    self.assertEqual('hw-000', call[1][0])
-    # See if data disk exists.
-    call = method_calls.next()
-    self.assertEqual('GetDisk', call[0])
-    self.assertEqual('hw-000-data', call[1][0])
-    # Create data disk.
-    call = method_calls.next()
-    self.assertEqual('CreateDisk', call[0])
-    self.assertEqual('hw-000-data', call[1][0])
-    # See if data disk is ready.
-    call = method_calls.next()
-    self.assertEqual('GetDisk', call[0])
-    self.assertEqual('hw-000-data', call[1][0])
-    # Create worker instance #000.
-    call = method_calls.next()
-    self.assertEqual('CreateInstance', call[0])
-    self.assertEqual('hw-000', call[1][0])
-    self.assertTrue(call[2]['external_ip'])
-    self.assertFalse(call[2]['can_ip_forward'])
-    # See if boot disk for worker instance #001 exists.
-    call = method_calls.next()
-    self.assertEqual('GetDisk', call[0])
-    self.assertEqual('hw-001', call[1][0])
-    # Create boot disk.
-    call = method_calls.next()
-    self.assertEqual('CreateDisk', call[0])
-    self.assertEqual('hw-001', call[1][0])
-    # See if boot disk is ready.
-    call = method_calls.next()
-    self.assertEqual('GetDisk', call[0])
-    self.assertEqual('hw-001', call[1][0])
-    # See if data disk exists.
-    call = method_calls.next()
-    self.assertEqual('GetDisk', call[0])
-    self.assertEqual('hw-001-data', call[1][0])
-    # Create data disk.
-    call = method_calls.next()
-    self.assertEqual('CreateDisk', call[0])
-    self.assertEqual('hw-001-data', call[1][0])
-    # See if data disk is ready.
-    call = method_calls.next()
-    self.assertEqual('GetDisk', call[0])
-    self.assertEqual('hw-001-data', call[1][0])
-    # Create worker instance #001.
-    call = method_calls.next()
-    self.assertEqual('CreateInstance', call[0])
-    self.assertEqual('hw-001', call[1][0])
-    self.assertTrue(call[2]['external_ip'])
-    self.assertFalse(call[2]['can_ip_forward'])
-    # Check worker 000's status
-    call = method_calls.next()
-    self.assertEqual('GetInstance', call[0])
-    self.assertEqual('hw-000', call[1][0])
-    # Check worker 001's status
-    call = method_calls.next()
-    self.assertEqual('GetInstance', call[0])
-    self.assertEqual('hw-001', call[1][0])
-    # Get master's external IP address.
+    # Create disks of all workers by batch requests.
+    self._AssertNextCall(
+        method_calls, 'BatchGet', 'disks',
+        ['hw-000', 'hw-000-data', 'hw-001', 'hw-001-data'])
+    call = self._AssertNextCall(method_calls, 'BatchCreateDisks')
+    self.assertEqual(
+        {'hw-000': {'image': GceCluster.DEFAULT_IMAGE},
+         'hw-000-data': {'size_gb': GceCluster.DEFAULT_DATA_DISK_SIZE_GB},
+         'hw-001': {'image': GceCluster.DEFAULT_IMAGE},
+         'hw-001-data': {'size_gb': GceCluster.DEFAULT_DATA_DISK_SIZE_GB}},
+        call[1][0])
+    # Wait for all disks to get ready at once.
+    call = self._AssertNextCall(method_calls, 'WaitForOperations')
+    self.assertItemsEqual(
+        ['operation-hw-000', 'operation-hw-000-data',
+         'operation-hw-001', 'operation-hw-001-data'],
+        [o['name'] for o in call[1][0]])
+    # Create worker instances in parallel.
+    calls = self._AssertNextCallsInAnyOrder(method_calls, [
+        ('CreateInstance', 'hw-000'), ('CreateInstance', 'hw-001'),
+    ])
+    for call in calls:
+      self.assertTrue(call[2]['external_ip'])
+      self.assertFalse(call[2]['can_ip_forward'])
+    # Wait for all instances to be created at once.
+    call = self._AssertNextCall(method_calls, 'WaitForOperations')
+    self.assertItemsEqual(['operation-hw-000', 'operation-hw-001'],
+                          [o['name'] for o in call[1][0]])
+    # Check status of all workers at once.
+    self._AssertNextCall(method_calls, 'ListInstances',
+                         'name eq "^(hw-\\d+|hc-\\d+)$"')
+    # Master's external IP address comes from the local record without
+    # another GetInstance().
+    # Save timeline of the steps.
     call = method_calls.next()
-    self.assertEqual('GetInstance', call[0])
-    self.assertEqual('hm', call[1][0])
+    self.assertEqual('open', call[0])
+    self.assertRegexpMatches(call[1][0], 'timeline-hm\\.csv$')
     # End of call list.
     self.assertRaises(StopIteration, method_calls.next)
 
+  def _GetCreateInstanceCall(self, parent_mock, instance_name):
+    """Returns the CreateInstance() call for the instance."""
+    for call in parent_mock.method_calls:
+      if call[0] == 'CreateInstance' and call[1][0] == instance_name:
+        return call
+    self.fail('CreateInstance() is not called for %s' % instance_name)
+
+  def testStartCluster_HadoopProperties(self):
+    """Unit test of StartCluster() passing Hadoop configuration."""
+    parent_mock = self._SetUpMocksForClusterStart()
+
+    GceCluster(argparse.Namespace(
+        project='project-hoge', bucket='bucket-fuga',
+        machinetype='n1-highcpu-4', image='', zone='us-central2-a',
+        num_workers=2, command='', external_ip='all')).StartCluster()
+
+    # Machine type is looked up only once.
+    parent_mock.GceApi.return_value.GetMachineType.assert_called_once_with(
+        'n1-highcpu-4')
+    for instance_name in ('hm', 'hw-000', 'hw-001'):
+      metadata = self._GetCreateInstanceCall(
+          parent_mock, instance_name)[2]['metadata']
+      self.assertIn(
+          'mapred-site.xml\tmapred.tasktracker.map.tasks.maximum\t4\n',
+          metadata['hadoop-properties'])
+      self.assertIn('hdfs-site.xml\tdfs.replication\t2\n',
+                    metadata['hadoop-properties'])
+
+  def testStartCluster_MachineTypeNotFound(self):
+    """Unit test of StartCluster() with unknown machine type."""
+    parent_mock = self._SetUpMocksForClusterStart()
+    parent_mock.GceApi.return_value.GetMachineType.return_value = None
+
+    self.assertRaises(
+        gce_cluster.ClusterSetUpError,
+        GceCluster(argparse.Namespace(
+            project='project-hoge', bucket='bucket-fuga',
+            machinetype='n1-unknown', image='', zone='us-central2-a',
+            num_workers=2, command='', external_ip='all')).StartCluster)
+
+    self.assertFalse(parent_mock.CreateInstance.called)
+
+  def testHadoopProperties(self):
+    """Unit test of HadoopProperties() for machine types."""
+    def Properties(*args):
+      return dict((name, value) for _, name, value in
+                  gce_cluster.HadoopProperties(*args))
+
+    # n1-highcpu-4: 4 map slots and 2 reduce slots share 2765MB.
+    properties = Properties(4, 3686, 500, 10)
+    self.assertEqual(4, properties['mapred.tasktracker.map.tasks.maximum'])
+    self.assertEqual(2, properties['mapred.tasktracker.reduce.tasks.maximum'])
+    self.assertEqual('-Xmx448m', properties['mapred.child.java.opts'])
+    self.assertEqual(179, properties['io.sort.mb'])
+    self.assertEqual(3, properties['dfs.replication'])
+    self.assertEqual(8, properties['dfs.datanode.handler.count'])
+    self.assertEqual(46, properties['dfs.namenode.handler.count'])
+    self.assertEqual(50 * 1024 ** 3, properties['dfs.datanode.du.reserved'])
+
+    # n1-highmem-8: heap and sort buffer are capped.
+    properties = Properties(8, 53248, 100, 1)
+    self.assertEqual(8, properties['mapred.tasktracker.map.tasks.maximum'])
+    self.assertEqual(4, properties['mapred.tasktracker.reduce.tasks.maximum'])
+    self.assertEqual('-Xmx4096m', properties['mapred.child.java.opts'])
+    self.assertEqual(1024, properties['io.sort.mb'])
+    self.assertEqual(1, properties['dfs.replication'])
+    self.assertEqual(10, properties['dfs.namenode.handler.count'])
+    self.assertEqual(10 * 1024 ** 3, properties['dfs.datanode.du.reserved'])
+
+    # f1-micro: fewer slots so that each heap has the minimum size.
+    properties = Properties(1, 614, 10, 3)
+    self.assertEqual(1, properties['mapred.tasktracker.map.tasks.maximum'])
+    self.assertEqual(1, properties['mapred.tasktracker.reduce.tasks.maximum'])
+    self.assertEqual('-Xmx256m', properties['mapred.child.java.opts'])
+
+    # Many vCPUs with little memory.
+    properties = Properties(16, 4096, 500, 3)
+    self.assertEqual(8, properties['mapred.tasktracker.map.tasks.maximum'])
+    self.assertEqual(4, properties['mapred.tasktracker.reduce.tasks.maximum'])
+    self.assertEqual('-Xmx256m', properties['mapred.child.java.opts'])
+
   def testStartCluster_NoExternalIp(self):
     """Unit test of StartCluster() with no external IP addresses for workers."""
     parent_mock = self._SetUpMocksForClusterStart()
@@ -273,26 +387,55 @@ class GceClusterTest(unittest.TestCase):
 
     # Just check parameters of CreateInstance.
     # Master instance.
-    call = parent_mock.method_calls[10]
-    self.assertEqual('CreateInstance', call[0])
-    self.assertEqual('hm', call[1][0])
+    call = self._GetCreateInstanceCall(parent_mock, 'hm')
     self.assertTrue(call[2]['external_ip'])
     self.assertTrue(call[2]['can_ip_forward'])
 
     # Worker 000.
-    call = parent_mock.method_calls[19]
-    self.assertEqual('CreateInstance', call[0])
-    self.assertEqual('hw-000', call[1][0])
+    call = self._GetCreateInstanceCall(parent_mock, 'hw-000')
     self.assertFalse(call[2]['external_ip'])
     self.assertFalse(call[2]['can_ip_forward'])
 
     # Worker 001.
-    call = parent_mock.method_calls[26]
-    self.assertEqual('CreateInstance', call[0])
-    self.assertEqual('hw-001', call[1][0])
+    call = self._GetCreateInstanceCall(parent_mock, 'hw-001')
     self.assertFalse(call[2]['external_ip'])
     self.assertFalse(call[2]['can_ip_forward'])
 
+  def testStartCluster_WorkerDiskError(self):
+    """Unit test of StartCluster() with disk creation failure of a worker."""
+    parent_mock = self._SetUpMocksForClusterStart()
+    batch_create_disks = (
+        parent_mock.GceApi.return_value.BatchCreateDisks.side_effect)
+
+    def BatchCreateDisks(disks):
+      operations = batch_create_disks(disks)
+      if 'hw-001-data' in operations:
+        operations['hw-001-data'] = None
+      return operations
+
+    parent_mock.GceApi.return_value.BatchCreateDisks.side_effect = (
+        BatchCreateDisks)
+
+    with self.assertRaises(gce_cluster.ClusterSetUpError) as context:
+      GceCluster(argparse.Namespace(
+          project='project-hoge', bucket='bucket-fuga',
+          machinetype='', image='', zone='us-central2-a', num_workers=3,
+          command='', external_ip='all', concurrency=2)).StartCluster()
+
+    # Only the failed disk is reported, and other workers' disks are
+    # created by the same batch request.
+    self.assertIn('hw-001-data', str(context.exception))
+    self.assertNotIn('hw-000', str(context.exception))
+    self.assertNotIn('hw-002', str(context.exception))
+    create_disk_calls = [call[1][0] for call in parent_mock.method_calls
+                         if call[0] == 'BatchCreateDisks']
+    self.assertEqual(2, len(create_disk_calls))
+    self.assertIn('hw-002-data', create_disk_calls[1])
+    # No worker instance is created.
+    self.assertEqual(
+        ['hm'], [call[1][0] for call in parent_mock.method_calls
+                 if call[0] == 'CreateInstance'])
+
   def testStartCluster_InstanceStatusError(self):
     """Unit test of StartCluster() instance status error.
 
@@ -313,9 +456,723 @@ class GceClusterTest(unittest.TestCase):
             machinetype='', image='', zone='', num_workers=2,
             command='', external_ip='all')).StartCluster)
 
-    # Ensure ListInstances() and sleep() are called more than 120 times.
+    # Ensure status is checked until the timeout with growing interval.
     self.assertLessEqual(40, parent_mock.GetInstance.call_count)
-    self.assertLessEqual(40, parent_mock.sleep.call_count)
+    intervals = [c[0][0] for c in parent_mock.sleep.call_args_list]
+    self.assertAlmostEqual(GceCluster.MASTER_SET_UP_TIMEOUT, sum(intervals))
+    self.assertLess(intervals[0], intervals[-2])
+
+  def testWaitForWorkersReady(self):
+    """Unit test of _WaitForWorkersReady() with status changes of workers."""
+    parent_mock = self._SetUpMocksForClusterStart()
+    parent_mock.ListInstances.return_value = None
+    parent_mock.ListInstances.side_effect = [
+        [],
+        [{'name': 'boo-hw-000', 'status': 'STAGING'}],
+        [{'name': 'boo-hw-000', 'status': 'RUNNING'},
+         {'name': 'boo-hw-001', 'status': 'PROVISIONING'},
+         {'name': 'boo-hw-002', 'status': 'RUNNING'}],
+        [{'name': 'boo-hw-000', 'status': 'RUNNING'},
+         {'name': 'boo-hw-001', 'status': 'RUNNING'},
+         {'name': 'boo-hw-002', 'status': 'RUNNING'}],
+    ]
+
+    cluster = GceCluster(argparse.Namespace(
+        project='project-hoge', zone='zone-fuga', num_workers=2,
+        prefix='boo'))
+    cluster._WaitForWorkersReady()
+
+    # One list request per check regardless of the number of workers.
+    self.assertEqual(
+        [mock.call('name eq "^(boo-hw-\\d+|boo-hc-\\d+)$"')] * 4,
+        parent_mock.ListInstances.call_args_list)
+    self.assertEqual(3, parent_mock.sleep.call_count)
+    self.assertFalse(parent_mock.GetInstance.called)
+    # Instances not in the cluster size are ignored.
+    self.assertEqual({'boo-hw-000': 'RUNNING', 'boo-hw-001': 'RUNNING'},
+                     cluster.worker_status)
+
+  def testWaitForMasterSsh_PortNotOpen(self):
+    """Unit test of _WaitForMasterSsh() while SSH port is not open."""
+    parent_mock = self._SetUpMocksForClusterStart()
+    parent_mock.ProbePorts.side_effect = [set(), set(), set([('1.2.3.4', 22)])]
+
+    GceCluster(argparse.Namespace(
+        project='project-hoge', zone='zone-fuga'))._WaitForMasterSsh()
+
+    self.assertEqual(
+        [mock.call([('1.2.3.4', 22)], GceCluster.PORT_PROBE_TIMEOUT)] * 3,
+        parent_mock.ProbePorts.call_args_list)
+    # SSH command runs only once after the port gets open.
+    self.assertEqual(1, parent_mock.subprocess_call.call_count)
+    self.assertEqual(2, parent_mock.sleep.call_count)
+
+  def testWaitForWorkersReady_SshPort(self):
+    """Unit test of _WaitForWorkersReady() with workers' SSH ports probed."""
+    parent_mock = self._SetUpMocksForClusterStart()
+
+    def Worker(name, ip):
+      return {'name': name, 'status': 'RUNNING',
+              'networkInterfaces': [{'accessConfigs': [{'natIP': ip}]}]}
+
+    parent_mock.ListInstances.return_value = [
+        Worker('hw-000', '10.0.0.1'), Worker('hw-001', '10.0.0.2')]
+    parent_mock.ProbePorts.side_effect = [
+        set([('10.0.0.1', 22)]), set(), set([('10.0.0.2', 22)])]
+
+    cluster = GceCluster(argparse.Namespace(
+        project='project-hoge', zone='zone-fuga', num_workers=2))
+    cluster._WaitForWorkersReady()
+
+    # All workers are probed at once, and only until the port gets open.
+    self.assertEqual(
+        [mock.call({('10.0.0.1', 22): 'hw-000', ('10.0.0.2', 22): 'hw-001'},
+                   GceCluster.PORT_PROBE_TIMEOUT),
+         mock.call({('10.0.0.2', 22): 'hw-001'},
+                   GceCluster.PORT_PROBE_TIMEOUT),
+         mock.call({('10.0.0.2', 22): 'hw-001'},
+                   GceCluster.PORT_PROBE_TIMEOUT)],
+        parent_mock.ProbePorts.call_args_list)
+    self.assertEqual(set(['hw-000', 'hw-001']), cluster.ready_workers)
+    self.assertEqual(2, parent_mock.sleep.call_count)
+
+  def testStartCluster_WaitForHadoop(self):
+    """Unit test of StartCluster() waiting for Hadoop daemons on master."""
+    parent_mock = self._SetUpMocksForClusterStart()
+
+    GceCluster(argparse.Namespace(
+        project='project-hoge', bucket='bucket-fuga',
+        machinetype='', image='', zone='us-central2-a', num_workers=2,
+        command='', external_ip='all', wait_for_hadoop=True)).StartCluster()
+
+    parent_mock.ProbePorts.assert_called_with(
+        [('1.2.3.4', 50070), ('1.2.3.4', 50030)],
+        GceCluster.PORT_PROBE_TIMEOUT)
+
+  def testStartCluster_Timeline(self):
+    """Unit test of StartCluster() recording spans of the steps."""
+    parent_mock = self._SetUpMocksForClusterStart()
+
+    cluster = GceCluster(argparse.Namespace(
+        project='project-hoge', bucket='bucket-fuga',
+        machinetype='', image='', zone='us-central2-a', num_workers=2,
+        command='', external_ip='all', wait_for_hadoop=True))
+    cluster.StartCluster()
+
+    self.assertEqual(
+        ['create-route', 'start-master', 'wait-master-ssh',
+         'create-worker-disks', 'create-worker-instances',
+         'wait-workers-ready', 'wait-hadoop-master'],
+        [span.phase for span in cluster.timeline.spans])
+    for span in cluster.timeline.spans:
+      self.assertEqual('controller', span.node)
+      self.assertLessEqual(span.start, span.end)
+    parent_mock.open.assert_called_with('./timeline-hm.csv', 'w')
+
+  def testStartCluster_TimelineOnError(self):
+    """Unit test of StartCluster() saving spans when start-up fails."""
+    parent_mock = self._SetUpMocksForClusterStart()
+    parent_mock.GceApi.return_value.GetInstance.return_value = {
+        'status': 'STAGING',
+    }
+
+    cluster = GceCluster(argparse.Namespace(
+        project='project-hoge', bucket='bucket-fuga',
+        machinetype='', image='', zone='', num_workers=2,
+        command='', external_ip='all'))
+    self.assertRaises(gce_cluster.ClusterSetUpError, cluster.StartCluster)
+
+    self.assertEqual(['create-route', 'start-master', 'wait-master-ssh'],
+                     [span.phase for span in cluster.timeline.spans])
+    # Failed step lasted until the timeout.
+    self.assertAlmostEqual(
+        GceCluster.MASTER_SET_UP_TIMEOUT,
+        cluster.timeline.spans[-1].end - cluster.timeline.spans[-1].start)
+    parent_mock.open.assert_called_with('./timeline-hm.csv', 'w')
+
+  def testStartCluster_BootSnapshot(self):
+    """Unit test of StartCluster() taking snapshot of master boot disk."""
+    parent_mock = self._SetUpMocksForClusterStart()
+    mock_api = parent_mock.GceApi.return_value
+    mock_api.GetSnapshot.return_value = None
+    mock_api.CreateSnapshot.side_effect = self._FakeOperation
+
+    GceCluster(argparse.Namespace(
+        project='project-hoge', bucket='bucket-fuga',
+        machinetype='', image='', zone='us-central2-a', num_workers=2,
+        command='', external_ip='all',
+        boot_snapshot='snap')).StartCluster()
+
+    # Snapshot is taken after Hadoop is set up on the master.
+    parent_mock.ProbePorts.assert_any_call(
+        [('1.2.3.4', 50070), ('1.2.3.4', 50030)],
+        GceCluster.PORT_PROBE_TIMEOUT)
+    mock_api.CreateSnapshot.assert_called_once_with('hm', 'snap')
+    create_disk_calls = [call[1][0] for call in parent_mock.method_calls
+                         if call[0] == 'BatchCreateDisks']
+    self.assertEqual({'image': GceCluster.DEFAULT_IMAGE},
+                     create_disk_calls[0]['hm'])
+    self.assertEqual({'snapshot': 'snap'}, create_disk_calls[1]['hw-000'])
+    self.assertEqual({'snapshot': 'snap'}, create_disk_calls[1]['hw-001'])
+
+  def testStartCluster_ExistingBootSnapshot(self):
+    """Unit test of StartCluster() with existing snapshot."""
+    parent_mock = self._SetUpMocksForClusterStart()
+    mock_api = parent_mock.GceApi.return_value
+    mock_api.GetSnapshot.return_value = {'name': 'snap', 'status': 'READY'}
+
+    GceCluster(argparse.Namespace(
+        project='project-hoge', bucket='bucket-fuga',
+        machinetype='', image='', zone='us-central2-a', num_workers=2,
+        command='', external_ip='all',
+        boot_snapshot='snap')).StartCluster()
+
+    self.assertFalse(mock_api.CreateSnapshot.called)
+
+  def testStartCluster_ReuseDisks(self):
+    """Unit test of StartCluster() on disks left by the previous cluster."""
+    parent_mock = self._SetUpMocksForClusterStart()
+    mock_api = parent_mock.GceApi.return_value
+    # Disks of the master and of the first worker exist.
+    mock_api.BatchGet.side_effect = lambda unused_type, names: dict(
+        (name, {'status': 'READY'} if name.startswith(('hm', 'hw-000'))
+         else None) for name in names)
+
+    cluster = GceCluster(argparse.Namespace(
+        project='project-hoge', bucket='bucket-fuga',
+        machinetype='', image='', zone='us-central2-a', num_workers=2,
+        command='', external_ip='all'))
+    cluster.StartCluster()
+
+    # Only the disks of the new worker are created.
+    create_disk_calls = [call[1][0] for call in parent_mock.method_calls
+                         if call[0] == 'BatchCreateDisks']
+    self.assertEqual([['hw-001', 'hw-001-data']],
+                     [sorted(disks) for disks in create_disk_calls])
+    self.assertEqual(
+        dict((name, 'READY') for name in [
+            'hm', 'hm-data', 'hw-000', 'hw-000-data', 'hw-001',
+            'hw-001-data']),
+        cluster.disk_index)
+
+    # Disks in the index are not looked up again.
+    cluster._CreateDisks(['hm', 'hw-001'])
+    self.assertEqual(2, mock_api.BatchGet.call_count)
+
+  def testCreateDisks_WaitForExistingDisks(self):
+    """Unit test of _CreateDisks() waiting for existing disks together."""
+    parent_mock = self._SetUpMocksForClusterStart()
+    mock_api = parent_mock.GceApi.return_value
+    creating = dict((name, {'status': 'CREATING'}) for name in [
+        'hw-000', 'hw-000-data', 'hw-001', 'hw-001-data'])
+    mock_api.BatchGet.side_effect = [
+        creating, creating,
+        {'hw-000': {'status': 'READY'}, 'hw-000-data': {'status': 'READY'},
+         'hw-001': {'status': 'READY'}, 'hw-001-data': None},
+        {'hw-001-data': {'status': 'READY'}}]
+
+    cluster = GceCluster(argparse.Namespace(
+        project='project-hoge', bucket='bucket-fuga',
+        machinetype='', image='', zone='us-central2-a', num_workers=2,
+        command='', external_ip='all'))
+    self.assertEqual([], cluster._CreateDisks(['hw-000', 'hw-001']))
+
+    # All disks are checked by single request per check.
+    self.assertEqual(4, mock_api.BatchGet.call_count)
+    self.assertEqual(
+        mock.call('disks', ['hw-000', 'hw-000-data', 'hw-001',
+                            'hw-001-data']),
+        mock_api.BatchGet.call_args_list[1])
+    mock_api.BatchGet.assert_called_with('disks', ['hw-001-data'])
+    self.assertFalse(mock_api.BatchCreateDisks.called)
+    self.assertEqual(['READY'] * 4, cluster.disk_index.values())
+
+  def testCreateDisks_WrongState(self):
+    """Unit test of _CreateDisks() with recorded disks that don't exist."""
+    parent_mock = self._SetUpMocksForClusterStart()
+    mock_api = parent_mock.GceApi.return_value
+
+    cluster = GceCluster(argparse.Namespace(
+        project='project-hoge', bucket='bucket-fuga',
+        machinetype='', image='', zone='us-central2-a', num_workers=1,
+        command='', external_ip='all'))
+    # Interrupted start recorded the disks, whose creation never happened.
+    for disk_name in ['hw-000', 'hw-000-data']:
+      cluster.state.RecordDisk(disk_name, 'us-central2-a', 'CREATING')
+    operations = cluster._CreateDisks(['hw-000'])
+
+    mock_api.BatchGet.assert_called_once_with(
+        'disks', ['hw-000', 'hw-000-data'])
+    self.assertEqual(['hw-000', 'hw-000-data'],
+                     sorted(mock_api.BatchCreateDisks.call_args[0][0]))
+    self.assertEqual(2, len(operations))
+
+  def testStartCluster_Resume(self):
+    """Unit test of StartCluster() resuming from the local record."""
+    parent_mock = self._SetUpMocksForClusterStart()
+    mock_api = parent_mock.GceApi.return_value
+    # Only hw-000 of the recorded workers exists.  All workers are running
+    # after the start.
+    workers = [{'name': 'hw-%03d' % i, 'status': 'RUNNING'} for i in xrange(3)]
+    mock_api.ListInstances.side_effect = lambda filter_string: (
+        workers if '\\d' in filter_string else workers[:1])
+
+    cluster = GceCluster(argparse.Namespace(
+        project='project-hoge', bucket='bucket-fuga',
+        machinetype='', image='', zone='us-central2-a', num_workers=3,
+        command='', external_ip='all'))
+    for name in ['hm', 'hw-000', 'hw-002']:
+      cluster.state.RecordInstance(name, 'us-central2-a',
+                                   {'status': 'RUNNING'})
+    cluster.StartCluster()
+
+    # Recorded master is checked by GetInstance() instead of created.
+    self.assertEqual('GetInstance', parent_mock.method_calls[1][0])
+    mock_api.ListInstances.assert_any_call('name eq "^(hw-000|hw-002)$"')
+    create_calls = [call for call in parent_mock.method_calls
+                    if call[0] == 'CreateInstance']
+    self.assertEqual(['hw-001', 'hw-002'],
+                     sorted(call[1][0] for call in create_calls))
+
+  def testStartCluster_PreemptibleWorkers(self):
+    """Unit test of StartCluster() with compute-only preemptible workers."""
+    parent_mock = self._SetUpMocksForClusterStart()
+    mock_api = parent_mock.GceApi.return_value
+    mock_api.ListInstances.return_value = [
+        {'name': name, 'status': 'RUNNING'}
+        for name in ['hw-000', 'hw-001', 'hc-000', 'hc-001', 'hc-002']]
+
+    GceCluster(argparse.Namespace(
+        project='project-hoge', bucket='bucket-fuga',
+        machinetype='', image='', zone='us-central2-a', num_workers=2,
+        preemptible_workers=3, command='',
+        external_ip='master')).StartCluster()
+
+    self.assertEqual(
+        ['hc-000', 'hc-001', 'hc-002', 'hm', 'hw-000', 'hw-001'],
+        sorted(call[1][0] for call in parent_mock.method_calls
+               if call[0] == 'CreateInstance'))
+    core_call = self._GetCreateInstanceCall(parent_mock, 'hw-001')
+    self.assertFalse(core_call[2]['preemptible'])
+    self.assertEqual(1, core_call[2]['metadata']['DataNode'])
+    compute_call = self._GetCreateInstanceCall(parent_mock, 'hc-002')
+    self.assertTrue(compute_call[2]['preemptible'])
+    self.assertNotIn('DataNode', compute_call[2]['metadata'])
+    self.assertEqual(1, compute_call[2]['metadata']['TaskTracker'])
+    self.assertEqual(2, compute_call[2]['metadata']['num-workers'])
+    # Compute-only workers are routed through the master as well.
+    self.assertEqual(['hadoop-workers'], compute_call[2]['tags'])
+    self.assertFalse(self._GetCreateInstanceCall(
+        parent_mock, 'hm')[2]['preemptible'])
+
+  def testReplacePreemptedWorkers(self):
+    """Unit test of ReplacePreemptedWorkers()."""
+    parent_mock = self._SetUpMocksForClusterStart()
+    mock_api = parent_mock.GceApi.return_value
+    mock_api.ListInstances.side_effect = [
+        # Compute-only workers.
+        [{'name': 'hc-001', 'status': 'RUNNING'},
+         {'name': 'hc-000', 'status': 'TERMINATED'},
+         {'name': 'hc-002', 'status': 'TERMINATED'}],
+        # Preempted workers are deleted without listing them again.
+        # Core workers.
+        [{'name': 'hw-%03d' % i} for i in xrange(3)],
+        # Status of the new instances.
+        [{'name': 'hc-000', 'status': 'RUNNING'},
+         {'name': 'hc-002', 'status': 'RUNNING'}],
+    ]
+    mock_api.BatchDeleteInstances.side_effect = self._FakeBatchOperations
+
+    flags = argparse.Namespace(
+        project='project-hoge', bucket='bucket-fuga',
+        machinetype='', image='', zone='us-central2-a', command='',
+        external_ip='all')
+    GceCluster(flags).ReplacePreemptedWorkers()
+
+    mock_api.BatchDeleteInstances.assert_called_once_with(
+        ['hc-000', 'hc-002'])
+    self.assertFalse(mock_api.BatchDeleteDisks.called)
+    create_calls = [call for call in parent_mock.method_calls
+                    if call[0] == 'CreateInstance']
+    self.assertEqual(['hc-000', 'hc-002'],
+                     sorted(call[1][0] for call in create_calls))
+    for call in create_calls:
+      self.assertTrue(call[2]['preemptible'])
+      self.assertEqual(3, call[2]['metadata']['num-workers'])
+
+  def testReplacePreemptedWorkers_NonePreempted(self):
+    """Unit test of ReplacePreemptedWorkers() without preempted workers."""
+    mock_api = mock.patch('gce_api.GceApi').start().return_value
+    mock_api.ListInstances.return_value = [
+        {'name': 'hc-000', 'status': 'RUNNING'}]
+
+    GceCluster(argparse.Namespace(
+        project='project-hoge', zone='zone-fuga')).ReplacePreemptedWorkers()
+
+    mock_api.ListInstances.assert_called_once_with('name eq "^hc-\\d+$"')
+    self.assertFalse(mock_api.BatchDeleteInstances.called)
+    self.assertFalse(mock_api.CreateInstance.called)
+
+  def testReplacePreemptedWorkers_Interval(self):
+    """Unit test of ReplacePreemptedWorkers() checking periodically."""
+    mock_replace = mock.patch.object(
+        GceCluster, '_ReplacePreemptedWorkersOnce',
+        side_effect=[gce_cluster.ClusterSetUpError('quota'), None,
+                     gce_cluster.ClusterSetUpError('quota')]).start()
+    mock_sleep = mock.patch('time.sleep').start()
+
+    # Failure is retried at the next check.
+    GceCluster(argparse.Namespace(
+        project='project-hoge', interval=30)).ReplacePreemptedWorkers(2)
+    self.assertEqual(2, mock_replace.call_count)
+    mock_sleep.assert_called_once_with(30)
+
+    # Failure is raised when checking once.
+    self.assertRaises(
+        gce_cluster.ClusterSetUpError,
+        GceCluster(argparse.Namespace(
+            project='project-hoge', interval=0)).ReplacePreemptedWorkers)
+
+  def _ZoneApiMock(self, zone):
+    """Returns mock of GceApi object in the zone.
+
+    Instances created by the mock are listed as RUNNING, and operations
+    returned by it have the zone.
+    """
+    api = mock.MagicMock(name=zone)
+    zone_url = 'https://www.googleapis.com/compute/v1/zones/' + zone
+    created = []
+
+    def ZoneOperation(resource_name):
+      operation = self._FakeOperation(resource_name)
+      operation['zone'] = zone_url
+      return operation
+
+    def CreateInstance(name, *unused_args, **unused_kwargs):
+      created.append({'name': name, 'status': 'RUNNING'})
+      return ZoneOperation(name)
+
+    api.BatchGet.side_effect = (
+        lambda unused_type, names: dict.fromkeys(names))
+    api.BatchCreateDisks.side_effect = (
+        lambda disks: dict((name, ZoneOperation(name)) for name in disks))
+    api.CreateInstance.side_effect = CreateInstance
+    api.ListInstances.side_effect = lambda unused_filter: list(created)
+    api.WaitForOperations.return_value = []
+    api.GetInstance.return_value = {
+        'status': 'RUNNING',
+        'networkInterfaces': [{'accessConfigs': [{'natIP': '1.2.3.4'}]}],
+    }
+    api.GetMachineType.return_value = {
+        'name': 'n1-highcpu-4', 'guestCpus': 4, 'memoryMb': 3686,
+    }
+    return api
+
+  def _SetUpMocksForZones(self, zones):
+    """Sets up a mock of GceApi object per zone for multi-zone tests.
+
+    Args:
+      zones: List of zone names.
+    Returns:
+      Dictionary of zone name to mock of GceApi object.
+    """
+    apis = dict((zone, self._ZoneApiMock(zone)) for zone in zones)
+    self.mock_gce_api_class = mock.patch(
+        'gce_api.GceApi',
+        side_effect=lambda *args, **unused_kwargs: apis[args[-1]]).start()
+    mock.patch('subprocess.call', return_value=0).start()
+    mock.patch('__builtin__.open').start()
+    mock.patch('port_prober.ProbePorts',
+               side_effect=lambda endpoints, unused_timeout: set(endpoints)
+              ).start()
+    self._SetUpFakeClock()
+    return apis
+
+  def testStartCluster_MultiZone(self):
+    """Unit test of StartCluster() spreading workers over zones."""
+    apis = self._SetUpMocksForZones(['zone-a', 'zone-b', 'zone-c'])
+
+    GceCluster(argparse.Namespace(
+        project='project-hoge', bucket='bucket-fuga',
+        machinetype='', image='', zone='zone-a', num_workers=5,
+        preemptible_workers=2, worker_zones='zone-b,zone-c', command='',
+        external_ip='all')).StartCluster()
+
+    def CreatedInstances(zone):
+      return sorted(call[0][0] for call in
+                    apis[zone].CreateInstance.call_args_list)
+
+    self.assertEqual(['hm'], CreatedInstances('zone-a'))
+    self.assertEqual(['hc-000', 'hw-000', 'hw-002', 'hw-004'],
+                     CreatedInstances('zone-b'))
+    self.assertEqual(['hc-001', 'hw-001', 'hw-003'],
+                     CreatedInstances('zone-c'))
+    # Disks are created in the zones of their instances.
+    self.assertEqual(
+        ['hw-001', 'hw-001-data', 'hw-003', 'hw-003-data',
+         'hc-001', 'hc-001-data'],
+        sorted(apis['zone-c'].BatchCreateDisks.call_args[0][0],
+               key=lambda name: (name[:2] == 'hc', name)))
+    # Operations are waited for in their zones.
+    self.assertTrue(apis['zone-b'].WaitForOperations.called)
+    for call in apis['zone-b'].WaitForOperations.call_args_list:
+      self.assertTrue(all(o['zone'].endswith('/zone-b') for o in call[0][0]))
+    # Status of workers is checked by one list request per zone.
+    self.assertFalse(apis['zone-a'].ListInstances.called)
+    self.assertEqual(1, apis['zone-b'].ListInstances.call_count)
+    # Topology script is set up on all instances.
+    metadata = apis['zone-c'].CreateInstance.call_args[1]['metadata']
+    self.assertEqual(1, metadata['rack-aware'])
+    self.assertIn(
+        'core-site.xml\ttopology.script.file.name\t'
+        '/home/hadoop/hadoop/conf/topology.sh\n',
+        metadata['hadoop-properties'])
+    # API calls in all zones share the rate limit.
+    rate_limiters = [call[1]['rate_limiter'] for call in
+                     self.mock_gce_api_class.call_args_list]
+    self.assertEqual(3, len(rate_limiters))
+    self.assertEqual(1, len(set(rate_limiters)))
+
+  def testStartCluster_SingleZone(self):
+    """Unit test of StartCluster() without topology script in single zone."""
+    apis = self._SetUpMocksForZones(['zone-a'])
+
+    GceCluster(argparse.Namespace(
+        project='project-hoge', bucket='bucket-fuga',
+        machinetype='', image='', zone='zone-a', num_workers=2,
+        worker_zones='zone-a', command='', external_ip='all')).StartCluster()
+
+    metadata = apis['zone-a'].CreateInstance.call_args[1]['metadata']
+    self.assertEqual(0, metadata['rack-aware'])
+    self.assertNotIn('topology', metadata['hadoop-properties'])
+
+  def testInstanceZone(self):
+    """Unit test of _InstanceZone()."""
+    cluster = GceCluster(argparse.Namespace(
+        project='project-hoge', zone='zone-a', prefix='boo',
+        worker_zones='zone-b,zone-c'))
+
+    self.assertEqual('zone-a', cluster._InstanceZone('boo-hm'))
+    self.assertEqual('zone-b', cluster._InstanceZone('boo-hw-000'))
+    self.assertEqual('zone-c', cluster._InstanceZone('boo-hw-011'))
+    self.assertEqual('zone-c', cluster._InstanceZone('boo-hc-001'))
+    # Zone where the instance was found takes precedence.
+    cluster.instance_zones['boo-hw-011'] = 'zone-b'
+    self.assertEqual('zone-b', cluster._InstanceZone('boo-hw-011'))
+
+  def testShrinkCluster_MultiZone(self):
+    """Unit test of ShrinkCluster() deleting workers in their zones."""
+    apis = self._SetUpMocksForZones(['zone-a', 'zone-b'])
+    for zone, indices in [('zone-a', [0, 2, 4]), ('zone-b', [1, 3])]:
+      apis[zone].ListInstances.side_effect = [
+          [{'name': 'hw-%03d' % i} for i in indices],
+          [{'name': 'hw-%03d' % indices[-1]}], []]
+      apis[zone].ListDisks.side_effect = [
+          [{'name': 'hw-%03d' % indices[-1]}], []]
+      apis[zone].BatchDeleteInstances.side_effect = self._FakeBatchOperations
+      apis[zone].BatchDeleteDisks.side_effect = self._FakeBatchOperations
+
+    GceCluster(argparse.Namespace(
+        project='project-hoge', zone='zone-a', worker_zones='zone-a,zone-b',
+        count=2)).ShrinkCluster()
+
+    apis['zone-a'].BatchDeleteInstances.assert_called_once_with(['hw-004'])
+    apis['zone-b'].BatchDeleteInstances.assert_called_once_with(['hw-003'])
+    apis['zone-b'].ListDisks.assert_called_with(
+        'name eq "^(hw-003)(-data)?$"')
+
+  def testGrowCluster(self):
+    """Unit test of GrowCluster()."""
+    parent_mock = self._SetUpMocksForClusterStart()
+    mock_api = parent_mock.GceApi.return_value
+    existing_workers = [
+        {'name': 'hw-001', 'status': 'RUNNING'},
+        {'name': 'hw-000', 'status': 'RUNNING'},
+    ]
+    mock_api.ListInstances.side_effect = [
+        existing_workers,
+        existing_workers + [{'name': 'hw-002', 'status': 'RUNNING'},
+                            {'name': 'hw-003', 'status': 'RUNNING'}],
+    ]
+
+    flags = argparse.Namespace(
+        project='project-hoge', bucket='bucket-fuga',
+        machinetype='', image='', zone='us-central2-a', count=2,
+        command='', external_ip='all')
+    GceCluster(flags).GrowCluster()
+
+    self.assertEqual(
+        ['hw-002', 'hw-003'],
+        sorted(call[1][0] for call in parent_mock.method_calls
+               if call[0] == 'CreateInstance'))
+    self.assertEqual(4, flags.num_workers)
+    self.assertEqual(
+        4, self._GetCreateInstanceCall(
+            parent_mock, 'hw-002')[2]['metadata']['num-workers'])
+    # New workers are added to the master after they get ready.
+    self.assertEqual('subprocess_call', parent_mock.method_calls[-1][0])
+    self.assertRegexpMatches(
+        parent_mock.method_calls[-1][1][0],
+        'resize__at__master.sh hadoop add 0 hw-002 hw-003$')
+
+  def _SetUpMocksForClusterShrink(self):
+    """Sets up mocks for cluster shrink tests.
+
+    Returns:
+      Tuple of mock of GceApi object and mock of subprocess.call().
+    """
+    mock_api = mock.patch('gce_api.GceApi').start().return_value
+    mock_subprocess_call = mock.patch('subprocess.call', return_value=0).start()
+    workers = [
+        {'name': 'hw-%03d' % i,
+         'networkInterfaces': [{
+             'networkIP': '10.0.0.%d' % i,
+             'accessConfigs': [{'natIP': '1.2.3.%d' % i}],
+         }]} for i in xrange(5)]
+    mock_api.ListInstances.return_value = workers[::-1]
+    mock_api.ListDisks.side_effect = [
+        [{'name': 'hw-003'}, {'name': 'hw-003-data'}], []]
+    mock_api.BatchDeleteInstances.side_effect = self._FakeBatchOperations
+    mock_api.BatchDeleteDisks.side_effect = self._FakeBatchOperations
+    mock_api.WaitForOperations.return_value = []
+    return mock_api, mock_subprocess_call
+
+  def testShrinkCluster(self):
+    """Unit test of ShrinkCluster()."""
+    mock_api, mock_subprocess_call = self._SetUpMocksForClusterShrink()
+
+    GceCluster(argparse.Namespace(
+        project='project-hoge', zone='zone-fuga', count=2)).ShrinkCluster()
+
+    # Workers with the largest numbers are decommissioned, and then deleted.
+    commands = [call[0][0] for call in mock_subprocess_call.call_args_list]
+    self.assertEqual(2, len(commands))
+    self.assertRegexpMatches(
+        commands[0],
+        'resize__at__master.sh hadoop decommission 3600 '
+        'hw-003 10.0.0.3 1.2.3.3 hw-004 10.0.0.4 1.2.3.4$')
+    # Instances listed at the start are deleted without listing them again.
+    mock_api.ListInstances.assert_called_once_with('name eq "^hw-\\d+$"')
+    mock_api.BatchDeleteInstances.assert_called_once_with(['hw-003', 'hw-004'])
+    mock_api.ListDisks.assert_called_with(
+        'name eq "^(hw-003|hw-004)(-data)?$"')
+    self.assertRegexpMatches(
+        commands[1],
+        'resize__at__master.sh hadoop remove 0 '
+        'hw-003 10.0.0.3 1.2.3.3 hw-004 10.0.0.4 1.2.3.4$')
+
+  def testShrinkCluster_DecommissionError(self):
+    """Unit test of ShrinkCluster() when decommission fails."""
+    mock_api, mock_subprocess_call = self._SetUpMocksForClusterShrink()
+    mock_subprocess_call.return_value = 1
+
+    self.assertRaises(
+        gce_cluster.RemoteExecutionError,
+        GceCluster(argparse.Namespace(
+            project='project-hoge', zone='zone-fuga',
+            count=2)).ShrinkCluster)
+
+    # No worker is deleted.
+    self.assertFalse(mock_api.BatchDeleteInstances.called)
+    self.assertFalse(mock_api.BatchDeleteDisks.called)
+
+  def testShrinkCluster_TooManyWorkers(self):
+    """Unit test of ShrinkCluster() leaving fewer workers than replicas."""
+    mock_api, mock_subprocess_call = self._SetUpMocksForClusterShrink()
+
+    # The error tells the largest number of workers that can be removed.
+    self.assertRaisesRegexp(
+        gce_cluster.ClusterResizeError, 'at most 2 can be removed',
+        GceCluster(argparse.Namespace(
+            project='project-hoge', zone='zone-fuga',
+            count=3)).ShrinkCluster)
+
+    self.assertFalse(mock_subprocess_call.called)
+    self.assertFalse(mock_api.BatchDeleteInstances.called)
+
+  def _AutoscaleFlags(self):
+    """Returns flags of 'autoscale' subcommand."""
+    return argparse.Namespace(
+        project='project-hoge', bucket='bucket-fuga', zone='zone-fuga',
+        min_workers=2, max_workers=10, interval=60, max_step=5,
+        scale_up_cooldown=300, scale_down_cooldown=600)
+
+  def testAutoscale(self):
+    """Unit test of Autoscale() adding workers for waiting tasks."""
+    mock_api = mock.patch('gce_api.GceApi').start().return_value
+    mock_api.GetInstance.return_value = {
+        'name': 'hm',
+        'networkInterfaces': [{'accessConfigs': [{'natIP': '1.2.3.4'}]}],
+    }
+    mock_api.ListInstances.return_value = [
+        {'name': 'hw-%03d' % i} for i in xrange(3)]
+    mock_client_class = mock.patch('autoscaler.JobTrackerClient').start()
+    # 3 workers with 4 map slots each are busy, and 6 maps are waiting.
+    mock_client_class.return_value.GetLoad.return_value = (
+        gce_cluster.autoscaler.Load(3, 12, 12, 6, 6, 0, 0))
+    mock_grow = mock.patch.object(GceCluster, 'GrowCluster').start()
+    mock_sleep = mock.patch('time.sleep').start()
+
+    flags = self._AutoscaleFlags()
+    GceCluster(flags).Autoscale(iterations=3)
+
+    mock_client_class.assert_called_once_with('1.2.3.4')
+    self.assertEqual(3, mock_client_class.return_value.GetLoad.call_count)
+    # Workers are added after 2 consecutive samples, and not again within
+    # the cooldown.
+    mock_grow.assert_called_once_with()
+    self.assertEqual(2, flags.count)
+    self.assertEqual(2, mock_sleep.call_count)
+
+  def testAutoscale_IdleWithFewMinWorkers(self):
+    """Unit test of Autoscale() removing workers down to 3 at least."""
+    mock_api = mock.patch('gce_api.GceApi').start().return_value
+    mock_api.GetInstance.return_value = {
+        'name': 'hm',
+        'networkInterfaces': [{'accessConfigs': [{'natIP': '1.2.3.4'}]}],
+    }
+    mock_api.ListInstances.return_value = [
+        {'name': 'hw-%03d' % i} for i in xrange(10)]
+    mock_client_class = mock.patch('autoscaler.JobTrackerClient').start()
+    # 10 workers with 4 map slots each are idle.
+    mock_client_class.return_value.GetLoad.return_value = (
+        gce_cluster.autoscaler.Load(10, 40, 0, 0, 20, 0, 0))
+    mock_shrink = mock.patch.object(GceCluster, 'ShrinkCluster').start()
+    mock.patch('time.sleep').start()
+
+    flags = self._AutoscaleFlags()
+    flags.min_workers = 1
+    flags.max_workers = 20
+    flags.max_step = 10
+    GceCluster(flags).Autoscale(iterations=5)
+
+    # Workers are removed after 5 consecutive samples down to 3, which
+    # ShrinkCluster() accepts.
+    mock_shrink.assert_called_once_with()
+    self.assertEqual(7, flags.count)
+
+  def testResize_TooManyWorkersToRemove(self):
+    """Unit test of _Resize() removing as many workers as allowed."""
+    mock_api = mock.patch('gce_api.GceApi').start().return_value
+    mock_api.ListInstances.return_value = [
+        {'name': 'hw-%03d' % i} for i in xrange(5)]
+    mock_shrink = mock.patch.object(GceCluster, 'ShrinkCluster').start()
+
+    flags = argparse.Namespace(project='project-hoge', zone='zone-fuga')
+    GceCluster(flags)._Resize(-4)
+
+    mock_shrink.assert_called_once_with()
+    self.assertEqual(2, flags.count)
+
+  def testAutoscale_NoMaster(self):
+    """Unit test of Autoscale() without running master."""
+    mock_api = mock.patch('gce_api.GceApi').start().return_value
+    mock_api.GetInstance.return_value = None
+    mock_client_class = mock.patch('autoscaler.JobTrackerClient').start()
+
+    self.assertRaises(gce_cluster.ClusterResizeError,
+                      GceCluster(self._AutoscaleFlags()).Autoscale, 1)
+    self.assertFalse(mock_client_class.called)
 
   def testTeardownCluster(self):
     """Unit test of TeardownCluster()."""
@@ -334,28 +1191,78 @@ class GceClusterTest(unittest.TestCase):
               {'name': 'piyopiyo-data'},
           ], []
       ]
-      mock_gce_api_class.return_value.GetInstance.return_value = None
-      mock_gce_api_class.return_value.GetDisk.return_value = None
+      mock_gce_api_class.return_value.BatchDeleteInstances.side_effect = (
+          self._FakeBatchOperations)
+      mock_gce_api_class.return_value.BatchDeleteDisks.side_effect = (
+          self._FakeBatchOperations)
+      mock_gce_api_class.return_value.WaitForOperations.return_value = []
 
       GceCluster(argparse.Namespace(
           project='project-hoge', zone='zone-fuga')).TeardownCluster()
 
       mock_gce_api_class.assert_called_once_with(
           'hadoop_on_compute', mock.ANY, mock.ANY,
-          'project-hoge', 'zone-fuga')
+          'project-hoge', 'zone-fuga', rate_limiter=mock.ANY)
       (mock_gce_api_class.return_value.ListInstances.
-       assert_called_with('name eq "^(hm|hw-\\d+)$"'))
+       assert_called_with('name eq "^(hm|hw-\\d+|hc-\\d+)$"'))
       (mock_gce_api_class.return_value.ListDisks.
-       assert_called_with('name eq "^(hm|hw-\\d+)(-data)?$"'))
-      # Make sure DeleteInstance() is called for each instance.
+       assert_called_with('name eq "^(hm|hw-\\d+|hc-\\d+)(-data)?$"'))
+      # Make sure all instances and disks are deleted by single call each.
       self.assertEqual(
-          [mock.call('fugafuga'), mock.call('hogehoge'),
-           mock.call('piyopiyo')],
-          mock_gce_api_class.return_value.DeleteInstance.call_args_list)
+          [mock.call(['fugafuga', 'hogehoge', 'piyopiyo'])],
+          mock_gce_api_class.return_value.BatchDeleteInstances.call_args_list)
       self.assertEqual(
-          [mock.call('fugafuga-data'), mock.call('hogehoge-data'),
-           mock.call('piyopiyo-data')],
-          mock_gce_api_class.return_value.DeleteDisk.call_args_list)
+          [mock.call(['fugafuga-data', 'hogehoge-data', 'piyopiyo-data'])],
+          mock_gce_api_class.return_value.BatchDeleteDisks.call_args_list)
+      self.assertEqual(
+          2, mock_gce_api_class.return_value.WaitForOperations.call_count)
+
+  def testTeardownCluster_AlreadyDeleted(self):
+    """Unit test of TeardownCluster() with resources deleted by others."""
+    mock_api = mock.patch('gce_api.GceApi').start().return_value
+    mock_api.ListInstances.side_effect = [
+        [{'name': 'hm'}, {'name': 'hw-000'}], [], []]
+    mock_api.ListDisks.return_value = []
+    # Deletion is not accepted, as the instances are gone already.
+    mock_api.BatchDeleteInstances.return_value = {'hm': None, 'hw-000': None}
+
+    GceCluster(argparse.Namespace(
+        project='project-hoge', zone='zone-fuga')).TeardownCluster()
+
+    self.assertEqual(3, mock_api.ListInstances.call_count)
+    self.assertFalse(mock_api.WaitForOperations.called)
+
+  def testTeardownCluster_DeletionError(self):
+    """Unit test of TeardownCluster() when the resources can't be deleted."""
+    mock_api = mock.patch('gce_api.GceApi').start().return_value
+    mock_api.ListInstances.side_effect = [
+        [{'name': 'hm'}, {'name': 'hw-000'}], [{'name': 'hw-000'}]]
+    mock_api.BatchDeleteInstances.return_value = {'hm': None, 'hw-000': None}
+
+    self.assertRaisesRegexp(
+        gce_cluster.ClusterDeletionTimeout, 'resources: hw-000$',
+        GceCluster(argparse.Namespace(
+            project='project-hoge', zone='zone-fuga')).TeardownCluster)
+
+  def testTeardownCluster_MultiZone(self):
+    """Unit test of TeardownCluster() in the zones of master and workers."""
+    apis = self._SetUpMocksForZones(['zone-a', 'zone-b', 'zone-c'])
+    for api in apis.values():
+      api.ListInstances.side_effect = None
+      api.ListInstances.return_value = []
+      api.ListDisks.return_value = []
+
+    GceCluster(argparse.Namespace(
+        project='project-hoge', zone='zone-b',
+        worker_zones='zone-a,zone-b')).TeardownCluster()
+
+    for zone in ['zone-a', 'zone-b']:
+      apis[zone].ListInstances.assert_called_once_with(
+          'name eq "^(hm|hw-\\d+|hc-\\d+)$"')
+      apis[zone].ListDisks.assert_called_once_with(
+          'name eq "^(hm|hw-\\d+|hc-\\d+)(-data)?$"')
+    self.assertFalse(apis['zone-c'].ListInstances.called)
+    apis['zone-b'].DeleteRoute.assert_called_once_with('hadoop-worker-route')
 
   def testTeardownCluster_WithPrefix(self):
     """Unit test of TeardownCluster() with prefix."""
@@ -366,8 +1273,11 @@ class GceClusterTest(unittest.TestCase):
       mock_gce_api_class.return_value.ListDisks.side_effect = [
           [{'name': 'wahoooo-data'}], []
       ]
-      mock_gce_api_class.return_value.GetInstance.return_value = None
-      mock_gce_api_class.return_value.GetDisk.return_value = None
+      mock_gce_api_class.return_value.BatchDeleteInstances.side_effect = (
+          self._FakeBatchOperations)
+      mock_gce_api_class.return_value.BatchDeleteDisks.side_effect = (
+          self._FakeBatchOperations)
+      mock_gce_api_class.return_value.WaitForOperations.return_value = []
 
       GceCluster(argparse.Namespace(
           project='project-hoge', zone='zone-fuga',
@@ -375,18 +1285,19 @@ class GceClusterTest(unittest.TestCase):
 
       mock_gce_api_class.assert_called_once_with(
           'hadoop_on_compute', mock.ANY, mock.ANY,
-          'project-hoge', 'zone-fuga')
+          'project-hoge', 'zone-fuga', rate_limiter=mock.ANY)
       # Make sure prefix is included in instance name patterns.
       (mock_gce_api_class.return_value.ListInstances.
-       assert_called_with('name eq "^(boo-hm|boo-hw-\\d+)$"'))
+       assert_called_with('name eq "^(boo-hm|boo-hw-\\d+|boo-hc-\\d+)$"'))
       (mock_gce_api_class.return_value.ListDisks.
-       assert_called_with('name eq "^(boo-hm|boo-hw-\\d+)(-data)?$"'))
+       assert_called_with(
+           'name eq "^(boo-hm|boo-hw-\\d+|boo-hc-\\d+)(-data)?$"'))
       self.assertEqual(
-          [mock.call('wahoooo')],
-          mock_gce_api_class.return_value.DeleteInstance.call_args_list)
+          [mock.call(['wahoooo'])],
+          mock_gce_api_class.return_value.BatchDeleteInstances.call_args_list)
       self.assertEqual(
-          [mock.call('wahoooo-data')],
-          mock_gce_api_class.return_value.DeleteDisk.call_args_list)
+          [mock.call(['wahoooo-data'])],
+          mock_gce_api_class.return_value.BatchDeleteDisks.call_args_list)
 
   def testTeardownCluster_NoInstance(self):
     """Unit test of TeardownCluster() with no instance returned by list."""
@@ -400,17 +1311,282 @@ class GceClusterTest(unittest.TestCase):
 
       mock_gce_api_class.assert_called_once_with(
           'hadoop_on_compute', mock.ANY, mock.ANY,
-          'project-hoge', 'zone-fuga')
+          'project-hoge', 'zone-fuga', rate_limiter=mock.ANY)
       (mock_gce_api_class.return_value.ListInstances.
-       assert_called_once_with('name eq "^(hm|hw-\\d+)$"'))
+       assert_called_once_with('name eq "^(hm|hw-\\d+|hc-\\d+)$"'))
       (mock_gce_api_class.return_value.ListDisks.
-       assert_called_once_with('name eq "^(hm|hw-\\d+)(-data)?$"'))
-      # Make sure DeleteInstance() is not called.
+       assert_called_once_with('name eq "^(hm|hw-\\d+|hc-\\d+)(-data)?$"'))
+      # Make sure BatchDeleteInstances() is not called.
+      self.assertFalse(
+          mock_gce_api_class.return_value.BatchDeleteInstances.called)
+      # Make sure BatchDeleteDisks() is not called.
       self.assertFalse(
-          mock_gce_api_class.return_value.DeleteInstance.called)
-      # Make sure DeleteDisk() is not called.
+          mock_gce_api_class.return_value.BatchDeleteDisks.called)
+
+  def testTeardownCluster_KeepDisks(self):
+    """Unit test of TeardownCluster() keeping persistent disks."""
+    with mock.patch('gce_api.GceApi') as mock_gce_api_class:
+      mock_gce_api_class.return_value.ListInstances.side_effect = [
+          [{'name': 'hm'}], []]
+      mock_gce_api_class.return_value.BatchDeleteInstances.side_effect = (
+          self._FakeBatchOperations)
+      mock_gce_api_class.return_value.WaitForOperations.return_value = []
+
+      GceCluster(argparse.Namespace(
+          project='project-hoge', zone='zone-fuga',
+          keep_disks=True)).TeardownCluster()
+
+      (mock_gce_api_class.return_value.BatchDeleteInstances.
+       assert_called_once_with(['hm']))
+      self.assertFalse(mock_gce_api_class.return_value.ListDisks.called)
       self.assertFalse(
-          mock_gce_api_class.return_value.DeleteDisk.called)
+          mock_gce_api_class.return_value.BatchDeleteDisks.called)
+
+  def _SetUpStateDir(self, instances, disks):
+    """Writes local record of the instances and the disks in zone-fuga.
+
+    Returns:
+      Directory of the record.
+    """
+    state_dir = tempfile.mkdtemp()
+    self.addCleanup(shutil.rmtree, state_dir)
+    state = cluster_state.ClusterState(
+        os.path.join(state_dir, 'cluster-project-hoge-hm.json'))
+    for name in instances:
+      state.RecordInstance(name, 'zone-fuga', {'status': 'RUNNING'})
+    for name in disks:
+      state.RecordDisk(name, 'zone-fuga', 'READY')
+    state.Save()
+    return state_dir
+
+  def testTeardownCluster_StateDir(self):
+    """Unit test of TeardownCluster() deleting recorded resources."""
+    state_dir = self._SetUpStateDir(['hm', 'hw-000'],
+                                    ['hm', 'hm-data', 'hw-000', 'hw-000-data'])
+    mock_api = mock.patch('gce_api.GceApi').start().return_value
+    mock_api.BatchDeleteInstances.side_effect = self._FakeBatchOperations
+    mock_api.BatchDeleteDisks.side_effect = self._FakeBatchOperations
+    mock_api.WaitForOperations.return_value = []
+
+    GceCluster(argparse.Namespace(
+        project='project-hoge', zone='zone-fuga',
+        state_dir=state_dir)).TeardownCluster()
+
+    # Recorded resources are deleted without list requests.
+    self.assertFalse(mock_api.ListInstances.called)
+    self.assertFalse(mock_api.ListDisks.called)
+    mock_api.BatchDeleteInstances.assert_called_once_with(['hm', 'hw-000'])
+    mock_api.BatchDeleteDisks.assert_called_once_with(
+        ['hm', 'hm-data', 'hw-000', 'hw-000-data'])
+    state = cluster_state.ClusterState(
+        os.path.join(state_dir, 'cluster-project-hoge-hm.json'))
+    self.assertEqual([], state.InstanceNames())
+    self.assertEqual([], state.DiskNames())
+
+  def testTeardownCluster_WrongState(self):
+    """Unit test of TeardownCluster() when the record turns out wrong."""
+    state_dir = self._SetUpStateDir(['hm', 'hw-000'], [])
+    mock_api = mock.patch('gce_api.GceApi').start().return_value
+    # hw-000 has been deleted by other means, and hw-001 has been created.
+    mock_api.BatchDeleteInstances.side_effect = [
+        {'hm': self._FakeOperation('hm'), 'hw-000': None},
+        self._FakeBatchOperations(['hw-001'])]
+    mock_api.ListInstances.side_effect = [[{'name': 'hw-001'}], []]
+    mock_api.ListDisks.return_value = []
+    mock_api.WaitForOperations.return_value = []
+
+    GceCluster(argparse.Namespace(
+        project='project-hoge', zone='zone-fuga',
+        state_dir=state_dir)).TeardownCluster()
+
+    # Instances are listed after deleting the recorded ones.
+    self.assertEqual(
+        [mock.call(['hm', 'hw-000']), mock.call(['hw-001'])],
+        mock_api.BatchDeleteInstances.call_args_list)
+    mock_api.ListInstances.assert_called_with(
+        'name eq "^(hm|hw-\\d+|hc-\\d+)$"')
+    mock_api.ListDisks.assert_called_once_with(
+        'name eq "^(hm|hw-\\d+|hc-\\d+)(-data)?$"')
+
+  def testTeardownCluster_RefreshState(self):
+    """Unit test of TeardownCluster() discarding the local record."""
+    state_dir = self._SetUpStateDir(['hm'], [])
+    mock_api = mock.patch('gce_api.GceApi').start().return_value
+    mock_api.ListInstances.return_value = []
+    mock_api.ListDisks.return_value = []
+
+    GceCluster(argparse.Namespace(
+        project='project-hoge', zone='zone-fuga', state_dir=state_dir,
+        refresh_state=True)).TeardownCluster()
+
+    self.assertFalse(mock_api.BatchDeleteInstances.called)
+    mock_api.ListInstances.assert_called_once_with(
+        'name eq "^(hm|hw-\\d+|hc-\\d+)$"')
+
+  def _SetUpMocksForBakeImage(self, subprocess_results):
+    """Sets up mocks for image bake tests.
+
+    Args:
+      subprocess_results: Return codes of subprocess.call() in order.
+    Returns:
+      Tuple of mock of GceApi object and mock of subprocess.call().
+    """
+    mock_api = mock.patch('gce_api.GceApi').start().return_value
+    mock_subprocess_call = mock.patch(
+        'subprocess.call', side_effect=subprocess_results).start()
+    mock.patch('__builtin__.open').start()
+    self._SetUpFakeClock()
+
+    mock_api.GetImage.side_effect = [
+        None, {'status': 'PENDING'}, {'status': 'READY'}]
+    mock_api.CreateDisk.side_effect = self._FakeOperation
+    mock_api.CreateInstance.side_effect = self._FakeOperation
+    mock_api.CreateImage.side_effect = self._FakeOperation
+    mock_api.WaitForOperations.return_value = []
+    mock_api.ListInstances.side_effect = [
+        [{'name': 'hadoop-image-builder'}], []]
+    mock_api.ListDisks.side_effect = [[{'name': 'hadoop-image-builder'}], []]
+    mock_api.BatchDeleteInstances.side_effect = self._FakeBatchOperations
+    mock_api.BatchDeleteDisks.side_effect = self._FakeBatchOperations
+    return mock_api, mock_subprocess_call
+
+  def testBakeImage(self):
+    """Unit test of BakeImage()."""
+    # Bundle is not uploaded at the first check.
+    mock_api, mock_subprocess_call = self._SetUpMocksForBakeImage(
+        [1, 1, 0, 0, 0])
+
+    GceCluster(argparse.Namespace(
+        project='project-foo', bucket='bucket-bar', image_name='hadoop-image',
+        image='', machinetype='', zone='zone-baz')).BakeImage()
+
+    mock_api.CreateDisk.assert_called_once_with(
+        'hadoop-image-builder', image=GceCluster.DEFAULT_IMAGE)
+    mock_api.CreateInstance.assert_called_once_with(
+        'hadoop-image-builder', GceCluster.DEFAULT_MACHINE_TYPE,
+        boot_disk='hadoop-image-builder', startup_script=mock.ANY,
+        service_accounts=mock.ANY, metadata=mock.ANY)
+    bundle = 'gs://bucket-bar/mapreduce/image/hadoop-image.image.tar.gz'
+    self.assertEqual(
+        bundle,
+        mock_api.CreateInstance.call_args[1]['metadata']['image-bundle'])
+    mock_api.CreateImage.assert_called_once_with(
+        'hadoop-image', 'https://storage.googleapis.com/bucket-bar/mapreduce/'
+        'image/hadoop-image.image.tar.gz', description=mock.ANY)
+    self.assertEqual(3, mock_api.GetImage.call_count)
+    # Image builder and its disk are deleted, and so is the bundle.
+    mock_api.BatchDeleteInstances.assert_called_once_with(
+        ['hadoop-image-builder'])
+    mock_api.BatchDeleteDisks.assert_called_once_with(
+        ['hadoop-image-builder'])
+    self.assertEqual(
+        ['gsutil -q ls ' + bundle, 'gsutil -q ls %s.error' % bundle,
+         'gsutil -q ls ' + bundle, 'gsutil -q rm ' + bundle,
+         'gsutil -q rm %s.error' % bundle],
+        [c[0][0] for c in mock_subprocess_call.call_args_list])
+
+  def testBakeImage_BuilderError(self):
+    """Unit test of BakeImage() when the image builder fails."""
+    # Error file is uploaded instead of the bundle.
+    mock_api, _ = self._SetUpMocksForBakeImage([1, 0, 0, 0])
+
+    self.assertRaises(
+        gce_cluster.ImageBakeError,
+        GceCluster(argparse.Namespace(
+            project='project-foo', bucket='bucket-bar',
+            image_name='hadoop-image', image='', machinetype='',
+            zone='zone-baz')).BakeImage)
+
+    self.assertFalse(mock_api.CreateImage.called)
+    mock_api.BatchDeleteInstances.assert_called_once_with(
+        ['hadoop-image-builder'])
+    mock_api.BatchDeleteDisks.assert_called_once_with(
+        ['hadoop-image-builder'])
+
+  def testBakeImage_ImageExists(self):
+    """Unit test of BakeImage() when the image already exists."""
+    mock_api, _ = self._SetUpMocksForBakeImage([])
+    mock_api.GetImage.side_effect = None
+    mock_api.GetImage.return_value = {'status': 'READY'}
+
+    self.assertRaises(
+        gce_cluster.ImageBakeError,
+        GceCluster(argparse.Namespace(
+            project='project-foo', bucket='bucket-bar',
+            image_name='hadoop-image', image='', machinetype='',
+            zone='zone-baz')).BakeImage)
+
+    self.assertFalse(mock_api.CreateInstance.called)
+
+  def _SetUpTimelineFiles(self, controller_spans, markers):
+    """Sets up local timeline of the controller and markers of instances.
+
+    Args:
+      controller_spans: Content of local timeline file of the controller.
+          The file doesn't exist if None.
+      markers: Dictionary of instance name to its phase markers, which
+          'gsutil cp' downloads.
+    Returns:
+      Mock of subprocess.call().
+    """
+    local_dir = tempfile.mkdtemp()
+    self.addCleanup(shutil.rmtree, local_dir)
+    mock.patch.object(GceCluster, 'LOCAL_TMP_DIR', local_dir).start()
+    if controller_spans is not None:
+      with open('%s/timeline-hm.csv' % local_dir, 'w') as f:
+        f.write(controller_spans)
+
+    def Download(command, **unused_kwargs):
+      destination = command.split()[-1]
+      for name, text in markers.iteritems():
+        with open('%s/%s.txt' % (destination, name), 'w') as f:
+          f.write(text)
+      return 0 if markers else 1
+
+    return mock.patch('subprocess.call', side_effect=Download).start()
+
+  def testShowTimeline(self):
+    """Unit test of ShowTimeline()."""
+    controller_spans = ('controller,start-master,100.0,110.0\n'
+                        'controller,create-worker-instances,120.0,130.0\n'
+                        'controller,wait-workers-ready,130.0,200.0\n')
+    markers = {
+        'hm': '101.0 boot\n105.0 startup\n109.0 done\n',
+        'hw-000': '125.0 boot\n131.0 startup\n150.0 start-daemons\n'
+                  '160.0 done\n',
+        # Instance of another cluster in the same bucket.
+        'other-hw-000': '100.0 boot\n300.0 done\n',
+    }
+    mock_subprocess_call = self._SetUpTimelineFiles(controller_spans, markers)
+    csv_file = tempfile.NamedTemporaryFile()
+
+    GceCluster(argparse.Namespace(
+        project='project-hoge', bucket='bucket-fuga',
+        csv=csv_file.name)).ShowTimeline()
+
+    self.assertRegexpMatches(
+        mock_subprocess_call.call_args[0][0],
+        '^gsutil -q -m cp gs://bucket-fuga/mapreduce/tmp/timeline/\\*\\.txt ')
+    rows = [line.split(',') for line in open(csv_file.name).read().split()]
+    self.assertEqual(['node', 'phase', 'start', 'end', 'seconds', 'critical'],
+                     rows[0])
+    self.assertNotIn('other-hw-000', [row[0] for row in rows])
+    # Start-up of the worker is the critical path.
+    self.assertEqual(
+        [['controller', 'start-master'],
+         ['controller', 'create-worker-instances'],
+         ['hw-000', 'boot'], ['hw-000', 'startup'],
+         ['hw-000', 'start-daemons']],
+        [row[:2] for row in rows[1:] if row[5] == '1'])
+
+  def testShowTimeline_NoTimeline(self):
+    """Unit test of ShowTimeline() with no timeline anywhere."""
+    self._SetUpTimelineFiles(None, {})
+
+    self.assertRaises(
+        gce_cluster.ClusterSetUpError,
+        GceCluster(argparse.Namespace(
+            project='project-hoge', bucket='bucket-fuga')).ShowTimeline)
 
   def testStartMapReduce(self):
     """Unit test of StartMapReduce()."""
@@ -438,8 +1614,7 @@ class GceClusterTest(unittest.TestCase):
                   shell=True),
         mock_subprocess_call.call_args_list[1])
     self.assertEqual(
-        mock.call('gsutil cp /path/to/program/gcs_to_hdfs_mapper.sh '
-                  '/path/to/program/hdfs_to_gcs_mapper.sh '
+        mock.call('gsutil cp /path/to/program/gcs_hdfs_copy_mapper.py '
                   'gs://tmp-bucket/mapreduce/mapper-reducer/',
                   shell=True),
         mock_subprocess_call.call_args_list[2])
@@ -449,10 +1624,188 @@ class GceClusterTest(unittest.TestCase):
                   'tmp-bucket '
                   'gs://tmp-bucket/mapreduce/mapper-reducer/mapper.exe 5 '
                   'gs://tmp-bucket/mapreduce/mapper-reducer/reducer.exe 1 '
-                  'gs://data/inputs gs://data/outputs',
+                  'gs://data/inputs gs://data/outputs files full none '
+                  '- - none none keep',
                   shell=True),
         mock_subprocess_call.call_args_list[3])
 
+  def testStartMapReduce_CopyOptions(self):
+    """Unit test of StartMapReduce() with options to copy input and output."""
+    mock_subprocess_call = mock.patch('subprocess.call', return_value=0).start()
+    mock.patch('gce_cluster.MakeScriptRelativePath',
+               side_effect=lambda x: '/path/to/program/' + x).start()
+
+    GceCluster(argparse.Namespace(
+        project='project-hoge', bucket='tmp-bucket', zone='zone-fuga',
+        input='gs://data/inputs', output='gs://data/outputs',
+        mapper=None, reducer=None, mapper_count=5, reducer_count=1,
+        output_mode='compose', incremental_input=True, direct_io='input',
+        prefix='boo')).StartMapReduce()
+
+    self.assertEqual(
+        mock.call('/path/to/program/run-script-remote.sh project-hoge '
+                  'zone-fuga boo-hm mapreduce__at__master.sh hadoop '
+                  'tmp-bucket cat 5 cat 1 '
+                  'gs://data/inputs gs://data/outputs compose incremental '
+                  'input - - none none keep',
+                  shell=True),
+        mock_subprocess_call.call_args_list[-1])
+
+  def testStartMapReduce_Compression(self):
+    """Unit test of StartMapReduce() with compression options."""
+    mock_subprocess_call = mock.patch('subprocess.call', return_value=0).start()
+    mock.patch('gce_cluster.MakeScriptRelativePath',
+               side_effect=lambda x: '/path/to/program/' + x).start()
+
+    GceCluster(argparse.Namespace(
+        project='project-hoge', bucket='tmp-bucket', zone='zone-fuga',
+        input='gs://data/inputs', output='gs://data/outputs',
+        mapper=None, reducer=None, mapper_count=5, reducer_count=1,
+        map_output_codec='snappy', output_codec='gzip', decompress_input=True,
+        prefix='boo')).StartMapReduce()
+
+    self.assertEqual(
+        mock.call('/path/to/program/run-script-remote.sh project-hoge '
+                  'zone-fuga boo-hm mapreduce__at__master.sh hadoop '
+                  'tmp-bucket cat 5 cat 1 '
+                  'gs://data/inputs gs://data/outputs files full none '
+                  '- - snappy gzip decompress',
+                  shell=True),
+        mock_subprocess_call.call_args_list[-1])
+
+  def testStartMapReduce_CombinerAndFiles(self):
+    """Unit test of StartMapReduce() with combiner and additional files."""
+    mock_subprocess_call = mock.patch('subprocess.call', return_value=0).start()
+    mock.patch('gce_cluster.MakeScriptRelativePath',
+               side_effect=lambda x: '/path/to/program/' + x).start()
+
+    GceCluster(argparse.Namespace(
+        project='project-hoge', bucket='tmp-bucket', zone='zone-fuga',
+        input='gs://data/inputs', output='gs://data/outputs',
+        mapper='mapper.py', reducer=None, combiner='combiner.py',
+        file=['lib.py', 'gs://data/data.txt'],
+        mapper_count=5, reducer_count=1,
+        prefix='boo')).StartMapReduce()
+
+    mapper_reducer = 'gs://tmp-bucket/mapreduce/mapper-reducer/'
+    self.assertEqual(
+        mock.call('gsutil cp combiner.py %scombiner.py' % mapper_reducer,
+                  shell=True),
+        mock_subprocess_call.call_args_list[1])
+    self.assertEqual(
+        mock.call('gsutil cp lib.py %slib.py' % mapper_reducer, shell=True),
+        mock_subprocess_call.call_args_list[2])
+    self.assertEqual(
+        mock.call('/path/to/program/run-script-remote.sh project-hoge '
+                  'zone-fuga boo-hm mapreduce__at__master.sh hadoop '
+                  'tmp-bucket %smapper.py 5 cat 1 '
+                  'gs://data/inputs gs://data/outputs files full none '
+                  '%scombiner.py %slib.py,gs://data/data.txt '
+                  'none none keep' % (
+                      mapper_reducer, mapper_reducer, mapper_reducer),
+                  shell=True),
+        mock_subprocess_call.call_args_list[-1])
+
+  def testStartPipeline(self):
+    """Unit test of StartPipeline()."""
+    mock_subprocess_call = mock.patch('subprocess.call', return_value=0).start()
+    mock.patch('gce_cluster.MakeScriptRelativePath',
+               side_effect=lambda x: '/path/to/program/' + x).start()
+    spec = {
+        'stages': [
+            {'name': 'first', 'inputs': ['gs://data/inputs/'],
+             'mapper': 'mapper.exe', 'mapper_count': 10, 'reducer_count': 0},
+            {'name': 'second', 'inputs': ['first', 'gs://data/extra'],
+             'mapper': 'mapper.exe', 'reducer': 'reducer.exe',
+             'output': 'gs://data/outputs'},
+        ]
+    }
+
+    with tempfile.NamedTemporaryFile() as f:
+      json.dump(spec, f)
+      f.flush()
+      GceCluster(argparse.Namespace(
+          project='project-hoge', bucket='tmp-bucket', zone='zone-fuga',
+          pipeline=f.name, prefix='boo')).StartPipeline()
+
+    remote = ('/path/to/program/run-script-remote.sh project-hoge '
+              'zone-fuga boo-hm mapreduce__at__master.sh hadoop tmp-bucket ')
+    mapper_reducer = 'gs://tmp-bucket/mapreduce/mapper-reducer/'
+    self.assertEqual([
+        mock.call('gsutil cp /path/to/program/gcs_hdfs_copy_mapper.py ' +
+                  mapper_reducer, shell=True),
+        mock.call('gsutil cp mapper.exe %smapper.exe' % mapper_reducer,
+                  shell=True),
+        mock.call('gsutil cp reducer.exe %sreducer.exe' % mapper_reducer,
+                  shell=True),
+        # Inputs on Cloud Storage are copied to HDFS once, by as many
+        # mappers as the stages reading them.
+        mock.call(remote + '- 5 - 0 gs://data/extra pipeline/inputs/0 '
+                  'files full none - - none none keep', shell=True),
+        mock.call(remote + '- 10 - 0 gs://data/inputs pipeline/inputs/1 '
+                  'files full none - - none none keep', shell=True),
+        mock.call(remote + mapper_reducer + 'mapper.exe 10 cat 0 '
+                  'pipeline/inputs/1 pipeline/stages/first '
+                  'files full none - - none none keep',
+                  shell=True),
+        mock.call(remote + mapper_reducer + 'mapper.exe 5 ' +
+                  mapper_reducer + 'reducer.exe 1 '
+                  'pipeline/stages/first,pipeline/inputs/0 '
+                  'pipeline/stages/second files full none - - none none keep',
+                  shell=True),
+        # Only output of the stage with "output" is copied.
+        mock.call(remote + '- 5 - 0 pipeline/stages/second gs://data/outputs '
+                  'files full none - - none none keep', shell=True),
+    ], mock_subprocess_call.call_args_list)
+
+  def testStartPipeline_StageError(self):
+    """Unit test of StartPipeline() when a stage fails."""
+    # Copy mapper upload and import of input succeed, and the stage fails.
+    mock_subprocess_call = mock.patch(
+        'subprocess.call', side_effect=[0, 0, 1]).start()
+    mock.patch('gce_cluster.MakeScriptRelativePath',
+               side_effect=lambda x: '/path/to/program/' + x).start()
+    spec = {
+        'stages': [
+            {'name': 'first', 'inputs': ['gs://data/inputs']},
+            {'name': 'second', 'inputs': ['first'],
+             'output': 'gs://data/outputs'},
+        ]
+    }
+
+    with tempfile.NamedTemporaryFile() as f:
+      json.dump(spec, f)
+      f.flush()
+      self.assertRaises(
+          gce_cluster.MapReduceError,
+          GceCluster(argparse.Namespace(
+              project='project-hoge', bucket='tmp-bucket', zone='zone-fuga',
+              pipeline=f.name, prefix='boo')).StartPipeline)
+
+    # Neither the second stage nor export of the output runs.
+    self.assertEqual(3, mock_subprocess_call.call_count)
+
+  def testStartPipeline_InvalidSpec(self):
+    """Unit test of StartPipeline() with pipeline in cyclic dependency."""
+    mock_subprocess_call = mock.patch('subprocess.call', return_value=0).start()
+    spec = {
+        'stages': [
+            {'name': 'first', 'inputs': ['second']},
+            {'name': 'second', 'inputs': ['first']},
+        ]
+    }
+
+    with tempfile.NamedTemporaryFile() as f:
+      json.dump(spec, f)
+      f.flush()
+      self.assertRaises(
+          gce_cluster.MapReduceError,
+          GceCluster(argparse.Namespace(
+              project='project-hoge', bucket='tmp-bucket', zone='zone-fuga',
+              pipeline=f.name, prefix='boo')).StartPipeline)
+
+    self.assertFalse(mock_subprocess_call.called)
+
 
 if __name__ == '__main__':
   unittest.main()
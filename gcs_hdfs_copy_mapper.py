@@ -0,0 +1,1279 @@
+#!/usr/bin/env python
+# Copyright 2013 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Hadoop streaming mapper to copy files between Cloud Storage and HDFS.
+
+Each input line consists of source and destination separated by a tab.
+Paths starting with 'gs://' are on Google Cloud Storage, and other paths are
+on HDFS.  Files are copied by a bounded pool of threads with long-lived
+HTTP connections to Cloud Storage JSON API and to WebHDFS, instead of
+starting gsutil and Hadoop command per file.  Large files are read by
+multiple ranged requests in parallel.
+
+With --plan-dir, the script runs as planner of the copy job instead.  It
+packs the files in the list into bins of balanced size, one input file of
+the copy job per bin, so that every mapper copies about the same number of
+bytes.  With --split-min-size-mb, large files are also split into byte
+ranges copied by different mappers.  Range boundaries are moved to the
+next line break, in the same way as Hadoop splits text input, so that the
+pieces can be used as separate input files of MapReduce.
+
+With --sync-manifest, only files that are new or changed since the last
+copy are planned, and copies of changed or removed files are deleted.  The
+manifest on HDFS records Cloud Storage object generation and CRC32C of each
+copied file, and is updated with --commit-sync after the copy job.
+
+With --direct-input, the script runs as wrapper of the mapper of MapReduce,
+which gives content of the files in its input list to the standard input of
+the mapper command, so that input doesn't need to be copied to HDFS.  With
+--direct-output, standard output of the mapper or reducer is uploaded to
+Cloud Storage as part file of the task, instead of being written to HDFS.
+
+Gzip-compressed files ('.gz') are decompressed on the fly when copied to
+destination without '.gz' suffix, which --plan-dir with --decompress plans,
+and when given to the mapper with --direct-input.  They are never split into
+byte ranges.  With --compress-output, --direct-output uploads the output
+compressed with gzip.
+
+With --compose, the script combines Cloud Storage objects listed in the
+input into one object with compose requests, without downloading them.
+
+The mapper runs on Google Compute Engine instances, and gets access token
+to Cloud Storage from the metadata server.
+"""
+
+
+
+import argparse
+import collections
+import errno
+import heapq
+import httplib
+import json
+import logging
+import os
+import os.path
+import Queue
+import socket
+import stat
+import subprocess
+import sys
+import threading
+import time
+import urllib
+import urlparse
+import zlib
+
+
+MIB = 1024 * 1024
+
+DEFAULT_THREADS = 4
+# Files larger than the range size are read by multiple ranged requests.
+DEFAULT_RANGE_SIZE_MB = 16
+# Maximum number of ranged reads in flight per file.
+DEFAULT_RANGES_IN_FLIGHT = 4
+DEFAULT_WEBHDFS_PORT = 50070
+# Size of read to look for line break at range boundary.
+LINE_SEARCH_SIZE = 64 * 1024
+# Maximum number of source objects of single compose request.
+MAX_COMPOSE_SOURCES = 32
+# Suffix of the manifest of files being copied by incremental sync.
+PENDING_MANIFEST_SUFFIX = '.pending'
+# Size of single read from output of the command run by --direct-output.
+OUTPUT_READ_SIZE = 1024 * 1024
+# Suffix of gzip-compressed files, which can't be split into byte ranges.
+GZIP_SUFFIX = '.gz'
+# Compression level of gzip output.  Lower level is a lot faster, with
+# slightly larger output.
+GZIP_LEVEL = 6
+
+
+class CopyError(Exception):
+  """Error on copying file."""
+
+
+class NotFoundError(CopyError):
+  """File to access doesn't exist."""
+
+
+class _HttpClient(object):
+  """HTTP client that keeps one connection per thread and host alive."""
+
+  # Number of attempts of request when connection is broken.
+  ATTEMPTS = 2
+
+  def __init__(self):
+    self._local = threading.local()
+
+  def _Connection(self, scheme, netloc):
+    connections = self._local.__dict__.setdefault('connections', {})
+    if (scheme, netloc) not in connections:
+      if scheme == 'https':
+        connections[(scheme, netloc)] = httplib.HTTPSConnection(netloc)
+      else:
+        connections[(scheme, netloc)] = httplib.HTTPConnection(netloc)
+    return connections[(scheme, netloc)]
+
+  def _CloseConnection(self, scheme, netloc):
+    connection = self._local.__dict__.get('connections', {}).pop(
+        (scheme, netloc), None)
+    if connection:
+      connection.close()
+
+  def Request(self, method, url, body=None, headers=None):
+    """Sends HTTP request and reads whole response.
+
+    Args:
+      method: HTTP method.
+      url: URL of the request.
+      body: Request body string, or iterable of strings to send in chunked
+          transfer encoding.
+      headers: Dictionary of request headers.
+    Returns:
+      Tuple of httplib.HTTPResponse and response body.
+    Raises:
+      CopyError: Connection error.
+    """
+    parsed = urlparse.urlparse(url)
+    path = parsed.path + ('?' + parsed.query if parsed.query else '')
+    headers = dict(headers or {})
+    for attempt in xrange(self.ATTEMPTS):
+      connection = self._Connection(parsed.scheme, parsed.netloc)
+      try:
+        if body is None or isinstance(body, str):
+          connection.request(method, path, body, headers)
+        else:
+          # Chunks can be sent only once, so that no retry is possible.
+          attempt = self.ATTEMPTS
+          connection.putrequest(method, path)
+          headers['Transfer-Encoding'] = 'chunked'
+          for name, value in headers.iteritems():
+            connection.putheader(name, value)
+          connection.endheaders()
+          for chunk in body:
+            if chunk:
+              connection.send('%x\r\n%s\r\n' % (len(chunk), chunk))
+          connection.send('0\r\n\r\n')
+        response = connection.getresponse()
+        return response, response.read()
+      except (httplib.HTTPException, socket.error) as e:
+        self._CloseConnection(parsed.scheme, parsed.netloc)
+        if attempt + 1 >= self.ATTEMPTS:
+          raise CopyError('%s %s: %s' % (method, url, e))
+
+
+class GcsStorage(object):
+  """Google Cloud Storage client with JSON API."""
+
+  API_URL = 'https://www.googleapis.com'
+  METADATA_TOKEN_URL = ('http://metadata/computeMetadata/v1/instance/'
+                        'service-accounts/default/token')
+  # Chunk size of resumable upload must be multiple of 256KB.
+  UPLOAD_CHUNK_ALIGNMENT = 256 * 1024
+  UPLOAD_CHUNK_SIZE = 32 * UPLOAD_CHUNK_ALIGNMENT
+  # Access token is refreshed this many seconds before it expires.
+  TOKEN_REFRESH_MARGIN = 60
+
+  def __init__(self):
+    self._http = _HttpClient()
+    self._lock = threading.Lock()
+    self._token = None
+    self._token_expiry = 0
+
+  @staticmethod
+  def _Split(path):
+    """Splits 'gs://bucket/object' to bucket and object name."""
+    bucket, _, name = path[len('gs://'):].partition('/')
+    return bucket, name
+
+  def _AccessToken(self):
+    """Returns access token of the service account of the instance."""
+    with self._lock:
+      if time.time() + self.TOKEN_REFRESH_MARGIN >= self._token_expiry:
+        response, content = self._http.Request(
+            'GET', self.METADATA_TOKEN_URL,
+            headers={'Metadata-Flavor': 'Google',
+                     'X-Google-Metadata-Request': 'True'})
+        if response.status != 200:
+          raise CopyError('Failed to get access token: %d %s' % (
+              response.status, content))
+        token = json.loads(content)
+        self._token = token['access_token']
+        self._token_expiry = time.time() + token['expires_in']
+      return self._token
+
+  def _Request(self, method, url, body=None, headers=None,
+               expected=(200,)):
+    headers = dict(headers or {})
+    headers['Authorization'] = 'OAuth ' + self._AccessToken()
+    response, content = self._http.Request(method, url, body, headers)
+    if response.status not in expected:
+      error_class = NotFoundError if response.status == 404 else CopyError
+      raise error_class('%s %s: %d %s' % (method, url, response.status,
+                                          content))
+    return response, content
+
+  def _ObjectUrl(self, path, upload=False):
+    bucket, name = self._Split(path)
+    if upload:
+      return '%s/upload/storage/v1/b/%s/o?name=%s' % (
+          self.API_URL, bucket, urllib.quote(name, safe=''))
+    return '%s/storage/v1/b/%s/o/%s' % (
+        self.API_URL, bucket, urllib.quote(name, safe=''))
+
+  def Stat(self, path):
+    """Returns size and version (generation and CRC32C) of the object."""
+    _, content = self._Request('GET', self._ObjectUrl(path))
+    metadata = json.loads(content)
+    return (int(metadata['size']),
+            '%s/%s' % (metadata['generation'], metadata.get('crc32c', '')))
+
+  def Size(self, path):
+    return self.Stat(path)[0]
+
+  def Delete(self, path):
+    self._Request('DELETE', self._ObjectUrl(path), expected=(204,))
+
+  def Compose(self, sources, dst):
+    """Combines objects in the same bucket into the destination object."""
+    bucket, _ = self._Split(dst)
+    body = {
+        'sourceObjects': [],
+        'destination': {'contentType': 'application/octet-stream'},
+    }
+    for source in sources:
+      source_bucket, name = self._Split(source)
+      if source_bucket != bucket:
+        raise CopyError('%s: Cannot compose object in other bucket than %s' %
+                        (source, dst))
+      body['sourceObjects'].append({'name': name})
+    self._Request('POST', self._ObjectUrl(dst) + '/compose',
+                  body=json.dumps(body),
+                  headers={'Content-Type': 'application/json'})
+
+  def Read(self, path, start, end):
+    _, content = self._Request(
+        'GET', self._ObjectUrl(path) + '?alt=media',
+        headers={'Range': 'bytes=%d-%d' % (start, end - 1)},
+        expected=(200, 206))
+    return content
+
+  def Write(self, path, chunks):
+    """Uploads chunks as an object.
+
+    The object is uploaded by single request if the content is smaller than
+    UPLOAD_CHUNK_SIZE, otherwise by resumable upload, so that memory usage
+    is bounded regardless of the object size.
+    """
+    chunks = iter(chunks)
+    buf = ''
+    for chunk in chunks:
+      buf += chunk
+      if len(buf) >= self.UPLOAD_CHUNK_SIZE:
+        break
+    else:
+      self._Request('POST', self._ObjectUrl(path, upload=True) +
+                    '&uploadType=media', body=buf,
+                    headers={'Content-Type': 'application/octet-stream'})
+      return
+
+    response, _ = self._Request(
+        'POST', self._ObjectUrl(path, upload=True) + '&uploadType=resumable',
+        body='', headers={'X-Upload-Content-Type': 'application/octet-stream'})
+    session_url = response.getheader('location')
+    offset = 0
+    for chunk in chunks:
+      buf += chunk
+      if len(buf) >= self.UPLOAD_CHUNK_SIZE:
+        length = len(buf) - len(buf) % self.UPLOAD_CHUNK_ALIGNMENT
+        self._Request('PUT', session_url, body=buf[:length], headers={
+            'Content-Range': 'bytes %d-%d/*' % (offset, offset + length - 1)
+        }, expected=(308,))
+        offset += length
+        buf = buf[length:]
+    # Last chunk, or empty request if no data is left.
+    total = offset + len(buf)
+    if buf:
+      content_range = 'bytes %d-%d/%d' % (offset, total - 1, total)
+    else:
+      content_range = 'bytes */%d' % total
+    self._Request('PUT', session_url, body=buf,
+                  headers={'Content-Range': content_range},
+                  expected=(200, 201))
+
+
+class WebHdfsStorage(object):
+  """HDFS client with WebHDFS REST API."""
+
+  def __init__(self, namenode, user):
+    """Constructor.
+
+    Args:
+      namenode: Host and port of WebHDFS on NameNode.  e.g. 'hm:50070'
+      user: User name to access HDFS as.
+    """
+    self._http = _HttpClient()
+    self._namenode = namenode
+    self._user = user
+
+  def _AbsolutePath(self, path):
+    """Returns absolute path in HDFS of the path relative to the home."""
+    if path.startswith('hdfs://'):
+      return urlparse.urlparse(path).path
+    elif not path.startswith('/'):
+      return '/user/%s/%s' % (self._user, path)
+    return path
+
+  def _Url(self, path, op, **params):
+    """Returns WebHDFS URL of the operation on the path."""
+    params['op'] = op
+    params['user.name'] = self._user
+    return 'http://%s/webhdfs/v1%s?%s' % (
+        self._namenode, urllib.quote(self._AbsolutePath(path)),
+        urllib.urlencode(sorted(params.iteritems())))
+
+  def _Request(self, method, url, body=None, expected=(200,)):
+    response, content = self._http.Request(method, url, body)
+    if response.status not in expected:
+      error_class = NotFoundError if response.status == 404 else CopyError
+      raise error_class('%s %s: %d %s' % (method, url, response.status,
+                                          content))
+    return response, content
+
+  def Stat(self, path):
+    """Returns size and version (modification time) of the file."""
+    _, content = self._Request('GET', self._Url(path, 'GETFILESTATUS'))
+    status = json.loads(content)['FileStatus']
+    return int(status['length']), str(status['modificationTime'])
+
+  def Size(self, path):
+    return self.Stat(path)[0]
+
+  def Delete(self, path):
+    self._Request('DELETE', self._Url(path, 'DELETE'))
+
+  def Read(self, path, start, end):
+    # NameNode redirects to DataNode that has the data.
+    response, _ = self._Request(
+        'GET', self._Url(path, 'OPEN', offset=start, length=end - start),
+        expected=(307,))
+    _, content = self._Request('GET', response.getheader('location'))
+    return content
+
+  def Rename(self, src, dst):
+    _, content = self._Request(
+        'PUT', self._Url(src, 'RENAME', destination=self._AbsolutePath(dst)))
+    if not json.loads(content).get('boolean'):
+      raise CopyError('Failed to rename %s to %s' % (src, dst))
+
+  def Write(self, path, chunks):
+    """Writes the file.
+
+    Content is written to temporary file, which is renamed to the path only
+    after all of it is written, so that partial file left by failed or
+    killed task never appears at the path.  Name of the temporary file
+    starts with '.', so that MapReduce jobs ignore it as input.
+    """
+    directory, slash, name = path.rpartition('/')
+    temp_path = '%s%s.%s.%d.%d.tmp' % (directory, slash, name, os.getpid(),
+                                       threading.current_thread().ident)
+    try:
+      # NameNode redirects to DataNode to write the data to.
+      response, _ = self._Request(
+          'PUT', self._Url(temp_path, 'CREATE', overwrite='true'),
+          expected=(307,))
+      self._Request('PUT', response.getheader('location'), body=chunks,
+                    expected=(201,))
+      # Rename doesn't overwrite existing file.
+      self.Delete(path)
+      self.Rename(temp_path, path)
+    except Exception:
+      try:
+        self.Delete(temp_path)
+      except CopyError as e:
+        logging.warning('Failed to delete %s: %s', temp_path, e)
+      raise
+
+
+class LocalStorage(object):
+  """Storage on local directory, used in place of Cloud Storage or HDFS."""
+
+  def __init__(self, root):
+    self._root = root
+
+  def _LocalPath(self, path):
+    if path.startswith('gs://'):
+      path = path[len('gs://'):]
+    elif path.startswith('hdfs://'):
+      path = urlparse.urlparse(path).path
+    return os.path.join(self._root, path.lstrip('/'))
+
+  def Stat(self, path):
+    try:
+      info = os.stat(self._LocalPath(path))
+    except OSError as e:
+      if e.errno == errno.ENOENT:
+        raise NotFoundError('%s: %s' % (path, e))
+      raise CopyError('%s: %s' % (path, e))
+    return info.st_size, '%r/%d' % (info.st_mtime, info.st_size)
+
+  def Size(self, path):
+    return self.Stat(path)[0]
+
+  def Read(self, path, start, end):
+    with open(self._LocalPath(path), 'rb') as f:
+      f.seek(start)
+      return f.read(end - start)
+
+  def Delete(self, path):
+    try:
+      os.remove(self._LocalPath(path))
+    except OSError as e:
+      if e.errno == errno.ENOENT:
+        raise NotFoundError('%s: %s' % (path, e))
+      raise
+
+  def Compose(self, sources, dst):
+    contents = [self.Read(source, 0, self.Size(source)) for source in sources]
+    self.Write(dst, contents)
+
+  def Write(self, path, chunks):
+    local_path = self._LocalPath(path)
+    try:
+      os.makedirs(os.path.dirname(local_path))
+    except OSError as e:
+      if e.errno != errno.EEXIST:
+        raise
+    temp_path = '%s.%d.tmp' % (local_path, threading.current_thread().ident)
+    try:
+      with open(temp_path, 'wb') as f:
+        for chunk in chunks:
+          f.write(chunk)
+      os.rename(temp_path, local_path)
+    finally:
+      if os.path.exists(temp_path):
+        os.remove(temp_path)
+
+
+class CopyEngine(object):
+  """Copies files between Cloud Storage and HDFS in parallel."""
+
+  def __init__(self, gcs, hdfs, threads=DEFAULT_THREADS,
+               range_size=DEFAULT_RANGE_SIZE_MB * MIB,
+               ranges_in_flight=DEFAULT_RANGES_IN_FLIGHT):
+    """Constructor.
+
+    Args:
+      gcs: Storage object for paths starting with 'gs://'.
+      hdfs: Storage object for other paths.
+      threads: Number of files copied at the same time.
+      range_size: Size of single ranged read in bytes.
+      ranges_in_flight: Maximum number of ranged reads in flight per file.
+    """
+    self.gcs = gcs
+    self.hdfs = hdfs
+    self.threads = threads
+    self.range_size = range_size
+    self.ranges_in_flight = ranges_in_flight
+
+  def _Storage(self, path):
+    return self.gcs if path.startswith('gs://') else self.hdfs
+
+  def _ReadChunks(self, storage, path, start, end):
+    """Yields content of the file in order, reading ranges in parallel.
+
+    Args:
+      storage: Storage object where the file is.
+      path: Path of the file.
+      start: Offset of the first byte to read.
+      end: Offset next to the last byte to read.
+    Yields:
+      Chunks of the file content.
+    Raises:
+      CopyError: Read error.
+    """
+    in_flight = collections.deque()
+
+    def Fetch(start, end, result):
+      try:
+        result['data'] = storage.Read(path, start, end)
+        if len(result['data']) != end - start:
+          raise CopyError('%s: Short read at %d: %d bytes' % (
+              path, start, len(result['data'])))
+      except Exception as e:  # pylint: disable=broad-except
+        result['error'] = e
+
+    def Next():
+      thread, result = in_flight.popleft()
+      thread.join()
+      if 'error' in result:
+        raise result['error']
+      return result['data']
+
+    for offset in xrange(start, end, self.range_size):
+      if len(in_flight) >= self.ranges_in_flight:
+        yield Next()
+      result = {}
+      thread = threading.Thread(
+          target=Fetch,
+          args=(offset, min(offset + self.range_size, end), result))
+      thread.daemon = True
+      thread.start()
+      in_flight.append((thread, result))
+    while in_flight:
+      yield Next()
+
+  @staticmethod
+  def _AlignToLine(storage, path, offset, size):
+    """Returns the first offset at or after the offset that starts a line.
+
+    Args:
+      storage: Storage object where the file is.
+      path: Path of the file.
+      offset: Offset in the file.
+      size: Size of the file.
+    Returns:
+      Offset of the beginning of a line, or the size of the file if no line
+      starts at or after the offset.
+    """
+    if offset <= 0:
+      return 0
+    position = offset - 1
+    while position < size:
+      data = storage.Read(path, position,
+                          min(position + LINE_SEARCH_SIZE, size))
+      if not data:
+        break
+      index = data.find('\n')
+      if index >= 0:
+        return position + index + 1
+      position += len(data)
+    return size
+
+  def Read(self, src, start=None, end=None):
+    """Reads single file, or lines in the byte range of the file.
+
+    Args:
+      src: Source path.
+      start: Offset of the byte range, or None to read whole file.
+      end: Offset next to the end of the byte range.
+    Returns:
+      Tuple of number of bytes to read, and iterator of the content.
+    """
+    src_storage = self._Storage(src)
+    size = src_storage.Size(src)
+    if start is None:
+      start, end = 0, size
+    else:
+      start = self._AlignToLine(src_storage, src, start, size)
+      end = self._AlignToLine(src_storage, src, min(end, size), size)
+      end = max(start, end)
+    return end - start, self._ReadChunks(src_storage, src, start, end)
+
+  def Copy(self, src, dst, start=None, end=None):
+    """Copies single file, or lines in the byte range of the file.
+
+    Args:
+      src: Source path.
+      dst: Destination path.
+      start: Offset of the byte range, or None to copy whole file.
+      end: Offset next to the end of the byte range.
+    Returns:
+      Number of bytes copied.
+    """
+    size, chunks = self.Read(src, start, end)
+    if src.endswith(GZIP_SUFFIX) and not dst.endswith(GZIP_SUFFIX):
+      chunks = Decompress(chunks)
+    self._Storage(dst).Write(dst, chunks)
+    return size
+
+  def CopyAll(self, entries, callback=None):
+    """Copies files with the pool of threads.
+
+    Args:
+      entries: List of (source, destination) tuples, or of (source,
+          destination, start, end) tuples to copy byte ranges.
+      callback: Function called with source, destination, number of bytes
+          and exception (None on success) every time copy of a file
+          finishes.
+    Returns:
+      List of (source, destination, exception) tuples of failed copies.
+    """
+    failures = []
+    lock = threading.Lock()
+
+    def CopyEntry(entry):
+      size = 0
+      error = None
+      try:
+        size = self.Copy(*entry)
+      except Exception as e:  # pylint: disable=broad-except
+        error = e
+      with lock:
+        if error:
+          failures.append((entry[0], entry[1], error))
+        if callback:
+          callback(entry[0], entry[1], size, error)
+
+    _RunInThreads(CopyEntry, entries, self.threads)
+    return failures
+
+  def GetStats(self, paths):
+    """Returns dictionary of file sizes and versions, asking in parallel."""
+    stats = {}
+
+    def GetStat(path):
+      stats[path] = self._Storage(path).Stat(path)
+
+    errors = _RunInThreads(GetStat, paths, self.threads)
+    if errors:
+      raise CopyError('Failed to get size of %d files: %s' % (
+          len(errors), errors[0]))
+    return stats
+
+
+def _RunInThreads(function, items, threads):
+  """Calls the function with each item by the pool of threads.
+
+  Args:
+    function: Function to call with an item.
+    items: List of items.
+    threads: Number of threads.
+  Returns:
+    List of exceptions raised by the function.
+  """
+  item_queue = Queue.Queue()
+  for item in items:
+    item_queue.put(item)
+  errors = []
+
+  def Worker():
+    while True:
+      try:
+        item = item_queue.get_nowait()
+      except Queue.Empty:
+        return
+      try:
+        function(item)
+      except Exception as e:  # pylint: disable=broad-except
+        errors.append(e)
+
+  workers = [threading.Thread(target=Worker)
+             for _ in xrange(min(threads, len(items)))]
+  for worker in workers:
+    worker.daemon = True
+    worker.start()
+  for worker in workers:
+    worker.join()
+  return errors
+
+
+def Decompress(chunks):
+  """Yields decompressed content of gzip file given as chunks.
+
+  Concatenated gzip files, such as part files combined into one, are
+  decompressed as a whole.
+
+  Args:
+    chunks: Iterator of chunks of gzip file.
+  Yields:
+    Chunks of the decompressed content.
+  Raises:
+    CopyError: The content is not valid gzip data.
+  """
+  # 16 in window bits makes zlib expect gzip header and trailer.
+  decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+  try:
+    for chunk in chunks:
+      while chunk:
+        data = decompressor.decompress(chunk)
+        if data:
+          yield data
+        # Data after the end of a gzip member starts the next member.
+        chunk = decompressor.unused_data
+        if chunk:
+          yield decompressor.flush()
+          decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    data = decompressor.flush()
+    if data:
+      yield data
+  except zlib.error as e:
+    raise CopyError('Invalid gzip data: %s' % e)
+
+
+def Compress(chunks, level=GZIP_LEVEL):
+  """Yields content given as chunks compressed in gzip format."""
+  compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+  for chunk in chunks:
+    data = compressor.compress(chunk)
+    if data:
+      yield data
+  yield compressor.flush()
+
+
+def PlanBins(files, bin_count, min_split_size=None):
+  """Packs files into bins so that each bin has about the same bytes.
+
+  Files are assigned from the largest one to the bin with the least bytes
+  so far (LPT scheduling).  If min_split_size is specified, files larger
+  than both min_split_size and the average bytes per bin are split into
+  byte ranges first, except for gzip files.
+
+  Args:
+    files: List of (source, destination, size) tuples.
+    bin_count: Number of bins.
+    min_split_size: Minimum size of byte range to split large files into,
+        or None not to split files.
+  Returns:
+    List of bins.  Each bin is a list of (source, destination) tuples, or
+    (source, destination, start, end) tuples for byte ranges.  Destination
+    of a byte range has suffix '.split-NNNNN'.
+  Raises:
+    ValueError: bin_count is not positive.
+  """
+  if bin_count <= 0:
+    raise ValueError('Number of bins must be positive: %d' % bin_count)
+  pieces = []
+  total = sum(size for _, _, size in files)
+  split_size = None
+  if min_split_size and bin_count:
+    split_size = max(min_split_size, -(-total // bin_count))
+  for src, dst, size in files:
+    if split_size and size > split_size and not src.endswith(GZIP_SUFFIX):
+      count = -(-size // split_size)
+      for i in xrange(count):
+        start = size * i // count
+        end = size * (i + 1) // count
+        pieces.append((end - start,
+                       (src, '%s.split-%05d' % (dst, i), start, end)))
+    else:
+      pieces.append((size, (src, dst)))
+
+  bins = [[] for _ in xrange(bin_count)]
+  loads = [(0, i) for i in xrange(bin_count)]
+  for size, entry in sorted(pieces, key=lambda piece: (-piece[0], piece[1])):
+    load, index = heapq.heappop(loads)
+    bins[index].append(entry)
+    heapq.heappush(loads, (load + size, index))
+  return bins
+
+
+def ComposeObjects(gcs, sources, dst, threads=DEFAULT_THREADS):
+  """Combines Cloud Storage objects into one object in order.
+
+  Single compose request takes at most MAX_COMPOSE_SOURCES objects, so that
+  more objects are combined into intermediate objects in parallel first.
+  Intermediate objects are deleted at the end.
+
+  Args:
+    gcs: Storage object of Cloud Storage.
+    sources: List of paths of source objects.
+    dst: Path of the destination object.
+    threads: Number of compose requests sent at the same time.
+  Raises:
+    CopyError: Compose request failed.
+  """
+  if not sources:
+    gcs.Write(dst, [])
+    return
+  intermediates = []
+  level = 0
+
+  def ComposeBatch(batch_and_target):
+    gcs.Compose(*batch_and_target)
+
+  try:
+    while len(sources) > MAX_COMPOSE_SOURCES:
+      batches = [sources[i:i + MAX_COMPOSE_SOURCES]
+                 for i in xrange(0, len(sources), MAX_COMPOSE_SOURCES)]
+      sources = ['%s.compose-%d-%05d' % (dst, level, i)
+                 for i in xrange(len(batches))]
+      intermediates.extend(sources)
+      errors = _RunInThreads(ComposeBatch, zip(batches, sources), threads)
+      if errors:
+        raise CopyError('Failed to compose %s: %s' % (dst, errors[0]))
+      level += 1
+    gcs.Compose(sources, dst)
+  finally:
+    for intermediate in intermediates:
+      try:
+        gcs.Delete(intermediate)
+      except Exception as e:  # pylint: disable=broad-except
+        logging.warning('Failed to delete %s: %s', intermediate, e)
+
+
+def PlanSync(manifest, files):
+  """Compares source files with the manifest of files copied before.
+
+  Args:
+    manifest: Dictionary from source path to dictionary of 'version' and
+        'destination' of the source when it was copied, and 'files', list of
+        paths the source was copied to.
+    files: List of (source, destination, size, version) tuples of the
+        current source files.
+  Returns:
+    Tuple of list of (source, destination, size) tuples of new or changed
+    files to copy, list of paths copied before to delete, and the manifest
+    of unchanged files.
+  """
+  unchanged = {}
+  to_copy = []
+  for src, dst, size, version in files:
+    entry = manifest.get(src)
+    if entry and entry['version'] == version and entry['destination'] == dst:
+      unchanged[src] = entry
+    else:
+      to_copy.append((src, dst, size))
+  stale = sorted(path for src, entry in manifest.iteritems()
+                 if src not in unchanged for path in entry['files'])
+  return to_copy, stale, unchanged
+
+
+def _LoadManifest(storage, path):
+  """Returns manifest stored in the file, or None if it doesn't exist."""
+  try:
+    size = storage.Size(path)
+  except NotFoundError:
+    return None
+  return json.loads(storage.Read(path, 0, size))
+
+
+def _SaveManifest(storage, path, manifest):
+  storage.Write(path, [json.dumps(manifest, indent=1, sort_keys=True)])
+
+
+def _DeleteFiles(storage, paths, threads):
+  """Deletes files in parallel, ignoring files that don't exist."""
+
+  def Delete(path):
+    try:
+      storage.Delete(path)
+    except NotFoundError:
+      pass
+
+  errors = _RunInThreads(Delete, paths, threads)
+  if errors:
+    raise CopyError('Failed to delete %d files: %s' % (len(errors), errors[0]))
+
+
+def StartSync(hdfs, manifest_path, files, threads=DEFAULT_THREADS):
+  """Deletes copies of changed or removed files before incremental sync.
+
+  Args:
+    hdfs: Storage object of HDFS, where the manifest is stored.
+    manifest_path: Path of the manifest.
+    files: List of (source, destination, size, version) tuples of the
+        current source files.
+    threads: Number of files deleted at the same time.
+  Returns:
+    List of (source, destination, size) tuples of files to copy.
+  """
+  manifest = _LoadManifest(hdfs, manifest_path) or {}
+  to_copy, stale, unchanged = PlanSync(manifest, files)
+  logging.info('%d files are unchanged, %d files to copy, %d files to '
+               'delete.', len(unchanged), len(to_copy), len(stale))
+  _DeleteFiles(hdfs, stale, threads)
+  # Changed files are removed from the manifest until they're copied.
+  _SaveManifest(hdfs, manifest_path, unchanged)
+  return to_copy
+
+
+def _SavePendingManifest(hdfs, manifest_path, bins, files):
+  """Saves manifest of files planned to be copied.
+
+  Args:
+    hdfs: Storage object of HDFS, where the manifest is stored.
+    manifest_path: Path of the manifest.
+    bins: List of bins returned by PlanBins().
+    files: List of (source, destination, size, version) tuples of the
+        current source files.
+  """
+  pending = {}
+  for src, dst, size, version in files:
+    pending[src] = {'version': version, 'destination': dst, 'size': size,
+                    'files': []}
+  for entries in bins:
+    for entry in entries:
+      pending[entry[0]]['files'].append(entry[1])
+  for src in pending.keys():
+    if pending[src]['files']:
+      pending[src]['files'].sort()
+    else:
+      # Unchanged file.
+      del pending[src]
+  _SaveManifest(hdfs, manifest_path + PENDING_MANIFEST_SUFFIX, pending)
+
+
+def _CopyProblem(src, entry, copied, versions):
+  """Returns why the source is not copied as planned, or None if it is.
+
+  Args:
+    src: Source path.
+    entry: Entry of the source in the pending manifest.
+    copied: Dictionary of path to size of the copies that exist.
+    versions: Dictionary of source path to its current version, or None not
+        to check the versions.
+  """
+  if not all(path in copied for path in entry['files']):
+    return 'was not copied completely'
+  # Copies of decompressed file differ in size from the source.
+  decompressed = (src.endswith(GZIP_SUFFIX) and
+                  not entry['destination'].endswith(GZIP_SUFFIX))
+  if ('size' in entry and not decompressed and
+      sum(copied[path] for path in entry['files']) != entry['size']):
+    return 'was copied with wrong size'
+  if versions is not None and versions.get(src) != entry['version']:
+    return 'has changed since planned'
+  return None
+
+
+def CommitSync(hdfs, manifest_path, threads=DEFAULT_THREADS, sources=None):
+  """Adds files copied by incremental sync to the manifest.
+
+  Sources are committed only if all their copies exist, the copies add up
+  to the planned size of the source, and the source hasn't changed since
+  planned.  Other sources are left out of the manifest, and their copies
+  are deleted, so that they are copied next time.
+
+  Args:
+    hdfs: Storage object of HDFS, where the manifest is stored.
+    manifest_path: Path of the manifest.
+    threads: Number of files checked at the same time.
+    sources: Storage object of the sources to check their versions, or
+        None not to check them.
+  Returns:
+    Number of sources added to the manifest.
+  """
+  pending_path = manifest_path + PENDING_MANIFEST_SUFFIX
+  manifest = _LoadManifest(hdfs, manifest_path) or {}
+  pending = _LoadManifest(hdfs, pending_path) or {}
+  copied = {}
+  versions = {} if sources else None
+
+  def Check(path):
+    try:
+      copied[path] = hdfs.Size(path)
+    except NotFoundError:
+      pass
+
+  def CheckSource(src):
+    try:
+      versions[src] = sources.Stat(src)[1]
+    except NotFoundError:
+      pass
+
+  errors = _RunInThreads(
+      Check, [path for entry in pending.itervalues()
+              for path in entry['files']], threads)
+  if sources:
+    errors += _RunInThreads(CheckSource, pending.keys(), threads)
+  if errors:
+    raise CopyError('Failed to check %d files: %s' % (len(errors), errors[0]))
+
+  committed = 0
+  partial_copies = []
+  for src, entry in pending.iteritems():
+    problem = _CopyProblem(src, entry, copied, versions)
+    if not problem:
+      manifest[src] = entry
+      committed += 1
+    else:
+      logging.warning('%s %s.', src, problem)
+      partial_copies.extend(path for path in entry['files'] if path in copied)
+  _DeleteFiles(hdfs, partial_copies, threads)
+  _SaveManifest(hdfs, manifest_path, manifest)
+  _DeleteFiles(hdfs, [pending_path], threads)
+  return committed
+
+
+def _ResolveCommand(command):
+  """Returns command to run a program shipped to the working directory.
+
+  Hadoop streaming makes only the mapper or reducer itself executable, but
+  not the program it runs.
+  """
+  program = command[0]
+  if os.sep not in program and os.path.isfile(program):
+    mode = os.stat(program).st_mode
+    if not mode & stat.S_IXUSR:
+      os.chmod(program, mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+    return [os.path.join(os.curdir, program)] + command[1:]
+  return command
+
+
+def RunCommand(engine, command, entries=None, output=None, stdin=None,
+               stderr=sys.stderr, compress=False):
+  """Runs the command with input from and output to Cloud Storage.
+
+  Args:
+    engine: CopyEngine object to read and write files.
+    command: Command to run as list of arguments.
+    entries: List of entries of files to give to standard input of the
+        command in order, or None to pass through the standard input.
+        Gzip files are decompressed.
+    output: Path to upload standard output of the command to, or None to
+        pass through the standard output.
+    stdin: File object of standard input used if entries is None.
+    stderr: File object to report progress to Hadoop.
+    compress: Whether to compress the output in gzip format.
+  Returns:
+    Return code of the command.
+  Raises:
+    CopyError: Failed to upload the output.
+  """
+  process = subprocess.Popen(
+      _ResolveCommand(command),
+      stdin=subprocess.PIPE if entries is not None else stdin,
+      stdout=subprocess.PIPE if output else None)
+  upload_errors = []
+  uploader = None
+  if output:
+
+    def Upload():
+      chunks = iter(lambda: process.stdout.read(OUTPUT_READ_SIZE), '')
+      try:
+        engine.gcs.Write(output, Compress(chunks) if compress else chunks)
+      except Exception as e:  # pylint: disable=broad-except
+        upload_errors.append(e)
+        # Keep reading so that the command isn't blocked on writing.
+        for _ in chunks:
+          pass
+
+    uploader = threading.Thread(target=Upload)
+    uploader.daemon = True
+    uploader.start()
+
+  try:
+    for entry in entries or []:
+      _, chunks = engine.Read(entry[0], *entry[2:])
+      if entry[0].endswith(GZIP_SUFFIX):
+        chunks = Decompress(chunks)
+      for chunk in chunks:
+        process.stdin.write(chunk)
+      # Report progress to Hadoop so that the task isn't regarded as hung.
+      stderr.write('reporter:status:Read %s\n' % entry[0])
+      stderr.flush()
+  except IOError as e:
+    if e.errno != errno.EPIPE:
+      raise
+    logging.warning('Command exited before reading all input.')
+  finally:
+    if entries is not None:
+      process.stdin.close()
+  return_code = process.wait()
+  if uploader:
+    uploader.join()
+    if upload_errors:
+      raise CopyError('Failed to upload output to %s: %s' % (
+          output, upload_errors[0]))
+  return return_code
+
+
+def _WritePlan(bins, plan_dir):
+  """Writes non-empty bins as files in the directory."""
+  if not os.path.isdir(plan_dir):
+    os.makedirs(plan_dir)
+  for index, entries in enumerate(bins):
+    if entries:
+      with open(os.path.join(plan_dir, 'bin-%05d' % index), 'w') as f:
+        for entry in entries:
+          f.write('\t'.join(str(field) for field in entry) + '\n')
+
+
+def _DefaultNameNode():
+  """Returns WebHDFS host and port from job configuration in environment.
+
+  Hadoop streaming passes job configuration to mapper as environment
+  variables, with '.' in the names replaced with '_'.
+  """
+  host = urlparse.urlparse(
+      os.environ.get('fs_default_name', 'hdfs://localhost')).hostname
+  port = os.environ.get('dfs_http_address', '').rpartition(':')[2]
+  return '%s:%s' % (host, port or DEFAULT_WEBHDFS_PORT)
+
+
+def _ParseArguments(argv):
+  parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+  parser.add_argument(
+      '--threads', type=int,
+      default=int(os.environ.get('COPY_THREADS', DEFAULT_THREADS)),
+      help='Number of files copied at the same time.')
+  parser.add_argument(
+      '--range-size-mb', type=int, dest='range_size_mb',
+      default=int(os.environ.get('COPY_RANGE_SIZE_MB',
+                                 DEFAULT_RANGE_SIZE_MB)),
+      help='Size of single ranged read of large files in MB.')
+  parser.add_argument(
+      '--namenode', default=_DefaultNameNode(),
+      help='Host and port of WebHDFS on NameNode.')
+  parser.add_argument(
+      '--user', default=os.environ.get('user_name', 'hadoop'),
+      help='User name to access HDFS as.')
+  parser.add_argument(
+      '--local-gcs-dir', dest='local_gcs_dir',
+      help='Use local directory in place of Cloud Storage.')
+  parser.add_argument(
+      '--local-hdfs-dir', dest='local_hdfs_dir',
+      help='Use local directory in place of HDFS.')
+  parser.add_argument(
+      '--plan-dir', dest='plan_dir',
+      help='Instead of copying files, write the file list packed into '
+      'bins as files in the local directory.')
+  parser.add_argument(
+      '--plan-bins', type=int, dest='plan_bins', default=1,
+      help='Number of bins for --plan-dir.')
+  parser.add_argument(
+      '--split-min-size-mb', type=int, dest='split_min_size_mb', default=0,
+      help='With --plan-dir, split files larger than this size and the '
+      'average bytes per bin into byte ranges.  0 not to split files.')
+  parser.add_argument(
+      '--decompress', action='store_true',
+      help='With --plan-dir, remove ".gz" suffix from destinations, so that '
+      'gzip files are decompressed when copied.')
+  parser.add_argument(
+      '--compose',
+      help='Instead of copying files, combine Cloud Storage objects listed '
+      'one per line in the input into this object.')
+  parser.add_argument(
+      '--delete-sources', dest='delete_sources', action='store_true',
+      help='With --compose, delete source objects after they are combined.')
+  parser.add_argument(
+      '--sync-manifest', dest='sync_manifest',
+      help='With --plan-dir, plan only new or changed files since the last '
+      'sync recorded in this manifest on HDFS, and delete copies of changed '
+      'or removed files.')
+  parser.add_argument(
+      '--commit-sync', dest='commit_sync', metavar='SYNC_MANIFEST',
+      help='Instead of copying files, record files copied as planned with '
+      '--sync-manifest in the manifest on HDFS.')
+  parser.add_argument(
+      '--direct-input', dest='direct_input', action='store_true',
+      help='Run the command with content of the files in the input list as '
+      'its standard input, instead of copying them.')
+  parser.add_argument(
+      '--direct-output', dest='direct_output', metavar='GCS_DIR',
+      help='Run the command, and upload its standard output to part file '
+      'of the task in the directory on Cloud Storage.')
+  parser.add_argument(
+      '--compress-output', dest='compress_output', action='store_true',
+      help='With --direct-output, compress the output in gzip format.')
+  parser.add_argument(
+      'command', nargs=argparse.REMAINDER,
+      help='Mapper or reducer to run with --direct-input or --direct-output, '
+      'following "--".')
+  return parser.parse_args(argv)
+
+
+def _ReadFileList(stream):
+  """Reads tab-separated copy entries from the stream.
+
+  Each line has source and destination, optionally followed by start and end
+  of the byte range to copy.
+  """
+  entries = []
+  for line in stream:
+    line = line.rstrip('\r\n')
+    if line:
+      fields = line.split('\t')
+      if len(fields) == 4:
+        entries.append((fields[0], fields[1], int(fields[2]), int(fields[3])))
+      else:
+        entries.append((fields[0], fields[1]))
+  return entries
+
+
+def main(argv, stdin=sys.stdin, stdout=sys.stdout, stderr=sys.stderr):
+  flags = _ParseArguments(argv)
+  if flags.local_gcs_dir:
+    gcs = LocalStorage(flags.local_gcs_dir)
+  else:
+    gcs = GcsStorage()
+  if flags.local_hdfs_dir:
+    hdfs = LocalStorage(flags.local_hdfs_dir)
+  else:
+    hdfs = WebHdfsStorage(flags.namenode, flags.user)
+  engine = CopyEngine(gcs, hdfs, threads=flags.threads,
+                      range_size=flags.range_size_mb * MIB)
+
+  if flags.compose:
+    sources = sorted(line.strip() for line in stdin if line.strip())
+    ComposeObjects(gcs, sources, flags.compose, threads=flags.threads)
+    if flags.delete_sources:
+      errors = _RunInThreads(gcs.Delete, sources, flags.threads)
+      if errors:
+        raise CopyError('Failed to delete %d objects: %s' % (
+            len(errors), errors[0]))
+    return 0
+
+  command = flags.command[1:] if flags.command[:1] == ['--'] else flags.command
+  if flags.direct_input or flags.direct_output:
+    if not command:
+      raise CopyError('No command to run with direct input or output.')
+    output = None
+    if flags.direct_output:
+      output = '%s/part-%05d' % (flags.direct_output.rstrip('/'), int(
+          os.environ.get('mapred_task_partition', 0)))
+      if flags.compress_output:
+        output += GZIP_SUFFIX
+    entries = _ReadFileList(stdin) if flags.direct_input else None
+    return RunCommand(engine, command, entries=entries, output=output,
+                      stdin=stdin, stderr=stderr,
+                      compress=flags.compress_output)
+
+  if flags.commit_sync:
+    CommitSync(hdfs, flags.commit_sync, threads=flags.threads, sources=gcs)
+    return 0
+
+  entries = _ReadFileList(stdin)
+  if flags.plan_dir:
+    if flags.decompress:
+      entries = [(src, dst[:-len(GZIP_SUFFIX)]
+                  if dst.endswith(GZIP_SUFFIX) else dst)
+                 for src, dst in entries]
+    stats = engine.GetStats([entry[0] for entry in entries])
+    files = [(src, dst) + stats[src] for src, dst in entries]
+    if flags.sync_manifest:
+      to_copy = StartSync(hdfs, flags.sync_manifest, files,
+                          threads=flags.threads)
+    else:
+      to_copy = [(src, dst, size) for src, dst, size, _ in files]
+    bins = PlanBins(to_copy, flags.plan_bins, flags.split_min_size_mb * MIB)
+    if flags.sync_manifest:
+      _SavePendingManifest(hdfs, flags.sync_manifest, bins, files)
+    _WritePlan(bins, flags.plan_dir)
+    return 0
+
+  finished = [0]
+
+  def Report(src, dst, size, error):
+    finished[0] += 1
+    if error:
+      stdout.write('[%s]\tERROR: Copy to %s failed: %s\n' % (src, dst, error))
+    else:
+      stdout.write('[%s]\tCopied to %s (%d bytes)\n' % (src, dst, size))
+      # Report progress to Hadoop so that the task isn't regarded as hung.
+      stderr.write('reporter:counter:Copy,Bytes copied,%d\n' % size)
+    stderr.write('reporter:status:%d out of %d files copied\n' % (
+        finished[0], len(entries)))
+    stdout.flush()
+    stderr.flush()
+
+  failures = engine.CopyAll(entries, callback=Report)
+  return 1 if failures else 0
+
+
+if __name__ == '__main__':
+  logging.basicConfig(level=logging.INFO)
+  sys.exit(main(sys.argv[1:]))
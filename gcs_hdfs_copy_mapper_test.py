@@ -0,0 +1,605 @@
+#!/usr/bin/env python
+# Copyright 2013 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Unit tests of gcs_hdfs_copy_mapper.py."""
+
+
+
+import gzip
+import os
+import os.path
+import shutil
+import StringIO
+import tempfile
+import unittest
+
+import mock
+
+import gcs_hdfs_copy_mapper
+
+
+class GcsHdfsCopyMapperTest(unittest.TestCase):
+  """Unit test class of gcs_hdfs_copy_mapper."""
+
+  def setUp(self):
+    self.gcs_dir = tempfile.mkdtemp()
+    self.addCleanup(shutil.rmtree, self.gcs_dir)
+    self.hdfs_dir = tempfile.mkdtemp()
+    self.addCleanup(shutil.rmtree, self.hdfs_dir)
+    self.gcs = gcs_hdfs_copy_mapper.LocalStorage(self.gcs_dir)
+    self.hdfs = gcs_hdfs_copy_mapper.LocalStorage(self.hdfs_dir)
+
+  def _WriteFile(self, root, path, content):
+    path = os.path.join(root, path)
+    if not os.path.isdir(os.path.dirname(path)):
+      os.makedirs(os.path.dirname(path))
+    with open(path, 'wb') as f:
+      f.write(content)
+
+  def _ReadFile(self, root, path):
+    with open(os.path.join(root, path), 'rb') as f:
+      return f.read()
+
+  def _Gzip(self, content):
+    data = StringIO.StringIO()
+    with gzip.GzipFile(fileobj=data, mode='wb') as f:
+      f.write(content)
+    return data.getvalue()
+
+  def testCopy_GcsToHdfs(self):
+    """Unit test of Copy() from Cloud Storage to HDFS."""
+    self._WriteFile(self.gcs_dir, 'bucket/input/a.txt', 'hello world\n')
+    engine = gcs_hdfs_copy_mapper.CopyEngine(self.gcs, self.hdfs)
+
+    self.assertEqual(12, engine.Copy('gs://bucket/input/a.txt', 'input/a.txt'))
+
+    self.assertEqual('hello world\n',
+                     self._ReadFile(self.hdfs_dir, 'input/a.txt'))
+
+  def testCopy_HdfsToGcs(self):
+    """Unit test of Copy() from HDFS to Cloud Storage."""
+    self._WriteFile(self.hdfs_dir, 'output/part-00000', 'result\n')
+    engine = gcs_hdfs_copy_mapper.CopyEngine(self.gcs, self.hdfs)
+
+    engine.Copy('output/part-00000', 'gs://bucket/output/part-00000')
+
+    self.assertEqual('result\n',
+                     self._ReadFile(self.gcs_dir, 'bucket/output/part-00000'))
+
+  def testCopy_Decompress(self):
+    """Unit test of Copy() of gzip file to destination without '.gz'."""
+    # Concatenated gzip files are decompressed as a whole.
+    self._WriteFile(self.gcs_dir, 'bucket/input/a.txt.gz',
+                    self._Gzip('hello\n') + self._Gzip('world\n'))
+    engine = gcs_hdfs_copy_mapper.CopyEngine(self.gcs, self.hdfs,
+                                             range_size=7)
+
+    engine.Copy('gs://bucket/input/a.txt.gz', 'input/a.txt')
+    engine.Copy('gs://bucket/input/a.txt.gz', 'input/a.txt.gz')
+
+    self.assertEqual('hello\nworld\n',
+                     self._ReadFile(self.hdfs_dir, 'input/a.txt'))
+    # Destination with '.gz' gets the compressed file as it is.
+    self.assertEqual(self._ReadFile(self.gcs_dir, 'bucket/input/a.txt.gz'),
+                     self._ReadFile(self.hdfs_dir, 'input/a.txt.gz'))
+
+  def testCopy_DecompressError(self):
+    """Unit test of Copy() of broken gzip file."""
+    self._WriteFile(self.gcs_dir, 'bucket/input/a.txt.gz', 'not gzip\n')
+    engine = gcs_hdfs_copy_mapper.CopyEngine(self.gcs, self.hdfs)
+
+    self.assertRaises(gcs_hdfs_copy_mapper.CopyError, engine.Copy,
+                      'gs://bucket/input/a.txt.gz', 'input/a.txt')
+
+  def testCompress(self):
+    """Unit test of Compress() and Decompress()."""
+    compressed = ''.join(gcs_hdfs_copy_mapper.Compress(
+        ['line %d\n' % i for i in xrange(1000)]))
+
+    self.assertEqual(''.join('line %d\n' % i for i in xrange(1000)),
+                     gzip.GzipFile(
+                         fileobj=StringIO.StringIO(compressed)).read())
+    self.assertEqual('', ''.join(gcs_hdfs_copy_mapper.Decompress(
+        gcs_hdfs_copy_mapper.Compress([]))))
+
+  def testCopy_RangedReads(self):
+    """Unit test of Copy() of file larger than range size."""
+    content = ''.join(chr(i % 251) for i in xrange(10000))
+    self._WriteFile(self.gcs_dir, 'bucket/large', content)
+    engine = gcs_hdfs_copy_mapper.CopyEngine(
+        self.gcs, self.hdfs, range_size=1000, ranges_in_flight=3)
+
+    with mock.patch.object(self.gcs, 'Read', wraps=self.gcs.Read) as (
+        mock_read):
+      engine.Copy('gs://bucket/large', 'large')
+
+    self.assertEqual(content, self._ReadFile(self.hdfs_dir, 'large'))
+    self.assertEqual(
+        sorted((('gs://bucket/large', start, start + 1000), {})
+               for start in xrange(0, 10000, 1000)),
+        sorted(mock_read.call_args_list))
+
+  def testCopy_EmptyFile(self):
+    """Unit test of Copy() of empty file."""
+    self._WriteFile(self.gcs_dir, 'bucket/empty', '')
+    engine = gcs_hdfs_copy_mapper.CopyEngine(self.gcs, self.hdfs)
+
+    self.assertEqual(0, engine.Copy('gs://bucket/empty', 'empty'))
+
+    self.assertEqual('', self._ReadFile(self.hdfs_dir, 'empty'))
+
+  def testCopy_ReadError(self):
+    """Unit test of Copy() when ranged read fails."""
+    self._WriteFile(self.gcs_dir, 'bucket/large', 'x' * 5000)
+    engine = gcs_hdfs_copy_mapper.CopyEngine(
+        self.gcs, self.hdfs, range_size=1000)
+
+    with mock.patch.object(self.gcs, 'Read', side_effect=IOError('broken')):
+      self.assertRaises(IOError, engine.Copy, 'gs://bucket/large', 'large')
+
+    # Partially copied file is not left.
+    self.assertFalse(os.path.exists(os.path.join(self.hdfs_dir, 'large')))
+
+  def testCopyAll(self):
+    """Unit test of CopyAll() with missing source file."""
+    for i in xrange(10):
+      self._WriteFile(self.gcs_dir, 'bucket/in/%d' % i, 'data %d' % i)
+    pairs = [('gs://bucket/in/%d' % i, 'in/%d' % i) for i in xrange(10)]
+    pairs.append(('gs://bucket/in/missing', 'in/missing'))
+    engine = gcs_hdfs_copy_mapper.CopyEngine(self.gcs, self.hdfs, threads=3)
+    callback = mock.MagicMock()
+
+    failures = engine.CopyAll(pairs, callback=callback)
+
+    self.assertEqual(1, len(failures))
+    self.assertEqual(('gs://bucket/in/missing', 'in/missing'), failures[0][:2])
+    self.assertIsInstance(failures[0][2], gcs_hdfs_copy_mapper.CopyError)
+    self.assertEqual(11, callback.call_count)
+    for i in xrange(10):
+      self.assertEqual('data %d' % i,
+                       self._ReadFile(self.hdfs_dir, 'in/%d' % i))
+
+  def testCopy_Ranges(self):
+    """Unit test of Copy() of byte ranges aligned to line breaks."""
+    content = ''.join('line %d\n' % i for i in xrange(1000))
+    self._WriteFile(self.gcs_dir, 'bucket/large', content)
+    engine = gcs_hdfs_copy_mapper.CopyEngine(self.gcs, self.hdfs)
+    bounds = [0, 1000, 1007, 3000, len(content) + 10]
+
+    with mock.patch('gcs_hdfs_copy_mapper.LINE_SEARCH_SIZE', 4):
+      for i in xrange(len(bounds) - 1):
+        engine.Copy('gs://bucket/large', 'large.%d' % i,
+                    bounds[i], bounds[i + 1])
+
+    pieces = [self._ReadFile(self.hdfs_dir, 'large.%d' % i)
+              for i in xrange(len(bounds) - 1)]
+    self.assertEqual(content, ''.join(pieces))
+    for piece in pieces:
+      self.assertTrue(not piece or piece.endswith('\n'))
+      self.assertTrue(not piece or piece.startswith('line '))
+
+  def testPlanBins(self):
+    """Unit test of PlanBins() without split."""
+    files = [('gs://b/%d' % size, 'in/%d' % size, size)
+             for size in (70, 50, 40, 30, 20, 10)]
+
+    bins = gcs_hdfs_copy_mapper.PlanBins(files, 3)
+
+    self.assertEqual([[('gs://b/70', 'in/70'), ('gs://b/10', 'in/10')],
+                      [('gs://b/50', 'in/50'), ('gs://b/20', 'in/20')],
+                      [('gs://b/40', 'in/40'), ('gs://b/30', 'in/30')]],
+                     bins)
+
+  def testPlanBins_Split(self):
+    """Unit test of PlanBins() with a file larger than the others."""
+    files = [('gs://b/huge', 'in/huge', 1000), ('gs://b/small', 'in/small', 20)]
+
+    bins = gcs_hdfs_copy_mapper.PlanBins(files, 4, min_split_size=100)
+
+    self.assertEqual(
+        [[('gs://b/huge', 'in/huge.split-00000', 0, 250),
+          ('gs://b/small', 'in/small')],
+         [('gs://b/huge', 'in/huge.split-00001', 250, 500)],
+         [('gs://b/huge', 'in/huge.split-00002', 500, 750)],
+         [('gs://b/huge', 'in/huge.split-00003', 750, 1000)]],
+        bins)
+
+  def testPlanBins_NoSplitBelowMinimum(self):
+    """Unit test of PlanBins() with files smaller than minimum split size."""
+    files = [('gs://b/a', 'in/a', 1000), ('gs://b/b', 'in/b', 20)]
+
+    bins = gcs_hdfs_copy_mapper.PlanBins(files, 4, min_split_size=2000)
+
+    self.assertEqual([[('gs://b/a', 'in/a')], [('gs://b/b', 'in/b')], [], []],
+                     bins)
+
+  def testPlanBins_NoSplitGzip(self):
+    """Unit test of PlanBins() with large gzip file."""
+    files = [('gs://b/huge.gz', 'in/huge', 1000), ('gs://b/b', 'in/b', 20)]
+
+    bins = gcs_hdfs_copy_mapper.PlanBins(files, 4, min_split_size=100)
+
+    self.assertEqual(
+        [[('gs://b/huge.gz', 'in/huge')], [('gs://b/b', 'in/b')], [], []],
+        bins)
+
+  def testPlanBins_NoBins(self):
+    """Unit test of PlanBins() with no bins."""
+    self.assertRaises(ValueError, gcs_hdfs_copy_mapper.PlanBins,
+                      [('gs://a/x', 'x', 10)], 0, 64)
+
+  def testComposeObjects(self):
+    """Unit test of ComposeObjects() with more objects than single request."""
+    sources = []
+    for i in xrange(70):
+      self._WriteFile(self.gcs_dir, 'bucket/out/part-%05d' % i, '%d\n' % i)
+      sources.append('gs://bucket/out/part-%05d' % i)
+
+    with mock.patch.object(self.gcs, 'Compose', wraps=self.gcs.Compose) as (
+        mock_compose):
+      gcs_hdfs_copy_mapper.ComposeObjects(
+          self.gcs, sources, 'gs://bucket/out/results.txt')
+
+    self.assertEqual(''.join('%d\n' % i for i in xrange(70)),
+                     self._ReadFile(self.gcs_dir, 'bucket/out/results.txt'))
+    # 3 intermediate objects, and the final one from them.
+    self.assertEqual(4, mock_compose.call_count)
+    for call in mock_compose.call_args_list:
+      self.assertGreaterEqual(32, len(call[0][0]))
+    # Intermediate objects are deleted, and source objects are left.
+    self.assertEqual(71, len(os.listdir(os.path.join(self.gcs_dir,
+                                                     'bucket/out'))))
+
+  def testMain_Compose(self):
+    """Unit test of main() to compose objects and delete the sources."""
+    self._WriteFile(self.gcs_dir, 'bucket/out/part-00001', 'b\n')
+    self._WriteFile(self.gcs_dir, 'bucket/out/part-00000', 'a\n')
+    stdin = StringIO.StringIO('gs://bucket/out/part-00001\n'
+                              'gs://bucket/out/part-00000\n')
+
+    self.assertEqual(0, gcs_hdfs_copy_mapper.main(
+        ['--local-gcs-dir', self.gcs_dir,
+         '--compose', 'gs://bucket/out/results.txt', '--delete-sources'],
+        stdin, StringIO.StringIO(), StringIO.StringIO()))
+
+    self.assertEqual(['results.txt'],
+                     os.listdir(os.path.join(self.gcs_dir, 'bucket/out')))
+    self.assertEqual('a\nb\n',
+                     self._ReadFile(self.gcs_dir, 'bucket/out/results.txt'))
+
+  def testWebHdfsStorage_Url(self):
+    """Unit test of WebHDFS URL of relative and absolute paths."""
+    hdfs = gcs_hdfs_copy_mapper.WebHdfsStorage('hm:50070', 'hadoop')
+
+    self.assertEqual(
+        'http://hm:50070/webhdfs/v1/user/hadoop/input/a.txt'
+        '?op=GETFILESTATUS&user.name=hadoop',
+        hdfs._Url('input/a.txt', 'GETFILESTATUS'))
+    self.assertEqual(
+        'http://hm:50070/webhdfs/v1/tmp/a.txt'
+        '?length=10&offset=0&op=OPEN&user.name=hadoop',
+        hdfs._Url('hdfs://hm:9000/tmp/a.txt', 'OPEN', offset=0, length=10))
+
+  def _FakeResponse(self, status, location=None):
+    response = mock.MagicMock(status=status)
+    response.getheader.return_value = location
+    return response
+
+  def testWebHdfsStorage_Write(self):
+    """Unit test of WebHDFS write to temporary file renamed at the end."""
+    hdfs = gcs_hdfs_copy_mapper.WebHdfsStorage('hm:50070', 'hadoop')
+    hdfs._http = mock.MagicMock()
+    hdfs._http.Request.side_effect = [
+        (self._FakeResponse(307, 'http://hw-000:50075/data'), ''),
+        (self._FakeResponse(201), ''),
+        (self._FakeResponse(200), '{"boolean": true}'),
+        (self._FakeResponse(200), '{"boolean": true}'),
+    ]
+
+    hdfs.Write('in/a', ['data'])
+
+    calls = hdfs._http.Request.call_args_list
+    self.assertEqual(4, len(calls))
+    self.assertRegexpMatches(
+        calls[0][0][1], '/user/hadoop/in/\\.a\\.\\d+\\.\\d+\\.tmp\\?op=CREATE&')
+    self.assertEqual(('PUT', 'http://hw-000:50075/data', ['data']),
+                     calls[1][0])
+    self.assertEqual('DELETE', calls[2][0][0])
+    self.assertRegexpMatches(calls[2][0][1], '/user/hadoop/in/a\\?op=DELETE&')
+    self.assertEqual('PUT', calls[3][0][0])
+    self.assertRegexpMatches(
+        calls[3][0][1],
+        '/user/hadoop/in/\\.a\\.\\d+\\.\\d+\\.tmp\\?destination='
+        '%2Fuser%2Fhadoop%2Fin%2Fa&op=RENAME&')
+
+  def testWebHdfsStorage_WriteError(self):
+    """Unit test of WebHDFS write failure leaving no file at the path."""
+    hdfs = gcs_hdfs_copy_mapper.WebHdfsStorage('hm:50070', 'hadoop')
+    hdfs._http = mock.MagicMock()
+    hdfs._http.Request.side_effect = [
+        (self._FakeResponse(307, 'http://hw-000:50075/data'), ''),
+        (self._FakeResponse(500), 'broken'),
+        (self._FakeResponse(200), '{"boolean": true}'),
+    ]
+
+    self.assertRaises(gcs_hdfs_copy_mapper.CopyError, hdfs.Write, 'in/a',
+                      ['data'])
+
+    # Only the temporary file is deleted, and nothing is renamed.
+    calls = hdfs._http.Request.call_args_list
+    self.assertEqual(3, len(calls))
+    self.assertEqual('DELETE', calls[2][0][0])
+    self.assertRegexpMatches(calls[2][0][1], '/in/\\.a\\..*\\?op=DELETE&')
+
+  def testMain(self):
+    """Unit test of main() with local directories."""
+    self._WriteFile(self.gcs_dir, 'bucket/in/a', 'aaa')
+    self._WriteFile(self.gcs_dir, 'bucket/in/b', 'bb')
+    stdin = StringIO.StringIO(
+        'gs://bucket/in/a\tinput/a\ngs://bucket/in/b\tinput/b\n')
+    stdout = StringIO.StringIO()
+    stderr = StringIO.StringIO()
+
+    self.assertEqual(0, gcs_hdfs_copy_mapper.main(
+        ['--local-gcs-dir', self.gcs_dir, '--local-hdfs-dir', self.hdfs_dir],
+        stdin, stdout, stderr))
+
+    self.assertEqual('aaa', self._ReadFile(self.hdfs_dir, 'input/a'))
+    self.assertEqual('bb', self._ReadFile(self.hdfs_dir, 'input/b'))
+    self.assertEqual(
+        ['[gs://bucket/in/a]\tCopied to input/a (3 bytes)',
+         '[gs://bucket/in/b]\tCopied to input/b (2 bytes)'],
+        sorted(stdout.getvalue().splitlines()))
+    self.assertIn('reporter:status:2 out of 2 files copied',
+                  stderr.getvalue())
+
+  def testMain_PlanAndCopy(self):
+    """Unit test of main() to plan bins and copy files in them."""
+    content = ''.join('%05d\n' % i for i in xrange(2000))
+    self._WriteFile(self.gcs_dir, 'bucket/in/large', content)
+    self._WriteFile(self.gcs_dir, 'bucket/in/small', 'small\n')
+    plan_dir = os.path.join(self.hdfs_dir, 'plan')
+    local_dirs = ['--local-gcs-dir', self.gcs_dir,
+                  '--local-hdfs-dir', self.hdfs_dir]
+
+    with mock.patch('gcs_hdfs_copy_mapper.MIB', 1000):
+      self.assertEqual(0, gcs_hdfs_copy_mapper.main(
+          local_dirs + ['--plan-dir', plan_dir, '--plan-bins', '3',
+                        '--split-min-size-mb', '1'],
+          StringIO.StringIO('gs://bucket/in/large\tinput/large\n'
+                            'gs://bucket/in/small\tinput/small\n'),
+          StringIO.StringIO(), StringIO.StringIO()))
+
+    self.assertEqual(['bin-00000', 'bin-00001', 'bin-00002'],
+                     sorted(os.listdir(plan_dir)))
+    for name in os.listdir(plan_dir):
+      with open(os.path.join(plan_dir, name)) as f:
+        self.assertEqual(0, gcs_hdfs_copy_mapper.main(
+            local_dirs, f, StringIO.StringIO(), StringIO.StringIO()))
+
+    input_dir = os.path.join(self.hdfs_dir, 'input')
+    pieces = sorted(name for name in os.listdir(input_dir)
+                    if name.startswith('large.split-'))
+    self.assertEqual(3, len(pieces))
+    self.assertEqual(content, ''.join(
+        self._ReadFile(input_dir, name) for name in pieces))
+    self.assertEqual('small\n', self._ReadFile(input_dir, 'small'))
+
+  def testMain_PlanDecompress(self):
+    """Unit test of main() to plan copy of gzip files with --decompress."""
+    self._WriteFile(self.gcs_dir, 'bucket/in/a.gz', self._Gzip('a\n'))
+    self._WriteFile(self.gcs_dir, 'bucket/in/b', 'b\n')
+    plan_dir = os.path.join(self.hdfs_dir, 'plan')
+
+    self.assertEqual(0, gcs_hdfs_copy_mapper.main(
+        ['--local-gcs-dir', self.gcs_dir, '--local-hdfs-dir', self.hdfs_dir,
+         '--plan-dir', plan_dir, '--decompress'],
+        StringIO.StringIO('gs://bucket/in/a.gz\tinput/a.gz\n'
+                          'gs://bucket/in/b\tinput/b\n'),
+        StringIO.StringIO(), StringIO.StringIO()))
+
+    self.assertEqual(
+        'gs://bucket/in/a.gz\tinput/a\ngs://bucket/in/b\tinput/b\n',
+        self._ReadFile(plan_dir, 'bin-00000'))
+
+  def testPlanSync(self):
+    """Unit test of PlanSync() with unchanged, changed and removed files."""
+    manifest = {
+        'gs://b/same': {'version': '1/a', 'destination': 'in/same',
+                        'files': ['in/same']},
+        'gs://b/changed': {'version': '1/b', 'destination': 'in/changed',
+                           'files': ['in/changed.split-00000',
+                                     'in/changed.split-00001']},
+        'gs://b/removed': {'version': '1/c', 'destination': 'in/removed',
+                           'files': ['in/removed']},
+    }
+    files = [('gs://b/same', 'in/same', 10, '1/a'),
+             ('gs://b/changed', 'in/changed', 20, '2/d'),
+             ('gs://b/new', 'in/new', 30, '1/e')]
+
+    to_copy, stale, unchanged = gcs_hdfs_copy_mapper.PlanSync(manifest, files)
+
+    self.assertEqual([('gs://b/changed', 'in/changed', 20),
+                      ('gs://b/new', 'in/new', 30)], to_copy)
+    self.assertEqual(['in/changed.split-00000', 'in/changed.split-00001',
+                      'in/removed'], stale)
+    self.assertEqual(['gs://b/same'], unchanged.keys())
+
+  def _Sync(self, file_list):
+    """Runs incremental sync of the files, and returns copied sources."""
+    plan_dir = tempfile.mkdtemp()
+    self.addCleanup(shutil.rmtree, plan_dir)
+    local_dirs = ['--local-gcs-dir', self.gcs_dir,
+                  '--local-hdfs-dir', self.hdfs_dir]
+    self.assertEqual(0, gcs_hdfs_copy_mapper.main(
+        local_dirs + ['--plan-dir', plan_dir,
+                      '--sync-manifest', 'inputs.manifest'],
+        StringIO.StringIO(file_list), StringIO.StringIO(),
+        StringIO.StringIO()))
+    copied = []
+    for name in os.listdir(plan_dir):
+      with open(os.path.join(plan_dir, name)) as f:
+        copied.extend(line.split('\t')[0] for line in f)
+        f.seek(0)
+        self.assertEqual(0, gcs_hdfs_copy_mapper.main(
+            local_dirs, f, StringIO.StringIO(), StringIO.StringIO()))
+    self.assertEqual(0, gcs_hdfs_copy_mapper.main(
+        local_dirs + ['--commit-sync', 'inputs.manifest'],
+        StringIO.StringIO(), StringIO.StringIO(), StringIO.StringIO()))
+    return sorted(copied)
+
+  def testMain_Sync(self):
+    """Unit test of main() to copy files incrementally."""
+    for name in ('a', 'b', 'c'):
+      self._WriteFile(self.gcs_dir, 'bucket/in/' + name, name)
+
+    self.assertEqual(
+        ['gs://bucket/in/a', 'gs://bucket/in/b', 'gs://bucket/in/c'],
+        self._Sync('gs://bucket/in/a\tinputs/a\n'
+                   'gs://bucket/in/b\tinputs/b\n'
+                   'gs://bucket/in/c\tinputs/c\n'))
+
+    # Change 'b', remove 'c' and add 'd'.
+    self._WriteFile(self.gcs_dir, 'bucket/in/b', 'b changed')
+    self._WriteFile(self.gcs_dir, 'bucket/in/d', 'd')
+    self.assertEqual(
+        ['gs://bucket/in/b', 'gs://bucket/in/d'],
+        self._Sync('gs://bucket/in/a\tinputs/a\n'
+                   'gs://bucket/in/b\tinputs/b\n'
+                   'gs://bucket/in/d\tinputs/d\n'))
+
+    self.assertEqual(['a', 'b', 'd'],
+                     sorted(os.listdir(os.path.join(self.hdfs_dir, 'inputs'))))
+    self.assertEqual('b changed', self._ReadFile(self.hdfs_dir, 'inputs/b'))
+    self.assertEqual(['inputs.manifest'],
+                     [name for name in os.listdir(self.hdfs_dir)
+                      if name.startswith('inputs.')])
+
+    # Nothing to copy.
+    self.assertEqual([], self._Sync('gs://bucket/in/a\tinputs/a\n'))
+
+  def testCommitSync_IncompleteCopy(self):
+    """Unit test of CommitSync() when a source is not copied completely."""
+    self._WriteFile(self.hdfs_dir, 'in/big.split-00000', 'x')
+    self._WriteFile(self.hdfs_dir, 'in/small', 'y')
+    gcs_hdfs_copy_mapper._SaveManifest(self.hdfs, 'm.pending', {
+        'gs://b/big': {'version': '1', 'destination': 'in/big',
+                       'files': ['in/big.split-00000', 'in/big.split-00001']},
+        'gs://b/small': {'version': '2', 'destination': 'in/small',
+                         'files': ['in/small']},
+    })
+
+    self.assertEqual(1, gcs_hdfs_copy_mapper.CommitSync(self.hdfs, 'm'))
+
+    self.assertEqual(['gs://b/small'],
+                     gcs_hdfs_copy_mapper._LoadManifest(self.hdfs, 'm').keys())
+    self.assertEqual(['small'], os.listdir(os.path.join(self.hdfs_dir, 'in')))
+    self.assertFalse(os.path.exists(os.path.join(self.hdfs_dir, 'm.pending')))
+
+  def testCommitSync_WrongSizeOrChangedSource(self):
+    """Unit test of CommitSync() with copies that don't match the sources."""
+    self._WriteFile(self.gcs_dir, 'b/ok', 'abc')
+    self._WriteFile(self.gcs_dir, 'b/short', 'abcdef')
+    self._WriteFile(self.gcs_dir, 'b/changed', 'abc')
+    self._WriteFile(self.hdfs_dir, 'in/ok', 'abc')
+    self._WriteFile(self.hdfs_dir, 'in/short', 'abc')
+    self._WriteFile(self.hdfs_dir, 'in/changed', 'abc')
+    pending = {}
+    for name in ['ok', 'short', 'changed']:
+      src = 'gs://b/' + name
+      size, version = self.gcs.Stat(src)
+      pending[src] = {'version': version, 'destination': 'in/' + name,
+                      'size': size, 'files': ['in/' + name]}
+    pending['gs://b/changed']['version'] = 'old'
+    gcs_hdfs_copy_mapper._SaveManifest(self.hdfs, 'm.pending', pending)
+
+    self.assertEqual(1, gcs_hdfs_copy_mapper.CommitSync(
+        self.hdfs, 'm', sources=self.gcs))
+
+    self.assertEqual(['gs://b/ok'],
+                     gcs_hdfs_copy_mapper._LoadManifest(self.hdfs, 'm').keys())
+    self.assertEqual(['ok'], os.listdir(os.path.join(self.hdfs_dir, 'in')))
+
+  def testMain_DirectInputAndOutput(self):
+    """Unit test of main() to run command with input and output on GCS."""
+    self._WriteFile(self.gcs_dir, 'bucket/in/a', 'abc\n')
+    self._WriteFile(self.gcs_dir, 'bucket/in/b', 'line 1\nline 2\nline 3\n')
+    stdin = StringIO.StringIO('gs://bucket/in/a\t-\n'
+                              'gs://bucket/in/b\t-.split-00001\t7\t100\n')
+
+    with mock.patch.dict(os.environ, {'mapred_task_partition': '3'}):
+      self.assertEqual(0, gcs_hdfs_copy_mapper.main(
+          ['--local-gcs-dir', self.gcs_dir, '--direct-input',
+           '--direct-output', 'gs://bucket/out/', '--', 'tr', 'a-z', 'A-Z'],
+          stdin, StringIO.StringIO(), StringIO.StringIO()))
+
+    self.assertEqual('ABC\nLINE 2\nLINE 3\n',
+                     self._ReadFile(self.gcs_dir, 'bucket/out/part-00003'))
+
+  def testMain_DirectInputAndOutput_Gzip(self):
+    """Unit test of main() to run command with compressed input and output."""
+    self._WriteFile(self.gcs_dir, 'bucket/in/a.gz', self._Gzip('abc\n'))
+
+    self.assertEqual(0, gcs_hdfs_copy_mapper.main(
+        ['--local-gcs-dir', self.gcs_dir, '--direct-input',
+         '--direct-output', 'gs://bucket/out', '--compress-output',
+         '--', 'tr', 'a-z', 'A-Z'],
+        StringIO.StringIO('gs://bucket/in/a.gz\t-\n'), StringIO.StringIO(),
+        StringIO.StringIO()))
+
+    self.assertEqual('ABC\n', gzip.GzipFile(os.path.join(
+        self.gcs_dir, 'bucket/out/part-00000.gz')).read())
+
+  def testRunCommand_PassThroughInput(self):
+    """Unit test of RunCommand() with standard input passed through."""
+    engine = gcs_hdfs_copy_mapper.CopyEngine(self.gcs, self.hdfs)
+    with tempfile.TemporaryFile() as stdin:
+      stdin.write('reduce input\n')
+      stdin.seek(0)
+
+      self.assertEqual(0, gcs_hdfs_copy_mapper.RunCommand(
+          engine, ['cat'], output='gs://bucket/out/part-00000', stdin=stdin))
+
+    self.assertEqual('reduce input\n',
+                     self._ReadFile(self.gcs_dir, 'bucket/out/part-00000'))
+
+  def testRunCommand_UploadError(self):
+    """Unit test of RunCommand() when output can't be uploaded."""
+    engine = gcs_hdfs_copy_mapper.CopyEngine(self.gcs, self.hdfs)
+
+    def BrokenWrite(unused_path, chunks):
+      next(chunks)
+      raise IOError('broken')
+
+    with mock.patch.object(self.gcs, 'Write', side_effect=BrokenWrite):
+      self.assertRaises(
+          gcs_hdfs_copy_mapper.CopyError, gcs_hdfs_copy_mapper.RunCommand,
+          engine, ['head', '-c', '10000000', '/dev/zero'], entries=[],
+          output='gs://bucket/out/part-00000')
+
+  def testMain_Failure(self):
+    """Unit test of main() when copy fails."""
+    stdin = StringIO.StringIO('gs://bucket/missing\tinput/missing\n')
+    stdout = StringIO.StringIO()
+
+    self.assertEqual(1, gcs_hdfs_copy_mapper.main(
+        ['--local-gcs-dir', self.gcs_dir, '--local-hdfs-dir', self.hdfs_dir],
+        stdin, stdout, StringIO.StringIO()))
+
+    self.assertIn('ERROR', stdout.getvalue())
+
+
+if __name__ == '__main__':
+  unittest.main()
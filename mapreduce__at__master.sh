@@ -14,21 +14,65 @@
 # limitations under the License.
 
 declare -r TMP_BUCKET=$1 ; shift
+# "-" as mapper only copies input to output without MapReduce job.
 declare -r MAPPER=$1 ; shift
 declare -r MAPPER_COUNT=$1 ; shift
 declare -r REDUCER=$1 ; shift
 declare -r REDUCER_COUNT=$1 ; shift
+# Input and output are directories on GCS (gs://...), or in HDFS.
+# Input in HDFS may be comma-separated list of directories.
 declare -r INPUT_DIR=$1 ; shift
 declare -r OUTPUT_DIR=$1 ; shift
+# How to upload part files of MapReduce output to Cloud Storage.
+#   files: Upload part files in parallel from workers.
+#   compose: Upload part files in parallel, and combine them into
+#       results.txt by compose requests.
+#   concat: Concatenate part files into results.txt through the master.
+declare -r OUTPUT_MODE=${1:-files} ; shift
+# How to copy input files from Cloud Storage to HDFS.
+#   full: Copy all input files.
+#   incremental: Copy only new or changed files since the last copy, and
+#       delete removed ones.
+declare -r INPUT_MODE=${1:-full} ; shift
+# Which of input and output the MapReduce job reads from and writes to Cloud
+# Storage directly, skipping copy through HDFS.  (none, input, output or both)
+declare -r DIRECT_IO=${1:-none} ; shift
+# Combiner of the MapReduce job, or "-" for no combiner.
+declare -r COMBINER=${1:--} ; shift
+# Comma-separated list of additional files shipped with the job, such as
+# libraries of mapper and reducer, or "-" for none.
+declare -r FILES=${1:--} ; shift
+# Codec to compress map output shuffled to reducers with.
+# (none, default, gzip or snappy)
+declare -r MAP_OUTPUT_CODEC=${1:-none} ; shift
+# Codec to compress output of the job with.  (none or gzip)
+declare -r OUTPUT_CODEC=${1:-none} ; shift
+# Whether to decompress gzip (.gz) input files when copied to HDFS.
+# (keep or decompress)
+declare -r INPUT_COMPRESSION=${1:-keep} ; shift
 
 declare -r HADOOP_DIR=hadoop
 declare -r HADOOP_HOME=/home/hadoop
 declare -r HADOOP_ROOT=/home/hadoop/$HADOOP_DIR
 declare -r HADOOP_BIN=$HADOOP_ROOT/bin
 declare -r MAPREDUCE_HOME=$HADOOP_HOME/mapreduce
+declare -r COPY_MAPPER=$MAPREDUCE_HOME/gcs_hdfs_copy_mapper.py
+# Programs and files shipped with jobs are copied to directory of the
+# process, since jobs of pipeline may run at the same time.
+declare -r JOB_DIR=$MAPREDUCE_HOME/job.$$
 
 declare -r GCS_TMP=gs://$TMP_BUCKET/mapreduce/tmp
 declare -r GCS_MAPPER_REDUCER=gs://$TMP_BUCKET/mapreduce/mapper-reducer
+# Number of files each mapper of copy jobs copies at the same time.
+declare -r COPY_THREADS=4
+# Input files larger than this size are split into byte ranges copied by
+# different mappers.
+declare -r COPY_SPLIT_MIN_SIZE_MB=64
+# Use larger of the MAPPER_COUNT and REDUCER_COUNT as mapper size
+# of the copy job, at least 1.
+declare -r COPY_PARALLEL_COUNT=$((MAPPER_COUNT > REDUCER_COUNT ?  \
+    (MAPPER_COUNT > 1 ? MAPPER_COUNT : 1) :  \
+    (REDUCER_COUNT > 1 ? REDUCER_COUNT : 1)))
 
 
 function mapreduce() {
@@ -39,29 +83,50 @@ function mapreduce() {
   local -r reducer_count=$1 ; shift
   local -r input_hdfs=$1 ; shift
   local -r output_hdfs=$1 ; shift
+  # Command prefix to run mapper and reducer with, if any.
+  local -r mapper_wrapper=$1 ; shift
+  local -r reducer_wrapper=$1 ; shift
+  # Remaining arguments are passed to Hadoop streaming as they are, after
+  # generic options (-D) of the job.
+  local -r extra_params="$@"
 
   local mapper_local
   local reducer_local
   local file_param
 
   # Copy mapper and reducer to local if they're on Cloud Storage.
-  # Otherwise treat it as local program.
+  # Otherwise treat it as local program.  Wrapper runs the program shipped
+  # with the job in the working directory of the task.
   if [[ "${mapper:0:5}" == "gs://" ]] ; then
-    gsutil cp $mapper $MAPREDUCE_HOME
-    mapper_local=$MAPREDUCE_HOME/$(basename $mapper)
+    mapper_local=$(fetch_file $mapper)
     file_param="$file_param -file $mapper_local"
+    if [[ -n "$mapper_wrapper" ]] ; then
+      mapper_local=$(basename $mapper)
+    fi
   else
     mapper_local=$mapper
   fi
 
   if [[ "${reducer:0:5}" == "gs://" ]] ; then
-    gsutil cp $reducer $MAPREDUCE_HOME
-    reducer_local=$MAPREDUCE_HOME/$(basename $reducer)
+    reducer_local=$(fetch_file $reducer)
     file_param="$file_param -file $reducer_local"
+    if [[ -n "$reducer_wrapper" ]] ; then
+      reducer_local=$(basename $reducer)
+    fi
   else
     reducer_local=$reducer
   fi
 
+  if [[ -n "$mapper_wrapper" ]] ; then
+    mapper_local="$mapper_wrapper -- $mapper_local"
+  fi
+  if [[ -n "$reducer_wrapper" ]] ; then
+    reducer_local="$reducer_wrapper -- $reducer_local"
+  fi
+  if [[ -n "$mapper_wrapper$reducer_wrapper" ]] ; then
+    file_param="$file_param -file $COPY_MAPPER"
+  fi
+
   echo
   echo ".... Starting MapReduce job ...."
   echo
@@ -72,38 +137,69 @@ function mapreduce() {
           -D mapred.map.tasks=$mapper_count  \
           -D mapred.reduce.tasks=$reducer_count  \
           -D mapred.job.name=\"$job_name\"  \
+          $extra_params  \
           -input $input_hdfs -output $output_hdfs  \
-          -mapper $mapper_local  \
-          -reducer $reducer_local  \
+          -mapper \"$mapper_local\"  \
+          -reducer \"$reducer_local\"  \
           $file_param  \
           "
   echo "MapReduce command: $command"
   eval $command
 }
 
-function do_copy() {
+# Copies file on Cloud Storage to the job directory, and prints local path.
+function fetch_file() {
+  local -r file=$1 ; shift
+
+  gsutil -q cp $file $JOB_DIR 1>&2
+  echo $JOB_DIR/$(basename $file)
+}
+
+# Prints Hadoop class name of the codec.
+function codec_class() {
+  local -r codec=$1 ; shift
+
+  case "$codec" in
+    default) echo org.apache.hadoop.io.compress.DefaultCodec ;;
+    gzip) echo org.apache.hadoop.io.compress.GzipCodec ;;
+    snappy) echo org.apache.hadoop.io.compress.SnappyCodec ;;
+  esac
+}
+
+# Packs file list from stdin into balanced bins, one input file per bin,
+# and puts them as input of the copy job.
+function plan_copy() {
   local -r name=$1 ; shift
+  local -r plan_dir=$MAPREDUCE_HOME/$name.plan
 
-  # Use larger of the MAPPER_COUNT and REDUCER_COUNT as mapper size
-  # of the copy job.
-  local parallel_count=$((MAPPER_COUNT > REDUCER_COUNT ?  \
-                          MAPPER_COUNT : REDUCER_COUNT))
+  rm -rf $plan_dir
+  python $COPY_MAPPER --plan-dir $plan_dir  \
+      --plan-bins $COPY_PARALLEL_COUNT "$@" || return 1
+  $HADOOP_BIN/hadoop dfs -put $plan_dir $name/inputs
+}
 
-  # Initiate MapReduce for copy.
+# Runs the copy job planned by plan_copy, and returns non-zero if it failed.
+function do_copy() {
+  local -r name=$1 ; shift
+  local status=0
+
+  # Initiate MapReduce for copy.  Each bin file is small, but is never split
+  # further, so that each mapper copies one bin with COPY_THREADS threads.
   mapreduce $name  \
-      $GCS_MAPPER_REDUCER/${name}_mapper.sh $parallel_count  \
-      cat 0 $name/inputs $name/outputs
-
-  # Copy results from HDFS to GCS.  Exclude directories.
-  # First, copy files except results (part-*).
-  for f in $($HADOOP_BIN/hadoop dfs -lsr $name/outputs/ | grep -v ^d  \
-      | awk '{print $8}' | grep -v part-.*) ; do
-    local gcs_output=$GCS_TMP/${name}.outputs/${f#*$name/outputs/}
-    $HADOOP_BIN/hadoop dfs -cat $f | gsutil cp - $gcs_output
-  done
-  # Combine results into one file and copy to GCS.
-  $HADOOP_BIN/hadoop dfs -cat "$name/outputs/part-*" |  \
-      gsutil cp - $GCS_TMP/${name}.outputs/results.txt
+      $GCS_MAPPER_REDUCER/gcs_hdfs_copy_mapper.py $COPY_PARALLEL_COUNT  \
+      cat 0 $name/inputs $name/outputs "" ""  \
+      -D mapred.min.split.size=$((1 << 40))  \
+      -cmdenv COPY_THREADS=$COPY_THREADS || status=1
+
+  # Copy log of the copy job from HDFS to GCS.  Combine mapper output
+  # (part-*) into one file, and upload other files in parallel.
+  local -r log_dir=$MAPREDUCE_HOME/$name.outputs
+  rm -rf $log_dir
+  $HADOOP_BIN/hadoop dfs -get $name/outputs $log_dir
+  cat $log_dir/part-* | gsutil cp - $GCS_TMP/${name}.outputs/results.txt
+  rm -f $log_dir/part-*
+  gsutil -m cp -R $log_dir/* $GCS_TMP/${name}.outputs/
+  return $status
 }
 
 # Copies input files from GCS to HDFS with MapRecuce.
@@ -111,15 +207,32 @@ function gcs_to_hdfs() {
   local -r src_gfs=$1 ; shift
   local -r dst_hdfs=$1 ; shift
   local -r name=gcs_to_hdfs
+  local -r manifest=$dst_hdfs.manifest
+
+  local sync_param
+  if [[ "$INPUT_MODE" == "incremental" ]] ; then
+    sync_param="--sync-manifest $manifest"
+  fi
+  local decompress_param
+  if [[ "$INPUT_COMPRESSION" == "decompress" ]] ; then
+    decompress_param="--decompress"
+  fi
 
   echo "Clear previous $name input/output."
   $HADOOP_BIN/hadoop dfs -rmr $name/inputs $name/outputs
 
-  # Prepare file list as input of GCS-to-HDFS copy MapReduce job.
+  # Prepare file list as input of GCS-to-HDFS copy MapReduce job.  Large
+  # files are split, since they're read as separate input files anyway.
   gsutil ls $src_gfs |  \
       perl -p -e "s|.*$src_gfs(.*)|\$&\t$dst_hdfs\$1|" |  \
-      $HADOOP_BIN/hadoop dfs -put - $name/inputs/file-list
-  do_copy $name
+      plan_copy $name --split-min-size-mb $COPY_SPLIT_MIN_SIZE_MB  \
+          $sync_param $decompress_param
+  do_copy $name || return 1
+
+  if [[ -n "$sync_param" ]] ; then
+    # Record the copied files, so that they're skipped next time.
+    python $COPY_MAPPER --commit-sync $manifest < /dev/null
+  fi
 }
 
 # Copies output files from HDFS to GCS with MapReduce.
@@ -127,34 +240,181 @@ function hdfs_to_gcs() {
   local -r src_hdfs=$1 ; shift
   local -r dst_gfs=$1 ; shift
   local -r name=hdfs_to_gcs
+  local -r results=$dst_gfs/results.txt$(results_suffix)
 
   echo "Clear previous $name input/output."
   $HADOOP_BIN/hadoop dfs -rmr $name/inputs $name/outputs
 
   # Prepare file list as input of HDFS-to-GCS copy MapReduce job.
-  # Exclude directories.
+  # Exclude directories, and part files if they're concatenated below.
+  local part_filter='^$'
+  if [[ "$OUTPUT_MODE" == "concat" ]] ; then
+    part_filter='/part-[^/]*$'
+  fi
   $HADOOP_BIN/hadoop dfs -lsr $src_hdfs | grep -v ^d | awk '{print $8}' |  \
+      grep -v "$part_filter" |  \
       perl -p -e "s|.*$src_hdfs/(.*)|\$&\t$dst_gfs/\$1|" |  \
-      $HADOOP_BIN/hadoop dfs -put - $name/inputs/file-list
-  do_copy $name
+      plan_copy $name
+  do_copy $name || return 1
+
+  case "$OUTPUT_MODE" in
+    compose)
+      # Combine part files uploaded by the copy job without downloading.
+      gsutil ls "$dst_gfs/part-*" |  \
+          python $COPY_MAPPER --compose $results --delete-sources
+      ;;
+    concat)
+      # Concatenated gzip part files are a valid gzip file.
+      $HADOOP_BIN/hadoop dfs -cat "$src_hdfs/part-*" |  \
+          gsutil cp - $results
+      ;;
+  esac
+}
+
+# Prints suffix of the combined results file for the output codec.
+function results_suffix() {
+  if [[ "$OUTPUT_CODEC" == "gzip" ]] ; then
+    echo .gz
+  fi
+}
+
+# Clears HDFS directory to copy input to, unless incremental copy keeps it.
+function clear_input() {
+  local -r dir=$1 ; shift
+
+  if [[ "$INPUT_MODE" == "incremental" ]] &&  \
+      $HADOOP_BIN/hadoop dfs -test -e $dir.manifest ; then
+    echo "Keep previous input $dir for incremental copy."
+  else
+    echo "Clear previous input $dir if any."
+    $HADOOP_BIN/hadoop dfs -rmr $dir $dir.manifest
+  fi
 }
 
 function main() {
   declare -r hdfs_input="inputs"
-  declare -r hdfs_output="outputs"
+  local hdfs_output="outputs"
+
+  mkdir -p $MAPREDUCE_HOME $JOB_DIR
+  trap "rm -rf $JOB_DIR" EXIT
+  # Copy mapper is used to copy files between GCS and HDFS, and to read and
+  # write GCS directly.
+  if [[ "${INPUT_DIR:0:5}" == "gs://" || "${OUTPUT_DIR:0:5}" == "gs://" ]]
+  then
+    gsutil cp $GCS_MAPPER_REDUCER/$(basename $COPY_MAPPER) $COPY_MAPPER
+  fi
+
+  # Mapper "-" only copies input on GCS to HDFS, or HDFS to output on GCS.
+  if [[ "$MAPPER" == "-" ]] ; then
+    if [[ "${INPUT_DIR:0:5}" == "gs://" ]] ; then
+      clear_input $OUTPUT_DIR
+      gcs_to_hdfs $INPUT_DIR $OUTPUT_DIR
+    else
+      hdfs_to_gcs $INPUT_DIR $OUTPUT_DIR
+    fi
+    return
+  fi
+
+  # Output not on GCS is kept in HDFS.
+  if [[ "${OUTPUT_DIR:0:5}" != "gs://" ]] ; then
+    hdfs_output=$OUTPUT_DIR
+  fi
+  echo "Clear previous output $hdfs_output if any."
+  $HADOOP_BIN/hadoop dfs -rmr $hdfs_output
 
-  mkdir -p $MAPREDUCE_HOME
+  local job_input=$hdfs_input
+  local mapper_wrapper
+  local reducer_wrapper
+  local job_params
+  local direct_output
+  local -r wrapper=$(basename $COPY_MAPPER)
 
-  echo "Clear previous input/output if any."
-  $HADOOP_BIN/hadoop dfs -rmr $hdfs_input $hdfs_output
+  # Copy input, or let mapper read input directly from GCS.  Input not on
+  # GCS is comma-separated list of directories in HDFS.
+  if [[ "${INPUT_DIR:0:5}" != "gs://" ]] ; then
+    job_input=$INPUT_DIR
+  elif [[ "$DIRECT_IO" == "input" || "$DIRECT_IO" == "both" ]] ; then
+    local -r name=direct_input
+    $HADOOP_BIN/hadoop dfs -rmr $name/inputs
+    # Pack input files into bins as input of the job, one bin per mapper.
+    gsutil ls $INPUT_DIR | awk '{print $0 "\t-"}' |  \
+        plan_copy $name --split-min-size-mb $COPY_SPLIT_MIN_SIZE_MB
+    job_input=$name/inputs
+    mapper_wrapper="$wrapper --direct-input"
+    job_params="-D mapred.min.split.size=$((1 << 40))"
+  else
+    clear_input $hdfs_input
+    gcs_to_hdfs $INPUT_DIR $hdfs_input || return 1
+  fi
+
+  # Let the last step of the job write output directly to GCS.
+  if [[ "${OUTPUT_DIR:0:5}" == "gs://" ]] &&  \
+      [[ "$DIRECT_IO" == "output" || "$DIRECT_IO" == "both" ]] ; then
+    direct_output=yes
+    gsutil -m rm -f "$OUTPUT_DIR/part-*"
+    if (( REDUCER_COUNT > 0 )) ; then
+      reducer_wrapper="$wrapper --direct-output $OUTPUT_DIR"
+    else
+      mapper_wrapper="${mapper_wrapper:-$wrapper} --direct-output $OUTPUT_DIR"
+    fi
+  fi
+
+  # Compress map output and output of the job.  Generic options (-D) must
+  # precede the other options of streaming added below.
+  if [[ "$MAP_OUTPUT_CODEC" != "none" ]] ; then
+    job_params="$job_params -D mapred.compress.map.output=true"
+    job_params="$job_params  \
+        -D mapred.map.output.compression.codec=$(codec_class $MAP_OUTPUT_CODEC)"
+  fi
+  if [[ "$OUTPUT_CODEC" != "none" ]] ; then
+    if [[ -n "$direct_output" ]] ; then
+      if (( REDUCER_COUNT > 0 )) ; then
+        reducer_wrapper="$reducer_wrapper --compress-output"
+      else
+        mapper_wrapper="$mapper_wrapper --compress-output"
+      fi
+    else
+      job_params="$job_params -D mapred.output.compress=true"
+      job_params="$job_params  \
+          -D mapred.output.compression.codec=$(codec_class $OUTPUT_CODEC)"
+    fi
+  fi
+
+  # Run combiner on the output of each mapper to reduce shuffle data.
+  if [[ "$COMBINER" != "-" ]] ; then
+    if [[ "${COMBINER:0:5}" == "gs://" ]] ; then
+      job_params="$job_params -combiner $(basename $COMBINER)"
+      job_params="$job_params -file $(fetch_file $COMBINER)"
+    else
+      job_params="$job_params -combiner \"$COMBINER\""
+    fi
+  fi
+  # Ship additional files with the job into working directory of tasks.
+  if [[ "$FILES" != "-" ]] ; then
+    local file
+    for file in ${FILES//,/ } ; do
+      if [[ "${file:0:5}" == "gs://" ]] ; then
+        file=$(fetch_file $file)
+      fi
+      job_params="$job_params -file $file"
+    done
+  fi
 
-  # Copy input
-  gcs_to_hdfs $INPUT_DIR $hdfs_input
   # Perform MapReduce
   mapreduce $(basename $MAPPER) $MAPPER $MAPPER_COUNT $REDUCER $REDUCER_COUNT  \
-      $hdfs_input $hdfs_output
-  # Copy output
-  hdfs_to_gcs $hdfs_output $OUTPUT_DIR
+      $job_input $hdfs_output "$mapper_wrapper" "$reducer_wrapper"  \
+      $job_params || return 1
+
+  # Copy output, or combine the output written to GCS if necessary.
+  if [[ "${OUTPUT_DIR:0:5}" != "gs://" ]] ; then
+    return
+  elif [[ -z "$direct_output" ]] ; then
+    hdfs_to_gcs $hdfs_output $OUTPUT_DIR
+  elif [[ "$OUTPUT_MODE" != "files" ]] ; then
+    gsutil ls "$OUTPUT_DIR/part-*" |  \
+        python $COPY_MAPPER --delete-sources  \
+            --compose $OUTPUT_DIR/results.txt$(results_suffix)
+  fi
 }
 
 main
@@ -0,0 +1,217 @@
+#!/usr/bin/env python
+# Copyright 2013 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Pipeline of MapReduce stages that depend on each other's output.
+
+Pipeline is specified in JSON as follows.
+
+    {
+      "stages": [
+        {
+          "name": "count",
+          "mapper": "sample/shortest-to-longest-mapper.pl",
+          "reducer": "sample/shortest-to-longest-reducer.pl",
+          "combiner": "sample/shortest-to-longest-combiner.py",
+          "mapper_count": 5,
+          "reducer_count": 1,
+          "inputs": ["gs://bucket/inputs"]
+        },
+        {
+          "name": "top",
+          "inputs": ["count"],
+          "output": "gs://bucket/outputs"
+        }
+      ]
+    }
+
+Input of a stage is either a directory on Google Cloud Storage, or name of
+another stage whose output the stage reads.  Only stages with "output"
+are exported to Google Cloud Storage.  "combiner" and "files" are optional,
+and the same as --combiner and --file options of 'mapreduce' subcommand.
+"""
+
+
+
+import json
+import logging
+import re
+import threading
+
+
+class PipelineError(Exception):
+  """Error in pipeline specification or in execution of stages."""
+
+
+class Stage(object):
+  """MapReduce stage in the pipeline."""
+
+  NAME_PATTERN = '^[a-zA-Z0-9][-_a-zA-Z0-9]*$'
+
+  def __init__(self, spec):
+    """Constructor.
+
+    Args:
+      spec: Dictionary of the stage in the pipeline specification.
+    Raises:
+      PipelineError: The specification is invalid.
+    """
+    unknown_keys = set(spec) - set([
+        'name', 'mapper', 'reducer', 'combiner', 'files', 'mapper_count',
+        'reducer_count', 'inputs', 'output'])
+    if unknown_keys:
+      raise PipelineError('Unknown keys in stage: %s' %
+                          ', '.join(sorted(unknown_keys)))
+    self.name = spec.get('name', '')
+    if not re.match(self.NAME_PATTERN, self.name):
+      raise PipelineError('Invalid stage name: "%s"' % self.name)
+    self.mapper = spec.get('mapper')
+    self.reducer = spec.get('reducer')
+    self.combiner = spec.get('combiner')
+    self.files = spec.get('files', [])
+    self.mapper_count = spec.get('mapper_count', 5)
+    self.reducer_count = spec.get('reducer_count', 1)
+    self.inputs = spec.get('inputs', [])
+    if not self.inputs:
+      raise PipelineError('Stage %s has no input' % self.name)
+    self.output = spec.get('output')
+    if self.output and not self.output.startswith('gs://'):
+      raise PipelineError('Output of stage %s is not on Cloud Storage: %s' %
+                          (self.name, self.output))
+
+  def Dependencies(self):
+    """Returns names of stages whose output the stage reads."""
+    return [name for name in self.inputs if not name.startswith('gs://')]
+
+  def CloudStorageInputs(self):
+    """Returns inputs of the stage on Cloud Storage."""
+    return [path for path in self.inputs if path.startswith('gs://')]
+
+
+class Pipeline(object):
+  """DAG of MapReduce stages."""
+
+  def __init__(self, spec):
+    """Constructor.
+
+    Args:
+      spec: Dictionary of the pipeline specification.
+    Raises:
+      PipelineError: The specification is invalid.
+    """
+    self.stages = [Stage(stage_spec) for stage_spec in spec.get('stages', [])]
+    if not self.stages:
+      raise PipelineError('Pipeline has no stage')
+    self._stages_by_name = {}
+    for stage in self.stages:
+      if stage.name in self._stages_by_name:
+        raise PipelineError('Duplicate stage name: %s' % stage.name)
+      self._stages_by_name[stage.name] = stage
+    for stage in self.stages:
+      for name in stage.Dependencies():
+        if name not in self._stages_by_name:
+          raise PipelineError('Stage %s reads unknown stage %s' % (
+              stage.name, name))
+    self._CheckCycle()
+
+  @classmethod
+  def Load(cls, path):
+    """Loads pipeline specification from JSON file."""
+    try:
+      with open(path) as f:
+        return cls(json.load(f))
+    except (IOError, ValueError) as e:
+      raise PipelineError('Failed to load pipeline %s: %s' % (path, e))
+
+  def _CheckCycle(self):
+    """Raises PipelineError if stages depend on each other in cycle."""
+    done = set()
+    visiting = set()
+
+    def Visit(name, path):
+      if name in done:
+        return
+      if name in visiting:
+        raise PipelineError('Cyclic dependency: %s' % ' -> '.join(
+            path + [name]))
+      visiting.add(name)
+      for dependency in self._stages_by_name[name].Dependencies():
+        Visit(dependency, path + [name])
+      visiting.remove(name)
+      done.add(name)
+
+    for stage in self.stages:
+      Visit(stage.name, [])
+
+  def CloudStorageInputs(self):
+    """Returns sorted list of distinct inputs on Cloud Storage."""
+    return sorted(set(path for stage in self.stages
+                      for path in stage.CloudStorageInputs()))
+
+  def Run(self, function, concurrency):
+    """Calls the function for each stage after stages it depends on.
+
+    Stages whose dependencies are done run concurrently, up to the
+    concurrency.  After a stage fails, no more stages are started, and the
+    running ones are waited for.
+
+    Args:
+      function: Function that takes Stage object as the only argument.
+      concurrency: Maximum number of stages to run at the same time.
+    Raises:
+      PipelineError: At least one stage failed.
+    """
+    condition = threading.Condition()
+    done = set()
+    running = set()
+    errors = {}
+
+    def RunStage(stage):
+      error = None
+      try:
+        function(stage)
+      except Exception as e:  # pylint: disable=broad-except
+        logging.error('Stage %s failed: %s', stage.name, e)
+        error = e
+      with condition:
+        running.remove(stage.name)
+        if error:
+          errors[stage.name] = error
+        else:
+          done.add(stage.name)
+        condition.notify()
+
+    threads = []
+    with condition:
+      while True:
+        if not errors:
+          for stage in self.stages:
+            if len(running) >= concurrency:
+              break
+            if (stage.name not in done and stage.name not in running and
+                set(stage.Dependencies()).issubset(done)):
+              logging.info('Starting stage %s', stage.name)
+              running.add(stage.name)
+              thread = threading.Thread(target=RunStage, args=(stage,))
+              threads.append(thread)
+              thread.start()
+        if not running:
+          break
+        condition.wait()
+    for thread in threads:
+      thread.join()
+
+    if errors:
+      raise PipelineError('Failed stages: %s' % ', '.join(
+          '%s (%s)' % (name, errors[name]) for name in sorted(errors)))
@@ -0,0 +1,157 @@
+#!/usr/bin/env python
+# Copyright 2013 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Unit tests of pipeline.py."""
+
+
+
+import json
+import tempfile
+import threading
+import time
+import unittest
+
+import pipeline
+
+
+class PipelineTest(unittest.TestCase):
+  """Unit test class of pipeline."""
+
+  # Diamond-shaped pipeline: 'split' -> 'left' and 'right' -> 'join'.
+  DIAMOND = {
+      'stages': [
+          {'name': 'join', 'inputs': ['left', 'right'],
+           'output': 'gs://bucket/outputs'},
+          {'name': 'left', 'inputs': ['split'], 'mapper': 'left.py',
+           'combiner': 'combiner.py', 'files': ['lib.py']},
+          {'name': 'right', 'inputs': ['split', 'gs://bucket/extra']},
+          {'name': 'split', 'inputs': ['gs://bucket/inputs'],
+           'mapper_count': 10, 'reducer_count': 0},
+      ]
+  }
+
+  def testPipeline(self):
+    """Unit test of Pipeline with valid specification."""
+    spec = pipeline.Pipeline(self.DIAMOND)
+
+    self.assertEqual(['join', 'left', 'right', 'split'],
+                     [stage.name for stage in spec.stages])
+    self.assertEqual(['gs://bucket/extra', 'gs://bucket/inputs'],
+                     spec.CloudStorageInputs())
+    self.assertEqual(['split'], spec.stages[2].Dependencies())
+    self.assertEqual('left.py', spec.stages[1].mapper)
+    self.assertIsNone(spec.stages[1].reducer)
+    self.assertEqual('combiner.py', spec.stages[1].combiner)
+    self.assertEqual(['lib.py'], spec.stages[1].files)
+    self.assertEqual([], spec.stages[2].files)
+    self.assertEqual(5, spec.stages[1].mapper_count)
+    self.assertEqual(0, spec.stages[3].reducer_count)
+    self.assertEqual('gs://bucket/outputs', spec.stages[0].output)
+    self.assertIsNone(spec.stages[1].output)
+
+  def testPipeline_Invalid(self):
+    """Unit test of Pipeline with invalid specifications."""
+    for spec in [
+        {},
+        {'stages': [{'name': 'a'}]},
+        {'stages': [{'name': 'a b', 'inputs': ['gs://b/in']}]},
+        {'stages': [{'name': 'a', 'inputs': ['gs://b/in'], 'foo': 1}]},
+        {'stages': [{'name': 'a', 'inputs': ['gs://b/in'],
+                     'output': 'outputs'}]},
+        {'stages': [{'name': 'a', 'inputs': ['gs://b/in']},
+                    {'name': 'a', 'inputs': ['gs://b/in']}]},
+        {'stages': [{'name': 'a', 'inputs': ['b']}]},
+        {'stages': [{'name': 'a', 'inputs': ['c']},
+                    {'name': 'b', 'inputs': ['a']},
+                    {'name': 'c', 'inputs': ['b']}]},
+    ]:
+      self.assertRaises(pipeline.PipelineError, pipeline.Pipeline, spec)
+
+  def testLoad(self):
+    """Unit test of Load() from JSON file."""
+    with tempfile.NamedTemporaryFile() as f:
+      json.dump(self.DIAMOND, f)
+      f.flush()
+
+      self.assertEqual(4, len(pipeline.Pipeline.Load(f.name).stages))
+
+  def testLoad_InvalidJson(self):
+    """Unit test of Load() from broken JSON file."""
+    with tempfile.NamedTemporaryFile() as f:
+      f.write('{"stages": [')
+      f.flush()
+
+      self.assertRaises(pipeline.PipelineError,
+                        pipeline.Pipeline.Load, f.name)
+
+  def _RunAndRecord(self, spec, concurrency, failing_stage=None):
+    """Runs the pipeline, and returns order and maximum concurrency."""
+    lock = threading.Lock()
+    events = []
+    running = set()
+    max_running = [0]
+
+    def RunStage(stage):
+      with lock:
+        running.add(stage.name)
+        max_running[0] = max(max_running[0], len(running))
+        events.append('start ' + stage.name)
+      time.sleep(0.05)
+      with lock:
+        running.remove(stage.name)
+        events.append('end ' + stage.name)
+      if stage.name == failing_stage:
+        raise RuntimeError('failed')
+
+    error = None
+    try:
+      spec.Run(RunStage, concurrency)
+    except pipeline.PipelineError as e:
+      error = e
+    return events, max_running[0], error
+
+  def testRun(self):
+    """Unit test of Run() running independent stages concurrently."""
+    events, max_running, error = self._RunAndRecord(
+        pipeline.Pipeline(self.DIAMOND), 3)
+
+    self.assertIsNone(error)
+    self.assertEqual(['start split', 'end split'], events[:2])
+    self.assertEqual(set(['start left', 'start right']), set(events[2:4]))
+    self.assertEqual(['start join', 'end join'], events[-2:])
+    self.assertEqual(2, max_running)
+
+  def testRun_Concurrency(self):
+    """Unit test of Run() with concurrency 1."""
+    events, max_running, _ = self._RunAndRecord(
+        pipeline.Pipeline(self.DIAMOND), 1)
+
+    self.assertEqual(8, len(events))
+    self.assertEqual(1, max_running)
+
+  def testRun_Failure(self):
+    """Unit test of Run() when a stage fails."""
+    events, _, error = self._RunAndRecord(
+        pipeline.Pipeline(self.DIAMOND), 3, failing_stage='left')
+
+    self.assertIsInstance(error, pipeline.PipelineError)
+    self.assertIn('left', str(error))
+    # Running stage finishes, but the stage depending on it doesn't start.
+    self.assertIn('end right', events)
+    self.assertNotIn('start join', events)
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+# Copyright 2013 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Module to check whether TCP ports on many hosts accept connections."""
+
+
+
+import errno
+import logging
+import select
+import socket
+import time
+
+
+_CONNECTING_ERRORS = (errno.EINPROGRESS, errno.EWOULDBLOCK, errno.EALREADY)
+
+
+def ProbePorts(endpoints, timeout):
+  """Checks whether TCP ports accept connections.
+
+  Connections to all endpoints are started at once with non-blocking
+  sockets, and are closed as soon as they are established.  No data is
+  sent, so that the check is much cheaper than starting actual session
+  of the protocol.  All connections are waited for by single poll() loop,
+  which has no limit of the number of sockets unlike select(), so that
+  every endpoint gets the whole timeout however many endpoints there are.
+
+  Args:
+    endpoints: Iterable of (IP address, port) tuples.
+    timeout: Maximum time in seconds to wait for connections.
+  Returns:
+    Set of (IP address, port) tuples that accepted connections.
+  """
+  deadline = time.time() + timeout
+  open_endpoints = set()
+  # Dictionary of file descriptor to tuple of socket and endpoint.
+  connecting = {}
+  poller = select.poll()
+  try:
+    for endpoint in sorted(set(endpoints)):
+      try:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+      except socket.error as e:
+        # E.g. too many open files.  The endpoint is checked next time.
+        logging.warning('Failed to open socket to %s:%d: %s', endpoint[0],
+                        endpoint[1], e)
+        continue
+      sock.setblocking(0)
+      try:
+        error = sock.connect_ex(endpoint)
+      except socket.error as e:
+        logging.debug('Failed to connect to %s:%d: %s', endpoint[0],
+                      endpoint[1], e)
+        error = -1
+      if error in _CONNECTING_ERRORS:
+        connecting[sock.fileno()] = (sock, endpoint)
+        poller.register(sock, select.POLLOUT)
+        continue
+      if not error:
+        open_endpoints.add(endpoint)
+      sock.close()
+
+    while connecting:
+      remaining = deadline - time.time()
+      if remaining <= 0:
+        break
+      for fd, _ in poller.poll(remaining * 1000):
+        sock, endpoint = connecting.pop(fd)
+        poller.unregister(fd)
+        if not sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR):
+          open_endpoints.add(endpoint)
+        sock.close()
+  finally:
+    for sock, _ in connecting.itervalues():
+      sock.close()
+  return open_endpoints
@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+# Copyright 2013 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Unit tests of port_prober.py."""
+
+
+
+import socket
+import unittest
+
+import mock
+
+import port_prober
+
+
+class PortProberTest(unittest.TestCase):
+  """Unit test class of port_prober."""
+
+  def _ListeningPort(self):
+    """Opens listening socket on local host and returns its endpoint."""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.bind(('127.0.0.1', 0))
+    sock.listen(5)
+    self.addCleanup(sock.close)
+    return sock.getsockname()
+
+  def _ClosedPort(self):
+    """Returns endpoint on local host where nothing listens."""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.bind(('127.0.0.1', 0))
+    endpoint = sock.getsockname()
+    sock.close()
+    return endpoint
+
+  def testProbePorts(self):
+    """Unit test of ProbePorts() with open and closed ports."""
+    open_ports = [self._ListeningPort() for _ in xrange(3)]
+    closed_port = self._ClosedPort()
+
+    self.assertEqual(
+        set(open_ports),
+        port_prober.ProbePorts(open_ports + [closed_port], 5))
+
+  def testProbePorts_NoEndpoint(self):
+    """Unit test of ProbePorts() with no endpoint."""
+    self.assertEqual(set(), port_prober.ProbePorts([], 5))
+
+  def testProbePorts_ManyEndpoints(self):
+    """Unit test of ProbePorts() with endpoints that connect at any time."""
+    sockets = [mock.MagicMock() for _ in xrange(3)]
+    for i, sock in enumerate(sockets):
+      sock.connect_ex.return_value = port_prober.errno.EINPROGRESS
+      sock.fileno.return_value = 10 + i
+      sock.getsockopt.return_value = 0
+    mock_poll = mock.MagicMock()
+    # The last endpoints connect after the first one keeps connecting for
+    # most of the timeout.
+    mock_poll.poll.side_effect = [
+        [], [(11, port_prober.select.POLLOUT)],
+        [(12, port_prober.select.POLLOUT)], []]
+
+    with mock.patch('socket.socket', side_effect=sockets):
+      with mock.patch('select.poll', return_value=mock_poll):
+        with mock.patch('time.time', side_effect=[1000, 1000, 1004.5, 1004.8,
+                                                  1004.9, 1006]):
+          self.assertEqual(
+              set([('10.0.0.2', 22), ('10.0.0.3', 22)]),
+              port_prober.ProbePorts(
+                  [('10.0.0.1', 22), ('10.0.0.2', 22), ('10.0.0.3', 22)], 5))
+
+    self.assertEqual(4, mock_poll.poll.call_count)
+    for sock in sockets:
+      sock.close.assert_called_once_with()
+
+  def testProbePorts_Timeout(self):
+    """Unit test of ProbePorts() with connections that don't finish."""
+    sockets = [mock.MagicMock(), mock.MagicMock()]
+    for i, sock in enumerate(sockets):
+      sock.connect_ex.return_value = port_prober.errno.EINPROGRESS
+      sock.fileno.return_value = 10 + i
+
+    with mock.patch('socket.socket', side_effect=sockets):
+      with mock.patch('select.poll') as mock_poll_class:
+        mock_poll_class.return_value.poll.return_value = []
+        with mock.patch('time.time', side_effect=[1000, 1000, 1006]):
+          self.assertEqual(set(), port_prober.ProbePorts(
+              [('10.0.0.1', 22), ('10.0.0.2', 22)], 5))
+
+    # Sockets of unfinished connections are closed.
+    for sock in sockets:
+      sock.close.assert_called_once_with()
+
+if __name__ == '__main__':
+  unittest.main()
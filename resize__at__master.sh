@@ -0,0 +1,125 @@
+#!/bin/bash
+# Copyright 2013 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Updates the set of workers known to Hadoop daemons on the master.
+#   add <timeout> <name>...: Adds workers to slaves file.
+#   decommission <timeout> <host>...: Excludes DataNodes and TaskTrackers on
+#       the hosts, and waits until their HDFS blocks are replicated to other
+#       DataNodes.
+#   remove <timeout> <host>...: Removes deleted workers from slaves file and
+#       exclude file.
+# Hosts are given by instance names and IP addresses, since DataNodes are
+# identified by IP address and TaskTrackers by host name.
+declare -r ACTION=$1 ; shift
+declare -r TIMEOUT=$1 ; shift
+declare -r HOSTS="$@"
+
+declare -r HADOOP_BIN=/home/hadoop/hadoop/bin
+# Both files are outside the configuration directory, which is recreated at
+# every boot, so that the workers survive reboot of the master.  Slaves file
+# in the configuration directory is a symbolic link to SLAVES.
+declare -r SLAVES=/home/hadoop/slaves
+# Exclude file specified by dfs.hosts.exclude and mapred.hosts.exclude.
+declare -r EXCLUDES=/home/hadoop/excludes
+declare -r CHECK_INTERVAL=10
+
+function die() {
+  echo "$@" 1>&2
+  exit 1
+}
+
+# Removes lines that match one of the hosts from the file.
+function remove_hosts() {
+  local -r file=$1 ; shift
+  local host
+
+  touch $file
+  for host in $HOSTS ; do
+    grep -v -x -F "$host" $file > $file.new
+    mv $file.new $file
+  done
+}
+
+# Makes NameNode and JobTracker read the exclude file again.
+function refresh_nodes() {
+  $HADOOP_BIN/hadoop dfsadmin -refreshNodes ||  \
+      die "Failed to refresh DataNodes"
+  $HADOOP_BIN/hadoop mradmin -refreshNodes ||  \
+      die "Failed to refresh TaskTrackers"
+}
+
+# Prints decommission status of DataNodes on the hosts that are still in
+# service or being decommissioned.
+function decommissioning_nodes() {
+  local host
+
+  $HADOOP_BIN/hadoop dfsadmin -report > /tmp/dfsadmin-report.$$ ||  \
+      die "Failed to get report of DataNodes"
+  for host in $HOSTS ; do
+    awk -v host=$host '
+        index($0, "Name: " host ":") == 1 { found = 1 }
+        found && /^Decommission Status/ {
+          status = $0
+          sub(/^Decommission Status *: */, "", status)
+          if (status != "Decommissioned") { print "  " host ": " status }
+          found = 0
+        }' /tmp/dfsadmin-report.$$
+  done
+  rm -f /tmp/dfsadmin-report.$$
+}
+
+case "$ACTION" in
+  add)
+    remove_hosts $SLAVES
+    for host in $HOSTS ; do
+      echo $host >> $SLAVES
+    done
+    remove_hosts $EXCLUDES
+    refresh_nodes
+    ;;
+
+  decommission)
+    remove_hosts $EXCLUDES
+    for host in $HOSTS ; do
+      echo $host >> $EXCLUDES
+    done
+    refresh_nodes
+
+    deadline=$((SECONDS + TIMEOUT))
+    while true ; do
+      status=$(decommissioning_nodes)
+      if [[ -z "$status" ]] ; then
+        echo "Decommission complete: $HOSTS"
+        break
+      fi
+      echo "Waiting for decommission:"
+      echo "$status"
+      if (( SECONDS >= deadline )) ; then
+        die "Decommission timed out"
+      fi
+      sleep $CHECK_INTERVAL
+    done
+    ;;
+
+  remove)
+    remove_hosts $SLAVES
+    remove_hosts $EXCLUDES
+    refresh_nodes
+    ;;
+
+  *)
+    die "Unknown action: $ACTION"
+    ;;
+esac
@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+# Copyright 2013 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""In-mapper aggregation for Hadoop streaming mappers.
+
+Mapper that emits many records of the same key, such as word count, can
+aggregate values of the same key in memory before writing them out, so that
+far fewer records are sorted and shuffled to reducers.  Aggregator keeps
+bounded number of keys, and writes out all of them when the number exceeds
+the limit, so that memory usage doesn't depend on the size of input.
+
+    aggregator = mapper_aggregation.Aggregator()
+    for line in sys.stdin:
+      for word in line.split():
+        aggregator.Add(word, 1)
+    aggregator.Flush()
+
+The module is shipped with the job by --file option of 'mapreduce'
+subcommand, and is found in the working directory of the task.
+"""
+
+
+
+import operator
+import sys
+
+
+class Aggregator(object):
+  """Bounded-memory dictionary that writes out aggregated values."""
+
+  DEFAULT_MAX_KEYS = 100000
+
+  def __init__(self, max_keys=DEFAULT_MAX_KEYS, output=None,
+               combine=operator.add):
+    """Constructor.
+
+    Args:
+      max_keys: Maximum number of keys to keep in memory.  All keys are
+          written out when the number of keys exceeds it.
+      output: File-like object to write records to.  Standard output if not
+          specified.
+      combine: Function to combine two values of the same key.
+    """
+    self.max_keys = max_keys
+    self.output = output or sys.stdout
+    self.combine = combine
+    self.values = {}
+    self.flush_count = 0
+
+  def Add(self, key, value):
+    """Adds value of the key.
+
+    Args:
+      key: Key of the record as string.
+      value: Value to be combined with the existing value of the key.
+    """
+    if key in self.values:
+      self.values[key] = self.combine(self.values[key], value)
+    else:
+      self.values[key] = value
+      if len(self.values) > self.max_keys:
+        self.Flush()
+
+  def Flush(self):
+    """Writes out all keys and values in key order, and clears them."""
+    for key in sorted(self.values):
+      self.output.write('%s\t%s\n' % (key, self.values[key]))
+    self.values.clear()
+    self.flush_count += 1
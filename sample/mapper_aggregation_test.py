@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+# Copyright 2013 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Unit tests of mapper_aggregation.py."""
+
+
+
+import cStringIO
+import unittest
+
+import mapper_aggregation
+
+
+class AggregatorTest(unittest.TestCase):
+  """Unit test class of Aggregator."""
+
+  def testAdd(self):
+    """Unit test of Add() and Flush()."""
+    output = cStringIO.StringIO()
+    aggregator = mapper_aggregation.Aggregator(output=output)
+
+    for key in ['b', 'a', 'b', 'c', 'b']:
+      aggregator.Add(key, 1)
+    self.assertEqual('', output.getvalue())
+
+    aggregator.Flush()
+    self.assertEqual('a\t1\nb\t3\nc\t1\n', output.getvalue())
+    self.assertEqual({}, aggregator.values)
+
+  def testAdd_MaxKeys(self):
+    """Unit test of Add() flushing keys when exceeding maximum number."""
+    output = cStringIO.StringIO()
+    aggregator = mapper_aggregation.Aggregator(max_keys=2, output=output)
+
+    aggregator.Add('a', 1)
+    aggregator.Add('b', 1)
+    aggregator.Add('a', 1)
+    self.assertEqual('', output.getvalue())
+
+    # Third key exceeds the limit.
+    aggregator.Add('c', 1)
+    self.assertEqual('a\t2\nb\t1\nc\t1\n', output.getvalue())
+    self.assertEqual(1, aggregator.flush_count)
+
+    aggregator.Add('a', 1)
+    aggregator.Flush()
+    self.assertEqual('a\t2\nb\t1\nc\t1\na\t1\n', output.getvalue())
+
+  def testAdd_Combine(self):
+    """Unit test of Add() with custom combine function."""
+    output = cStringIO.StringIO()
+    aggregator = mapper_aggregation.Aggregator(output=output, combine=max)
+
+    for value in [3, 5, 2]:
+      aggregator.Add('key', value)
+    aggregator.Flush()
+
+    self.assertEqual('key\t5\n', output.getvalue())
+
+
+if __name__ == '__main__':
+  unittest.main()
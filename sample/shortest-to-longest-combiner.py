@@ -0,0 +1,45 @@
+#!/usr/bin/env python
+# Copyright 2013 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Combiner sample.
+
+The combiner sums up the occurrence of each word in the sorted output of a
+mapper before it's shuffled to reducers.  Unlike the reducer, it keeps the
+key of the mapper output, so that the reducer reads its output in the same
+way as the mapper output.
+"""
+
+import sys
+
+
+def main(input_lines):
+  current_key = None
+  current_count = 0
+
+  for line in input_lines:
+    key, count = line.split('\t', 1)
+    if key != current_key:
+      if current_key is not None:
+        print '%s\t%d' % (current_key, current_count)
+      current_key = key
+      current_count = 0
+    current_count += int(count)
+
+  if current_key is not None:
+    print '%s\t%d' % (current_key, current_count)
+
+
+if __name__ == '__main__':
+  main(sys.stdin)
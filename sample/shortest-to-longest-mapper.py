@@ -20,15 +20,27 @@ With the corresponding reducer, the MapReduce task counts occurrence
 of the word in the original text.
 The output is sorted by the length of the word, and then in alphabetical
 order if the length of the word is the same.
+
+Occurrence of words is aggregated in the mapper with mapper_aggregation.py,
+which is shipped with the job by --file option.
 """
 
+import os
 import re
 import sys
 
+# Files shipped with the job are in the working directory of the task.
+sys.path.append(os.getcwd())
+
+import mapper_aggregation
+
 
 word_pattern = re.compile('[a-z]+')
+aggregator = mapper_aggregation.Aggregator()
 
 for line in sys.stdin:
   for match in word_pattern.finditer(line.lower()):
     word = match.group()
-    print '%03d:%s\t%s' % (len(word), word, 1)
+    aggregator.Add('%03d:%s' % (len(word), word), 1)
+
+aggregator.Flush()
@@ -15,7 +15,7 @@
 
 # Reducer sample.
 # The word is already sorted in the desirable order.
-# The reducer counts the occurrence of each word and outputs the word
+# The reducer sums up the occurrence of each word and outputs the word
 # and its occurrence.
 
 sub output {
@@ -26,13 +26,15 @@ sub output {
   print "$word\t$count\n";
 }
 
-$count = 1;
+$count = 0;
 while (<>) {
-  $key = (split /\t/)[0];
+  chomp;
+  ($key, $value) = split /\t/;
   if ($key eq $prev) {
     # The same key as the previous line indicates the repetition of the same
-    # word.  Increment the counter.
-    $count++;
+    # word.  Add the occurrence, which is more than 1 if the mapper or the
+    # combiner has aggregated it.
+    $count += $value;
   } else {
     # The different key indicates the next word.  Output the count of the
     # previous word.
@@ -40,7 +42,7 @@ while (<>) {
     # of the same key is handled by the same reducer.
     &output($prev) if defined $prev;
     $prev = $key;
-    $count = 1;
+    $count = $value;
   }
 }
 # Output the last word count.
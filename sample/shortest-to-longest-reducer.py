@@ -16,7 +16,7 @@
 """Reducer sample.
 
 The word is already sorted in the desirable order.
-The reducer counts the occurrence of each word and outputs the word
+The reducer sums up the occurrence of each word and outputs the word
 and its occurrence.
 """
 
@@ -55,7 +55,7 @@ class ShortestToLongestReducer(object):
       line: Input line.
     """
     # Split input to key and value.
-    key = line.split('\t', 1)[0]
+    key, count = line.split('\t', 1)
 
     # Split key to word-length and word.
     word = key.split(':', 1)[1]
@@ -66,7 +66,7 @@ class ShortestToLongestReducer(object):
       self.current_word.Print()
       self.current_word = Word(word)
 
-    self.current_word.Increment()
+    self.current_word.Increment(int(count))
 
 
 def main(input_lines):
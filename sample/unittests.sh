@@ -38,3 +38,28 @@ EXPECTED=$(cat $UNITTEST_DATADIR/reducer-expected.txt)
 ACTUAL=$(cat $UNITTEST_DATADIR/reducer-input.txt | $SAMPLE_DIR/shortest-to-longest-reducer.pl)
 
 expect_equals "$EXPECTED" "$ACTUAL"
+
+
+EXPECTED=$(cat $UNITTEST_DATADIR/aggregation-mapper-expected.txt)
+ACTUAL=$(cat $UNITTEST_DATADIR/aggregation-mapper-input.txt | $SAMPLE_DIR/shortest-to-longest-mapper.py)
+
+expect_equals "$EXPECTED" "$ACTUAL"
+
+
+EXPECTED=$(cat $UNITTEST_DATADIR/combiner-expected.txt)
+ACTUAL=$(cat $UNITTEST_DATADIR/combiner-input.txt | $SAMPLE_DIR/shortest-to-longest-combiner.py)
+
+expect_equals "$EXPECTED" "$ACTUAL"
+
+
+# Reducers sum up the occurrence aggregated by the mapper or the combiner.
+EXPECTED=$(cat $UNITTEST_DATADIR/reducer-combined-expected.txt)
+ACTUAL=$(cat $UNITTEST_DATADIR/combiner-expected.txt | $SAMPLE_DIR/shortest-to-longest-reducer.pl)
+
+expect_equals "$EXPECTED" "$ACTUAL"
+
+
+EXPECTED=$(cat $UNITTEST_DATADIR/reducer-combined-expected.txt)
+ACTUAL=$(cat $UNITTEST_DATADIR/combiner-expected.txt | $SAMPLE_DIR/shortest-to-longest-reducer.py)
+
+expect_equals "$EXPECTED" "$ACTUAL"
@@ -13,6 +13,23 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+# Phase markers of this boot.  Each line has the time in seconds since
+# epoch when the phase began and the phase name.  The file is uploaded to
+# Cloud Storage at the end, from which 'timeline' subcommand reads it.
+declare -r TIMELINE_FILE=/var/log/hadoop-timeline.txt
+
+# Records the beginning of the phase.
+function mark_phase() {
+  echo "$(date +%s.%N) $1" >> $TIMELINE_FILE
+}
+
+# Uploads phase markers to Cloud Storage with the last marker.
+function upload_timeline() {
+  mark_phase $1
+  gsutil -q cp $TIMELINE_FILE $TMP_CLOUD_STORAGE/timeline/$(hostname).txt ||  \
+      echo "Failed to upload timeline to $TMP_CLOUD_STORAGE/timeline/"
+}
+
 function die() {
   # Message to STDERR goes to start-up script log in the instance.
   echo
@@ -20,9 +37,20 @@ function die() {
   echo "$@"
   echo "###########################"
 
+  if [[ -n "$IMAGE_BUNDLE" ]] ; then
+    # Tell the image builder waiting for the bundle about the failure.
+    echo "$@" | gsutil cp - $IMAGE_BUNDLE.error
+  elif [[ -n "$TMP_CLOUD_STORAGE" ]] ; then
+    upload_timeline failed
+  fi
   exit 1
 }
 
+# Start the timeline of this boot with the time when the kernel booted.
+echo "$(date +%s.%N) $(awk '{ print $1 }' /proc/uptime)" |  \
+    awk '{ printf "%.3f boot\n", $1 - $2 }' > $TIMELINE_FILE
+mark_phase startup
+
 declare -r METADATA_ROOT=http://metadata/computeMetadata/v1
 
 function get_metadata_value() {
@@ -35,12 +63,103 @@ function get_custom_metadata() {
   get_metadata_value "instance/attributes/$name"
 }
 
+declare -r TMP_DIR=/tmp/hadoop_package
+declare -r HADOOP_DIR=hadoop-*
+declare -r GENERATED_FILES_DIR=generated_files
+declare -r DEB_PACKAGE_DIR=deb_packages
+
+declare -r HADOOP_HOME=/home/hadoop
+declare -r SCRIPT_DIR=hadoop_scripts
+
+# Exists on boot disk that has the packages below already installed, either
+# from image built by 'bake-image' subcommand, or by earlier boot.
+declare -r PREINSTALLED_MARKER=/var/lib/hadoop-on-compute/preinstalled
+
+# Installs Hadoop and Java Runtime Environment.  Configuration specific to
+# the cluster and the node is done later, so that the result can be baked
+# into a boot image shared by any cluster.
+function install_packages() {
+  # Set up user and group
+  groupadd --gid 5555 hadoop
+  useradd --uid 1111 --gid hadoop --shell /bin/bash -m hadoop
+
+  # Error check in CreateTrackerDirIfNeeded() in gslib/util.py in gsutil 3.37
+  # (line 119) raises exception when called from Hadoop streaming MapReduce,
+  # saying permission error to create /homes.
+  perl -pi -e '$.>110 and $.<125 and s/raise$/pass/'  \
+      /usr/local/share/google/gsutil/gslib/util.py
+
+  mkdir -p $TMP_DIR
+
+  # Download packages from Cloud Storage.
+  mark_phase download
+  gsutil -m cp -R $TMP_CLOUD_STORAGE/$HADOOP_DIR.tar.gz  \
+      $TMP_CLOUD_STORAGE/$DEB_PACKAGE_DIR  \
+      $TMP_DIR ||  \
+      die "Failed to download Hadoop and required packages from "  \
+          "$TMP_CLOUD_STORAGE/"
+
+  # Set up Java Runtime Environment.
+  mark_phase install-jre
+  dpkg -i --force-depends $TMP_DIR/$DEB_PACKAGE_DIR/*.deb
+
+  local install_script=$TMP_DIR/install_as_hadoop.sh
+  cat > $install_script <<NEKO
+# Exits if one of the commands fails.
+set -o errexit
+
+# Extract Hadoop package.
+tar zxf $TMP_DIR/$HADOOP_DIR.tar.gz -C \$HOME
+ln -sfn \$HOME/$HADOOP_DIR \$HOME/hadoop
+# Keep original configuration, from which configuration of the node is
+# generated at every boot.
+rm -rf \$HOME/hadoop/conf.dist
+cp -a \$HOME/hadoop/conf \$HOME/hadoop/conf.dist
+
+# Set PATH for hadoop user
+echo "export PATH=\$HOME/hadoop/bin:\$HOME/hadoop/sbin:\\\$PATH" >>  \
+    \$HOME/.profile
+echo "export JAVA_HOME=/usr/lib/jvm/java-6-openjdk-amd64" >> \$HOME/.profile
+
+NEKO
+
+  mark_phase install-hadoop
+  sudo -u hadoop bash $install_script ||  \
+      die "Failed to install Hadoop as hadoop user"
+
+  mkdir -p $(dirname $PREINSTALLED_MARKER)
+  touch $PREINSTALLED_MARKER
+}
+
+IMAGE_BUNDLE=$(get_custom_metadata 'image-bundle')
+TMP_CLOUD_STORAGE=$(get_custom_metadata 'tmp-cloud-storage')
+
+# Build boot image if started by 'bake-image' subcommand.  The boot disk is
+# bundled and uploaded to Cloud Storage, from which the image is created.
+if [[ -n "$IMAGE_BUNDLE" ]] ; then
+  echo "Building boot image with Hadoop preinstalled."
+  install_packages
+  rm -rf $TMP_DIR
+
+  BUNDLE_DIR=$(mktemp -d)
+  gcimagebundle -d /dev/sda -o $BUNDLE_DIR  \
+      --log_file=$BUNDLE_DIR/gcimagebundle.log ||  \
+      die "Failed to bundle boot disk"
+  gsutil cp $BUNDLE_DIR/*.image.tar.gz $IMAGE_BUNDLE ||  \
+      die "Failed to upload image bundle to $IMAGE_BUNDLE"
+
+  echo
+  echo "Image bundle uploaded in $SECONDS seconds."
+  echo
+  exit 0
+fi
+
 NUM_WORKERS=$(get_custom_metadata 'num-workers')
 HADOOP_MASTER=$(get_custom_metadata 'hadoop-master')
 WORKER_NAME_TEMPLATE=$(get_custom_metadata 'hadoop-worker-template')
-TMP_CLOUD_STORAGE=$(get_custom_metadata 'tmp-cloud-storage')
 CUSTOM_COMMAND=$(get_custom_metadata 'custom-command')
 DATA_DISK_ID=$(get_custom_metadata 'data-disk-id')
+RACK_AWARE=$(get_custom_metadata 'rack-aware')
 
 THIS_HOST=$(get_metadata_value  \
     instance/network-interfaces/0/access-configs/0/external-ip)
@@ -61,57 +180,48 @@ fi
 
 # Increase fd limit
 ulimit -n 32768
-echo hadoop soft nofile 32768 >> /etc/security/limits.conf
-echo hadoop hard nofile 32768 >> /etc/security/limits.conf
+if ! grep -q '^hadoop soft nofile' /etc/security/limits.conf ; then
+  echo hadoop soft nofile 32768 >> /etc/security/limits.conf
+  echo hadoop hard nofile 32768 >> /etc/security/limits.conf
+fi
+
+# Install packages unless the boot image has them already.
+if [[ -f $PREINSTALLED_MARKER ]] ; then
+  echo "Packages are preinstalled in the boot image."
+else
+  install_packages
+fi
 
 # Mount ephemeral disk
+mark_phase mount-disk
 declare -r HADOOP_ROOT=/hadoop
 declare -r DISK_DEVICE=/dev/disk/by-id/google-$DATA_DISK_ID
 
-mkdir $HADOOP_ROOT
+mkdir -p $HADOOP_ROOT
 /usr/share/google/safe_format_and_mount $DISK_DEVICE $HADOOP_ROOT
 
-# Set up user and group
-groupadd --gid 5555 hadoop
-useradd --uid 1111 --gid hadoop --shell /bin/bash -m hadoop
-
 # Prepare directories
-mkdir $HADOOP_ROOT/hdfs
-mkdir $HADOOP_ROOT/hdfs/name
-mkdir $HADOOP_ROOT/hdfs/data
-mkdir $HADOOP_ROOT/checkpoint
-mkdir $HADOOP_ROOT/mapred
-mkdir $HADOOP_ROOT/mapred/history
+mkdir -p $HADOOP_ROOT/hdfs
+mkdir -p $HADOOP_ROOT/hdfs/name
+mkdir -p $HADOOP_ROOT/hdfs/data
+mkdir -p $HADOOP_ROOT/checkpoint
+mkdir -p $HADOOP_ROOT/mapred
+mkdir -p $HADOOP_ROOT/mapred/history
 
 chown -R hadoop:hadoop $HADOOP_ROOT
 chmod -R 755 $HADOOP_ROOT
 
-mkdir /run/hadoop
+mkdir -p /run/hadoop
 chown hadoop:hadoop /run/hadoop
 chmod g+w /run/hadoop
 
 declare -r HADOOP_LOG_DIR=/var/log/hadoop
-mkdir $HADOOP_LOG_DIR
+mkdir -p $HADOOP_LOG_DIR
 chgrp hadoop $HADOOP_LOG_DIR
 chmod g+w $HADOOP_LOG_DIR
 
-# Error check in CreateTrackerDirIfNeeded() in gslib/util.py in gsutil 3.37
-# (line 119) raises exception when called from Hadoop streaming MapReduce,
-# saying permission error to create /homes.
-perl -pi -e '$.>110 and $.<125 and s/raise$/pass/'  \
-    /usr/local/share/google/gsutil/gslib/util.py
-
-declare -r TMP_DIR=/tmp/hadoop_package
-declare -r HADOOP_DIR=hadoop-*
-declare -r GENERATED_FILES_DIR=generated_files
-declare -r DEB_PACKAGE_DIR=deb_packages
-
-declare -r HADOOP_HOME=/home/hadoop
-declare -r SCRIPT_DIR=hadoop_scripts
-
-mkdir -p $TMP_DIR
-
 # Set up SSH keys for hadoop user.
+mark_phase configure
 SSH_KEY_DIR=$HADOOP_HOME/.ssh
 mkdir -p $SSH_KEY_DIR
 get_custom_metadata 'hadoop-private-key' > $SSH_KEY_DIR/id_rsa
@@ -119,7 +229,7 @@ get_custom_metadata 'hadoop-public-key' > $SSH_KEY_DIR/authorized_keys
 
 # Allow SSH between Hadoop cluster instances without user intervention.
 SSH_CLIENT_CONFIG=$SSH_KEY_DIR/config
-echo "Host *" >> $SSH_CLIENT_CONFIG
+echo "Host *" > $SSH_CLIENT_CONFIG
 echo "  StrictHostKeyChecking no" >> $SSH_CLIENT_CONFIG
 
 chown hadoop:hadoop -R $SSH_KEY_DIR
@@ -127,16 +237,17 @@ chmod 600 $SSH_KEY_DIR/id_rsa
 chmod 700 $SSH_KEY_DIR
 chmod 600 $SSH_CLIENT_CONFIG
 
-# Download packages from Cloud Storage.
-gsutil -m cp -R $TMP_CLOUD_STORAGE/$HADOOP_DIR.tar.gz  \
-    $TMP_CLOUD_STORAGE/$DEB_PACKAGE_DIR  \
-    $TMP_DIR ||  \
-    die "Failed to download Hadoop and required packages from "  \
-        "$TMP_CLOUD_STORAGE/"
-
-# Set up Java Runtime Environment.
-dpkg -i --force-depends $TMP_DIR/$DEB_PACKAGE_DIR/*.deb
+# Slaves file and exclude file, which 'resize' subcommand updates on the
+# master.  They are kept in the home directory of hadoop user, since the
+# configuration directory is recreated at every boot.  The instance ID
+# tells reboot of the same master, which keeps them, from a new master on
+# reused boot disk, which starts them over.
+declare -r SLAVES_FILE=$HADOOP_HOME/slaves
+declare -r EXCLUDES_FILE=$HADOOP_HOME/excludes
+declare -r HOSTS_OWNER_FILE=$HADOOP_HOME/hosts.instance-id
+declare -r INSTANCE_ID=$(get_metadata_value instance/id)
 
+mkdir -p $TMP_DIR
 SCRIPT_AS_HADOOP=$TMP_DIR/setup_as_hadoop.sh
 cat > $SCRIPT_AS_HADOOP <<NEKO
 # Exits if one of the commands fails.
@@ -144,18 +255,26 @@ set -o errexit
 
 HADOOP_CONFIG_DIR=\$HOME/hadoop/conf
 
-# Extract Hadoop package.
-tar zxf $TMP_DIR/$HADOOP_DIR.tar.gz -C \$HOME
-ln -s \$HOME/$HADOOP_DIR \$HOME/hadoop
+# Start from the original configuration, in case the boot disk is reused.
+rm -rf \$HADOOP_CONFIG_DIR
+cp -a \$HOME/hadoop/conf.dist \$HADOOP_CONFIG_DIR
 
 # Create masters file.
 echo $HADOOP_MASTER > \$HADOOP_CONFIG_DIR/masters
 
-# Create slaves file.
-rm -f \$HADOOP_CONFIG_DIR/slaves
-for ((i = 0; i < $NUM_WORKERS; i++)) ; do
-  printf "$WORKER_NAME_TEMPLATE\n" \$i >> \$HADOOP_CONFIG_DIR/slaves
-done
+# Create slaves file and empty exclude file of DataNodes and TaskTrackers,
+# which lists workers being removed from the cluster, unless this instance
+# created them in earlier boot.
+if [[ "\$(cat $HOSTS_OWNER_FILE 2> /dev/null)" != "$INSTANCE_ID" ]] ; then
+  rm -f $SLAVES_FILE
+  for ((i = 0; i < $NUM_WORKERS; i++)) ; do
+    printf "$WORKER_NAME_TEMPLATE\n" \$i >> $SLAVES_FILE
+  done
+  : > $EXCLUDES_FILE
+  echo "$INSTANCE_ID" > $HOSTS_OWNER_FILE
+fi
+touch $SLAVES_FILE $EXCLUDES_FILE
+ln -sf $SLAVES_FILE \$HADOOP_CONFIG_DIR/slaves
 
 # Overwrite Hadoop configuration files.
 perl -pi -e "s/###HADOOP_MASTER###/$HADOOP_MASTER/g"  \
@@ -166,19 +285,83 @@ perl -pi -e "s/###EXTERNAL_IP_ADDRESS###/$THIS_HOST/g"  \
     \$HADOOP_CONFIG_DIR/hdfs-site.xml  \
     \$HADOOP_CONFIG_DIR/mapred-site.xml
 
-# Set PATH for hadoop user
-echo "export PATH=\$HOME/hadoop/bin:\$HOME/hadoop/sbin:\\\$PATH" >>  \
-    \$HOME/.profile
-echo "export JAVA_HOME=/usr/lib/jvm/java-6-openjdk-amd64" >> \$HOME/.profile
-
 NEKO
 
 sudo -u hadoop bash $SCRIPT_AS_HADOOP ||  \
     die "Failed to run set-up command as hadoop user"
 
+# Add Hadoop configuration tuned for the machine type to the site files.
+# Each line of the metadata has file name, property name and value.
+while IFS=$'\t' read site_file name value ; do
+  [[ -n "$name" ]] || continue
+  echo "Hadoop configuration: $name=$value"
+  property="  <property>\n    <name>$name</name>\n"
+  property="$property    <value>$value</value>\n  </property>\n\n"
+  sudo -u hadoop perl -pi -e "s|</configuration>|$property</configuration>|"  \
+      $HADOOP_HOME/hadoop/conf/$site_file ||  \
+      die "Failed to set $name in $site_file"
+done < <(get_custom_metadata 'hadoop-properties')
+
 # Run custom commands.
 eval "$CUSTOM_COMMAND" || die "Custom command error: $CUSTOM_COMMAND"
 
+# Hosts and zones of the instances, which the master keeps in the home
+# directory of hadoop user, since the configuration directory is recreated
+# at every boot.  Lines added later win, because IP addresses may be reused.
+declare -r TOPOLOGY_DATA=$HADOOP_HOME/topology.data
+declare -r TOPOLOGY_SCRIPT=$HADOOP_HOME/hadoop/conf/topology.sh
+declare -r ZONE_REGISTRATION_RETRIES=60
+declare -r ZONE_REGISTRATION_INTERVAL=10
+
+# Creates the script that NameNode and JobTracker run to get rack of hosts.
+# Rack of a host is the zone of the instance.
+function create_topology_script() {
+  cat > $TOPOLOGY_SCRIPT <<NEKO
+#!/bin/bash
+# Prints rack of each host given as argument.
+cat $TOPOLOGY_DATA 2> /dev/null | awk -v hosts="\$*" '
+    { zone[\$1] = \$2 }
+    END {
+      n = split(hosts, host, " ")
+      for (i = 1; i <= n; i++) {
+        print (host[i] in zone) ? "/" zone[host[i]] : "/default-rack"
+      }
+    }'
+NEKO
+  chown hadoop:hadoop $TOPOLOGY_SCRIPT
+  chmod 755 $TOPOLOGY_SCRIPT
+}
+
+# Adds host name and IP addresses of this instance with its zone to the
+# topology data on the master.  Hadoop daemons identify hosts by any of
+# them.  Retries until the master accepts SSH connection of hadoop user.
+function register_zone() {
+  local -r zone=$(basename $(get_metadata_value instance/zone))
+  local -r internal_ip=$(get_metadata_value instance/network-interfaces/0/ip)
+  local entries="$(hostname) $zone\n$internal_ip $zone\n"
+  if [[ "$THIS_HOST" != "$(hostname)" ]] ; then
+    entries="$entries$THIS_HOST $zone\n"
+  fi
+
+  for ((i = 0; i < ZONE_REGISTRATION_RETRIES; i++)) ; do
+    if printf "$entries" | sudo -u hadoop ssh -o ConnectTimeout=10  \
+        $HADOOP_MASTER "cat >> $TOPOLOGY_DATA" ; then
+      echo "Registered zone $zone of $(hostname) to $HADOOP_MASTER"
+      return
+    fi
+    sleep $ZONE_REGISTRATION_INTERVAL
+  done
+  die "Failed to register zone to $HADOOP_MASTER"
+}
+
+# Tell the master the zone of this instance before Hadoop daemons start, so
+# that HDFS replica placement and task locality follow the zones.
+if (( RACK_AWARE )) ; then
+  mark_phase register-zone
+  create_topology_script
+  register_zone
+fi
+
 function run_as_hadoop() {
   failure_message=$1 ; shift
 
@@ -199,15 +382,24 @@ function maybe_start_node() {
 function start_namenode() {
   echo "Prepare and start NameNode(s)"
 
-  run_as_hadoop "Failed to format HDFS" "echo 'Y' | hadoop namenode -format"
+  # Keep HDFS on data disk reused from the previous cluster.
+  if [[ -d $HADOOP_ROOT/hdfs/name/current ]] ; then
+    echo "HDFS is already formatted."
+  else
+    mark_phase format-hdfs
+    run_as_hadoop "Failed to format HDFS"  \
+        "echo 'Y' | hadoop namenode -format"
+  fi
 
   # Start NameNode
+  mark_phase start-namenode
   run_as_hadoop "Failed to start NameNode" hadoop-daemon.sh start namenode
   # Start Secondary NameNode
   run_as_hadoop "Failed to start Secondary NameNode" hadoop-daemon.sh start  \
       secondarynamenode
 }
 
+mark_phase start-daemons
 if (( $(get_custom_metadata NameNode) )) ; then
   start_namenode
 fi
@@ -221,6 +413,8 @@ maybe_start_node JobTracker "Failed to start JobTracker"  \
 maybe_start_node TaskTracker "Failed to start TaskTracker"  \
     hadoop-daemon.sh start tasktracker
 
+upload_timeline done
+
 echo
-echo "Start-up script for Hadoop finished."
+echo "Start-up script for Hadoop finished in $SECONDS seconds."
 echo
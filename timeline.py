@@ -0,0 +1,241 @@
+#!/usr/bin/env python
+# Copyright 2013 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Timeline of phases of cluster start-up.
+
+Phases come from two sources.  The controller, which runs
+compute_cluster_for_hadoop.py, records a span around each step of the
+start-up.  Start-up script on each instance records a marker with the time
+when each phase begins, and the last marker ends the last phase.  Both are
+merged into one timeline, and the critical path is the chain of phases that
+determines when the cluster gets ready.
+"""
+
+
+
+import collections
+import contextlib
+import csv
+import threading
+import time
+
+
+# Node name of the spans recorded by the controller.
+CONTROLLER = 'controller'
+# Phases of the controller whose name starts with this only wait for the
+# instances.
+WAIT_PREFIX = 'wait-'
+# Marker of start-up script that ends the last phase instead of beginning
+# a new one.
+END_MARKERS = ('done', 'failed')
+
+Span = collections.namedtuple('Span', ['node', 'phase', 'start', 'end'])
+
+
+class Recorder(object):
+  """Records spans of the steps of the controller."""
+
+  def __init__(self, clock=None):
+    """Constructor.
+
+    Args:
+      clock: Function that returns current time in seconds.  time.time() if
+          not specified.
+    """
+    self._clock = clock
+    self._lock = threading.Lock()
+    self.spans = []
+
+  def _Now(self):
+    return self._clock() if self._clock else time.time()
+
+  @contextlib.contextmanager
+  def Span(self, phase):
+    """Returns context manager that records the span of the block.
+
+    The span is recorded even if the block raises an exception.
+
+    Args:
+      phase: Name of the phase.
+    """
+    start = self._Now()
+    try:
+      yield
+    finally:
+      with self._lock:
+        self.spans.append(Span(CONTROLLER, phase, start, self._Now()))
+
+  def Save(self, path):
+    """Saves the spans to CSV file."""
+    with open(path, 'w') as f:
+      writer = csv.writer(f)
+      for span in self.spans:
+        writer.writerow([span.node, span.phase, '%.3f' % span.start,
+                         '%.3f' % span.end])
+
+
+def LoadSpans(path):
+  """Loads spans saved by Recorder.Save()."""
+  with open(path) as f:
+    return [Span(node, phase, float(start), float(end))
+            for node, phase, start, end in csv.reader(f)]
+
+
+def ParseMarkers(node, text):
+  """Converts phase markers of start-up script to spans.
+
+  Args:
+    node: Name of the instance.
+    text: Lines of time in seconds since epoch and phase name.
+  Returns:
+    List of spans in time order.
+  """
+  markers = []
+  for line in text.splitlines():
+    fields = line.split()
+    if len(fields) != 2:
+      continue
+    try:
+      markers.append((float(fields[0]), fields[1]))
+    except ValueError:
+      continue
+  markers.sort()
+
+  spans = []
+  for (start, phase), (end, _) in zip(markers, markers[1:]):
+    if phase not in END_MARKERS:
+      spans.append(Span(node, phase, start, end))
+  return spans
+
+
+def CriticalPath(spans):
+  """Returns the chain of spans that determines when the cluster is ready.
+
+  The chain ends with the phase of the instances that finishes last.  It
+  goes back through the earlier phases of the instance, to the step of the
+  controller that created the instance, and then through the earlier steps
+  of the controller.
+
+  Args:
+    spans: List of spans.
+  Returns:
+    List of spans on the critical path in time order.
+  """
+  controller_spans = sorted(
+      (span for span in spans if span.node == CONTROLLER),
+      key=lambda span: span.start)
+  node_spans = [span for span in spans if span.node != CONTROLLER]
+  candidates = node_spans or [span for span in controller_spans
+                              if not span.phase.startswith(WAIT_PREFIX)]
+  if not candidates:
+    return []
+
+  path = [max(candidates, key=lambda span: span.end)]
+  while True:
+    current = path[-1]
+    if current.node == CONTROLLER:
+      # Previous step of the controller.
+      earlier = [span for span in controller_spans
+                 if span.start < current.start]
+    else:
+      earlier = [span for span in node_spans
+                 if span.node == current.node and span.start < current.start]
+      if not earlier:
+        # Step of the controller running when the instance started.
+        earlier = [span for span in controller_spans
+                   if span.start < current.start and
+                   not span.phase.startswith(WAIT_PREFIX)]
+    if not earlier:
+      break
+    path.append(max(earlier, key=lambda span: span.start))
+  path.reverse()
+  return path
+
+
+def FormatGantt(spans, critical_path=(), width=50):
+  """Returns lines of Gantt chart of the spans.
+
+  Args:
+    spans: List of spans.
+    critical_path: List of spans on the critical path, which are marked
+        with '*'.
+    width: Number of characters of the bars.
+  Returns:
+    List of lines.
+  """
+  if not spans:
+    return []
+  origin = min(span.start for span in spans)
+  total = max(max(span.end for span in spans) - origin, 1e-9)
+  critical = set(critical_path)
+  node_order = dict((node, i) for i, node in enumerate(sorted(
+      set(span.node for span in spans),
+      key=lambda node: (node != CONTROLLER, node))))
+  lines = ['  %-16s %-24s %8s %8s' % ('node', 'phase', 'start', 'seconds')]
+  for span in sorted(spans, key=lambda span: (node_order[span.node],
+                                              span.start)):
+    left = int((span.start - origin) / total * width)
+    length = max(int(round((span.end - span.start) / total * width)), 1)
+    bar = (' ' * left + '#' * length)[:width].ljust(width)
+    lines.append('%s %-16s %-24s %8.1f %8.1f |%s|' % (
+        '*' if span in critical else ' ', span.node, span.phase,
+        span.start - origin, span.end - span.start, bar))
+  return lines
+
+
+def FormatCriticalPath(critical_path):
+  """Returns lines of summary of the critical path.
+
+  Gaps between the spans, such as the time until the instance created by
+  the controller boots, are shown as waits.
+
+  Args:
+    critical_path: List of spans on the critical path.
+  Returns:
+    List of lines.
+  """
+  if not critical_path:
+    return []
+  origin = critical_path[0].start
+  lines = ['Critical path: %.1f seconds' % (critical_path[-1].end - origin)]
+  for span, next_span in zip(critical_path,
+                             critical_path[1:] + [None]):
+    end = min(span.end, next_span.start) if next_span else span.end
+    lines.append('  %8.1f %8.1f  %-16s %s' % (
+        span.start - origin, end - span.start, span.node, span.phase))
+    if next_span and next_span.start > end:
+      lines.append('  %8.1f %8.1f  %-16s %s' % (
+          end - origin, next_span.start - end, next_span.node, '(wait)'))
+  return lines
+
+
+def WriteCsv(spans, critical_path, f):
+  """Writes the spans to CSV with times relative to the earliest span.
+
+  Args:
+    spans: List of spans.
+    critical_path: List of spans on the critical path.
+    f: File object to write to.
+  """
+  origin = min(span.start for span in spans) if spans else 0
+  critical = set(critical_path)
+  writer = csv.writer(f)
+  writer.writerow(['node', 'phase', 'start', 'end', 'seconds', 'critical'])
+  for span in sorted(spans, key=lambda span: (span.start, span.node)):
+    writer.writerow([span.node, span.phase,
+                     '%.1f' % (span.start - origin),
+                     '%.1f' % (span.end - origin),
+                     '%.1f' % (span.end - span.start),
+                     int(span in critical)])
@@ -0,0 +1,145 @@
+#!/usr/bin/env python
+# Copyright 2013 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Unit tests of timeline.py."""
+
+
+
+import StringIO
+import tempfile
+import unittest
+
+import timeline
+from timeline import Span
+
+
+class TimelineTest(unittest.TestCase):
+  """Unit test class of timeline."""
+
+  # Controller starts the master and then 2 workers.  Worker hw-001 gets
+  # ready last.
+  SPANS = [
+      Span('controller', 'start-master', 0.0, 10.0),
+      Span('controller', 'wait-master-ssh', 10.0, 30.0),
+      Span('controller', 'create-worker-instances', 30.0, 40.0),
+      Span('controller', 'wait-workers-ready', 40.0, 90.0),
+      Span('hm', 'boot', 5.0, 15.0),
+      Span('hm', 'start-daemons', 15.0, 25.0),
+      Span('hw-000', 'boot', 35.0, 45.0),
+      Span('hw-000', 'start-daemons', 45.0, 60.0),
+      Span('hw-001', 'boot', 42.0, 50.0),
+      Span('hw-001', 'install-jre', 50.0, 70.0),
+      Span('hw-001', 'start-daemons', 70.0, 80.0),
+  ]
+
+  def testRecorder(self):
+    """Unit test of Recorder."""
+    clock = [100.0]
+    recorder = timeline.Recorder(clock=lambda: clock[0])
+
+    with recorder.Span('first'):
+      clock[0] += 5
+    try:
+      with recorder.Span('second'):
+        clock[0] += 2
+        raise RuntimeError('failed')
+    except RuntimeError:
+      pass
+
+    self.assertEqual([Span('controller', 'first', 100.0, 105.0),
+                      Span('controller', 'second', 105.0, 107.0)],
+                     recorder.spans)
+
+  def testSaveAndLoad(self):
+    """Unit test of Recorder.Save() and LoadSpans()."""
+    recorder = timeline.Recorder()
+    recorder.spans = self.SPANS[:4]
+    with tempfile.NamedTemporaryFile() as f:
+      recorder.Save(f.name)
+
+      self.assertEqual(self.SPANS[:4], timeline.LoadSpans(f.name))
+
+  def testParseMarkers(self):
+    """Unit test of ParseMarkers()."""
+    self.assertEqual(
+        [Span('hw-000', 'boot', 10.0, 12.5),
+         Span('hw-000', 'startup', 12.5, 20.0),
+         Span('hw-000', 'start-daemons', 20.0, 30.0)],
+        timeline.ParseMarkers(
+            'hw-000', '12.5 startup\n10.0 boot\nbroken line\n'
+            '20.0 start-daemons\n30.0 done\n'))
+
+  def testParseMarkers_Unfinished(self):
+    """Unit test of ParseMarkers() while start-up script is running."""
+    self.assertEqual(
+        [Span('hw-000', 'boot', 10.0, 12.5)],
+        timeline.ParseMarkers('hw-000', '10.0 boot\n12.5 startup\n'))
+    self.assertEqual([], timeline.ParseMarkers('hw-000', ''))
+
+  def testCriticalPath(self):
+    """Unit test of CriticalPath()."""
+    self.assertEqual(
+        [self.SPANS[0], self.SPANS[1], self.SPANS[2],
+         self.SPANS[8], self.SPANS[9], self.SPANS[10]],
+        timeline.CriticalPath(self.SPANS))
+
+  def testCriticalPath_ControllerOnly(self):
+    """Unit test of CriticalPath() without markers of the instances."""
+    self.assertEqual(self.SPANS[:3],
+                     timeline.CriticalPath(self.SPANS[:4]))
+    self.assertEqual([], timeline.CriticalPath([]))
+
+  def testFormatGantt(self):
+    """Unit test of FormatGantt()."""
+    lines = timeline.FormatGantt(
+        self.SPANS, timeline.CriticalPath(self.SPANS), width=9)
+
+    self.assertEqual(len(self.SPANS) + 1, len(lines))
+    # Controller comes first, then the instances in name order.
+    self.assertRegexpMatches(lines[1], r'^\* controller +start-master ')
+    self.assertTrue(lines[1].endswith('|#        |'))
+    self.assertRegexpMatches(lines[5], r'^  hm +boot ')
+    self.assertRegexpMatches(lines[-1], r'^\* hw-001 +start-daemons ')
+    self.assertTrue(lines[-1].endswith('|       # |'))
+
+  def testFormatCriticalPath(self):
+    """Unit test of FormatCriticalPath()."""
+    lines = timeline.FormatCriticalPath(timeline.CriticalPath(self.SPANS))
+
+    self.assertEqual('Critical path: 80.0 seconds', lines[0])
+    # Steps of the controller, the wait until the worker boots, and phases
+    # of the worker.
+    self.assertEqual(
+        ['start-master', 'wait-master-ssh', 'create-worker-instances',
+         '(wait)', 'boot', 'install-jre', 'start-daemons'],
+        [line.split()[-1] for line in lines[1:]])
+
+  def testWriteCsv(self):
+    """Unit test of WriteCsv()."""
+    output = StringIO.StringIO()
+    timeline.WriteCsv(self.SPANS, timeline.CriticalPath(self.SPANS), output)
+
+    rows = [line.split(',') for line in output.getvalue().split()]
+    self.assertEqual(['node', 'phase', 'start', 'end', 'seconds', 'critical'],
+                     rows[0])
+    self.assertEqual(['controller', 'start-master', '0.0', '10.0', '10.0',
+                      '1'], rows[1])
+    self.assertEqual(['hw-001', 'start-daemons', '70.0', '80.0', '10.0', '1'],
+                     rows[-1])
+    self.assertEqual(6, sum(int(row[5]) for row in rows[1:]))
+
+
+if __name__ == '__main__':
+  unittest.main()